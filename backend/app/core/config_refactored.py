@@ -44,6 +44,8 @@ class JWTConfig:
     secret_key: str
     algorithm: str = "HS256"
     expire_minutes: int = 1440  # 24 小時
+    verify_cache_size: int = 10000  # 已驗證 token 快取上限，0 表示停用
+    backend: str = "jose"  # JWT 解碼實作：jose 或 pyjwt
     
     @classmethod
     def from_env(cls) -> 'JWTConfig':
@@ -51,7 +53,9 @@ class JWTConfig:
         return cls(
             secret_key=os.getenv("CAMP_JWT_SECRET", "your-secret-key"),
             algorithm=os.getenv("CAMP_JWT_ALGORITHM", "HS256"),
-            expire_minutes=int(os.getenv("CAMP_JWT_EXPIRE_MINUTES", "1440"))
+            expire_minutes=int(os.getenv("CAMP_JWT_EXPIRE_MINUTES", "1440")),
+            verify_cache_size=int(os.getenv("CAMP_JWT_VERIFY_CACHE_SIZE", "10000")),
+            backend=os.getenv("CAMP_JWT_BACKEND", "jose").lower()
         )
 
 
@@ -95,6 +99,9 @@ class TradingConfig:
     min_trading_fee: int = 1
     transfer_fee_percentage: float = 0.01
     min_transfer_fee: int = 1
+    integrity_audit_interval: int = 0  # 0 表示不啟用定期稽核
+    pvp_sweep_interval: int = 60
+    team_totals_refresh_interval: int = 10
     
     @classmethod
     def from_env(cls) -> 'TradingConfig':
@@ -107,7 +114,10 @@ class TradingConfig:
             trading_fee_percentage=float(os.getenv("CAMP_TRADING_FEE_PCT", "0.01")),
             min_trading_fee=int(os.getenv("CAMP_MIN_TRADING_FEE", "1")),
             transfer_fee_percentage=float(os.getenv("CAMP_TRANSFER_FEE_PCT", "0.01")),
-            min_transfer_fee=int(os.getenv("CAMP_MIN_TRANSFER_FEE", "1"))
+            min_transfer_fee=int(os.getenv("CAMP_MIN_TRANSFER_FEE", "1")),
+            integrity_audit_interval=int(os.getenv("CAMP_INTEGRITY_AUDIT_INTERVAL", "0")),
+            pvp_sweep_interval=int(os.getenv("CAMP_PVP_SWEEP_INTERVAL", "60")),
+            team_totals_refresh_interval=int(os.getenv("CAMP_TEAM_TOTALS_REFRESH_INTERVAL", "10"))
         )
 
 
@@ -120,6 +130,8 @@ class ExternalServiceConfig:
     telegram_bot_api_url: str
     telegram_bot_token: str
     notification_timeout: int = 30
+    notification_flush_interval: float = 1.0
+    notification_batch_size: int = 200
     
     @classmethod
     def from_env(cls) -> 'ExternalServiceConfig':
@@ -130,7 +142,9 @@ class ExternalServiceConfig:
                 "https://camp.sitcon.party/bot/broadcast/"
             ),
             telegram_bot_token=os.getenv("CAMP_TELEGRAM_BOT_TOKEN", ""),
-            notification_timeout=int(os.getenv("CAMP_NOTIFICATION_TIMEOUT", "30"))
+            notification_timeout=int(os.getenv("CAMP_NOTIFICATION_TIMEOUT", "30")),
+            notification_flush_interval=float(os.getenv("CAMP_NOTIFICATION_FLUSH_INTERVAL", "1.0")),
+            notification_batch_size=int(os.getenv("CAMP_NOTIFICATION_BATCH_SIZE", "200"))
         )
 
 
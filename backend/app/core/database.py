@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from app.core.config_refactored import config
 import logging
 
@@ -64,6 +65,7 @@ class Collections:
     MARKET_CONFIG = "market_config"
     PVP_CHALLENGES = "pvp_challenges"
     QR_CODES = "qr_codes"
+    LEDGER_CHECKPOINTS = "ledger_checkpoints"
     
     @classmethod
     def all_collections(cls) -> list:
@@ -72,7 +74,7 @@ class Collections:
             cls.USERS, cls.GROUPS, cls.POINT_LOGS,
             cls.STOCKS, cls.STOCK_ORDERS, cls.TRADES,
             cls.ANNOUNCEMENTS, cls.MARKET_CONFIG, cls.PVP_CHALLENGES,
-            cls.QR_CODES
+            cls.QR_CODES, cls.LEDGER_CHECKPOINTS
         ]
 
 
@@ -86,6 +88,7 @@ async def init_database_indexes():
         await database[Collections.USERS].create_index("name")  # 使用者名稱索引（非唯一）
         await database[Collections.USERS].create_index("team")  # 隊伍索引
         await database[Collections.USERS].create_index("enabled")  # 啟用狀態索引
+        await database[Collections.USERS].create_index("owed_points")  # 欠款統計索引
         
         # point_logs
         await database[Collections.POINT_LOGS].create_index("user_id")
@@ -98,6 +101,8 @@ async def init_database_indexes():
         await database[Collections.STOCK_ORDERS].create_index("user_id")
         await database[Collections.STOCK_ORDERS].create_index("created_at")
         await database[Collections.STOCK_ORDERS].create_index("status")
+        await database[Collections.STOCK_ORDERS].create_index([("user_id", 1), ("status", 1), ("created_at", -1), ("_id", -1)])  # BOT /orders 游標分頁
+        await database[Collections.STOCK_ORDERS].create_index([("status", 1), ("price", 1)])  # 價格帶移動時依價格重新啟用 pending_limit 訂單
         
         # trades
         await database[Collections.TRADES].create_index("buy_user_id")
@@ -111,6 +116,31 @@ async def init_database_indexes():
         # market_config
         await database[Collections.MARKET_CONFIG].create_index("type", unique=True)
         
+        # qr_codes - 兌換時以 id 原子佔用，需唯一
+        # 既有資料有重複 id 時建立會失敗，獨立處理以免後面的索引一起被跳過
+        try:
+            await database[Collections.QR_CODES].create_index("id", unique=True)
+        except DuplicateKeyError as e:
+            logger.error(
+                f"Failed to create unique index on {Collections.QR_CODES}.id: duplicate QR code ids exist. "
+                f"QR code redemption is not protected against double use until the duplicates are removed "
+                f"(find them with db.{Collections.QR_CODES}.aggregate([{{$group: {{_id: '$id', count: {{$sum: 1}}}}}}, "
+                f"{{$match: {{count: {{$gt: 1}}}}}}])) and the backend is restarted: {e}"
+            )
+        except Exception as e:
+            logger.error(f"Failed to create unique index on {Collections.QR_CODES}.id: {e}")
+        
+        # pvp_challenges - 到期掃描依 (status, expires_at)；過期挑戰保留一段時間後由 TTL 索引刪除
+        await database[Collections.PVP_CHALLENGES].create_index([("status", 1), ("expires_at", 1)])
+        await database[Collections.PVP_CHALLENGES].create_index([("challenger", 1), ("status", 1)])
+        await database[Collections.PVP_CHALLENGES].create_index("expiry_claim_token", sparse=True)  # 過期通知的租約
+        await database[Collections.PVP_CHALLENGES].create_index(
+            "expired_at", expireAfterSeconds=7 * 24 * 3600  # 過期挑戰保留 7 天
+        )
+        
+        # ledger_checkpoints - 帳本重播對帳的每位使用者狀態
+        await database[Collections.LEDGER_CHECKPOINTS].create_index("user_id", unique=True)
+        
         logger.info("Database indexes created successfully")
         
     except Exception as e:
@@ -6,6 +6,8 @@ from typing import List, Dict, Optional, Set
 from fastapi import HTTPException, status, Depends
 from functools import wraps
 import logging
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +88,109 @@ ROLE_PERMISSIONS: Dict[Role, Set[Permission]] = {
     }
 }
 
+class RoleClaimRegistry:
+    """
+    角色聲明版本表（行程內記憶體）
+
+    使用者 token 內簽入 role / permissions 聲明，並附上簽發時的角色版本 (rv)
+    與本行程的 epoch (rve)。角色變更時 bump 版本，舊 token 的角色聲明立即失效，
+    之後改回資料庫查詢；行程重啟後 epoch 改變，所有舊聲明同樣不再被信任。
+    """
+
+    def __init__(self):
+        self._epoch = uuid.uuid4().hex[:12]
+        self._versions: Dict[str, int] = {}
+        self._claim_hits = 0
+        self._claim_misses = 0
+
+    def current_version(self, user_id: str) -> int:
+        """取得使用者目前的角色版本"""
+        return self._versions.get(str(user_id), 0)
+
+    def bump(self, *user_ids: str) -> None:
+        """角色變更時遞增版本，使已簽發的角色聲明失效"""
+        for user_id in user_ids:
+            if user_id is None:
+                continue
+            key = str(user_id)
+            self._versions[key] = self._versions.get(key, 0) + 1
+        logger.info(f"Role claims revoked for {[u for u in user_ids if u is not None]}")
+
+    def revoke_all(self) -> None:
+        """更換 epoch，使所有已簽發的角色聲明失效（資料重置後使用）"""
+        self._epoch = uuid.uuid4().hex[:12]
+        self._versions.clear()
+        logger.info("All role claims revoked")
+
+    def build_claims(self, user_id: str, role: Role, expires_at: int) -> dict:
+        """
+        建立要簽入 token 的角色聲明
+
+        role_exp 與 token 本身的 exp 相同；token 有效期間內聲明只會因撤銷或 epoch 改變而失效
+        """
+        return {
+            "role": role.value,
+            "permissions": sorted(p.value for p in ROLE_PERMISSIONS.get(role, set())),
+            "rv": self.current_version(user_id),
+            "rve": self._epoch,
+            "role_exp": int(expires_at)
+        }
+
+    def is_revoked(self, user: dict) -> bool:
+        """聲明是否在本 epoch 內被 bump() 撤銷（epoch 改變或過期不算）"""
+        user_id = user.get("user_id")
+        return (user.get("rve") == self._epoch
+                and user_id is not None
+                and user.get("rv") != self.current_version(user_id))
+
+    def role_from_claims(self, user: dict) -> Optional[Role]:
+        """
+        驗證 token 內的角色聲明
+
+        Returns:
+            聲明有效時回傳角色；沒有聲明、已過期或已被撤銷時回傳 None
+        """
+        role_value = user.get("role")
+        user_id = user.get("user_id")
+        if not role_value or not user_id or "rv" not in user:
+            return None
+
+        if (user.get("rve") != self._epoch
+                or user.get("rv") != self.current_version(user_id)
+                or user.get("role_exp", 0) < time.time()):
+            self._claim_misses += 1
+            return None
+
+        try:
+            role = Role(role_value)
+        except ValueError:
+            return None
+        self._claim_hits += 1
+        return role
+
+    def get_stats(self) -> dict:
+        """取得角色聲明驗證統計"""
+        total = self._claim_hits + self._claim_misses
+        return {
+            "revoked_users": len(self._versions),
+            "claim_hits": self._claim_hits,
+            "claim_misses": self._claim_misses,
+            "hit_rate": round(self._claim_hits / total, 4) if total else 0.0
+        }
+
+
+# 全域角色聲明版本表
+_role_claim_registry = RoleClaimRegistry()
+
+# get_current_user 在角色聲明失效時以資料庫確認的角色，附加在回傳的使用者資訊上
+RESOLVED_ROLE_KEY = "resolved_role"
+
+
+def get_role_claim_registry() -> RoleClaimRegistry:
+    """獲取角色聲明版本表實例"""
+    return _role_claim_registry
+
+
 class RBACService:
     """權限控制服務"""
     
@@ -105,14 +210,29 @@ class RBACService:
             if user.get("sub") == "admin":
                 return Role.ADMIN
             
+            # token 內的角色聲明仍有效時直接採用，不需存取資料庫
+            claimed_role = _role_claim_registry.role_from_claims(user)
+            if claimed_role is not None:
+                return claimed_role
+            
             # 從資料庫查詢使用者角色
             user_id = user.get("user_id") or user.get("sub")
             if not user_id:
                 return Role.STUDENT
             
             from app.core.database import get_database, Collections
+            from app.services.user_identity_service import get_user_identity_resolver
             from bson import ObjectId
             
+            # 先查詢角色快取，命中時不需存取資料庫
+            resolver = get_user_identity_resolver()
+            cached_role = resolver.get_role(str(user_id))
+            if cached_role is not None:
+                try:
+                    return Role(cached_role)
+                except ValueError:
+                    return Role.STUDENT
+            
             db = get_database()
             
             # 構建查詢條件
@@ -129,7 +249,13 @@ class RBACService:
             
             user_doc = await db[Collections.USERS].find_one({
                 "$or": query_conditions
-            })
+            }, {"_id": 1, "role": 1})
+            
+            resolver.remember_role(
+                str(user_id),
+                (user_doc or {}).get("role") or Role.STUDENT.value,
+                user_doc["_id"] if user_doc else None
+            )
             
             if user_doc and user_doc.get("role"):
                 try:
@@ -158,6 +284,34 @@ class RBACService:
         if user.get("sub") == "admin":
             return Role.ADMIN
             
+        # get_current_user 已以資料庫（含角色快取）確認過角色
+        resolved_role = user.get(RESOLVED_ROLE_KEY)
+        if resolved_role:
+            try:
+                return Role(resolved_role)
+            except ValueError:
+                return Role.STUDENT
+        
+        # 使用者 token 的角色聲明需通過版本檢查
+        if "rv" in user:
+            claimed_role = _role_claim_registry.role_from_claims(user)
+            if claimed_role is not None:
+                return claimed_role
+            
+            # 聲明失效且沒有經過 get_current_user：先使用角色快取
+            from app.services.user_identity_service import get_user_identity_resolver
+            cached_role = get_user_identity_resolver().get_role(str(user.get("user_id")))
+            if cached_role is not None:
+                try:
+                    return Role(cached_role)
+                except ValueError:
+                    return Role.STUDENT
+            
+            # 已被撤銷的聲明不能再採用；過期或行程重啟則沿用簽發時的角色
+            if _role_claim_registry.is_revoked(user):
+                logger.warning(f"Revoked role claim for user {user.get('user_id')} used without database lookup, treating as student")
+                return Role.STUDENT
+        
         # 從使用者資料中取得角色，預設為學員
         user_role = user.get("role", Role.STUDENT.value)
         
@@ -4,10 +4,17 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config_refactored import config
+from app.core.rbac import Role, RBACService, RESOLVED_ROLE_KEY, get_role_claim_registry
+from collections import OrderedDict
+from typing import Optional, Tuple
 import hashlib
 import hmac
+import logging
+import time
 import urllib.parse
 
+logger = logging.getLogger(__name__)
+
 # 密碼加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -40,18 +47,120 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     return encoded_jwt
 
 
-def verify_token(token: str) -> dict:
-    """驗證 JWT Token"""
+class TokenVerificationCache:
+    """
+    已驗證 JWT 的快取
+
+    以 token 的 SHA-256 摘要為鍵，保存解碼後的 claims 直到 exp，
+    同一個 token 重複使用時不必再做簽章驗證。超過上限時淘汰最久未使用的條目。
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """取得快取的 claims（未命中或已過期回傳 None）"""
+        if self._max_entries <= 0:
+            return None
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            self._entries.pop(key, None)
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return dict(payload)
+
+    def put(self, token: str, payload: dict) -> None:
+        """保存 claims，沒有 exp 的 token 不快取"""
+        expires_at = payload.get("exp")
+        if self._max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        self._entries[self._digest(token)] = (dict(payload), float(expires_at))
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空快取（更換金鑰等情況）"""
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """取得快取統計"""
+        total = self._hits + self._misses
+        return {
+            "backend": _jwt_backend_name(),
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / total, 4) if total else 0.0
+        }
+
+
+def _load_pyjwt():
+    """設定 CAMP_JWT_BACKEND=pyjwt 時載入 PyJWT（未安裝則退回 python-jose）"""
+    if config.jwt.backend != "pyjwt":
+        return None
     try:
-        payload = jwt.decode(token, config.jwt.secret_key,
-                             algorithms=[config.jwt.algorithm])
+        import jwt as pyjwt
+        return pyjwt
+    except ImportError:
+        logger.warning("PyJWT is not installed, falling back to python-jose")
+        return None
+
+
+_pyjwt = _load_pyjwt()
+_token_cache = TokenVerificationCache(int(config.jwt.verify_cache_size))
+
+
+def _jwt_backend_name() -> str:
+    return "pyjwt" if _pyjwt is not None else "jose"
+
+
+def get_token_verification_cache() -> TokenVerificationCache:
+    """獲取 JWT 驗證快取實例"""
+    return _token_cache
+
+
+def _decode_token(token: str) -> dict:
+    """以設定的 JWT 實作解碼並驗證簽章"""
+    if _pyjwt is not None:
+        try:
+            return _pyjwt.decode(token, config.jwt.secret_key,
+                                 algorithms=[config.jwt.algorithm])
+        except _pyjwt.PyJWTError as e:
+            raise JWTError(str(e))
+    return jwt.decode(token, config.jwt.secret_key,
+                      algorithms=[config.jwt.algorithm])
+
+
+def verify_token(token: str) -> dict:
+    """驗證 JWT Token（已驗證過且未過期的 token 直接使用快取的 claims）"""
+    payload = _token_cache.get(token)
+    if payload is not None:
         return payload
+    try:
+        payload = _decode_token(token)
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    _token_cache.put(token, payload)
+    return payload
 
 
 def verify_CAMP_ADMIN_PASSWORD(password: str) -> bool:
@@ -93,6 +202,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 detail="Invalid token type"
             )
 
+        if token_type == "user" and "rv" in payload:
+            # 角色聲明有效時不會存取資料庫；過期、撤銷或行程重啟（epoch 改變）後
+            # 改以角色快取 / 資料庫確認，同步的 RBACService.get_user_role 直接採用這個結果
+            role = await RBACService.get_user_role_from_db(payload)
+            payload = {**payload, RESOLVED_ROLE_KEY: role.value}
+
         return payload
 
     except JWTError:
@@ -140,11 +255,21 @@ def verify_telegram_auth(auth_data: dict, bot_token: str) -> bool:
     return hmac.compare_digest(received_hash, expected_hash)
 
 
-def create_user_token(user_id: str, telegram_id: int) -> str:
-    """為 Telegram 使用者建立 JWT Token"""
+def create_user_token(user_id: str, telegram_id: int, role: Optional[Role] = None) -> str:
+    """
+    為 Telegram 使用者建立 JWT Token
+
+    提供 role 時會一併簽入角色與權限聲明（與 token 同時到期、可由角色版本表撤銷），
+    權限檢查可直接使用聲明而不必每次查詢資料庫。
+    """
+    expires_delta = timedelta(minutes=int(config.jwt.expire_minutes))
     token_data = {
         "user_id": user_id,
         "telegram_id": telegram_id,
         "type": "user"
     }
-    return create_access_token(token_data)
+    if role is not None:
+        token_data.update(get_role_claim_registry().build_claims(
+            user_id, role, int(time.time() + expires_delta.total_seconds())
+        ))
+    return create_access_token(token_data, expires_delta)
@@ -21,6 +21,7 @@ from .strategies import (
 import hashlib
 import hmac
 from app.core.config_refactored import config
+from app.services.notification_dispatcher import get_notification_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -279,52 +280,23 @@ class StockTradingService:
 
     async def _send_trade_notification(self, user_id: str, action: str, quantity: int, 
                                      price: float, total_amount: float, order_id: str):
-        """傳送交易通知到 Telegram Bot"""
+        """排入交易通知，由通知批次派送器送到 Telegram Bot"""
         try:
-            if not config.external_services.telegram_bot_api_url or not config.security.internal_api_key:
-                logger.warning("Telegram Bot API 設定不完整，跳過通知傳送")
-                return
-            
             # 獲取使用者的 Telegram ID
             user = await self.user_repo.get_by_id(user_id)
             if not user or not hasattr(user, 'telegram_id') or not user.telegram_id:
                 logger.warning(f"無法傳送通知：使用者 {user_id} 未設定 telegram_id")
                 return
             
-            # 構建通知請求
-            notification_url = f"{config.external_services.telegram_bot_api_url.rstrip('/')}/bot/notification/trade"
-            
-            payload = {
-                "user_id": user.telegram_id,
-                "action": action,
-                "quantity": quantity,
-                "price": price,
-                "total_amount": total_amount,
-                "order_id": order_id
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "token": config.security.internal_api_key
-            }
-            
-            # 傳送通知（設定短超時避免阻塞交易）
-            response = requests.post(
-                notification_url,
-                json=payload,
-                headers=headers,
-                timeout=5  # 5秒超時
+            get_notification_dispatcher().enqueue_trade(
+                action=action,
+                quantity=quantity,
+                price=price,
+                total_amount=total_amount,
+                order_id=order_id,
+                telegram_id=user.telegram_id
             )
-            
-            if response.status_code == 200:
-                logger.info(f"成功傳送 {action} 交易通知給使用者 {user.telegram_id}")
-            else:
-                logger.warning(f"傳送交易通知失敗: HTTP {response.status_code} - {response.text}")
                 
-        except requests.exceptions.Timeout:
-            logger.warning(f"傳送交易通知超時，使用者: {user_id}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"傳送交易通知網路錯誤: {e}")
         except Exception as e:
             logger.error(f"傳送交易通知發生未預期錯誤: {e}")
 
@@ -156,9 +156,43 @@ async def startup_event():
         from app.services.user_service import get_user_service
         
         user_service = get_user_service()
-        await initialize_matching_scheduler(user_service, start_immediately=True)
+        matching_scheduler = await initialize_matching_scheduler(user_service, start_immediately=True)
         logger.info("Matching scheduler started with 60s interval")
         
+        # 載入交易時間行事曆並監看開收盤事件
+        from app.services.market_calendar import get_market_calendar
+        
+        market_calendar = get_market_calendar()
+        await market_calendar.load()
+        market_calendar.subscribe(matching_scheduler.on_market_event)
+        await market_calendar.start_watching()
+        
+        # 載入市場設定快照，replica set 上另以 change stream 同步
+        from app.services.market_config_snapshot import get_market_config_snapshot
+        
+        market_config_snapshot = get_market_config_snapshot()
+        await market_config_snapshot.load()
+        await market_config_snapshot.start_watching()
+        
+        # 載入隊伍點數總和投影，replica set 上以 change stream 增量更新
+        from app.services.team_totals import get_team_totals
+        
+        team_totals = get_team_totals()
+        await team_totals.load()
+        await team_totals.start_watching()
+        
+        # 啟動定期增量完整性稽核
+        from app.services.integrity_audit import get_integrity_audit_scheduler
+        await get_integrity_audit_scheduler().start()
+        
+        # 啟動 PvP 挑戰到期掃描
+        from app.services.pvp_expiry import get_pvp_expiry_sweeper
+        await get_pvp_expiry_sweeper().start()
+        
+        # 啟動 Telegram 通知批次派送
+        from app.services.notification_dispatcher import get_notification_dispatcher
+        await get_notification_dispatcher().start()
+        
         logger.info("Application started successfully with refactored architecture")
         
     except Exception as e:
@@ -179,6 +213,30 @@ async def shutdown_event():
         from app.services.matching_scheduler import cleanup_matching_scheduler
         await cleanup_matching_scheduler()
         
+        # 停止交易時間行事曆監看
+        from app.services.market_calendar import get_market_calendar
+        await get_market_calendar().stop_watching()
+        
+        # 停止市場設定快照監看
+        from app.services.market_config_snapshot import get_market_config_snapshot
+        await get_market_config_snapshot().stop_watching()
+        
+        # 停止隊伍點數總和投影監看
+        from app.services.team_totals import get_team_totals
+        await get_team_totals().stop_watching()
+        
+        # 停止定期完整性稽核
+        from app.services.integrity_audit import get_integrity_audit_scheduler
+        await get_integrity_audit_scheduler().stop()
+        
+        # 停止 PvP 挑戰到期掃描
+        from app.services.pvp_expiry import get_pvp_expiry_sweeper
+        await get_pvp_expiry_sweeper().stop()
+        
+        # 送出剩餘通知並停止批次派送
+        from app.services.notification_dispatcher import get_notification_dispatcher
+        await get_notification_dispatcher().stop()
+        
         # 清理服務資源
         service_container = get_service_container()
         await cleanup_services(service_container)
@@ -1,5 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from app.services.admin_service import AdminService, get_admin_service
+from app.services.export_service import ExportService, get_export_service, EXPORT_MEDIA_TYPES
+from app.services.bulk_operations import get_bulk_jobs
+from app.services.integrity_audit import (
+    IntegrityAuditService, get_integrity_audit_service, get_integrity_audit_scheduler
+)
+from app.services.ledger_reconciliation import LedgerReconciliationService, get_ledger_reconciliation_service
+from app.services.market_config_snapshot import get_market_config_snapshot
+from app.services.price_band import get_price_band
 from app.services.user_service import UserService, get_user_service
 from app.services.debt_service import DebtService, get_debt_service
 from app.schemas.public import (
@@ -542,6 +551,31 @@ async def final_settlement(
     return await admin_service.final_settlement()
 
 
+@router.get(
+    "/bulk-jobs",
+    responses={
+        401: {"model": ErrorResponse, "description": "未授權"}
+    },
+    summary="查詢批次工作進度",
+    description="查詢最近的隊伍發放點數與最終結算等批次工作進度"
+)
+async def get_bulk_job_progress(
+    current_user: dict = Depends(get_current_user)
+):
+    """查詢批次工作進度"""
+    # 檢查系統管理權限
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.SYSTEM_ADMIN not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要系統管理權限（目前角色：{user_role.value}）"
+        )
+    
+    return {"jobs": get_bulk_jobs()}
+
+
 @router.get(
     "/ipo/status",
     responses={
@@ -701,6 +735,8 @@ async def reset_ipo(
             upsert=True
         )
         
+        await get_market_config_snapshot().refresh("ipo_status", db)
+        
         logger.info(f"IPO reset: {initial_shares} shares @ {initial_price} points each")
         
         # 傳送系統公告到 Telegram Bot
@@ -795,10 +831,8 @@ async def update_ipo(
                 "updated_at": datetime.now(timezone.utc)
             })
         
-        # 取得更新後的狀態
-        updated_config = await db[Collections.MARKET_CONFIG].find_one(
-            {"type": "ipo_status"}
-        )
+        # 取得更新後的狀態並刷新市場設定快照
+        updated_config = await get_market_config_snapshot().refresh("ipo_status", db)
         
         message_parts = []
         if shares_remaining is not None:
@@ -915,6 +949,12 @@ async def reset_all_data(
             except Exception as e:
                 logger.error(f"Failed to delete from {collection_name}: {e}")
         
+        # 使用者已清空，身分索引一併清除，並撤銷所有已簽發的角色聲明
+        from app.services.user_identity_service import get_user_identity_resolver
+        from app.core.rbac import get_role_claim_registry
+        get_user_identity_resolver().clear()
+        get_role_claim_registry().revoke_all()
+        
         # 重新初始化基本設定
         try:
             # 初始化IPO狀態
@@ -946,6 +986,12 @@ async def reset_all_data(
             "updated_at": datetime.now(timezone.utc)
         })
         
+        # 交易時間已重建，行事曆下次查詢時重新載入
+        from app.services.market_calendar import get_market_calendar
+        get_market_calendar().invalidate()
+        get_market_config_snapshot().invalidate()
+        get_price_band().invalidate()
+        
         # 建立預設漲跌限制 (20%)
         await db[Collections.MARKET_CONFIG].insert_one({
             "type": "trading_limit",
@@ -1046,6 +1092,7 @@ async def reset_all_data_except_users(
             Collections.MARKET_CONFIG,
             Collections.PVP_CHALLENGES,
             Collections.QR_CODES,
+            Collections.LEDGER_CHECKPOINTS,
         ]
         
         # 記錄清除前的統計
@@ -1101,6 +1148,12 @@ async def reset_all_data_except_users(
             "updated_at": datetime.now(timezone.utc)
         })
         
+        # 交易時間已重建，行事曆下次查詢時重新載入
+        from app.services.market_calendar import get_market_calendar
+        get_market_calendar().invalidate()
+        get_market_config_snapshot().invalidate()
+        get_price_band().invalidate()
+        
         # 建立預設漲跌限制 (20%)
         await db[Collections.MARKET_CONFIG].insert_one({
             "type": "trading_limit",
@@ -1430,6 +1483,112 @@ async def trigger_system_wide_balance_check(
         )
 
 
+@router.post(
+    "/system/integrity-audit",
+    responses={
+        200: {"description": "完整性稽核完成"},
+        401: {"model": ErrorResponse, "description": "未授權"},
+        403: {"model": ErrorResponse, "description": "權限不足"},
+        500: {"model": ErrorResponse, "description": "系統錯誤"}
+    },
+    summary="執行系統完整性稽核",
+    description="以資料庫聚合檢查點數、持股、成交紀錄、賣單保留量與 IPO 發行量是否一致，可選擇只檢查上次檢查點後有異動的使用者，並可自動修復負點數、負持股與異常訂單"
+)
+async def run_integrity_audit(
+    fix: bool = Query(False, description="是否自動修復可修復的問題"),
+    incremental: bool = Query(False, description="只檢查上次檢查點之後有異動的使用者"),
+    current_user: dict = Depends(get_current_user),
+    audit_service: IntegrityAuditService = Depends(get_integrity_audit_service)
+):
+    """執行系統完整性稽核"""
+    # 檢查系統管理權限
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.SYSTEM_ADMIN not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要系統管理權限（目前角色：{user_role.value}）"
+        )
+    
+    try:
+        result = await audit_service.run_audit(fix=fix, incremental=incremental)
+        logger.info(f"Integrity audit by {current_user.get('username')}: {result['violations']} violations")
+        return result
+        
+    except Exception as e:
+        logger.error(f"Failed to run integrity audit: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"完整性稽核失敗: {str(e)}"
+        )
+
+
+@router.get(
+    "/system/integrity-audit/status",
+    responses={
+        401: {"model": ErrorResponse, "description": "未授權"}
+    },
+    summary="查詢定期完整性稽核狀態",
+    description="查詢背景增量稽核的執行狀態與最近一次結果"
+)
+async def get_integrity_audit_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """查詢定期完整性稽核狀態"""
+    # 檢查系統管理權限
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.SYSTEM_ADMIN not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要系統管理權限（目前角色：{user_role.value}）"
+        )
+    
+    return get_integrity_audit_scheduler().get_status()
+
+
+@router.post(
+    "/system/ledger-reconciliation",
+    responses={
+        200: {"description": "帳本對帳完成"},
+        401: {"model": ErrorResponse, "description": "未授權"},
+        403: {"model": ErrorResponse, "description": "權限不足"},
+        500: {"model": ErrorResponse, "description": "系統錯誤"}
+    },
+    summary="重播點數日誌與成交紀錄對帳",
+    description="依時間順序重播 point_logs 與 trades，回報每個帳戶第一次與日誌不一致的位置；預設只重播上次檢查點之後的新紀錄"
+)
+async def run_ledger_reconciliation(
+    full: bool = Query(False, description="忽略檢查點，從頭重播所有紀錄"),
+    current_user: dict = Depends(get_current_user),
+    reconciliation_service: LedgerReconciliationService = Depends(get_ledger_reconciliation_service)
+):
+    """重播點數日誌與成交紀錄對帳"""
+    # 檢查系統管理權限
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.SYSTEM_ADMIN not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要系統管理權限（目前角色：{user_role.value}）"
+        )
+    
+    try:
+        result = await reconciliation_service.reconcile(full=full)
+        logger.info(f"Ledger reconciliation by {current_user.get('username')}: {result['divergent_count']} divergent accounts")
+        return result
+        
+    except Exception as e:
+        logger.error(f"Failed to run ledger reconciliation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"帳本對帳失敗: {str(e)}"
+        )
+
+
 @router.post(
     "/pvp/cleanup",
     responses={
@@ -1446,43 +1605,33 @@ async def cleanup_pvp_challenges(
     """清理過期的 PVP 挑戰"""
     try:
         from app.core.database import get_database, Collections
+        from app.services.pvp_expiry import get_pvp_expiry_sweeper
         
         db = get_database()
-        now = datetime.now(timezone.utc)
         
-        # 清理過期的挑戰
-        expired_result = await db[Collections.PVP_CHALLENGES].update_many(
-            {
-                "status": {"$in": ["pending", "waiting_accepter"]},
-                "expires_at": {"$lt": now}
-            },
-            {"$set": {"status": "expired"}}
-        )
+        # 立即執行一次到期掃描（平常由背景掃描器處理）
+        expired_now = await get_pvp_expiry_sweeper().sweep(db)
         
-        # 獲取所有進行中的挑戰統計
-        pending_count = await db[Collections.PVP_CHALLENGES].count_documents({
-            "status": {"$in": ["pending", "waiting_accepter"]}
-        })
-        
-        expired_count = await db[Collections.PVP_CHALLENGES].count_documents({
-            "status": "expired"
-        })
-        
-        completed_count = await db[Collections.PVP_CHALLENGES].count_documents({
-            "status": "completed"
-        })
+        # 以一次聚合取得各狀態的挑戰數量
+        status_counts = {
+            item["_id"]: item["count"]
+            async for item in db[Collections.PVP_CHALLENGES].aggregate([
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ])
+        }
         
-        logger.info(f"PVP cleanup: expired {expired_result.modified_count} challenges")
+        logger.info(f"PVP cleanup: expired {expired_now} challenges")
         
         return {
             "ok": True,
-            "message": f"清理完成，過期了 {expired_result.modified_count} 個挑戰",
+            "message": f"清理完成，過期了 {expired_now} 個挑戰",
             "stats": {
-                "expired_now": expired_result.modified_count,
-                "pending": pending_count,
-                "expired_total": expired_count,
-                "completed": completed_count
-            }
+                "expired_now": expired_now,
+                "pending": status_counts.get("pending", 0) + status_counts.get("waiting_accepter", 0),
+                "expired_total": status_counts.get("expired", 0),
+                "completed": status_counts.get("completed", 0)
+            },
+            "sweeper": get_pvp_expiry_sweeper().get_status()
         }
         
     except Exception as e:
@@ -1683,10 +1832,8 @@ async def update_transfer_fee_config(
             upsert=True
         )
         
-        # 取得更新後的設定
-        updated_config = await db[Collections.MARKET_CONFIG].find_one(
-            {"type": "transfer_fee"}
-        )
+        # 取得更新後的設定並刷新市場設定快照
+        updated_config = await get_market_config_snapshot().refresh("transfer_fee", db)
         
         message_parts = []
         if fee_rate is not None:
@@ -2150,6 +2297,105 @@ async def get_all_point_logs(
     return await admin_service.get_all_point_logs(limit)
 
 
+# ========== 串流匯出 API ==========
+
+def _export_response(stream, dataset: str, fmt: str) -> StreamingResponse:
+    """包裝串流匯出回應，附上下載檔名"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(
+        stream,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{dataset}_{timestamp}.{extension}"'
+        }
+    )
+
+
+@router.get(
+    "/trades/export",
+    responses={
+        200: {"description": "交易紀錄串流匯出"},
+        401: {"model": ErrorResponse, "description": "未授權"},
+        403: {"model": ErrorResponse, "description": "權限不足"}
+    },
+    summary="串流匯出所有交易紀錄",
+    description="以 NDJSON 或 CSV 格式逐批串流匯出交易紀錄，適合匯出整個營期的資料"
+)
+async def export_all_trades(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="匯出格式：ndjson 或 csv"),
+    limit: Optional[int] = Query(None, ge=1, description="匯出筆數上限（不指定則全部匯出）"),
+    current_user: dict = Depends(get_current_user),
+    export_service: ExportService = Depends(get_export_service)
+) -> StreamingResponse:
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.VIEW_ALL_USERS not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要查看所有使用者權限（目前角色：{user_role.value}）"
+        )
+    
+    return _export_response(export_service.stream_trades(format, limit), "trades", format)
+
+
+@router.get(
+    "/points/history/export",
+    responses={
+        200: {"description": "點數紀錄串流匯出"},
+        401: {"model": ErrorResponse, "description": "未授權"},
+        403: {"model": ErrorResponse, "description": "權限不足"}
+    },
+    summary="串流匯出所有點數紀錄",
+    description="以 NDJSON 或 CSV 格式逐批串流匯出點數紀錄，適合匯出整個營期的資料"
+)
+async def export_all_point_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="匯出格式：ndjson 或 csv"),
+    limit: Optional[int] = Query(None, ge=1, description="匯出筆數上限（不指定則全部匯出）"),
+    current_user: dict = Depends(get_current_user),
+    export_service: ExportService = Depends(get_export_service)
+) -> StreamingResponse:
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.VIEW_ALL_USERS not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要查看所有使用者權限（目前角色：{user_role.value}）"
+        )
+    
+    return _export_response(export_service.stream_point_logs(format, limit), "point_logs", format)
+
+
+@router.get(
+    "/pending-orders/export",
+    responses={
+        200: {"description": "等待撮合訂單串流匯出"},
+        401: {"model": ErrorResponse, "description": "未授權"},
+        403: {"model": ErrorResponse, "description": "權限不足"}
+    },
+    summary="串流匯出所有等待撮合的訂單",
+    description="以 NDJSON 或 CSV 格式逐批串流匯出 pending、partial 和 pending_limit 狀態的訂單"
+)
+async def export_pending_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="匯出格式：ndjson 或 csv"),
+    limit: Optional[int] = Query(None, ge=1, description="匯出筆數上限（不指定則全部匯出）"),
+    current_user: dict = Depends(get_current_user),
+    export_service: ExportService = Depends(get_export_service)
+) -> StreamingResponse:
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.VIEW_ALL_USERS not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要查看所有使用者權限（目前角色：{user_role.value}）"
+        )
+    
+    return _export_response(export_service.stream_pending_orders(format, limit), "pending_orders", format)
+
+
 # 動態價格級距功能已移除，改為固定漲跌限制
 
 
@@ -2220,6 +2466,37 @@ async def get_all_debtors(
         )
 
 
+@router.get(
+    "/debt/dashboard",
+    summary="欠款統計面板",
+    description="一次聚合取得欠款總計、各隊統計與分頁的欠款用戶列表"
+)
+async def get_debt_dashboard(
+    page: int = Query(1, ge=1, description="頁碼"),
+    page_size: int = Query(50, ge=1, le=500, description="每頁筆數"),
+    team: Optional[str] = Query(None, description="只統計指定隊伍"),
+    current_user: dict = Depends(get_current_user),
+    debt_service: DebtService = Depends(get_debt_service)
+) -> dict:
+    """欠款統計面板"""
+    user_role = await RBACService.get_user_role_from_db(current_user)
+    user_permissions = ROLE_PERMISSIONS.get(user_role, set())
+    
+    if Permission.MANAGE_USERS not in user_permissions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"權限不足：需要用戶管理權限（目前角色：{user_role.value}）"
+        )
+    
+    result = await debt_service.get_debt_dashboard(page=page, page_size=page_size, team=team)
+    if not result['success']:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=result['message']
+        )
+    return result
+
+
 @router.get(
     "/debt/user/{user_id}",
     summary="獲取用戶債務訊息",
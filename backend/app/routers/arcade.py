@@ -105,9 +105,6 @@ async def arcade_add_points(
         if request.note:
             operation_note += f", 備註: {request.note}"
         
-        # 獲取操作前餘額
-        balance_before = user.get("points", 0)
-        
         # 檢查帳戶狀態
         if not user.get("enabled", True):
             raise HTTPException(
@@ -121,79 +118,24 @@ async def arcade_add_points(
                 detail="帳戶已凍結，無法進行操作"
             )
         
-        # 檢查是否有欠款，優先償還欠款
-        current_owed = user.get("owed_points", 0)
-        
-        if current_owed > 0:
-            # 有欠款，優先償還
-            current_points = user.get("points", 0)
-            
-            # 總可用於償還的金額 = 現有點數 + 新給予的點數
-            total_available = current_points + request.amount
-            
-            # 計算實際償還金額（不能超過欠款總額）
-            actual_repay = min(total_available, current_owed)
-            
-            # 計算償還後剩餘的點數
-            remaining_points = total_available - actual_repay
-            
-            # 更新邏輯：
-            # 1. 將現有點數歸零
-            # 2. 減少相應的欠款
-            # 3. 設定剩餘點數（如果有的話）
-            update_doc = {
-                "$set": {"points": remaining_points},
-                "$inc": {"owed_points": -actual_repay}
-            }
-            
-            # 如果完全償還欠款，解除凍結
-            if actual_repay >= current_owed:
-                update_doc["$set"]["frozen"] = False
-            
-            await user_service.db[Collections.USERS].update_one(
-                {"_id": user["_id"]},
-                update_doc
-            )
-            
-            # 記錄償還訊息
-            if actual_repay > 0:
-                repay_note = f"遊戲廳加款 {request.amount} 點 + 現有 {current_points} 點，共償還欠款: {actual_repay} 點"
-                await user_service._log_point_change(
-                    user["_id"],
-                    "debt_repayment",
-                    actual_repay,
-                    repay_note,
-                    transaction_id
-                )
-            
-            # 記錄剩餘點數（如果有）
-            if remaining_points > 0:
-                await user_service._log_point_change(
-                    user["_id"],
-                    "arcade_add",
-                    remaining_points,
-                    f"償還欠款後剩餘點數: {remaining_points} 點 - {operation_note}",
-                    transaction_id
-                )
-            
-            balance_after = remaining_points
-        else:
-            # 沒有欠款，直接增加點數
-            await user_service.db[Collections.USERS].update_one(
-                {"_id": user["_id"]},
-                {"$inc": {"points": request.amount}}
-            )
-            
-            # 記錄點數變化
-            await user_service._log_point_change(
-                user["_id"],
-                "arcade_add",
-                request.amount,
-                operation_note,
-                transaction_id
+        # 增加點數，有欠款時優先償還（由帳本引擎一次完成更新與記錄）
+        result = await user_service.ledger.credit(
+            user_id=user["_id"],
+            amount=request.amount,
+            change_type="arcade_add",
+            note=operation_note,
+            transaction_id=transaction_id,
+            repay_note="遊戲廳加款 {amount} 點 + 現有 {points_before} 點，共償還欠款: {repaid} 點",
+            remainder_note="償還欠款後剩餘點數: {net} 點 - {note}"
+        )
+        if not result['success']:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"User not found: {request.from_user}"
             )
-            
-            balance_after = balance_before + request.amount
+        
+        balance_before = result['balance_before']
+        balance_after = result['balance_after']
         
         logger.info(f"Arcade add successful: user {request.from_user}, amount {request.amount}, game {request.game_type}")
         
@@ -246,9 +188,6 @@ async def arcade_manage_points(
             if request.note:
                 operation_note += f", 備註: {request.note}"
             
-            # 獲取操作前餘額
-            balance_before = user.get("points", 0)
-            
             # 檢查帳戶狀態
             if not user.get("enabled", True):
                 raise HTTPException(
@@ -262,65 +201,24 @@ async def arcade_manage_points(
                     detail="帳戶已凍結，無法進行操作"
                 )
             
-            # 檢查是否有欠款，優先償還欠款
-            current_owed = user.get("owed_points", 0)
-            
-            if current_owed > 0:
-                # 有欠款，優先償還
-                current_points = user.get("points", 0)
-                total_available = current_points + request.amount
-                actual_repay = min(total_available, current_owed)
-                remaining_points = total_available - actual_repay
-                
-                update_doc = {
-                    "$set": {"points": remaining_points},
-                    "$inc": {"owed_points": -actual_repay}
-                }
-                
-                if actual_repay >= current_owed:
-                    update_doc["$set"]["frozen"] = False
-                
-                await user_service.db[Collections.USERS].update_one(
-                    {"_id": user["_id"]},
-                    update_doc
-                )
-                
-                if actual_repay > 0:
-                    repay_note = f"遊戲廳加款 {request.amount} 點 + 現有 {current_points} 點，共償還欠款: {actual_repay} 點"
-                    await user_service._log_point_change(
-                        user["_id"],
-                        "debt_repayment",
-                        actual_repay,
-                        repay_note,
-                        transaction_id
-                    )
-                
-                if remaining_points > 0:
-                    await user_service._log_point_change(
-                        user["_id"],
-                        "arcade_add",
-                        remaining_points,
-                        f"償還欠款後剩餘點數: {remaining_points} 點 - {operation_note}",
-                        transaction_id
-                    )
-                
-                balance_after = remaining_points
-            else:
-                # 沒有欠款，直接增加點數
-                await user_service.db[Collections.USERS].update_one(
-                    {"_id": user["_id"]},
-                    {"$inc": {"points": request.amount}}
-                )
-                
-                await user_service._log_point_change(
-                    user["_id"],
-                    "arcade_add",
-                    request.amount,
-                    operation_note,
-                    transaction_id
+            # 增加點數，有欠款時優先償還（由帳本引擎一次完成更新與記錄）
+            result = await user_service.ledger.credit(
+                user_id=user["_id"],
+                amount=request.amount,
+                change_type="arcade_add",
+                note=operation_note,
+                transaction_id=transaction_id,
+                repay_note="遊戲廳加款 {amount} 點 + 現有 {points_before} 點，共償還欠款: {repaid} 點",
+                remainder_note="償還欠款後剩餘點數: {net} 點 - {note}"
+            )
+            if not result['success']:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"User not found: {request.from_user}"
                 )
-                
-                balance_after = balance_before + request.amount
+            
+            balance_before = result['balance_before']
+            balance_after = result['balance_after']
             
             message = f"成功增加 {request.amount} 點"
         
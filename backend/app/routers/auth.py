@@ -3,6 +3,7 @@ from app.application.services import AuthenticationApplicationService
 from app.application.dependencies import get_authentication_application_service
 from app.schemas.user import TelegramOAuthRequest, TelegramOAuthResponse
 from app.core.security import create_user_token
+from app.core.rbac import RBACService
 from app.core.config_refactored import config
 import logging
 
@@ -46,8 +47,9 @@ async def telegram_oauth(
                 message=message
             )
         
-        # 建立 JWT Token
-        token = create_user_token(user_info["id"], auth_request.id)
+        # 登入時查詢一次角色，簽入 JWT Token
+        role = await RBACService.get_user_role_from_db({"user_id": user_info["id"]})
+        token = create_user_token(user_info["id"], auth_request.id, role)
         
         return TelegramOAuthResponse(
             success=True,
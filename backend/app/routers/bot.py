@@ -1,16 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.services.user_service import UserService, get_user_service
 from app.services.admin_service import AdminService, get_admin_service
 from app.schemas.bot import (
     BotStockOrderRequest, BotTransferRequest,
-    BotPortfolioRequest, BotPointHistoryRequest, BotStockOrdersRequest,
+    BotPortfolioRequest, BotPointHistoryRequest, BotStockOrdersRequest, BotStockOrdersPageRequest,
     BotProfileRequest, TelegramWebhookRequest, BroadcastRequest, BroadcastAllRequest,
-    PVPCreateRequest, PVPAcceptRequest, SimplePVPAcceptRequest, PVPResponse
+    PVPCreateRequest, PVPAcceptRequest, SimplePVPAcceptRequest, PVPResponse, PVPExpiryAckRequest
 )
 from app.schemas.user import (
     UserRegistrationResponse, UserPortfolio, StockOrderResponse,
-    TransferResponse, UserPointLog, UserStockOrder
+    TransferResponse, UserPointLog, UserStockOrder, UserStockOrdersPage
 )
+from app.services.team_totals import get_team_totals
 from app.core.security import verify_bot_token
 from typing import List, Dict, Union, Any
 import logging
@@ -145,6 +146,30 @@ async def bot_get_stock_orders(
     return await user_service.get_user_stock_orders_by_username(request.from_user, request.limit)
 
 
+@router.post(
+    "/stock/orders/page",
+    response_model=UserStockOrdersPage,
+    summary="BOT 分頁查詢股票訂單",
+    description="以游標分頁查詢使用者的股票訂單，進行中的訂單排在前面，只回傳顯示需要的欄位"
+)
+async def bot_get_stock_orders_page(
+    request: BotStockOrdersPageRequest,
+    token_verified: bool = Depends(verify_bot_token),
+    user_service: UserService = Depends(get_user_service)
+) -> UserStockOrdersPage:
+    """
+    BOT 分頁查詢使用者股票訂單
+
+    Args:
+        request: 包含 from_user、每頁筆數與游標的請求
+        token_verified: token 驗證結果（透過 header 傳入）
+
+    Returns:
+        本頁訂單與下一頁游標
+    """
+    return await user_service.get_user_stock_orders_page(request.from_user, request.limit, request.cursor)
+
+
 @router.delete(
     "/stock/order/{order_id}",
     response_model=dict,
@@ -306,21 +331,19 @@ async def bot_get_students(
     description="透過 BOT 取得所有隊伍的基本資料，包括隊伍名稱、成員數量等"
 )
 async def bot_get_teams(
-    token_verified: bool = Depends(verify_bot_token),
-    admin_service: AdminService = Depends(get_admin_service)
+    token_verified: bool = Depends(verify_bot_token)
 ) -> List[Dict[str, Any]]:
     """
-    BOT 取得所有隊伍資料
+    BOT 取得所有隊伍資料（來自隊伍點數總和投影）
     
     Args:
         token_verified: token 驗證結果（透過 header 傳入）
-        admin_service: 管理員服務（自動注入）
         
     Returns:
         所有隊伍的基本資料列表
     """
     try:
-        return await admin_service.list_all_teams()
+        return await get_team_totals().list_teams()
         
     except Exception as e:
         logger.error(f"BOT failed to get teams: {e}")
@@ -330,6 +353,43 @@ async def bot_get_teams(
         )
 
 
+@router.get(
+    "/teams/{name}",
+    response_model=Dict[str, Any],
+    summary="BOT 取得單一隊伍點數",
+    description="透過 BOT 取得單一隊伍的成員數量與點數總和，資料來自預先維護的隊伍總和投影"
+)
+async def bot_get_team(
+    name: str,
+    token_verified: bool = Depends(verify_bot_token)
+) -> Dict[str, Any]:
+    """
+    BOT 取得單一隊伍點數
+    
+    Args:
+        name: 隊伍名稱
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        隊伍名稱、成員數量與點數總和
+    """
+    try:
+        team = await get_team_totals().get_team(name)
+    except Exception as e:
+        logger.error(f"BOT failed to get team {name}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve team data"
+        )
+    
+    if team is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="隊伍不存在"
+        )
+    return team
+
+
 # ========== BOT PVP 猜拳 ==========
 
 @router.post(
@@ -461,6 +521,121 @@ async def bot_simple_accept_pvp_challenge(
     return await user_service.simple_accept_pvp_challenge(request.from_user, request.challenge_id)
 
 
+@router.post(
+    "/pvp/message",
+    response_model=dict,
+    summary="BOT 記錄 PVP 挑戰訊息",
+    description="記錄挑戰訊息的 message_id，讓 BOT 重啟後仍能編輯原始挑戰訊息"
+)
+async def bot_set_pvp_challenge_message(
+    request: dict,
+    token_verified: bool = Depends(verify_bot_token),
+    user_service: UserService = Depends(get_user_service)
+):
+    """
+    BOT 記錄 PVP 挑戰訊息
+    
+    Args:
+        request: 包含挑戰 ID 和訊息 ID
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        是否記錄成功
+    """
+    challenge_id = request.get("challenge_id")
+    message_id = request.get("message_id")
+    
+    if not challenge_id or message_id is None:
+        return {
+            "success": False,
+            "message": "缺少必要參數：challenge_id 或 message_id"
+        }
+    
+    return await user_service.set_pvp_challenge_message(challenge_id, int(message_id))
+
+
+@router.get(
+    "/pvp/open",
+    response_model=dict,
+    summary="BOT 列出進行中的 PVP 挑戰",
+    description="列出所有尚未到期的 PVP 挑戰，供 BOT 啟動時重建挑戰狀態"
+)
+async def bot_get_open_pvp_challenges(
+    token_verified: bool = Depends(verify_bot_token),
+    user_service: UserService = Depends(get_user_service)
+):
+    """
+    BOT 列出進行中的 PVP 挑戰
+    
+    Args:
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        進行中的挑戰列表（依到期時間排序）
+    """
+    return await user_service.get_open_pvp_challenges()
+
+
+@router.post(
+    "/pvp/expired/claim",
+    response_model=dict,
+    summary="BOT 取出已過期的 PVP 挑戰",
+    description="取出背景掃描器標記為過期、尚未通知的 PVP 挑戰；送出後需以 /pvp/expired/ack 回報"
+)
+async def bot_claim_expired_pvp_challenges(
+    limit: int = Query(100, ge=1, le=500),
+    token_verified: bool = Depends(verify_bot_token)
+):
+    """
+    BOT 取出已過期的 PVP 挑戰
+
+    BOT 以單一輪詢取代每個挑戰各自的倒數計時，收到後發送過期通知。
+    
+    Args:
+        limit: 最多取出的挑戰數量
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        過期挑戰列表
+    """
+    from app.services.pvp_expiry import get_pvp_expiry_sweeper
+    
+    challenges = await get_pvp_expiry_sweeper().claim_expired(limit)
+    return {
+        "success": True,
+        "challenges": challenges
+    }
+
+
+@router.post(
+    "/pvp/expired/ack",
+    response_model=dict,
+    summary="BOT 回報過期通知結果",
+    description="已送出的挑戰標記為已通知，送出失敗的挑戰釋放租約以便重試"
+)
+async def bot_ack_expired_pvp_challenges(
+    request: PVPExpiryAckRequest,
+    token_verified: bool = Depends(verify_bot_token)
+):
+    """
+    BOT 回報過期通知結果
+    
+    Args:
+        request: 已送出與送出失敗的挑戰 ID
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        標記與釋放的數量
+    """
+    from app.services.pvp_expiry import get_pvp_expiry_sweeper
+    
+    result = await get_pvp_expiry_sweeper().ack_expired(request.delivered, request.failed)
+    return {
+        "success": True,
+        **result
+    }
+
+
 @router.get(
     "/pvp/user-challenges/{user_id}",
     response_model=dict,
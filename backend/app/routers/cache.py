@@ -4,8 +4,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.services.cache_service import get_cache_service
 from app.services.cache_invalidation import get_cache_invalidator
-from app.core.rbac import RBACService, Permission
-from app.core.security import get_current_user
+from app.services.user_identity_service import get_user_identity_resolver
+from app.services.market_config_snapshot import get_market_config_snapshot
+from app.services.price_band import get_price_band
+from app.core.rbac import RBACService, Permission, get_role_claim_registry
+from app.core.security import get_current_user, get_token_verification_cache
 from typing import Dict, Any
 import logging
 
@@ -31,6 +34,11 @@ async def get_cache_stats(
         )
     
     stats = cache_service.get_stats()
+    stats["identity_resolver"] = get_user_identity_resolver().get_stats()
+    stats["role_claims"] = get_role_claim_registry().get_stats()
+    stats["jwt_verification"] = get_token_verification_cache().get_stats()
+    stats["market_config"] = get_market_config_snapshot().get_status()
+    stats["price_band"] = get_price_band().get_status()
     
     return {
         "status": "success",
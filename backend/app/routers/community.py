@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Query
 from app.core.database import get_database, Collections
 from app.schemas.public import ErrorResponse
+from app.services.points_ledger import PointsLedger
 from datetime import datetime, timezone
 import logging
 
@@ -215,40 +216,28 @@ async def community_give_points(
         # 發放點數
         now = datetime.now(timezone.utc)
         
-        # 更新學員點數
-        result = await db[Collections.USERS].update_one(
-            {"_id": user["_id"]},
-            {
-                "$inc": {"points": points},
-                "$set": {"updated_at": now}
+        # 更新學員點數並記錄點數歷史（帳本引擎由回傳文件計算餘額，不需重新查詢）
+        # 社群獎勵不自動償還欠款，確保每次發放都留下 community_reward 記錄供重複檢查
+        result = await PointsLedger(db).credit(
+            user_id=user["_id"],
+            amount=points,
+            change_type="community_reward",
+            note=f"{note} (來自 {community_name})",
+            repay_debt=False,
+            extra_set={"updated_at": now},
+            extra_log_fields={
+                "username": student_username,
+                "source": "community_booth",
+                "community": community_name
             }
         )
         
-        if result.modified_count == 0:
+        if not result['success']:
             return {
                 "success": False,
                 "message": "更新學員點數失敗"
             }
         
-        # 獲取更新後的餘額
-        updated_user = await db[Collections.USERS].find_one({"_id": user["_id"]})
-        balance_after = updated_user.get("points", 0) if updated_user else 0
-        
-        # 記錄點數歷史
-        point_record = {
-            "user_id": user["_id"],  # 使用 ObjectId 以保持與查詢邏輯一致
-            "username": student_username,
-            "amount": points,
-            "balance_after": balance_after,  # 使用實際更新後的餘額
-            "type": "community_reward",
-            "note": f"{note} (來自 {community_name})",
-            "source": "community_booth",
-            "community": community_name,
-            "created_at": now
-        }
-        
-        await db[Collections.POINT_LOGS].insert_one(point_record)
-        
         logger.info(f"社群 {community_name} 給學員 {student_username} 發放了 {points} 點數")
         
         return {
@@ -259,7 +248,7 @@ async def community_give_points(
             "student_photo_url": user.get("photo_url"),
             "student_team": user.get("team"),
             "points": points,
-            "new_balance": user["points"] + points,
+            "new_balance": result['balance_after'],
             "community": community_name
         }
         
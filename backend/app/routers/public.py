@@ -377,14 +377,10 @@ async def get_transfer_fee_config():
         - minFee: 最低手續費 (點數)
     """
     try:
-        from app.core.database import get_database, Collections
-        
-        db = get_database()
+        from app.services.market_config_snapshot import get_market_config_snapshot
         
-        # 查詢手續費設定
-        fee_config = await db[Collections.MARKET_CONFIG].find_one({
-            "type": "transfer_fee"
-        })
+        # 查詢手續費設定（市場設定快照）
+        fee_config = await get_market_config_snapshot().get("transfer_fee")
         
         if fee_config:
             return {
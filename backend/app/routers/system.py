@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from app.services.user_service import UserService, get_user_service
+from app.services.roster_import import read_roster_csv
 from app.schemas.system import (
     StudentUpdateRequest, StudentUpdateResponse, StudentInfo,
     StudentActivationRequest, StudentActivationResponse
@@ -52,6 +53,34 @@ async def activate_student(
         )
 
 
+def _student_update_response(result: dict) -> StudentUpdateResponse:
+    """將 update_students 的結果轉換為回應格式"""
+    if not result["success"]:
+        return StudentUpdateResponse(
+            ok=False,
+            message=result["message"],
+            students=[]
+        )
+    
+    # 轉換學生列表格式
+    students = [
+        StudentInfo(
+            id=student["id"],
+            name=student["name"], 
+            team=student.get("team"),
+            enabled=student.get("enabled", False)
+        )
+        for student in result["students"]
+    ]
+    
+    return StudentUpdateResponse(
+        ok=True,
+        message=result["message"],
+        students=students,
+        results=result.get("results", [])
+    )
+
+
 @router.post(
     "/users/update",
     response_model=StudentUpdateResponse,
@@ -80,29 +109,7 @@ async def update_students(
         # 批量更新學員資料
         result = await user_service.update_students(student_data_dicts)
         
-        if result["success"]:
-            # 轉換學生列表格式
-            students = [
-                StudentInfo(
-                    id=student["id"],
-                    name=student["name"], 
-                    team=student.get("team"),
-                    enabled=student.get("enabled", False)
-                )
-                for student in result["students"]
-            ]
-            
-            return StudentUpdateResponse(
-                ok=True,
-                message=result["message"],
-                students=students
-            )
-        else:
-            return StudentUpdateResponse(
-                ok=False,
-                message=result["message"],
-                students=[]
-            )
+        return _student_update_response(result)
                 
     except Exception as e:
         logger.error(f"學員更新失敗: {str(e)}")
@@ -110,3 +117,44 @@ async def update_students(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="更新失敗，請聯繫管理員"
         )
+
+
+@router.post(
+    "/users/import",
+    response_model=StudentUpdateResponse,
+    summary="匯入學員名單",
+    description="上傳 CSV 名單（需有 id,name,team 標頭）批量新增或更新學員"
+)
+async def import_students(
+    file: UploadFile = File(..., description="學員名單 CSV"),
+    token_verified: bool = Depends(verify_bot_token),
+    user_service: UserService = Depends(get_user_service)
+) -> StudentUpdateResponse:
+    """
+    以 CSV 匯入學員名單
+    
+    Args:
+        file: 學員名單 CSV
+        token_verified: token 驗證結果（透過 header 傳入）
+        
+    Returns:
+        更新結果、學生列表與每一列的處理結果
+    """
+    try:
+        rows = await read_roster_csv(file)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"CSV 格式錯誤: {str(e)}"
+        )
+    
+    try:
+        result = await user_service.update_students(rows)
+        return _student_update_response(result)
+        
+    except Exception as e:
+        logger.error(f"學員名單匯入失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="匯入失敗，請聯繫管理員"
+        )
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.services.user_service import UserService, get_user_service
 from app.services.admin_service import AdminService, get_admin_service
+from app.services.qr_code_service import QRCodeService, get_qr_code_service
 from app.schemas.user import (
     UserPortfolio, StockOrderRequest, StockOrderResponse,
     TransferRequest, TransferResponse, UserPointLog, UserStockOrder, UserBasicInfo
 )
 from app.schemas.public import UserAssetDetail, ErrorResponse, QRCodeRedeemRequest, QRCodeRedeemResponse, GivePointsRequest, PointLog
 from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 from app.core.security import get_current_user
 from app.core.rbac import RBACService, Permission
@@ -24,6 +26,10 @@ class QRCodeCreateRequest(BaseModel):
     qr_data: str = Field(..., description="QR Code 資料")
     points: int = Field(..., description="點數數量")
 
+class QRCodeBulkCreateRequest(BaseModel):
+    count: int = Field(..., ge=1, le=5000, description="產生數量")
+    points: int = Field(..., ge=1, le=1000, description="每個 QR Code 的點數數量")
+
 class QRCodeRecord(BaseModel):
     id: str = Field(..., description="QR Code ID")
     qr_data: str = Field(..., description="QR Code 資料")
@@ -34,6 +40,10 @@ class QRCodeRecord(BaseModel):
     used_at: Optional[datetime] = Field(None, description="使用時間")
     created_by: str = Field(..., description="創建者ID")
 
+class QRCodeBulkCreateResponse(BaseModel):
+    created_count: int = Field(..., description="建立數量")
+    records: List[QRCodeRecord] = Field(..., description="建立的 QR Code 記錄")
+
 
 # ========== 使用者資產管理 ==========
 
@@ -518,7 +528,7 @@ async def get_teams(
 async def redeem_qr_code(
     request: QRCodeRedeemRequest,
     current_user: dict = Depends(get_current_user),
-    admin_service: AdminService = Depends(get_admin_service)
+    qr_code_service: QRCodeService = Depends(get_qr_code_service)
 ) -> QRCodeRedeemResponse:
     """
     QR Code 兌換點數
@@ -526,13 +536,12 @@ async def redeem_qr_code(
     Args:
         request: QR Code 兌換請求
         current_user: 目前使用者資訊（從 JWT Token 解析）
-        admin_service: 管理員服務（自動注入）
+        qr_code_service: QR Code 服務（自動注入）
         
     Returns:
         兌換結果
     """
     import json
-    from datetime import datetime
     
     try:
         # 解析 QR Code 資料
@@ -554,54 +563,9 @@ async def redeem_qr_code(
                 detail="QR Code 資料不完整"
             )
         
-        # 檢查 QR Code 是否已經使用過
-        from app.core.database import get_database, Collections
-        db = get_database()
-        
-        # 檢查 QR Code 記錄是否存在且未使用
-        qr_record = await db[Collections.QR_CODES].find_one({"id": qr_id})
-        
-        if not qr_record:
-            return QRCodeRedeemResponse(
-                ok=False,
-                message="無效的 QR Code"
-            )
-        
-        if qr_record.get("used", False):
-            return QRCodeRedeemResponse(
-                ok=False,
-                message=f"此 QR Code 已經被 {qr_record.get('used_by', '其他人')} 兌換過了"
-            )
-        
-        # 給予點數
-        give_points_request = GivePointsRequest(
-            username=current_user["user_id"],
-            type="user",
-            amount=points
-        )
-        
-        # 給予點數
-        await admin_service.give_points(give_points_request)
-        
-        # 標記 QR Code 為已使用
-        await db[Collections.QR_CODES].update_one(
-            {"id": qr_id},
-            {
-                "$set": {
-                    "used": True,
-                    "used_by": current_user["user_id"],
-                    "used_at": datetime.now()
-                }
-            }
-        )
-        
-        # 點數記錄已由 admin_service.give_points 處理，不需要重複記錄
-        
-        return QRCodeRedeemResponse(
-            ok=True,
-            message=f"成功兌換 {points} 點數！",
-            points=points
-        )
+        # 原子地佔用 QR Code 並在同一個交易內入帳
+        result = await qr_code_service.redeem(qr_id, current_user["user_id"])
+        return QRCodeRedeemResponse(**result)
         
     except json.JSONDecodeError:
         raise HTTPException(
@@ -701,6 +665,11 @@ async def create_qr_code(
         
         return QRCodeRecord(**qr_record)
         
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="QR Code ID 已存在"
+        )
     except json.JSONDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -714,6 +683,50 @@ async def create_qr_code(
         )
 
 
+@router.post(
+    "/qr/bulk-create",
+    response_model=QRCodeBulkCreateResponse,
+    summary="批次產生 QR Code",
+    description="一次產生大量 QR Code 記錄（供列印），以單次批次寫入資料庫"
+)
+async def bulk_create_qr_codes(
+    request: QRCodeBulkCreateRequest,
+    current_user: dict = Depends(get_current_user),
+    qr_code_service: QRCodeService = Depends(get_qr_code_service)
+) -> QRCodeBulkCreateResponse:
+    """
+    批次產生 QR Code 記錄
+    
+    Args:
+        request: 產生數量與每個 QR Code 的點數
+        current_user: 目前使用者資訊（從 JWT Token 解析）
+        qr_code_service: QR Code 服務（自動注入）
+        
+    Returns:
+        建立的 QR Code 記錄
+    """
+    # 檢查權限
+    if not RBACService.has_permission(current_user, Permission.GENERATE_QRCODE):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="權限不足：需要 QR Code 生成權限"
+        )
+    
+    try:
+        records = await qr_code_service.create_bulk(request.count, request.points, current_user["user_id"])
+        return QRCodeBulkCreateResponse(
+            created_count=len(records),
+            records=[QRCodeRecord(**record) for record in records]
+        )
+        
+    except Exception as e:
+        logger.error(f"批次產生 QR Code 失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="批次產生 QR Code 失敗"
+        )
+
+
 @router.get(
     "/qr/list",
     response_model=List[QRCodeRecord],
@@ -63,6 +63,13 @@ class BotStockOrdersRequest(BaseModel):
     limit: int = Field(default=50, gt=0, le=100, description="查詢筆數限制")
 
 
+class BotStockOrdersPageRequest(BaseModel):
+    """BOT 分頁查詢股票訂單請求"""
+    from_user: str = Field(..., description="使用者id")
+    limit: int = Field(default=8, gt=0, le=50, description="每頁筆數")
+    cursor: Optional[str] = Field(None, description="上一頁回傳的 next_cursor，第一頁不帶")
+
+
 class BotProfileRequest(BaseModel):
     """BOT 查詢使用者資料請求"""
     from_user: str = Field(..., description="使用者id")
@@ -127,6 +134,12 @@ class SimplePVPAcceptRequest(BaseModel):
     challenge_id: str = Field(..., description="挑戰 ID")
 
 
+class PVPExpiryAckRequest(BaseModel):
+    """回報過期通知結果請求"""
+    delivered: List[str] = Field(default_factory=list, description="已送出通知的挑戰 ID")
+    failed: List[str] = Field(default_factory=list, description="送出失敗、需要重試的挑戰 ID")
+
+
 class PVPResponse(BaseModel):
     """PVP 操作回應"""
     success: bool = Field(..., description="操作是否成功")
@@ -25,11 +25,20 @@ class StudentInfo(BaseModel):
     enabled: bool = Field(False, description="是否已啟用")
 
 
+class StudentImportRowResult(BaseModel):
+    """名單匯入單列結果"""
+    row: int = Field(..., description="列索引（從 0 開始）")
+    id: Optional[str] = Field(None, description="學員ID")
+    status: str = Field(..., description="created / updated / unchanged / skipped / error")
+    error: Optional[str] = Field(None, description="錯誤訊息")
+
+
 class StudentUpdateResponse(BaseModel):
     """學員資料更新回應"""
     ok: bool = Field(..., description="是否成功")
     message: str = Field(..., description="更新狀況")
     students: List[StudentInfo] = Field(..., description="學生列表")
+    results: List[StudentImportRowResult] = Field([], description="每一列的處理結果")
 
 
 class StudentActivationRequest(BaseModel):
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -185,3 +185,22 @@ class UserStockOrder(BaseModel):
     status: str = Field(..., description="狀態")
     created_at: str = Field(..., description="建立時間")
     executed_at: Optional[str] = Field(None, description="成交時間")
+
+
+# 使用者股票訂單（分頁摘要，只含 BOT 顯示需要的欄位）
+class UserStockOrderSummary(BaseModel):
+    order_type: str = Field(..., description="訂單類型")
+    side: str = Field(..., description="買賣方向")
+    quantity: int = Field(..., description="數量（進行中為剩餘數量，已成交為成交數量）")
+    price: Optional[int] = Field(None, description="價格（元）")
+    status: str = Field(..., description="狀態")
+    filled_quantity: int = Field(0, description="已成交數量")
+    filled_price: Optional[float] = Field(None, description="成交價格")
+    created_at: str = Field(..., description="建立時間")
+
+
+class UserStockOrdersPage(BaseModel):
+    orders: List[UserStockOrderSummary] = Field(..., description="本頁訂單（進行中的訂單在前，各自依建立時間新到舊）")
+    next_cursor: Optional[str] = Field(None, description="下一頁游標，沒有下一頁時為 None")
+    total_count: Optional[int] = Field(None, description="訂單總數（只在第一頁回傳）")
+    open_count: Optional[int] = Field(None, description="進行中訂單數（只在第一頁回傳）")
@@ -20,6 +20,11 @@ import logging
 import os
 import requests
 from app.core.config_refactored import config
+from app.services.market_calendar import get_market_calendar
+from app.services.market_config_snapshot import get_market_config_snapshot
+from app.services.points_ledger import PointsLedger
+from app.services.bulk_operations import BulkOperationsService
+from app.services.integrity_audit import IntegrityAuditService
 
 
 logger = logging.getLogger(__name__)
@@ -40,6 +45,9 @@ class AdminService:
             self.db = get_database()
         else:
             self.db = db
+        self.ledger = PointsLedger(self.db)
+        self.bulk_operations = BulkOperationsService(self.db)
+        self.integrity_audit = IntegrityAuditService(self.db)
 
     # 管理員登入
     async def login(self, request: AdminLoginRequest) -> AdminLoginResponse:
@@ -132,78 +140,21 @@ class AdminService:
                         {"name": request.username},
                         {"id": request.username}
                     ]
-                })
+                }, {"_id": 1})
                 if not user:
                     raise UserNotFoundException(request.username)
 
-                # 檢查是否有欠款，優先償還欠款
-                current_owed = user.get("owed_points", 0)
-                
-                if current_owed > 0:
-                    # 有欠款，優先償還
-                    # 先取得目前有多少點數，全部用來償還欠款
-                    current_points = user.get("points", 0)
-                    
-                    # 總可用於償還的金額 = 現有點數 + 新給予的點數
-                    total_available = current_points + request.amount
-                    
-                    # 計算實際償還金額（不能超過欠款總額）
-                    actual_repay = min(total_available, current_owed)
-                    
-                    # 計算償還後剩餘的點數
-                    remaining_points = total_available - actual_repay
-                    
-                    # 更新邏輯：
-                    # 1. 將現有點數歸零
-                    # 2. 減少相應的欠款
-                    # 3. 設定剩餘點數（如果有的話）
-                    update_doc = {
-                        "$set": {"points": remaining_points},
-                        "$inc": {"owed_points": -actual_repay}
-                    }
-                    
-                    # 如果完全償還欠款，解除凍結
-                    if actual_repay >= current_owed:
-                        update_doc["$set"]["frozen"] = False
-                    
-                    await self.db[Collections.USERS].update_one(
-                        {"_id": user["_id"]},
-                        update_doc
-                    )
-                    
-                    # 記錄償還訊息
-                    if actual_repay > 0:
-                        repay_note = f"管理員給予 {request.amount} 點 + 現有 {current_points} 點，共償還欠款: {actual_repay} 點"
-                        await self._log_point_change(
-                            user["_id"],
-                            "debt_repayment",
-                            actual_repay,
-                            repay_note
-                        )
-                    
-                    # 記錄剩餘點數（如果有）
-                    if remaining_points > 0:
-                        await self._log_point_change(
-                            user["_id"],
-                            "admin_grant",
-                            remaining_points,
-                            f"償還欠款後剩餘點數: {remaining_points} 點"
-                        )
-                else:
-                    # 沒有欠款，直接增加點數
-                    await self.db[Collections.USERS].update_one(
-                        {"_id": user["_id"]},
-                        {"$inc": {"points": request.amount}}
-                    )
-                    
-                    # 記錄點數變化
-                    await self._log_point_change(
-                        user["_id"],
-                        "admin_grant",
-                        request.amount,
-                        f"管理員給予點數: {request.amount} 點"
-                    )
-
+                # 增加點數，有欠款時優先償還（償還、解除凍結與日誌由帳本引擎一次完成）
+                result = await self.ledger.credit(
+                    user_id=user["_id"],
+                    amount=request.amount,
+                    change_type="admin_grant",
+                    note=f"管理員給予點數: {request.amount} 點",
+                    repay_note="管理員給予 {amount} 點 + 現有 {points_before} 點，共償還欠款: {repaid} 點",
+                    remainder_note="償還欠款後剩餘點數: {net} 點"
+                )
+                if not result['success']:
+                    raise UserNotFoundException(request.username)
 
                 message = f"Successfully gave {request.amount} points to user {request.username}"
 
@@ -211,32 +162,16 @@ class AdminService:
                 # 給群組所有成員點數 - 直接使用 team 字段
                 team_name = request.username  # 這裡 username 實際是 team name
 
-                # 找到該團隊的所有成員
-                users_cursor = self.db[Collections.USERS].find(
-                    {"team": team_name}
+                # 批次更新成員點數並一次寫入日誌
+                result = await self.bulk_operations.grant_team_points(
+                    team_name,
+                    request.amount,
+                    note=f"管理員給予群組 {team_name} 點數"
                 )
-                users = await users_cursor.to_list(length=None)
-
-                if not users:
+                if result["updated_users"] == 0:
                     raise GroupNotFoundException(team_name)
 
-                # 批量更新點數
-                user_ids = [user["_id"] for user in users]
-                await self.db[Collections.USERS].update_many(
-                    {"_id": {"$in": user_ids}},
-                    {"$inc": {"points": request.amount}}
-                )
-
-                # 記錄所有使用者的點數變化
-                for user in users:
-                    await self._log_point_change(
-                        user["_id"],
-                        "admin_give_group",
-                        request.amount,
-                        note=f"管理員給予群組 {team_name} 點數"
-                    )
-
-                message = f"Successfully gave {request.amount} points to {len(users)} users in group {team_name}"
+                message = f"Successfully gave {request.amount} points to {result['updated_users']} users in group {team_name}"
 
             else:
                 raise AdminException("Invalid type, must be 'user' or 'group'")
@@ -384,6 +319,9 @@ class AdminService:
                 upsert=True
             )
 
+            # 重新編譯記憶體中的交易時間行事曆
+            get_market_calendar().update_slots(market_config["openTime"])
+
             logger.info("Market hours updated successfully")
             return MarketUpdateResponse(ok=True)
 
@@ -399,6 +337,7 @@ class AdminService:
                 await self.db[Collections.MARKET_CONFIG].delete_one(
                     {"type": "trading_limit"}
                 )
+                await get_market_config_snapshot().refresh("trading_limit", self.db)
                 logger.info("Trading limit cleared, using default fixed limit")
                 return MarketLimitResponse(
                     ok=True, 
@@ -422,6 +361,7 @@ class AdminService:
                 {"$set": limit_config},
                 upsert=True
             )
+            await get_market_config_snapshot().refresh("trading_limit", self.db)
 
             logger.info(
                 f"Trading limit set to {request.limit_percent}% ({limit_in_basis_points} bp)")
@@ -590,38 +530,9 @@ class AdminService:
     # 最終結算：將所有使用者的股票以固定價格換算為點數並清空股票
     async def final_settlement(self, final_price: int = 20) -> GivePointsResponse:
         try:
-            users_cursor = self.db[Collections.USERS].find({})
-            users = await users_cursor.to_list(length=None)
-            updated_users = 0
-
-            for user in users:
-                user_id = user["_id"]
-                stocks_doc = await self.db[Collections.STOCKS].find_one({"user_id": user_id}) or {}
-                stock_amount = stocks_doc.get("stock_amount", 0)
-
-                if stock_amount > 0:
-                    gain = stock_amount * final_price
-
-                    # 更新點數與清除股票
-                    await self.db[Collections.USERS].update_one(
-                        {"_id": user_id},
-                        {
-                            "$inc": {"points": gain},
-                        }
-                    )
-                    await self.db[Collections.STOCKS].update_one(
-                        {"user_id": user_id},
-                        {"$set": {"stock_amount": 0}}
-                    )
-
-                    await self._log_point_change(
-                        user_id=user_id,
-                        operation_type="final_settlement",
-                        amount=gain,
-                        note=f"最終結算：{stock_amount} 股 × {final_price} 元"
-                    )
-
-                    updated_users += 1
+            # 以聚合取得持股並批次轉換為點數
+            settlement = await self.bulk_operations.settle_all_holdings(final_price)
+            updated_users = settlement["settled_users"]
 
             # 清除所有進行中的掛單
             cancelled_orders_result = await self.db[Collections.STOCK_ORDERS].update_many(
@@ -667,10 +578,9 @@ class AdminService:
             dict: 檢查結果和修復統計
         """
         try:
-            # 查找所有負點數的使用者
-            negative_users = await self.db[Collections.USERS].find(
-                {"points": {"$lt": 0}}
-            ).to_list(None)
+            # 以聚合在資料庫端找出負點數使用者
+            balances = await self.integrity_audit.audit_balances()
+            negative_users = balances["negative"]
 
             if not negative_users:
                 return {
@@ -682,41 +592,12 @@ class AdminService:
                 }
 
             # 準備負點數使用者列表
-            negative_user_list = []
-            for user in negative_users:
-                user_info = {
-                    "user_id": str(user["_id"]),
-                    "username": user.get("username", user.get("name", "未知")),
-                    "points": user.get("points", 0),
-                    "team": user.get("team", "無")
-                }
-                negative_user_list.append(user_info)
+            negative_user_list = [self.integrity_audit.format_negative_user(user) for user in negative_users]
 
             fixed_count = 0
             if fix_mode:
-                # 修復模式：將所有負點數設為0
-                for user in negative_users:
-                    original_points = user.get("points", 0)
-
-                    # 設定點數為0
-                    await self.db[Collections.USERS].update_one(
-                        {"_id": user["_id"]},
-                        {"$set": {"points": 0}}
-                    )
-
-                    # 記錄修復操作
-                    from app.services.user_service import UserService
-                    user_service = UserService(self.db)
-                    await user_service._log_point_change(
-                        user_id=user["_id"],
-                        change_type="admin_fix",
-                        amount=abs(original_points),
-                        note=f"系統修復負點數：{original_points} -> 0"
-                    )
-
-                    fixed_count += 1
-                    logger.info(
-                        f"Fixed negative balance for user {user.get('username', user['_id'])}: {original_points} -> 0")
+                # 修復模式：批次將所有負點數設為0並寫入修復日誌
+                fixed_count = await self.integrity_audit.fix_negative_balances(negative_users)
 
                 # 傳送系統公告
                 await self._send_system_announcement(
@@ -745,31 +626,15 @@ class AdminService:
             dict: 檢查結果統計
         """
         try:
-            # 取得所有使用者
-            all_users = await self.db[Collections.USERS].find({}).to_list(None)
-
-            negative_users = []
-            total_checked = 0
-
-            for user in all_users:
-                total_checked += 1
-                user_id = user["_id"]
-                current_balance = user.get("points", 0)
-
-                if current_balance < 0:
-                    username = user.get("username", user.get("name", "未知"))
-                    team = user.get("team", "無")
-
-                    negative_users.append({
-                        "user_id": str(user_id),
-                        "username": username,
-                        "team": team,
-                        "points": current_balance
-                    })
-
-                    # 傳送即時警報
-                    logger.error(
-                        f"SYSTEM-WIDE CHECK: Negative balance detected - User: {username}, Balance: {current_balance}")
+            # 一次聚合取得使用者總數與負點數使用者
+            balances = await self.integrity_audit.audit_balances()
+            total_checked = balances["total_users"]
+            negative_users = [self.integrity_audit.format_negative_user(user) for user in balances["negative"]]
+
+            for user in negative_users:
+                # 傳送即時警報
+                logger.error(
+                    f"SYSTEM-WIDE CHECK: Negative balance detected - User: {user['username']}, Balance: {user['points']}")
 
             # 如果發現負點數，傳送彙總報告
             if negative_users:
@@ -0,0 +1,242 @@
+"""
+批次操作服務 - 管理員大量異動點數與持股
+
+隊伍發放點數與最終結算原本逐位使用者查詢、更新、寫日誌，
+耗時隨人數乘上 Mongo 延遲成長。這裡改為：一次查詢（或聚合 join 持股）、
+分批 bulk_write 更新餘額與持股、insert_many 寫入日誌，並記錄進度。
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 每批送出的寫入筆數
+BULK_BATCH_SIZE = 1000
+
+# 保留最近幾筆批次工作的進度紀錄
+MAX_TRACKED_JOBS = 20
+
+
+class BulkJobProgress:
+    """批次工作進度"""
+
+    def __init__(self, job_type: str, total: int = 0):
+        self.job_id = str(uuid.uuid4())
+        self.job_type = job_type
+        self.total = total
+        self.processed = 0
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+
+    def advance(self, count: int) -> None:
+        self.processed += count
+        logger.info(f"Bulk job {self.job_type} ({self.job_id}): {self.processed}/{self.total}")
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "job_type": self.job_type,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+# 最近的批次工作（新的在後）
+_bulk_jobs: List[BulkJobProgress] = []
+
+
+def get_bulk_jobs() -> List[Dict[str, Any]]:
+    """取得最近批次工作的進度"""
+    return [job.to_dict() for job in reversed(_bulk_jobs)]
+
+
+def _track_job(job_type: str) -> BulkJobProgress:
+    job = BulkJobProgress(job_type)
+    _bulk_jobs.append(job)
+    del _bulk_jobs[:-MAX_TRACKED_JOBS]
+    return job
+
+
+def get_bulk_operations_service() -> BulkOperationsService:
+    """BulkOperationsService 的依賴注入函數"""
+    return BulkOperationsService()
+
+
+class BulkOperationsService:
+    def __init__(self, db: AsyncIOMotorDatabase = None, batch_size: int = BULK_BATCH_SIZE):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.batch_size = batch_size
+
+    async def _flush(self, user_ops: List[UpdateOne], stock_ops: List[UpdateOne],
+                     logs: List[dict]) -> None:
+        """送出一批餘額、持股更新與日誌"""
+        if user_ops:
+            await self.db[Collections.USERS].bulk_write(user_ops, ordered=False)
+        if stock_ops:
+            await self.db[Collections.STOCKS].bulk_write(stock_ops, ordered=False)
+        if logs:
+            await self.db[Collections.POINT_LOGS].insert_many(logs, ordered=False)
+
+    async def _balances(self, user_ids: List[Any]) -> Dict[Any, int]:
+        """更新後一次讀回這批使用者的點數，作為日誌的 balance_after"""
+        users = await self.db[Collections.USERS].find(
+            {"_id": {"$in": user_ids}}, {"points": 1}
+        ).to_list(length=None)
+        return {user["_id"]: user.get("points", 0) for user in users}
+
+    # ========== 隊伍發放 ==========
+
+    async def grant_team_points(self, team_name: str, amount: int,
+                                change_type: str = "admin_give_group",
+                                note: str = None) -> Dict[str, Any]:
+        """
+        給隊伍所有成員點數
+
+        Returns:
+            dict: updated_users、job（進度紀錄）；找不到成員時 updated_users 為 0
+        """
+        job = _track_job("team_grant")
+        try:
+            members = await self.db[Collections.USERS].find(
+                {"team": team_name}, {"_id": 1}
+            ).to_list(length=None)
+            job.total = len(members)
+
+            if not members:
+                job.finish()
+                return {"updated_users": 0, "job": job.to_dict()}
+
+            note = note or f"管理員給予群組 {team_name} 點數"
+
+            for start in range(0, len(members), self.batch_size):
+                user_ids = [m["_id"] for m in members[start:start + self.batch_size]]
+                # 發點不自動償還欠款：整批 $inc 後讀回餘額寫日誌
+                await self._flush(
+                    [UpdateOne({"_id": user_id}, {"$inc": {"points": amount}}) for user_id in user_ids],
+                    [],
+                    []
+                )
+                balances = await self._balances(user_ids)
+                now = datetime.now(timezone.utc)
+                logs = [{
+                    "user_id": user_id,
+                    "type": change_type,
+                    "amount": amount,
+                    "note": note,
+                    "created_at": now,
+                    "balance_after": balances[user_id]
+                } for user_id in user_ids if user_id in balances]
+                await self._flush([], [], logs)
+                job.advance(len(user_ids))
+
+            job.finish()
+            return {"updated_users": len(members), "job": job.to_dict()}
+
+        except Exception as e:
+            job.finish(str(e))
+            raise
+
+    # ========== 最終結算 ==========
+
+    async def settle_all_holdings(self, final_price: int) -> Dict[str, Any]:
+        """
+        將所有持股以固定價格轉為點數並清除持股
+
+        以聚合一次取得「持股 > 0 且使用者存在」的持股，再分批 bulk_write
+        更新點數與持股，讀回更新後的點數後 insert_many 寫入結算日誌。
+
+        Returns:
+            dict: settled_users、total_gain、job（進度紀錄）
+        """
+        job = _track_job("final_settlement")
+        try:
+            job.total = await self.db[Collections.STOCKS].count_documents({"stock_amount": {"$gt": 0}})
+
+            cursor = self.db[Collections.STOCKS].aggregate([
+                {"$match": {"stock_amount": {"$gt": 0}}},
+                {"$lookup": {
+                    "from": Collections.USERS,
+                    "localField": "user_id",
+                    "foreignField": "_id",
+                    "as": "user"
+                }},
+                {"$unwind": "$user"},
+                {"$project": {"user_id": 1, "stock_amount": 1}}
+            ], allowDiskUse=True)
+
+            settled_users = set()
+            total_gain = 0
+            # 本批每位使用者的結算股數與所得（同一位使用者可能有多筆持股文件）
+            shares: Dict[Any, int] = {}
+            gains: Dict[Any, int] = {}
+            stock_ops: List[UpdateOne] = []
+
+            async for holding in cursor:
+                user_id = holding["user_id"]
+                stock_amount = holding["stock_amount"]
+                gain = stock_amount * final_price
+                shares[user_id] = shares.get(user_id, 0) + stock_amount
+                gains[user_id] = gains.get(user_id, 0) + gain
+                stock_ops.append(UpdateOne({"_id": holding["_id"]}, {"$set": {"stock_amount": 0}}))
+                settled_users.add(user_id)
+                total_gain += gain
+
+                if len(stock_ops) >= self.batch_size:
+                    await self._settle_batch(shares, gains, stock_ops, final_price)
+                    job.advance(len(stock_ops))
+                    shares, gains, stock_ops = {}, {}, []
+
+            if stock_ops:
+                await self._settle_batch(shares, gains, stock_ops, final_price)
+                job.advance(len(stock_ops))
+
+            job.finish()
+            return {
+                "settled_users": len(settled_users),
+                "total_gain": total_gain,
+                "job": job.to_dict()
+            }
+
+        except Exception as e:
+            job.finish(str(e))
+            raise
+
+    async def _settle_batch(self, shares: Dict[Any, int], gains: Dict[Any, int],
+                            stock_ops: List[UpdateOne], final_price: int) -> None:
+        """送出一批結算：加點、清除持股，再以更新後的點數寫日誌"""
+        user_ids = list(gains)
+        await self._flush(
+            [UpdateOne({"_id": user_id}, {"$inc": {"points": gains[user_id]}}) for user_id in user_ids],
+            stock_ops,
+            []
+        )
+        balances = await self._balances(user_ids)
+        now = datetime.now(timezone.utc)
+        await self._flush([], [], [{
+            "user_id": user_id,
+            "type": "final_settlement",
+            "amount": gains[user_id],
+            "note": f"最終結算：{shares[user_id]} 股 × {final_price} 元",
+            "created_at": now,
+            "balance_after": balances[user_id]
+        } for user_id in user_ids if user_id in balances])
@@ -4,20 +4,25 @@
 """
 
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import Collections
+from app.services.points_ledger import PointsLedger
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+# 沒有隊伍的欠款用戶在隊伍統計中的分組名稱
+NO_TEAM_LABEL = "未分組"
+
 
 class DebtService:
     """債務管理服務"""
     
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.ledger = PointsLedger(db)
     
     async def get_user_debt_info(self, user_id: ObjectId) -> Dict[str, Any]:
         """
@@ -30,7 +35,10 @@ class DebtService:
             dict: 包含債務訊息的字典
         """
         try:
-            user = await self.db[Collections.USERS].find_one({"_id": user_id})
+            user = await self.db[Collections.USERS].find_one(
+                {"_id": user_id},
+                {"name": 1, "points": 1, "owed_points": 1, "frozen": 1, "enabled": 1}
+            )
             
             if not user:
                 return {
@@ -71,7 +79,9 @@ class DebtService:
     
     async def validate_user_can_spend(self, user_id: ObjectId, amount: int) -> Dict[str, Any]:
         """
-        驗證用戶是否可以消費指定金額
+        預先檢查用戶是否可以消費指定金額（唯讀，不保留點數）
+
+        實際扣款請使用 spend()，檢查與扣款在同一個條件式更新內完成。
         
         Args:
             user_id: 用戶ID
@@ -83,14 +93,11 @@ class DebtService:
         try:
             debt_info = await self.get_user_debt_info(user_id)
             
-            if not debt_info['success']:
-                return debt_info
-            
             if not debt_info['user_exists']:
                 return {
                     'success': False,
                     'can_spend': False,
-                    'message': '使用者不存在'
+                    'message': debt_info.get('message', '使用者不存在')
                 }
             
             if not debt_info['enabled']:
@@ -139,6 +146,78 @@ class DebtService:
                 'message': f'驗證失敗: {str(e)}'
             }
     
+    async def spend(self, user_id: ObjectId, amount: int, change_type: str, note: str,
+                    action: str = "交易", transaction_id: str = None, session=None) -> Dict[str, Any]:
+        """
+        驗證並扣除點數
+
+        帳戶啟用、未凍結、沒有欠款與餘額足夠的條件都放在同一個
+        find_one_and_update 的查詢條件內，成功時不需要另外讀取使用者；
+        只有條件不符時才查詢一次以回傳具體原因。
+        
+        Args:
+            user_id: 用戶ID
+            amount: 消費金額
+            change_type: 點數日誌類型
+            note: 點數日誌備註
+            action: 失敗訊息中的操作名稱
+            transaction_id: 交易ID
+            session: 資料庫session（可選）
+            
+        Returns:
+            dict: 扣款結果（含 can_spend 與 error_code）
+        """
+        if amount <= 0:
+            return {
+                'success': False,
+                'can_spend': False,
+                'message': '金額必須大於 0',
+                'error_code': 'INVALID_AMOUNT'
+            }
+        
+        result = await self.ledger.debit(
+            user_id=user_id,
+            amount=amount,
+            change_type=change_type,
+            note=note,
+            transaction_id=transaction_id,
+            enforce_status=True,
+            action=action,
+            session=session
+        )
+        result['can_spend'] = result['success']
+        return result
+    
+    def check_spend(self, user: Optional[dict], amount: int, action: str = "交易") -> Dict[str, Any]:
+        """
+        以已讀取的使用者文件預檢能否消費（不移動點數、不另外查詢）
+
+        與 spend 使用相同的條件與錯誤碼；使用者文件需包含 SPEND_CHECK_PROJECTION 的欄位。
+        實際扣款仍須透過 spend 的條件式更新，預檢通過不代表扣款時仍然成立。
+
+        Returns:
+            dict: 含 can_spend 與 error_code 的檢查結果
+        """
+        if amount <= 0:
+            return {
+                'success': False,
+                'can_spend': False,
+                'message': '金額必須大於 0',
+                'error_code': 'INVALID_AMOUNT'
+            }
+
+        failure = PointsLedger.check_spendable(user, amount, enforce_status=True, action=action)
+        if failure is not None:
+            failure['can_spend'] = False
+            return failure
+        return {
+            'success': True,
+            'can_spend': True,
+            'message': f'可以進行{action}',
+            'error_code': None,
+            'available_balance': user.get("points", 0)
+        }
+
     async def repay_debt(self, user_id: ObjectId, amount: int, admin_id: Optional[ObjectId] = None) -> Dict[str, Any]:
         """
         償還欠款功能
@@ -303,65 +382,136 @@ class DebtService:
                 'message': f'添加欠款失敗: {str(e)}'
             }
     
-    async def get_all_debtors(self) -> Dict[str, Any]:
+    @staticmethod
+    def _debt_dashboard_pipeline(team: Optional[str], skip: int, limit: Optional[int]) -> List[dict]:
+        """欠款統計的 $facet pipeline：總計、各隊統計與欠款用戶列表"""
+        match: Dict[str, Any] = {"owed_points": {"$gt": 0}}
+        if team is not None:
+            match["team"] = team
+        
+        points = {"$ifNull": ["$points", 0]}
+        frozen_count = {"$sum": {"$cond": [{"$eq": ["$frozen", True]}, 1, 0]}}
+        
+        debtor_stages: List[dict] = [{"$sort": {"owed_points": -1, "_id": 1}}]
+        if skip:
+            debtor_stages.append({"$skip": skip})
+        if limit is not None:
+            debtor_stages.append({"$limit": limit})
+        debtor_stages.append({"$project": {
+            "_id": 0,
+            "user_id": {"$toString": "$_id"},
+            "id": 1,
+            "name": 1,
+            "points": points,
+            "owed_points": 1,
+            "available_balance": {"$subtract": [points, "$owed_points"]},
+            "frozen": {"$ifNull": ["$frozen", False]},
+            "enabled": {"$ifNull": ["$enabled", True]},
+            "team": 1,
+            "updated_at": 1
+        }})
+        
+        return [
+            {"$match": match},
+            {"$facet": {
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total_debtors": {"$sum": 1},
+                        "total_debt": {"$sum": "$owed_points"},
+                        "total_points": {"$sum": points},
+                        "frozen_debtors": frozen_count,
+                        # 即使扣光現有點數仍無法償還的部分
+                        "total_shortfall": {"$sum": {"$max": [{"$subtract": ["$owed_points", points]}, 0]}}
+                    }}
+                ],
+                "by_team": [
+                    {"$group": {
+                        "_id": {"$ifNull": ["$team", NO_TEAM_LABEL]},
+                        "debtors": {"$sum": 1},
+                        "total_debt": {"$sum": "$owed_points"},
+                        "frozen_debtors": frozen_count
+                    }},
+                    {"$sort": {"total_debt": -1, "_id": 1}},
+                    {"$project": {"_id": 0, "team": "$_id", "debtors": 1, "total_debt": 1, "frozen_debtors": 1}}
+                ],
+                "debtors": debtor_stages
+            }}
+        ]
+    
+    async def get_debt_dashboard(self, page: int = 1, page_size: Optional[int] = 50,
+                                 team: Optional[str] = None) -> Dict[str, Any]:
         """
-        獲取所有有欠款的用戶列表
+        欠款統計面板，一次聚合取得總計、各隊統計與分頁的欠款用戶列表
         
+        Args:
+            page: 頁碼（從 1 開始）
+            page_size: 每頁筆數，None 表示回傳全部
+            team: 只統計指定隊伍
+            
         Returns:
-            dict: 欠款用戶列表
+            dict: totals / by_team / debtors / 分頁資訊
         """
         try:
-            debtors_cursor = self.db[Collections.USERS].find(
-                {"owed_points": {"$gt": 0}},
-                {
-                    "_id": 1,
-                    "id": 1,
-                    "name": 1,
-                    "points": 1,
-                    "owed_points": 1,
-                    "frozen": 1,
-                    "enabled": 1,
-                    "team": 1,
-                    "updated_at": 1
-                }
-            ).sort("owed_points", -1)
+            skip = (page - 1) * page_size if page_size else 0
+            pipeline = self._debt_dashboard_pipeline(team, skip, page_size)
+            result = await self.db[Collections.USERS].aggregate(pipeline).to_list(1)
+            facet = result[0] if result else {}
             
-            debtors = []
-            total_debt = 0
-            
-            async for user in debtors_cursor:
-                owed_points = user.get("owed_points", 0)
-                total_debt += owed_points
-                
-                debtors.append({
-                    "user_id": str(user["_id"]),
-                    "id": user.get("id"),
-                    "name": user.get("name"),
-                    "points": user.get("points", 0),
-                    "owed_points": owed_points,
-                    "available_balance": user.get("points", 0) - owed_points,
-                    "frozen": user.get("frozen", False),
-                    "enabled": user.get("enabled", True),
-                    "team": user.get("team"),
-                    "updated_at": user.get("updated_at")
-                })
+            totals = (facet.get("totals") or [{}])[0]
+            total_debtors = totals.get("total_debtors", 0)
             
             return {
                 'success': True,
-                'debtors': debtors,
-                'total_debtors': len(debtors),
-                'total_debt': total_debt
+                'totals': {
+                    'total_debtors': total_debtors,
+                    'total_debt': totals.get("total_debt", 0),
+                    'total_points': totals.get("total_points", 0),
+                    'frozen_debtors': totals.get("frozen_debtors", 0),
+                    'total_shortfall': totals.get("total_shortfall", 0)
+                },
+                'by_team': facet.get("by_team", []),
+                'debtors': facet.get("debtors", []),
+                'page': page,
+                'page_size': page_size,
+                'total_pages': (total_debtors + page_size - 1) // page_size if page_size else 1,
+                'team': team
             }
             
         except Exception as e:
-            logger.error(f"Error getting debtors list: {e}")
+            logger.error(f"Error getting debt dashboard: {e}")
             return {
                 'success': False,
-                'message': f'獲取欠款用戶列表失敗: {str(e)}',
+                'message': f'獲取欠款統計失敗: {str(e)}',
+                'totals': {},
+                'by_team': [],
+                'debtors': []
+            }
+    
+    async def get_all_debtors(self) -> Dict[str, Any]:
+        """
+        獲取所有有欠款的用戶列表
+        
+        Returns:
+            dict: 欠款用戶列表
+        """
+        dashboard = await self.get_debt_dashboard(page=1, page_size=None)
+        if not dashboard['success']:
+            return {
+                'success': False,
+                'message': dashboard['message'],
                 'debtors': [],
                 'total_debtors': 0,
                 'total_debt': 0
             }
+        
+        return {
+            'success': True,
+            'debtors': dashboard['debtors'],
+            'total_debtors': dashboard['totals']['total_debtors'],
+            'total_debt': dashboard['totals']['total_debt'],
+            'by_team': dashboard['by_team']
+        }
 
 
 # 依賴注入
@@ -0,0 +1,246 @@
+"""
+資料匯出服務 - 以串流方式匯出交易、點數記錄與掛單
+
+管理員匯出整個營期的歷史資料時，不再把整份結果組成 list 後一次回傳，
+而是逐批讀取 Mongo cursor，邊讀邊寫出 NDJSON 或 CSV。
+使用者名稱透過一次載入的 id → name 對照表解析，不做逐筆 $lookup。
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+import csv
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每批從 cursor 讀取並寫出的筆數
+EXPORT_BATCH_SIZE = 500
+
+# 支援的匯出格式與對應的 media type
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# 各資料集的欄位順序（CSV 標頭與 NDJSON 欄位一致）
+TRADE_FIELDS = [
+    "id", "buyer_username", "seller_username", "buy_user_id", "sell_user_id",
+    "price", "quantity", "amount", "created_at"
+]
+POINT_LOG_FIELDS = [
+    "user_id", "user_name", "type", "amount", "note",
+    "balance_after", "transaction_id", "created_at"
+]
+PENDING_ORDER_FIELDS = [
+    "_id", "user_id", "username", "user_telegram_id", "user_team", "side",
+    "order_type", "quantity", "original_quantity", "price", "status",
+    "created_at", "updated_at"
+]
+
+# 系統虛擬帳戶（IPO、市價成交對手）
+SYSTEM_ACCOUNTS = ("SYSTEM", "MARKET")
+
+
+def get_export_service() -> ExportService:
+    """ExportService 的依賴注入函數"""
+    return ExportService()
+
+
+def _to_plain(value: Any) -> Any:
+    """將 Mongo 回傳值轉成可序列化的基本型別"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class ExportService:
+    def __init__(self, db: AsyncIOMotorDatabase = None, batch_size: int = EXPORT_BATCH_SIZE):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.batch_size = batch_size
+        self._user_names: Optional[Dict[Any, Dict[str, Any]]] = None
+
+    # ========== 使用者名稱對照 ==========
+
+    async def _load_user_map(self) -> Dict[Any, Dict[str, Any]]:
+        """
+        一次載入所有使用者的 id → 基本資料對照表
+
+        同時以 ObjectId（_id）與字串 id 作為鍵，
+        因為舊的 point_logs 可能以字串 id 記錄 user_id。
+        """
+        if self._user_names is not None:
+            return self._user_names
+
+        user_map: Dict[Any, Dict[str, Any]] = {}
+        cursor = self.db[Collections.USERS].find(
+            {},
+            {"_id": 1, "id": 1, "name": 1, "telegram_nickname": 1,
+             "telegram_id": 1, "team": 1}
+        ).batch_size(self.batch_size)
+
+        async for user in cursor:
+            info = {
+                "name": user.get("name"),
+                "display_name": user.get("telegram_nickname") or user.get("name"),
+                "telegram_id": user.get("telegram_id"),
+                "team": user.get("team"),
+            }
+            user_map[user["_id"]] = info
+            if user.get("id"):
+                user_map[user["id"]] = info
+
+        self._user_names = user_map
+        logger.info(f"Export user map loaded: {len(user_map)} keys")
+        return user_map
+
+    # ========== 編碼 ==========
+
+    @staticmethod
+    def _encode_batch(rows: List[Dict[str, Any]], fields: List[str],
+                      fmt: str, include_header: bool = False) -> str:
+        """將一批資料編碼成 NDJSON 或 CSV 文字"""
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if include_header:
+                writer.writerow(fields)
+            for row in rows:
+                writer.writerow(["" if row.get(f) is None else row.get(f) for f in fields])
+            return buffer.getvalue()
+
+        return "".join(
+            json.dumps({f: row.get(f) for f in fields}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+    async def _stream(self, cursor, fields: List[str], fmt: str,
+                      transform) -> AsyncIterator[str]:
+        """逐批讀取 cursor，轉換後以文字區塊輸出"""
+        if fmt == "csv":
+            # 讓 Excel 正確辨識 UTF-8 中文
+            yield "\ufeff" + self._encode_batch([], fields, fmt, include_header=True)
+
+        batch: List[Dict[str, Any]] = []
+        total = 0
+        async for doc in cursor:
+            batch.append(transform(doc))
+            if len(batch) >= self.batch_size:
+                total += len(batch)
+                yield self._encode_batch(batch, fields, fmt)
+                batch = []
+
+        if batch:
+            total += len(batch)
+            yield self._encode_batch(batch, fields, fmt)
+
+        logger.info(f"Export stream finished: {total} rows ({fmt})")
+
+    # ========== 資料集 ==========
+
+    async def stream_trades(self, fmt: str = "ndjson", limit: Optional[int] = None) -> AsyncIterator[str]:
+        """串流匯出交易紀錄（最新在前）"""
+        user_map = await self._load_user_map()
+
+        def transform(trade: dict) -> Dict[str, Any]:
+            buy_user_id = trade.get("buy_user_id")
+            sell_user_id = trade.get("sell_user_id")
+            return {
+                "id": str(trade["_id"]),
+                "buyer_username": self._resolve_name(user_map, buy_user_id),
+                "seller_username": self._resolve_name(user_map, sell_user_id),
+                "buy_user_id": _to_plain(buy_user_id),
+                "sell_user_id": _to_plain(sell_user_id),
+                "price": trade.get("price"),
+                "quantity": trade.get("quantity"),
+                "amount": trade.get("amount"),
+                "created_at": _to_plain(trade.get("created_at")),
+            }
+
+        cursor = self.db[Collections.TRADES].find({}).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        cursor = cursor.batch_size(self.batch_size)
+
+        async for chunk in self._stream(cursor, TRADE_FIELDS, fmt, transform):
+            yield chunk
+
+    async def stream_point_logs(self, fmt: str = "ndjson", limit: Optional[int] = None) -> AsyncIterator[str]:
+        """串流匯出點數記錄（排除沒有 amount 的非點數記錄）"""
+        user_map = await self._load_user_map()
+
+        def transform(log: dict) -> Dict[str, Any]:
+            user_id = log.get("user_id")
+            info = user_map.get(user_id) or {}
+            return {
+                "user_id": _to_plain(user_id) or "",
+                "user_name": info.get("display_name") or "未知使用者",
+                "type": log.get("type") or "qr_scan",
+                "amount": log.get("amount", 0),
+                "note": log.get("note", ""),
+                "balance_after": log.get("balance_after", 0),
+                "transaction_id": log.get("transaction_id"),
+                "created_at": _to_plain(log.get("created_at")),
+            }
+
+        cursor = self.db[Collections.POINT_LOGS].find(
+            {"amount": {"$exists": True}}
+        ).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        cursor = cursor.batch_size(self.batch_size)
+
+        async for chunk in self._stream(cursor, POINT_LOG_FIELDS, fmt, transform):
+            yield chunk
+
+    async def stream_pending_orders(self, fmt: str = "ndjson", limit: Optional[int] = None) -> AsyncIterator[str]:
+        """串流匯出等待撮合的訂單"""
+        user_map = await self._load_user_map()
+
+        def transform(order: dict) -> Dict[str, Any]:
+            info = user_map.get(order.get("user_id")) or {}
+            return {
+                "_id": str(order["_id"]),
+                "user_id": _to_plain(order.get("user_id")),
+                "username": info.get("name"),
+                "user_telegram_id": info.get("telegram_id"),
+                "user_team": info.get("team"),
+                "side": order.get("side"),
+                "order_type": order.get("order_type"),
+                "quantity": order.get("quantity"),
+                "original_quantity": order.get("original_quantity"),
+                "price": order.get("price"),
+                "status": order.get("status"),
+                "created_at": _to_plain(order.get("created_at")),
+                "updated_at": _to_plain(order.get("updated_at")),
+            }
+
+        cursor = self.db[Collections.STOCK_ORDERS].find(
+            {"status": {"$in": ["pending", "partial", "pending_limit"]}}
+        ).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        cursor = cursor.batch_size(self.batch_size)
+
+        async for chunk in self._stream(cursor, PENDING_ORDER_FIELDS, fmt, transform):
+            yield chunk
+
+    @staticmethod
+    def _resolve_name(user_map: Dict[Any, Dict[str, Any]], user_id: Any) -> str:
+        """解析交易雙方名稱，系統帳戶直接回傳原值"""
+        if user_id in SYSTEM_ACCOUNTS:
+            return user_id
+        info = user_map.get(user_id)
+        if not info:
+            return "未知使用者"
+        return info.get("name") or "未知使用者"
@@ -1,9 +1,14 @@
 from __future__ import annotations
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from app.core.database import get_database, Collections
-from datetime import datetime, timezone, timedelta
+from app.services.debt_service import DebtService
+from app.services.points_ledger import PointsLedger, SPEND_CHECK_PROJECTION
+from app.services.pvp_expiry import PVP_OPEN_STATUSES, PVP_CHALLENGE_TTL, get_pvp_expiry_sweeper
+from datetime import datetime, timezone
 from bson import ObjectId
 from typing import Optional
+import asyncio
 import logging
 import random
 
@@ -13,170 +18,100 @@ def get_game_service() -> GameService:
     """GameService 的依賴注入函數"""
     return GameService()
 
+
+class PvPSettlementError(Exception):
+    """PvP 結算失敗（用於回滾交易）"""
+
+
 class GameService:
-    """遊戲服務 - 負責處理 PvP 猜拳遊戲相關功能"""
-    
+    """
+    遊戲服務 - 負責處理 PvP 猜拳遊戲相關功能
+
+    挑戰狀態以條件式 find_one_and_update 轉換（pending → waiting_accepter → completed），
+    接受挑戰時佔用挑戰、扣除敗方點數與增加勝方點數在同一個交易內完成；
+    兩位玩家的狀態與餘額檢查都放在各自的條件式更新內，任一方不符時整筆回滾。
+    到期由 PvPExpirySweeper 統一處理。
+    """
+
     def __init__(self, db: AsyncIOMotorDatabase = None):
         if db is None:
             self.db = get_database()
         else:
             self.db = db
-            
-    async def _safe_deduct_points(self, user_id: ObjectId, amount: int, 
-                                operation_note: str, session=None) -> dict:
-        """
-        安全地扣除使用者點數，防止產生負數餘額
-        
-        Args:
-            user_id: 使用者ID
-            amount: 要扣除的點數
-            operation_note: 操作說明
-            session: 資料庫session（用於交易）
-            
-        Returns:
-            dict: {'success': bool, 'message': str, 'balance_before': int, 'balance_after': int}
-        """
-        try:
-            # 使用 MongoDB 的條件更新確保原子性
-            update_result = await self.db[Collections.USERS].update_one(
-                {
-                    "_id": user_id,
-                    "points": {"$gte": amount}  # 確保扣除後不會變負數
-                },
-                {"$inc": {"points": -amount}},
-                session=session
-            )
-            
-            if update_result.modified_count == 0:
-                # 扣除失敗，檢查使用者目前餘額
-                user = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-                current_balance = user.get("points", 0) if user else 0
-                
-                return {
-                    'success': False,
-                    'message': f'點數不足，目前餘額：{current_balance}，需要：{amount}',
-                    'balance_before': current_balance,
-                    'balance_after': current_balance
-                }
-            
-            # 扣除成功，記錄變動
-            user_after = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            balance_after = user_after.get("points", 0) if user_after else 0
-            balance_before = balance_after + amount
-            
-            # 記錄點數變動
-            try:
-                log_entry = {
-                    "user_id": user_id,
-                    "type": "game_deduction",
-                    "amount": -amount,  # 負數表示扣除
-                    "note": operation_note,
-                    "balance_after": balance_after,
-                    "created_at": datetime.now(timezone.utc)
-                }
-                await self.db[Collections.POINT_LOGS].insert_one(log_entry, session=session)
-                logger.info(f"Point deduction logged: user_id={user_id}, amount=-{amount}, balance_after={balance_after}")
-            except Exception as e:
-                logger.error(f"Failed to log point deduction: {e}")
-                # 不影響主要業務邏輯
-            
-            return {
-                'success': True,
-                'message': '點數扣除成功',
-                'balance_before': balance_before,
-                'balance_after': balance_after
-            }
-            
-        except Exception as e:
-            logger.error(f"Safe deduct points failed: {e}")
-            return {
-                'success': False,
-                'message': f'點數扣除失敗：{str(e)}',
-                'balance_before': 0,
-                'balance_after': 0
-            }
-    
+        self.ledger = PointsLedger(self.db)
+        self.debt_service = DebtService(self.db)
+
+    def _spend_failure_message(self, result: dict, amount: int, verb: str) -> str:
+        """將消費檢查失敗的錯誤碼轉成 PvP 訊息（verb：發起 / 參與）"""
+        error_code = result.get('error_code', 'UNKNOWN')
+        user_data = result.get('user_data', {})
+
+        if error_code == 'ACCOUNT_DISABLED':
+            return f"帳戶未啟用，無法{verb} PvP 挑戰"
+        if error_code == 'ACCOUNT_FROZEN':
+            return f"帳戶已凍結，無法{verb} PvP 挑戰"
+        if error_code == 'HAS_DEBT':
+            owed_points = user_data.get('owed_points', 0)
+            return f"帳戶有欠款 {owed_points} 點，請先償還後才能{verb} PvP 挑戰"
+        if error_code == 'INSUFFICIENT_BALANCE':
+            available_balance = result.get('available_balance', user_data.get('points', 0))
+            current_points = user_data.get('points', 0)
+            owed_points = user_data.get('owed_points', 0)
+            if owed_points > 0:
+                return f"可用點數不足！需要：{amount} 點，目前點數：{current_points} 點，欠款：{owed_points} 點，實際可用：{available_balance} 點"
+            return f"點數不足！需要：{amount} 點，目前點數：{available_balance} 點"
+        return result['message']
+
     async def create_pvp_challenge(self, from_user: str, amount: int, chat_id: str):
         """建立 PVP 挑戰"""
         from app.schemas.bot import PVPResponse
-        
+
         try:
-            # 檢查發起者是否存在且有足夠點數
-            user = await self.db[Collections.USERS].find_one({"telegram_id": from_user})
+            # 檢查發起者是否存在且有足夠點數（只讀取一次使用者）
+            user = await self.db[Collections.USERS].find_one(
+                {"telegram_id": from_user},
+                {"name": 1, **SPEND_CHECK_PROJECTION}
+            )
             if not user:
                 return PVPResponse(
                     success=False,
                     message="使用者不存在，請先註冊"
                 )
-            
-            # 使用債務驗證服務檢查發起者狀態和資金
-            from app.core.user_validation import UserValidationService
-            validation_service = UserValidationService(self.db)
-            
-            validation_result = await validation_service.validate_user_can_spend(
-                user_id=user["_id"],
-                amount=amount,
-                operation_type="發起PvP挑戰"
-            )
-            
+
+            # 建立挑戰時不移動點數，以同一份文件預檢發起者狀態和資金；實際扣款在結算時以條件式更新檢查
+            validation_result = self.debt_service.check_spend(user, amount, "PvP 挑戰")
             if not validation_result['can_spend']:
-                error_code = validation_result.get('error_code', 'UNKNOWN')
-                
-                if error_code == 'ACCOUNT_DISABLED':
-                    message = "帳戶未啟用，無法發起 PvP 挑戰"
-                elif error_code == 'ACCOUNT_FROZEN':
-                    message = "帳戶已凍結，無法發起 PvP 挑戰"
-                elif error_code == 'HAS_DEBT':
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    message = f"帳戶有欠款 {owed_points} 點，請先償還後才能發起 PvP 挑戰"
-                elif error_code == 'INSUFFICIENT_BALANCE':
-                    available_balance = validation_result.get('available_balance', 0)
-                    current_points = validation_result.get('user_data', {}).get('points', 0)
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    if owed_points > 0:
-                        message = f"可用點數不足！需要：{amount} 點，目前點數：{current_points} 點，欠款：{owed_points} 點，實際可用：{available_balance} 點"
-                    else:
-                        message = f"點數不足！需要：{amount} 點，目前點數：{available_balance} 點"
-                else:
-                    message = validation_result['message']
-                
                 return PVPResponse(
                     success=False,
-                    message=message
+                    message=self._spend_failure_message(validation_result, amount, "發起")
                 )
-            
-            # 檢查是否已有進行中的挑戰
+
+            now = datetime.now(timezone.utc)
+
+            # 檢查是否已有進行中的挑戰（已到期但尚未掃描的挑戰不算）
             existing_challenge = await self.db[Collections.PVP_CHALLENGES].find_one({
                 "challenger": from_user,
-                "status": {"$in": ["pending", "waiting_accepter"]}
-            })
-            
+                "status": {"$in": PVP_OPEN_STATUSES},
+                "expires_at": {"$gt": now}
+            }, {"status": 1})
+
             if existing_challenge:
-                # 檢查挑戰是否過期，如果過期則自動清理
-                expires_at = existing_challenge["expires_at"]
-                if not expires_at.tzinfo:
-                    expires_at = expires_at.replace(tzinfo=timezone.utc)
-                if datetime.now(timezone.utc) > expires_at:
-                    await self.db[Collections.PVP_CHALLENGES].update_one(
-                        {"_id": existing_challenge["_id"]},
-                        {"$set": {"status": "expired"}}
+                # 提供更詳細的訊息
+                challenge_status = existing_challenge.get("status", "pending")
+                if challenge_status == "waiting_accepter":
+                    return PVPResponse(
+                        success=False,
+                        message="你已經有一個等待接受的挑戰！請等待其他人接受或過期後再建立新挑戰。"
                     )
                 else:
-                    # 提供更詳細的訊息
-                    challenge_status = existing_challenge.get("status", "pending")
-                    if challenge_status == "waiting_accepter":
-                        return PVPResponse(
-                            success=False,
-                            message="你已經有一個等待接受的挑戰！請等待其他人接受或過期後再建立新挑戰。"
-                        )
-                    else:
-                        return PVPResponse(
-                            success=False,
-                            message="你已經有一個進行中的挑戰！請完成後再建立新挑戰。"
-                        )
-            
+                    return PVPResponse(
+                        success=False,
+                        message="你已經有一個進行中的挑戰！請完成後再建立新挑戰。"
+                    )
+
             # 建立挑戰記錄
             challenge_oid = ObjectId()
+            expires_at = now + PVP_CHALLENGE_TTL  # 3小時過期
             challenge_doc = {
                 "_id": challenge_oid,
                 "challenger": from_user,
@@ -184,30 +119,31 @@ class GameService:
                 "amount": amount,
                 "chat_id": chat_id,
                 "status": "waiting_accepter",  # 直接設為等待接受
-                "created_at": datetime.now(timezone.utc),
-                "expires_at": datetime.now(timezone.utc) + timedelta(hours=3)  # 3小時過期
+                "created_at": now,
+                "expires_at": expires_at
             }
-            
+
             await self.db[Collections.PVP_CHALLENGES].insert_one(challenge_doc)
-            
+            get_pvp_expiry_sweeper().notify(expires_at)
+
             return PVPResponse(
                 success=True,
                 message=f"🎯 {user.get('name', '未知使用者')} 發起了 {amount} 點的 PVP 挑戰！\n點選按鈕接受挑戰，50% 機率決定勝負！",
                 challenge_id=str(challenge_oid),
                 amount=amount
             )
-            
+
         except Exception as e:
             logger.error(f"Error creating PVP challenge: {e}")
             return PVPResponse(
                 success=False,
                 message="建立挑戰失敗，請稍後再試"
             )
-    
+
     async def set_pvp_creator_choice(self, from_user: str, challenge_id: str, choice: str):
         """設定 PVP 發起人的選擇"""
         from app.schemas.bot import PVPResponse
-        
+
         try:
             # 將 challenge_id 轉換為 ObjectId
             try:
@@ -217,53 +153,54 @@ class GameService:
                     success=False,
                     message="無效的挑戰 ID"
                 )
-            
-            # 查找挑戰
-            challenge = await self.db[Collections.PVP_CHALLENGES].find_one({
-                "_id": challenge_oid,
-                "status": "pending"
-            })
-            
-            if not challenge:
-                return PVPResponse(
-                    success=False,
-                    message="挑戰不存在或已結束"
-                )
-            
-            # 檢查是否為發起者本人
-            if challenge["challenger"] != from_user:
-                return PVPResponse(
-                    success=False,
-                    message="只有發起者可以設定選擇！"
-                )
-            
-            # 檢查是否已設定過選擇
-            if challenge.get("challenger_choice"):
-                return PVPResponse(
-                    success=False,
-                    message="你已經設定過選擇了！"
-                )
-            
-            # 更新挑戰，設定發起人選擇
-            await self.db[Collections.PVP_CHALLENGES].update_one(
-                {"_id": challenge_oid},
+
+            # 條件式轉換 pending → waiting_accepter
+            challenge = await self.db[Collections.PVP_CHALLENGES].find_one_and_update(
+                {
+                    "_id": challenge_oid,
+                    "status": "pending",
+                    "challenger": from_user,
+                    "challenger_choice": {"$in": [None, ""]},
+                    "expires_at": {"$gt": datetime.now(timezone.utc)}
+                },
                 {
                     "$set": {
                         "challenger_choice": choice,
                         "status": "waiting_accepter"
                     }
-                }
+                },
+                projection={"challenger_name": 1, "amount": 1},
+                return_document=ReturnDocument.AFTER
             )
-            
+
+            if not challenge:
+                # 轉換失敗時才讀取一次挑戰以回傳具體原因
+                existing = await self.db[Collections.PVP_CHALLENGES].find_one(
+                    {"_id": challenge_oid, "status": "pending"},
+                    {"challenger": 1, "challenger_choice": 1}
+                )
+                if not existing:
+                    message = "挑戰不存在或已結束"
+                elif existing["challenger"] != from_user:
+                    message = "只有發起者可以設定選擇！"
+                elif existing.get("challenger_choice"):
+                    message = "你已經設定過選擇了！"
+                else:
+                    message = "挑戰已過期"
+                return PVPResponse(
+                    success=False,
+                    message=message
+                )
+
             # 返回成功訊息，包含挑戰資訊供前端顯示
             challenger_name = challenge["challenger_name"]
             amount = challenge["amount"]
-            
+
             return PVPResponse(
                 success=True,
                 message=f"🎯 {challenger_name} 發起了 {amount} 點的 PVP 挑戰！\n\n發起者已經選擇了他出的拳，有誰想來挑戰嗎？選擇你出的拳吧！\n⏰ 如果 3 小時沒有人接受，系統會重新提醒"
             )
-            
+
         except Exception as e:
             logger.error(f"Error setting PVP creator choice: {e}")
             return PVPResponse(
@@ -271,10 +208,218 @@ class GameService:
                 message="設定選擇失敗，請稍後再試"
             )
 
+    # ========== 結算 ==========
+
+    async def _resolve_challenge(self, from_user: str, challenge_oid: ObjectId,
+                                 choice: Optional[str] = None) -> dict:
+        """
+        接受並結算挑戰，帶寫入衝突重試機制
+
+        Args:
+            choice: 接受者的猜拳選擇；None 表示純 50% 機率決定勝負
+
+        Returns:
+            dict: challenge / result / winner_name / loser_name / amount
+        """
+        max_retries = 5
+        retry_delay = 0.003
+
+        for attempt in range(max_retries):
+            try:
+                async with await self.db.client.start_session() as session:
+                    async with session.start_transaction():
+                        return await self._execute_resolve(from_user, challenge_oid, choice, session)
+
+            except PvPSettlementError:
+                raise
+
+            except Exception as e:
+                error_str = str(e)
+
+                # 檢查是否為事務不支援的錯誤
+                if "Transaction numbers are only allowed on a replica set member or mongos" in error_str:
+                    logger.warning("MongoDB transactions not supported, falling back to non-transactional mode for PvP settlement")
+                    return await self._execute_resolve(from_user, challenge_oid, choice, None)
+
+                # 檢查是否為寫入衝突錯誤（同時接受同一個挑戰時，重試後會看到挑戰已結束）
+                if ("WriteConflict" in error_str or "TransientTransactionError" in error_str) and attempt < max_retries - 1:
+                    logger.info(f"PvP settlement WriteConflict on attempt {attempt + 1}/{max_retries}, retrying...")
+                    await asyncio.sleep(retry_delay * random.uniform(0.8, 1.2))
+                    retry_delay *= 1.6
+                    continue
+
+                raise
+
+    async def _execute_resolve(self, from_user: str, challenge_oid: ObjectId,
+                               choice: Optional[str], session=None) -> dict:
+        now = datetime.now(timezone.utc)
+
+        # 以條件式更新佔用挑戰：只有未結束、未到期、不是自己發起的挑戰會被更新
+        claim_filter = {
+            "_id": challenge_oid,
+            "status": {"$in": PVP_OPEN_STATUSES},
+            "challenger": {"$ne": from_user},
+            "expires_at": {"$gt": now}
+        }
+        claim_set = {"accepter": from_user, "status": "completed", "completed_at": now}
+        if choice is None:
+            # 50% 機率決定勝負
+            result = "accepter_wins" if random.getrandbits(1) else "challenger_wins"
+            claim_set["result"] = result
+        else:
+            claim_filter["challenger_choice"] = {"$nin": [None, ""]}
+            claim_set["accepter_choice"] = choice
+
+        challenge = await self.db[Collections.PVP_CHALLENGES].find_one_and_update(
+            claim_filter,
+            {"$set": claim_set},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if challenge is None:
+            raise PvPSettlementError(
+                await self._claim_failure_message(challenge_oid, from_user, choice is not None, session)
+            )
+
+        if choice is not None:
+            result = self._determine_winner(challenge["challenger_choice"], choice)
+
+        try:
+            return await self._settle(challenge, from_user, result, session)
+        except PvPSettlementError:
+            if session is None:
+                await self._release_claim(challenge, from_user)
+            raise
+
+    async def _claim_failure_message(self, challenge_oid: ObjectId, from_user: str,
+                                     require_choice: bool, session=None) -> str:
+        """佔用失敗時讀取一次挑戰以回傳具體原因"""
+        existing = await self.db[Collections.PVP_CHALLENGES].find_one(
+            {"_id": challenge_oid},
+            {"status": 1, "challenger": 1, "challenger_choice": 1, "expires_at": 1},
+            session=session
+        )
+        if not existing or existing.get("status") not in PVP_OPEN_STATUSES:
+            return "挑戰不存在或已結束"
+        if require_choice and not existing.get("challenger_choice"):
+            return "發起人尚未選擇猜拳，請稍後再試"
+        expires_at = existing.get("expires_at")
+        if expires_at and (expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)) <= datetime.now(timezone.utc):
+            return "挑戰已過期"
+        if existing.get("challenger") == from_user:
+            return "不能接受自己的挑戰！"
+        return "挑戰不存在或已結束"
+
+    async def _settle(self, challenge: dict, from_user: str, result: str, session=None) -> dict:
+        """在佔用挑戰的同一個交易內結算雙方點數"""
+        amount = challenge["amount"]
+
+        users = await self.db[Collections.USERS].find(
+            {"telegram_id": {"$in": [from_user, challenge["challenger"]]}},
+            {"telegram_id": 1, "name": 1, **SPEND_CHECK_PROJECTION},
+            session=session
+        ).to_list(length=2)
+        users_by_telegram_id = {user["telegram_id"]: user for user in users}
+        accepter = users_by_telegram_id.get(from_user)
+        challenger_user = users_by_telegram_id.get(challenge["challenger"])
+        if not accepter:
+            raise PvPSettlementError("使用者不存在，請先註冊")
+        if not challenger_user:
+            raise PvPSettlementError("發起者不存在")
+
+        accepter_name = accepter.get("name", "未知使用者")
+        challenge_set = {"accepter_name": accepter_name, "result": result}
+        await self.db[Collections.PVP_CHALLENGES].update_one(
+            {"_id": challenge["_id"]},
+            {"$set": challenge_set},
+            session=session
+        )
+
+        settlement = {
+            "challenge": challenge,
+            "result": result,
+            "accepter_name": accepter_name,
+            "amount": amount
+        }
+
+        if result == "tie":
+            # 平手沒有點數變動，仍需確認接受者可以參與（以交易內已讀取的文件檢查）
+            validation_result = self.debt_service.check_spend(accepter, amount, "PvP 挑戰")
+            if not validation_result['can_spend']:
+                raise PvPSettlementError(self._spend_failure_message(validation_result, amount, "參與"))
+            return settlement
+
+        if result == "challenger_wins":
+            winner, loser = challenger_user, accepter
+            winner_name, loser_name = challenge["challenger_name"], accepter_name
+        else:
+            winner, loser = accepter, challenger_user
+            winner_name, loser_name = accepter_name, challenge["challenger_name"]
+        settlement.update(winner_name=winner_name, loser_name=loser_name)
+
+        def failure_message(failed: dict, user: dict) -> str:
+            if user is accepter:
+                return self._spend_failure_message(failed, amount, "參與")
+            return "發起者點數不足，挑戰無效"
+
+        transaction_id = str(challenge["_id"])
+
+        # 敗方：條件式扣款（啟用、未凍結、無欠款、餘額足夠）
+        deduction_result = await self.debt_service.spend(
+            user_id=loser["_id"],
+            amount=amount,
+            change_type="pvp_lose",
+            note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})",
+            action="PvP 挑戰",
+            transaction_id=transaction_id,
+            session=session
+        )
+        if not deduction_result['success']:
+            raise PvPSettlementError(failure_message(deduction_result, loser))
+
+        # 勝方：只在同樣可以支付賭注時入帳，避免不符資格的玩家只在獲勝時結算
+        credit_result = await self.ledger.credit(
+            user_id=winner["_id"],
+            amount=amount,
+            change_type="pvp_win",
+            note=f"PVP 勝利獲得 {amount} 點 (對手: {loser_name})",
+            transaction_id=transaction_id,
+            require_spendable=amount,
+            action="PvP 挑戰",
+            session=session
+        )
+        if not credit_result['success']:
+            if session is None:
+                # 非事務模式下退回敗方已扣除的點數
+                await self.ledger.credit(
+                    user_id=loser["_id"],
+                    amount=amount,
+                    change_type="pvp_refund",
+                    note=f"PVP 結算失敗退回 {amount} 點",
+                    transaction_id=transaction_id,
+                    repay_debt=False
+                )
+            raise PvPSettlementError(failure_message(credit_result, winner))
+
+        return settlement
+
+    async def _release_claim(self, challenge: dict, from_user: str) -> None:
+        """非事務模式下結算失敗，將自己佔用的挑戰恢復為佔用前的狀態"""
+        await self.db[Collections.PVP_CHALLENGES].update_one(
+            {"_id": challenge["_id"], "status": "completed", "accepter": from_user},
+            {
+                "$set": {"status": challenge["status"]},
+                "$unset": {
+                    "accepter": "", "accepter_name": "", "accepter_choice": "",
+                    "result": "", "completed_at": ""
+                }
+            }
+        )
+
     async def accept_pvp_challenge(self, from_user: str, challenge_id: str, choice: str):
         """接受 PVP 挑戰並進行猜拳遊戲"""
         from app.schemas.bot import PVPResponse
-        
+
         try:
             # 將 challenge_id 轉換為 ObjectId
             try:
@@ -284,157 +429,23 @@ class GameService:
                     success=False,
                     message="無效的挑戰 ID"
                 )
-            
-            # 查找挑戰
-            challenge = await self.db[Collections.PVP_CHALLENGES].find_one({
-                "_id": challenge_oid,
-                "status": {"$in": ["pending", "waiting_accepter"]}
-            })
-            
-            if not challenge:
-                return PVPResponse(
-                    success=False,
-                    message="挑戰不存在或已結束"
-                )
-            
-            # 檢查發起人是否已選擇
-            if not challenge.get("challenger_choice"):
-                return PVPResponse(
-                    success=False,
-                    message="發起人尚未選擇猜拳，請稍後再試"
-                )
-            
-            # 檢查是否過期
-            expires_at = challenge["expires_at"]
-            if not expires_at.tzinfo:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if datetime.now(timezone.utc) > expires_at:
-                await self.db[Collections.PVP_CHALLENGES].update_one(
-                    {"_id": challenge_oid},
-                    {"$set": {"status": "expired"}}
-                )
-                return PVPResponse(
-                    success=False,
-                    message="挑戰已過期"
-                )
-            
-            # 檢查是否為發起者本人
-            if challenge["challenger"] == from_user:
-                return PVPResponse(
-                    success=False,
-                    message="不能接受自己的挑戰！"
-                )
-            
-            # 檢查接受者是否存在且有足夠點數
-            accepter = await self.db[Collections.USERS].find_one({"telegram_id": from_user})
-            if not accepter:
-                return PVPResponse(
-                    success=False,
-                    message="使用者不存在，請先註冊"
-                )
-            
-            amount = challenge["amount"]
-            
-            # 使用債務驗證服務檢查用戶狀態和資金
-            from app.core.user_validation import UserValidationService
-            validation_service = UserValidationService(self.db)
-            
-            validation_result = await validation_service.validate_user_can_spend(
-                user_id=accepter["_id"],
-                amount=amount,
-                operation_type="PvP挑戰"
-            )
-            
-            if not validation_result['can_spend']:
-                error_code = validation_result.get('error_code', 'UNKNOWN')
-                
-                if error_code == 'ACCOUNT_DISABLED':
-                    message = "帳戶未啟用，無法參與 PvP 挑戰"
-                elif error_code == 'ACCOUNT_FROZEN':
-                    message = "帳戶已凍結，無法參與 PvP 挑戰"
-                elif error_code == 'HAS_DEBT':
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    message = f"帳戶有欠款 {owed_points} 點，請先償還後才能參與 PvP 挑戰"
-                elif error_code == 'INSUFFICIENT_BALANCE':
-                    available_balance = validation_result.get('available_balance', 0)
-                    current_points = validation_result.get('user_data', {}).get('points', 0)
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    if owed_points > 0:
-                        message = f"可用點數不足！需要：{amount} 點，目前點數：{current_points} 點，欠款：{owed_points} 點，實際可用：{available_balance} 點"
-                    else:
-                        message = f"點數不足！需要：{amount} 點，目前點數：{available_balance} 點"
-                else:
-                    message = validation_result['message']
-                
+
+            try:
+                settlement = await self._resolve_challenge(from_user, challenge_oid, choice)
+            except PvPSettlementError as e:
                 return PVPResponse(
                     success=False,
-                    message=message
+                    message=str(e)
                 )
-            
-            # 使用發起者預先選擇的猜拳
+
+            challenge = settlement["challenge"]
             challenger_choice = challenge["challenger_choice"]
-            
-            # 判斷勝負
-            result = self._determine_winner(challenger_choice, choice)
-            
-            # 更新挑戰狀態
-            await self.db[Collections.PVP_CHALLENGES].update_one(
-                {"_id": challenge_oid},
-                {
-                    "$set": {
-                        "accepter": from_user,
-                        "accepter_name": accepter.get("name", "未知使用者"),
-                        "accepter_choice": choice,
-                        "result": result,
-                        "status": "completed",
-                        "completed_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            
-            # 處理點數轉移
-            challenger_user = await self.db[Collections.USERS].find_one({"telegram_id": challenge["challenger"]})
-            
-            if result == "challenger_wins":
+            amount = settlement["amount"]
+
+            if settlement["result"] == "challenger_wins":
                 # 發起者勝利
-                winner_name = challenge["challenger_name"]
-                loser_name = accepter.get("name", "未知使用者")
-                
-                # 轉移點數 - 使用安全扣除
-                deduction_result = await self._safe_deduct_points(
-                    user_id=accepter["_id"],
-                    amount=amount,
-                    operation_note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
-                if not deduction_result['success']:
-                    # 點數扣除失敗，應該不會發生，但作為安全措施
-                    logger.error(f"PVP game point deduction failed: {deduction_result['message']}")
-                    return PVPResponse(
-                        success=False,
-                        message=f"遊戲結算失敗：{deduction_result['message']}"
-                    )
-                
-                # 增加勝利者點數
-                await self.db[Collections.USERS].update_one(
-                    {"telegram_id": challenge["challenger"]},
-                    {"$inc": {"points": amount}}
-                )
-                
-                # 記錄點數變動
-                await self._log_point_change(
-                    user_id=challenger_user["_id"],
-                    change_type="pvp_win",
-                    amount=amount,
-                    note=f"PVP 勝利獲得 {amount} 點 (對手: {loser_name})"
-                )
-                await self._log_point_change(
-                    user_id=accepter["_id"],
-                    change_type="pvp_lose",
-                    amount=-amount,
-                    note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
+                winner_name = settlement["winner_name"]
+                loser_name = settlement["loser_name"]
                 return PVPResponse(
                     success=True,
                     message=f"🎉 遊戲結束！\n{self._get_choice_emoji(challenger_choice)} {winner_name} 出 {self._get_choice_name(challenger_choice)}\n{self._get_choice_emoji(choice)} {loser_name} 出 {self._get_choice_name(choice)}\n\n🏆 {winner_name} 勝利！獲得 {amount} 點！",
@@ -442,47 +453,11 @@ class GameService:
                     loser=from_user,
                     amount=amount
                 )
-                
-            elif result == "accepter_wins":
+
+            elif settlement["result"] == "accepter_wins":
                 # 接受者勝利
-                winner_name = accepter.get("name", "未知使用者")
-                loser_name = challenge["challenger_name"]
-                
-                # 轉移點數 - 使用安全扣除
-                deduction_result = await self._safe_deduct_points(
-                    user_id=challenger_user["_id"],
-                    amount=amount,
-                    operation_note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
-                if not deduction_result['success']:
-                    # 點數扣除失敗，應該不會發生，但作為安全措施
-                    logger.error(f"PVP game point deduction failed: {deduction_result['message']}")
-                    return PVPResponse(
-                        success=False,
-                        message=f"遊戲結算失敗：{deduction_result['message']}"
-                    )
-                
-                # 增加勝利者點數
-                await self.db[Collections.USERS].update_one(
-                    {"telegram_id": from_user},
-                    {"$inc": {"points": amount}}
-                )
-                
-                # 記錄點數變動
-                await self._log_point_change(
-                    user_id=accepter["_id"],
-                    change_type="pvp_win",
-                    amount=amount,
-                    note=f"PVP 勝利獲得 {amount} 點 (對手: {loser_name})"
-                )
-                await self._log_point_change(
-                    user_id=challenger_user["_id"],
-                    change_type="pvp_lose",
-                    amount=-amount,
-                    note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
+                winner_name = settlement["winner_name"]
+                loser_name = settlement["loser_name"]
                 return PVPResponse(
                     success=True,
                     message=f"🎉 遊戲結束！\n{self._get_choice_emoji(challenger_choice)} {loser_name} 出 {self._get_choice_name(challenger_choice)}\n{self._get_choice_emoji(choice)} {winner_name} 出 {self._get_choice_name(choice)}\n\n🏆 {winner_name} 勝利！獲得 {amount} 點！",
@@ -490,25 +465,25 @@ class GameService:
                     loser=challenge["challenger"],
                     amount=amount
                 )
-                
+
             else:  # tie
                 return PVPResponse(
                     success=True,
-                    message=f"🤝 平手！\n{self._get_choice_emoji(challenger_choice)} {challenge['challenger_name']} 出 {self._get_choice_name(challenger_choice)}\n{self._get_choice_emoji(choice)} {accepter.get('name', '未知使用者')} 出 {self._get_choice_name(choice)}\n\n沒有點數變動！",
+                    message=f"🤝 平手！\n{self._get_choice_emoji(challenger_choice)} {challenge['challenger_name']} 出 {self._get_choice_name(challenger_choice)}\n{self._get_choice_emoji(choice)} {settlement['accepter_name']} 出 {self._get_choice_name(choice)}\n\n沒有點數變動！",
                     amount=0
                 )
-                
+
         except Exception as e:
             logger.error(f"Error accepting PVP challenge: {e}")
             return PVPResponse(
                 success=False,
                 message="接受挑戰失敗，請稍後再試"
             )
-    
+
     async def cancel_pvp_challenge(self, user_id: str, challenge_id: str):
         """取消 PVP 挑戰"""
         from app.schemas.bot import PVPResponse
-        
+
         try:
             # 將 challenge_id 轉換為 ObjectId
             try:
@@ -518,39 +493,37 @@ class GameService:
                     success=False,
                     message="無效的挑戰 ID"
                 )
-            
-            # 查找挑戰
-            challenge = await self.db[Collections.PVP_CHALLENGES].find_one({
-                "_id": challenge_oid,
-                "challenger": user_id,
-                "status": {"$in": ["pending", "waiting_accepter"]}
-            })
-            
-            if not challenge:
-                return PVPResponse(
-                    success=False,
-                    message="挑戰不存在、已結束或你不是發起者"
-                )
-            
-            # 更新挑戰狀態為取消
-            await self.db[Collections.PVP_CHALLENGES].update_one(
-                {"_id": challenge_oid},
+
+            # 條件式更新：只有發起者本人且挑戰仍未結束時才會取消
+            challenge = await self.db[Collections.PVP_CHALLENGES].find_one_and_update(
+                {
+                    "_id": challenge_oid,
+                    "challenger": user_id,
+                    "status": {"$in": PVP_OPEN_STATUSES}
+                },
                 {
                     "$set": {
                         "status": "cancelled",
                         "cancelled_at": datetime.now(timezone.utc),
                         "cancel_reason": "使用者主動取消"
                     }
-                }
+                },
+                projection={"_id": 1}
             )
-            
+
+            if not challenge:
+                return PVPResponse(
+                    success=False,
+                    message="挑戰不存在、已結束或你不是發起者"
+                )
+
             logger.info(f"PVP 挑戰 {challenge_id} 已被使用者 {user_id} 取消")
-            
+
             return PVPResponse(
                 success=True,
                 message="PVP 挑戰已成功取消"
             )
-            
+
         except Exception as e:
             logger.error(f"Error cancelling PVP challenge: {e}")
             return PVPResponse(
@@ -564,9 +537,10 @@ class GameService:
             # 查找使用者的活躍挑戰
             challenges = await self.db[Collections.PVP_CHALLENGES].find({
                 "challenger": user_id,
-                "status": {"$in": ["pending", "waiting_accepter"]}
+                "status": {"$in": PVP_OPEN_STATUSES},
+                "expires_at": {"$gt": datetime.now(timezone.utc)}
             }).to_list(length=None)
-            
+
             challenge_list = []
             for challenge in challenges:
                 challenge_info = {
@@ -578,15 +552,15 @@ class GameService:
                     "chat_id": challenge.get("chat_id")
                 }
                 challenge_list.append(challenge_info)
-            
+
             logger.info(f"Found {len(challenge_list)} active challenges for user {user_id}")
-            
+
             return {
                 "success": True,
                 "message": f"找到 {len(challenge_list)} 個活躍挑戰",
                 "challenges": challenge_list
             }
-            
+
         except Exception as e:
             logger.error(f"Error getting user active challenges: {e}")
             return {
@@ -594,32 +568,83 @@ class GameService:
                 "message": "查詢挑戰時發生錯誤",
                 "challenges": []
             }
-    
+
+    async def set_challenge_message(self, challenge_id: str, message_id: int) -> dict:
+        """記錄挑戰訊息的 message_id，BOT 重啟後仍可編輯原始挑戰訊息"""
+        try:
+            result = await self.db[Collections.PVP_CHALLENGES].update_one(
+                {"_id": ObjectId(challenge_id), "status": {"$in": PVP_OPEN_STATUSES}},
+                {"$set": {"message_id": message_id}}
+            )
+            return {"success": result.matched_count > 0}
+        except Exception as e:
+            logger.error(f"Error storing PVP challenge message: {e}")
+            return {"success": False}
+
+    @staticmethod
+    def _to_utc_iso(value: Optional[datetime]) -> Optional[str]:
+        # MongoDB 回傳的 datetime 不帶時區，實際為 UTC
+        if value is None:
+            return None
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+
+    async def get_open_challenges(self) -> dict:
+        """列出所有尚未到期的挑戰（BOT 啟動時重建本地狀態用）"""
+        try:
+            challenges = await self.db[Collections.PVP_CHALLENGES].find(
+                {
+                    "status": {"$in": PVP_OPEN_STATUSES},
+                    "expires_at": {"$gt": datetime.now(timezone.utc)}
+                },
+                {
+                    "challenger": 1, "challenger_name": 1, "amount": 1, "chat_id": 1,
+                    "message_id": 1, "status": 1, "created_at": 1, "expires_at": 1
+                }
+            ).sort("expires_at", 1).to_list(length=None)
+
+            return {
+                "success": True,
+                "challenges": [{
+                    "challenge_id": str(challenge["_id"]),
+                    "challenger": challenge.get("challenger"),
+                    "challenger_name": challenge.get("challenger_name"),
+                    "amount": challenge.get("amount", 0),
+                    "chat_id": challenge.get("chat_id"),
+                    "message_id": challenge.get("message_id"),
+                    "status": challenge.get("status"),
+                    "created_at": self._to_utc_iso(challenge.get("created_at")),
+                    "expires_at": self._to_utc_iso(challenge.get("expires_at"))
+                } for challenge in challenges]
+            }
+        except Exception as e:
+            logger.error(f"Error listing open PVP challenges: {e}")
+            return {"success": False, "challenges": []}
+
     def _determine_winner(self, choice1: str, choice2: str) -> str:
         """判斷猜拳勝負"""
         if choice1 == choice2:
             return "tie"
-        
+
         winning_combinations = {
             ("rock", "scissors"): "challenger_wins",
-            ("paper", "rock"): "challenger_wins", 
+            ("paper", "rock"): "challenger_wins",
             ("scissors", "paper"): "challenger_wins",
             ("scissors", "rock"): "accepter_wins",
             ("rock", "paper"): "accepter_wins",
             ("paper", "scissors"): "accepter_wins"
         }
-        
+
         return winning_combinations.get((choice1, choice2), "tie")
-    
+
     def _get_choice_emoji(self, choice: str) -> str:
         """獲取選擇對應的 emoji"""
         emojis = {
             "rock": "🪨",
-            "paper": "📄", 
+            "paper": "📄",
             "scissors": "✂️"
         }
         return emojis.get(choice, "❓")
-    
+
     def _get_choice_name(self, choice: str) -> str:
         """獲取選擇對應的中文名稱"""
         names = {
@@ -628,7 +653,7 @@ class GameService:
             "scissors": "剪刀"
         }
         return names.get(choice, "未知")
-    
+
     def _escape_markdown(self, text: str) -> str:
         """轉義 Markdown V2 特殊字符"""
         # MarkdownV2 需要轉義的字符
@@ -636,35 +661,13 @@ class GameService:
         for char in escape_chars:
             text = text.replace(char, f'\\{char}')
         return text
-    
-    async def _log_point_change(self, user_id, change_type: str, amount: int, note: str = ""):
-        """記錄點數變動"""
-        try:
-            # 獲取使用者目前餘額
-            user = await self.db[Collections.USERS].find_one({"_id": user_id})
-            balance_after = user.get("points", 0) if user else 0
-            
-            log_entry = {
-                "user_id": user_id,
-                "type": change_type,  # 使用統一的欄位名稱
-                "amount": amount,
-                "note": note,
-                "balance_after": balance_after,  # 添加餘額記錄
-                "created_at": datetime.now(timezone.utc)  # 使用統一的時間欄位名稱
-            }
-            await self.db[Collections.POINT_LOGS].insert_one(log_entry)
-            logger.info(f"Point change logged: user_id={user_id}, type={change_type}, amount={amount}, balance_after={balance_after}")
-            
-        except Exception as e:
-            logger.error(f"Failed to log point change: {e}")
-            # 不拋出異常，避免影響主要業務邏輯
-    
+
     async def simple_accept_pvp_challenge(self, from_user: str, challenge_id: str):
         """簡單 PVP 挑戰接受 - 純 50% 機率決定勝負"""
         from app.schemas.bot import PVPResponse
-        
+
         logger.info(f"Simple PVP accept: user {from_user}, challenge {challenge_id}")
-        
+
         try:
             # 將 challenge_id 轉換為 ObjectId
             try:
@@ -675,237 +678,34 @@ class GameService:
                     success=False,
                     message="無效的挑戰 ID"
                 )
-            
-            # 查找挑戰
-            challenge = await self.db[Collections.PVP_CHALLENGES].find_one({
-                "_id": challenge_oid,
-                "status": {"$in": ["pending", "waiting_accepter"]}
-            })
-            
-            logger.info(f"Looking for challenge {challenge_id}, found: {challenge is not None}")
-            
-            if not challenge:
-                # 嘗試查找任何狀態的挑戰來調試
-                any_challenge = await self.db[Collections.PVP_CHALLENGES].find_one({"_id": challenge_oid})
-                if any_challenge:
-                    logger.warning(f"Challenge {challenge_id} exists but has status: {any_challenge.get('status')}")
-                else:
-                    logger.warning(f"Challenge {challenge_id} does not exist in database")
-                
-                return PVPResponse(
-                    success=False,
-                    message="挑戰不存在或已結束"
-                )
-            
-            # 檢查是否過期
-            expires_at = challenge["expires_at"]
-            if not expires_at.tzinfo:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if datetime.now(timezone.utc) > expires_at:
-                await self.db[Collections.PVP_CHALLENGES].update_one(
-                    {"_id": challenge_oid},
-                    {"$set": {"status": "expired"}}
-                )
-                return PVPResponse(
-                    success=False,
-                    message="挑戰已過期"
-                )
-            
-            # 檢查是否為發起者本人
-            if challenge["challenger"] == from_user:
-                return PVPResponse(
-                    success=False,
-                    message="不能接受自己的挑戰！"
-                )
-            
-            # 檢查接受者是否存在
-            accepter = await self.db[Collections.USERS].find_one({"telegram_id": from_user})
-            if not accepter:
-                return PVPResponse(
-                    success=False,
-                    message="使用者不存在，請先註冊"
-                )
-            
-            amount = challenge["amount"]
-            
-            # 使用債務驗證服務檢查接受者狀態和資金
-            from app.core.user_validation import UserValidationService
-            validation_service = UserValidationService(self.db)
-            
-            validation_result = await validation_service.validate_user_can_spend(
-                user_id=accepter["_id"],
-                amount=amount,
-                operation_type="PvP挑戰"
-            )
-            
-            if not validation_result['can_spend']:
-                error_code = validation_result.get('error_code', 'UNKNOWN')
-                
-                if error_code == 'ACCOUNT_DISABLED':
-                    message = "帳戶未啟用，無法參與 PvP 挑戰"
-                elif error_code == 'ACCOUNT_FROZEN':
-                    message = "帳戶已凍結，無法參與 PvP 挑戰"
-                elif error_code == 'HAS_DEBT':
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    message = f"帳戶有欠款 {owed_points} 點，請先償還後才能參與 PvP 挑戰"
-                elif error_code == 'INSUFFICIENT_BALANCE':
-                    available_balance = validation_result.get('available_balance', 0)
-                    current_points = validation_result.get('user_data', {}).get('points', 0)
-                    owed_points = validation_result.get('user_data', {}).get('owed_points', 0)
-                    if owed_points > 0:
-                        message = f"可用點數不足！需要：{amount} 點，目前點數：{current_points} 點，欠款：{owed_points} 點，實際可用：{available_balance} 點"
-                    else:
-                        message = f"點數不足！需要：{amount} 點，目前點數：{available_balance} 點"
-                else:
-                    message = validation_result['message']
-                
-                return PVPResponse(
-                    success=False,
-                    message=message
-                )
-            
-            # 檢查發起者也有足夠點數
-            challenger_user = await self.db[Collections.USERS].find_one({"telegram_id": challenge["challenger"]})
-            if not challenger_user:
-                return PVPResponse(
-                    success=False,
-                    message="發起者不存在"
-                )
-                
-            challenger_validation = await validation_service.validate_user_can_spend(
-                user_id=challenger_user["_id"],
-                amount=amount,
-                operation_type="PvP挑戰"
-            )
-            
-            if not challenger_validation['can_spend']:
+
+            try:
+                settlement = await self._resolve_challenge(from_user, challenge_oid)
+            except PvPSettlementError as e:
+                logger.info(f"Simple PVP accept rejected for challenge {challenge_id}: {e}")
                 return PVPResponse(
                     success=False,
-                    message="發起者點數不足，挑戰無效"
+                    message=str(e)
                 )
-            
-            # 50% 機率決定勝負
-            accepter_wins = bool(random.getrandbits(1))
-            logger.info(f"PVP result: accepter_wins = {accepter_wins}")
-            
-            # 更新挑戰狀態
-            await self.db[Collections.PVP_CHALLENGES].update_one(
-                {"_id": challenge_oid},
-                {
-                    "$set": {
-                        "accepter": from_user,
-                        "accepter_name": accepter.get("name", "未知使用者"),
-                        "result": "accepter_wins" if accepter_wins else "challenger_wins",
-                        "status": "completed",
-                        "completed_at": datetime.now(timezone.utc)
-                    }
-                }
+
+            challenge = settlement["challenge"]
+            amount = settlement["amount"]
+            winner_name = settlement["winner_name"]
+            loser_name = settlement["loser_name"]
+            accepter_wins = settlement["result"] == "accepter_wins"
+            logger.info(f"PVP result: accepter_wins = {accepter_wins}, {winner_name} gets {amount} points from {loser_name}")
+
+            return PVPResponse(
+                success=True,
+                message=f"🎉 *遊戲結束！*\n\n🏆 *{self._escape_markdown(winner_name)}* 勝利！獲得 *{amount}* 點！\n💔 *{self._escape_markdown(loser_name)}* 失去 *{amount}* 點！",
+                winner=from_user if accepter_wins else challenge["challenger"],
+                loser=challenge["challenger"] if accepter_wins else from_user,
+                amount=amount
             )
-            
-            # 處理點數轉移
-            logger.info(f"Starting point transfer: amount={amount}, accepter_wins={accepter_wins}")
-            
-            if accepter_wins:
-                # 接受者勝利
-                winner_name = accepter.get("name", "未知使用者")
-                loser_name = challenge["challenger_name"]
-                logger.info(f"Accepter wins: {winner_name} gets {amount} points from {loser_name}")
-                
-                # 使用安全扣除
-                deduction_result = await self._safe_deduct_points(
-                    user_id=challenger_user["_id"],
-                    amount=amount,
-                    operation_note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
-                if not deduction_result['success']:
-                    logger.error(f"PVP game point deduction failed: {deduction_result['message']}")
-                    return PVPResponse(
-                        success=False,
-                        message=f"遊戲結算失敗：{deduction_result['message']}"
-                    )
-                
-                # 增加勝利者點數並記錄
-                update_result = await self.db[Collections.USERS].update_one(
-                    {"telegram_id": from_user},
-                    {"$inc": {"points": amount}}
-                )
-                
-                if update_result.modified_count > 0:
-                    # 記錄勝利者點數變動（敗方的點數扣除已在 _safe_deduct_points 中記錄）
-                    await self._log_point_change(
-                        user_id=accepter["_id"],
-                        change_type="pvp_win",
-                        amount=amount,
-                        note=f"PVP 勝利獲得 {amount} 點 (對手: {loser_name})"
-                    )
-                else:
-                    logger.error("Failed to update accepter's points")
-                    return PVPResponse(
-                        success=False,
-                        message="點數增加失敗"
-                    )
-                
-                return PVPResponse(
-                    success=True,
-                    message=f"🎉 *遊戲結束！*\n\n🏆 *{self._escape_markdown(winner_name)}* 勝利！獲得 *{amount}* 點！\n💔 *{self._escape_markdown(loser_name)}* 失去 *{amount}* 點！",
-                    winner=from_user,
-                    loser=challenge["challenger"],
-                    amount=amount
-                )
-                
-            else:
-                # 發起者勝利
-                winner_name = challenge["challenger_name"]
-                loser_name = accepter.get("name", "未知使用者")
-                logger.info(f"Challenger wins: {winner_name} gets {amount} points from {loser_name}")
-                
-                # 使用安全扣除
-                deduction_result = await self._safe_deduct_points(
-                    user_id=accepter["_id"],
-                    amount=amount,
-                    operation_note=f"PVP 失敗失去 {amount} 點 (對手: {winner_name})"
-                )
-                
-                if not deduction_result['success']:
-                    logger.error(f"PVP game point deduction failed: {deduction_result['message']}")
-                    return PVPResponse(
-                        success=False,
-                        message=f"遊戲結算失敗：{deduction_result['message']}"
-                    )
-                
-                # 增加勝利者點數並記錄
-                update_result = await self.db[Collections.USERS].update_one(
-                    {"telegram_id": challenge["challenger"]},
-                    {"$inc": {"points": amount}}
-                )
-                
-                if update_result.modified_count > 0:
-                    # 記錄勝利者點數變動（敗方的點數扣除已在 _safe_deduct_points 中記錄）
-                    await self._log_point_change(
-                        user_id=challenger_user["_id"],
-                        change_type="pvp_win",
-                        amount=amount,
-                        note=f"PVP 勝利獲得 {amount} 點 (對手: {loser_name})"
-                    )
-                else:
-                    logger.error("Failed to update challenger's points")
-                    return PVPResponse(
-                        success=False,
-                        message="點數增加失敗"
-                    )
-                
-                return PVPResponse(
-                    success=True,
-                    message=f"🎉 *遊戲結束！*\n\n🏆 *{self._escape_markdown(winner_name)}* 勝利！獲得 *{amount}* 點！\n💔 *{self._escape_markdown(loser_name)}* 失去 *{amount}* 點！",
-                    winner=challenge["challenger"],
-                    loser=from_user,
-                    amount=amount
-                )
-                
+
         except Exception as e:
             logger.error(f"Error in simple PVP challenge: {e}")
             return PVPResponse(
                 success=False,
                 message="接受挑戰失敗，請稍後再試"
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,644 @@
+"""
+系統完整性稽核服務 - 以伺服器端聚合檢查點數與持股不變量
+
+每個不變量各用一次聚合（$facet / $group / $lookup）在資料庫端算完，
+不再把所有使用者、持股或訂單讀回 Python 逐筆檢查；修復時以
+bulk_write / update_many 批次寫入。支援只稽核「上次檢查點之後有異動
+的使用者」的增量模式，並可由背景排程定期執行。
+
+檢查項目：
+- 點數總覽：點數與欠款總和、負點數、有點數卻仍有欠款
+- 持股總覽：持股總和、負持股
+- 持股與成交紀錄：持股 = 開盤持股 + 買進成交 - 賣出成交
+- 賣單保留量：未成交賣單數量總和不得超過持股
+- 無效訂單：數量 <= 0 但尚未成交或取消
+- IPO：已發行股數 = 系統賣出成交量，持股總和與發行量一致
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from app.core.config_refactored import config
+from app.services.points_ledger import PointsLedger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from bson import ObjectId
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 增量稽核檢查點（存放於 market_config）
+AUDIT_CHECKPOINT_TYPE = "integrity_audit_checkpoint"
+
+# 尚未成交的訂單狀態
+OPEN_ORDER_STATUSES = ["pending", "pending_limit", "partial"]
+
+# 報告中每一類問題最多列出的筆數
+MAX_REPORTED_ITEMS = 100
+
+# 每批 bulk_write 的筆數
+AUDIT_BATCH_SIZE = 1000
+
+
+def get_integrity_audit_service() -> IntegrityAuditService:
+    """IntegrityAuditService 的依賴注入函數"""
+    return IntegrityAuditService()
+
+
+def _user_lookup_stages(local_field: str = "user_id") -> List[dict]:
+    """以 $lookup 帶出使用者名稱與隊伍"""
+    return [
+        {"$lookup": {
+            "from": Collections.USERS,
+            "localField": local_field,
+            "foreignField": "_id",
+            "as": "user"
+        }},
+        {"$set": {
+            "username": {"$ifNull": [{"$arrayElemAt": ["$user.name", 0]}, "Unknown"]},
+            "team": {"$ifNull": [{"$arrayElemAt": ["$user.team", 0]}, "無"]}
+        }},
+        {"$unset": "user"}
+    ]
+
+
+class IntegrityAuditService:
+    def __init__(self, db: AsyncIOMotorDatabase = None, batch_size: int = AUDIT_BATCH_SIZE):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.batch_size = batch_size
+        self.ledger = PointsLedger(self.db)
+
+    # ========== 稽核範圍 ==========
+
+    @staticmethod
+    def _scope_match(field: str, scope: Optional[List[ObjectId]]) -> dict:
+        """scope 為 None 時檢查全部使用者"""
+        return {} if scope is None else {field: {"$in": scope}}
+
+    async def get_checkpoint(self) -> Optional[datetime]:
+        """取得上次稽核檢查點"""
+        doc = await self.db[Collections.MARKET_CONFIG].find_one({"type": AUDIT_CHECKPOINT_TYPE})
+        return doc.get("checked_at") if doc else None
+
+    async def save_checkpoint(self, checked_at: datetime) -> None:
+        await self.db[Collections.MARKET_CONFIG].update_one(
+            {"type": AUDIT_CHECKPOINT_TYPE},
+            {"$set": {"checked_at": checked_at, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def touched_users(self, since: datetime) -> List[ObjectId]:
+        """檢查點之後有點數異動、成交或下單的使用者"""
+        since_match = {"created_at": {"$gte": since}}
+        touched = set(await self.db[Collections.POINT_LOGS].distinct("user_id", since_match))
+        touched.update(await self.db[Collections.TRADES].distinct("buy_user_id", since_match))
+        touched.update(await self.db[Collections.TRADES].distinct("sell_user_id", since_match))
+        touched.update(await self.db[Collections.STOCK_ORDERS].distinct("user_id", since_match))
+        # 排除 SYSTEM / MARKET 等非使用者對手方
+        return [user_id for user_id in touched if isinstance(user_id, ObjectId)]
+
+    # ========== 點數 ==========
+
+    async def audit_balances(self, scope: Optional[List[ObjectId]] = None) -> Dict[str, Any]:
+        """
+        一次 $facet 聚合計算點數總覽、負點數、負欠款與未償還欠款人數
+
+        Returns:
+            dict: total_users / total_points / total_owed / negative / negative_debt / unsettled_debt_count
+        """
+        pipeline: List[dict] = []
+        if scope is not None:
+            pipeline.append({"$match": self._scope_match("_id", scope)})
+        pipeline.append({"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total_users": {"$sum": 1},
+                "total_points": {"$sum": {"$ifNull": ["$points", 0]}},
+                "total_owed": {"$sum": {"$max": [{"$ifNull": ["$owed_points", 0]}, 0]}}
+            }}],
+            "negative": [
+                {"$match": {"points": {"$lt": 0}}},
+                {"$project": {"name": 1, "username": 1, "team": 1, "points": 1}}
+            ],
+            "negative_debt": [
+                {"$match": {"owed_points": {"$lt": 0}}},
+                {"$project": {"name": 1, "team": 1, "points": 1, "owed_points": 1}}
+            ],
+            # 部分入帳路徑（例如批次發點）刻意不自動償還欠款，有點數又有欠款屬正常狀態，只統計人數
+            "unsettled_debt": [
+                {"$match": {"points": {"$gt": 0}, "owed_points": {"$gt": 0}}},
+                {"$count": "count"}
+            ]
+        }})
+
+        result = await self.db[Collections.USERS].aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        facets = result[0] if result else {}
+        totals = (facets.get("totals") or [{}])[0]
+        return {
+            "total_users": totals.get("total_users", 0),
+            "total_points": totals.get("total_points", 0),
+            "total_owed": totals.get("total_owed", 0),
+            "negative": facets.get("negative", []),
+            "negative_debt": facets.get("negative_debt", []),
+            "unsettled_debt_count": (facets.get("unsettled_debt") or [{}])[0].get("count", 0)
+        }
+
+    @staticmethod
+    def format_negative_user(user: dict) -> dict:
+        return {
+            "user_id": str(user["_id"]),
+            "username": user.get("username", user.get("name", "未知")),
+            "points": user.get("points", 0),
+            "team": user.get("team", "無")
+        }
+
+    async def fix_negative_balances(self, negative_users: List[dict]) -> int:
+        """將負點數設為 0 並寫入修復日誌，回傳實際修復的筆數"""
+        fixed_count = 0
+        for start in range(0, len(negative_users), self.batch_size):
+            batch = negative_users[start:start + self.batch_size]
+            # 條件帶稽核時讀到的點數，稽核後點數已變動（入帳或已被其他修復處理）的使用者不會更新，
+            # 日誌因此可以直接記錄稽核值
+            result = await self.db[Collections.USERS].bulk_write([
+                UpdateOne({"_id": u["_id"], "points": u["points"]}, {"$set": {"points": 0}})
+                for u in batch
+            ], ordered=False)
+            fixed = batch
+            if result.modified_count < len(batch):
+                # 有部分使用者點數已變動：只替目前點數為 0 的使用者寫日誌
+                current = await self.db[Collections.USERS].find(
+                    {"_id": {"$in": [u["_id"] for u in batch]}, "points": 0}, {"_id": 1}
+                ).to_list(length=None)
+                zeroed = {u["_id"] for u in current}
+                fixed = [u for u in batch if u["_id"] in zeroed]
+            fixed_count += result.modified_count
+
+            now = datetime.now(timezone.utc)
+            await self.ledger.write_logs([
+                self.ledger._build_log(
+                    u["_id"], "admin_fix", abs(u["points"]),
+                    f"系統修復負點數：{u['points']} -> 0", 0, None, now
+                ) for u in fixed
+            ])
+        logger.info(f"Fixed {fixed_count} of {len(negative_users)} negative balances")
+        return fixed_count
+
+    # ========== 持股 ==========
+
+    async def audit_holdings(self, scope: Optional[List[ObjectId]] = None) -> Dict[str, Any]:
+        """
+        一次 $facet 聚合計算持股總覽與負持股（附使用者名稱）
+
+        Returns:
+            dict: holding_records / total_shares / negative
+        """
+        pipeline: List[dict] = []
+        if scope is not None:
+            pipeline.append({"$match": self._scope_match("user_id", scope)})
+        pipeline.append({"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "holding_records": {"$sum": 1},
+                "total_shares": {"$sum": {"$ifNull": ["$stock_amount", 0]}}
+            }}],
+            "negative": [
+                {"$match": {"stock_amount": {"$lt": 0}}},
+                {"$project": {"user_id": 1, "stock_amount": 1}},
+                *_user_lookup_stages()
+            ]
+        }})
+
+        result = await self.db[Collections.STOCKS].aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        facets = result[0] if result else {}
+        totals = (facets.get("totals") or [{}])[0]
+        return {
+            "holding_records": totals.get("holding_records", 0),
+            "total_shares": totals.get("total_shares", 0),
+            "negative": facets.get("negative", [])
+        }
+
+    async def cancel_open_sell_orders(self, user_ids: List[Any], reason: str) -> int:
+        """取消指定使用者的所有待成交賣單，回傳取消筆數"""
+        if not user_ids:
+            return 0
+        result = await self.db[Collections.STOCK_ORDERS].update_many(
+            {
+                "user_id": {"$in": user_ids},
+                "side": "sell",
+                "status": {"$in": OPEN_ORDER_STATUSES}
+            },
+            {
+                "$set": {
+                    "status": "cancelled",
+                    "cancelled_at": datetime.now(timezone.utc),
+                    "cancel_reason": reason
+                }
+            }
+        )
+        return result.modified_count
+
+    async def fix_negative_holdings(self, negative_holdings: List[dict],
+                                    cancel_pending_orders: bool = True) -> Dict[str, int]:
+        """將負持股批次設為 0，可同時取消相關使用者的待成交賣單"""
+        cancelled_orders = 0
+        if cancel_pending_orders:
+            cancelled_orders = await self.cancel_open_sell_orders(
+                list({h["user_id"] for h in negative_holdings}), "系統修復：負股票持有量"
+            )
+        result = await self.db[Collections.STOCKS].update_many(
+            {"_id": {"$in": [h["_id"] for h in negative_holdings]}, "stock_amount": {"$lt": 0}},
+            {"$set": {"stock_amount": 0}}
+        )
+        logger.info(f"Fixed {result.modified_count} negative holdings, cancelled {cancelled_orders} sell orders")
+        return {"fixed_count": result.modified_count, "cancelled_orders": cancelled_orders}
+
+    async def holding_positions(self, scope: Optional[List[ObjectId]] = None) -> Dict[Any, dict]:
+        """
+        每位使用者目前的持股與開盤持股
+
+        開盤持股取持股文件建立時記錄的 initial_amount，舊文件沒有這個欄位時
+        改用使用者文件建立時寫入的 stock_amount；兩者都沒有時 opening 為 None。
+
+        Returns:
+            dict: user_id -> {stock_amount, opening}
+        """
+        pipeline: List[dict] = []
+        if scope is not None:
+            pipeline.append({"$match": self._scope_match("user_id", scope)})
+        pipeline.extend([
+            {"$group": {
+                "_id": "$user_id",
+                "stock_amount": {"$sum": {"$ifNull": ["$stock_amount", 0]}},
+                "initial_amount": {"$first": "$initial_amount"}
+            }},
+            {"$lookup": {
+                "from": Collections.USERS,
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "user"
+            }},
+            {"$project": {
+                "stock_amount": 1,
+                "opening": {"$ifNull": ["$initial_amount", {"$arrayElemAt": ["$user.stock_amount", 0]}]}
+            }}
+        ])
+        return {
+            doc["_id"]: {"stock_amount": doc["stock_amount"], "opening": doc.get("opening")}
+            async for doc in self.db[Collections.STOCKS].aggregate(pipeline, allowDiskUse=True)
+        }
+
+    async def audit_fills(self, scope: Optional[List[ObjectId]] = None) -> Dict[str, Any]:
+        """
+        比對持股與成交紀錄：持股應等於開盤持股 + 買進成交 - 賣出成交
+
+        成交淨額以一次聚合（每筆成交拆成買賣兩腿後 $group）算出；沒有持股文件的
+        使用者開盤持股與持股都視為 0，無法得知開盤持股的使用者略過不比對。
+        已經最終結算的使用者持股被清空，不列入比對。
+
+        Returns:
+            dict: checked / skipped / mismatches
+        """
+        trade_pipeline: List[dict] = []
+        if scope is not None:
+            trade_pipeline.append({"$match": {"$or": [
+                {"buy_user_id": {"$in": scope}},
+                {"sell_user_id": {"$in": scope}}
+            ]}})
+        trade_pipeline.extend([
+            {"$project": {"legs": [
+                {"user_id": "$buy_user_id", "quantity": "$quantity"},
+                {"user_id": "$sell_user_id", "quantity": {"$multiply": ["$quantity", -1]}}
+            ]}},
+            {"$unwind": "$legs"},
+            {"$match": {"legs.user_id": {"$type": "objectId"}}},
+            {"$group": {"_id": "$legs.user_id", "net_fills": {"$sum": "$legs.quantity"}}}
+        ])
+        if scope is not None:
+            trade_pipeline.append({"$match": {"_id": {"$in": scope}}})
+        net_fills = {
+            doc["_id"]: doc["net_fills"]
+            async for doc in self.db[Collections.TRADES].aggregate(trade_pipeline, allowDiskUse=True)
+        }
+
+        holdings = await self.holding_positions(scope)
+
+        settled_match = {"type": "final_settlement", **self._scope_match("user_id", scope)}
+        settled = set(await self.db[Collections.POINT_LOGS].distinct("user_id", settled_match))
+
+        mismatches: List[dict] = []
+        checked = 0
+        skipped = 0
+        for user_id in set(holdings) | set(net_fills):
+            if user_id in settled:
+                continue
+            position = holdings.get(user_id, {"stock_amount": 0, "opening": 0})
+            if position["opening"] is None:
+                skipped += 1
+                continue
+            checked += 1
+            expected = position["opening"] + net_fills.get(user_id, 0)
+            actual = position["stock_amount"]
+            if actual != expected:
+                mismatches.append({
+                    "user_id": str(user_id),
+                    "stock_amount": actual,
+                    "opening": position["opening"],
+                    "expected": expected,
+                    "net_fills": net_fills.get(user_id, 0),
+                    "difference": actual - expected
+                })
+
+        return {"checked": checked, "skipped": skipped, "mismatches": mismatches}
+
+    # ========== 訂單 ==========
+
+    async def audit_reservations(self, scope: Optional[List[ObjectId]] = None) -> List[dict]:
+        """找出未成交賣單數量總和超過持股的使用者（以 $lookup 在資料庫端比對）"""
+        match = {"side": "sell", "status": {"$in": OPEN_ORDER_STATUSES}, **self._scope_match("user_id", scope)}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$user_id", "reserved": {"$sum": "$quantity"}, "orders": {"$sum": 1}}},
+            {"$lookup": {
+                "from": Collections.STOCKS,
+                "localField": "_id",
+                "foreignField": "user_id",
+                "as": "holdings"
+            }},
+            {"$project": {
+                "user_id": "$_id",
+                "reserved": 1,
+                "orders": 1,
+                "stock_amount": {"$sum": "$holdings.stock_amount"}
+            }},
+            {"$match": {"$expr": {"$gt": ["$reserved", "$stock_amount"]}}},
+            *_user_lookup_stages()
+        ]
+        return await self.db[Collections.STOCK_ORDERS].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+    async def find_invalid_orders(self, scope: Optional[List[ObjectId]] = None) -> List[dict]:
+        """找出數量 <= 0 但狀態不是 filled / cancelled 的訂單（附使用者名稱）"""
+        pipeline = [
+            {"$match": {
+                "quantity": {"$lte": 0},
+                "status": {"$nin": ["filled", "cancelled"]},
+                **self._scope_match("user_id", scope)
+            }},
+            *_user_lookup_stages()
+        ]
+        return await self.db[Collections.STOCK_ORDERS].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+    async def cancel_invalid_orders(self, order_ids: List[ObjectId]) -> int:
+        """將無效訂單標記為已取消，回傳修復筆數"""
+        if not order_ids:
+            return 0
+        result = await self.db[Collections.STOCK_ORDERS].update_many(
+            {
+                "_id": {"$in": order_ids},
+                "quantity": {"$lte": 0},
+                "status": {"$nin": ["filled", "cancelled"]}
+            },
+            {
+                "$set": {
+                    "status": "cancelled",
+                    "cancelled_at": datetime.now(timezone.utc),
+                    "cancel_reason": "系統修復：無效數量訂單（quantity <= 0）"
+                }
+            }
+        )
+        return result.modified_count
+
+    # ========== IPO ==========
+
+    async def audit_ipo(self, total_shares: int) -> Dict[str, Any]:
+        """
+        檢查 IPO 發行量：已發行股數應等於系統賣出成交量，
+        持股總和應等於開盤持股總和 + 已發行股數 + 與市場的淨成交量
+
+        有使用者無法得知開盤持股時不比對持股總和（total_matches 為 None）
+        """
+        ipo_config = await self.db[Collections.MARKET_CONFIG].find_one({"type": "ipo_status"}) or {}
+        issued = ipo_config.get("initial_shares", 0) - ipo_config.get("shares_remaining", 0)
+
+        result = await self.db[Collections.TRADES].aggregate([
+            {"$group": {
+                "_id": None,
+                "system_sold": {"$sum": {"$cond": [{"$eq": ["$sell_user_id", "SYSTEM"]}, "$quantity", 0]}},
+                "market_sold": {"$sum": {"$cond": [{"$eq": ["$sell_user_id", "MARKET"]}, "$quantity", 0]}},
+                "market_bought": {"$sum": {"$cond": [{"$eq": ["$buy_user_id", "MARKET"]}, "$quantity", 0]}}
+            }}
+        ]).to_list(length=1)
+        fills = result[0] if result else {}
+        system_sold = fills.get("system_sold", 0)
+        market_net = fills.get("market_sold", 0) - fills.get("market_bought", 0)
+
+        settled = await self.db[Collections.POINT_LOGS].find_one({"type": "final_settlement"}, {"_id": 1})
+        openings = [position["opening"] for position in (await self.holding_positions()).values()]
+        unknown_openings = sum(1 for opening in openings if opening is None)
+        expected_total = sum(opening for opening in openings if opening is not None) + system_sold + market_net
+
+        if settled is not None:
+            # 最終結算後持股已清空，不比對持股總和
+            total_matches = True
+        elif unknown_openings:
+            total_matches = None
+        else:
+            total_matches = total_shares == expected_total
+
+        return {
+            "configured": bool(ipo_config),
+            "issued": issued,
+            "system_sold": system_sold,
+            "issued_matches_fills": issued == system_sold,
+            "total_shares": total_shares,
+            "expected_total_shares": expected_total,
+            "unknown_openings": unknown_openings,
+            "total_matches": total_matches
+        }
+
+    # ========== 稽核 ==========
+
+    async def run_audit(self, fix: bool = False, incremental: bool = False) -> Dict[str, Any]:
+        """
+        執行完整性稽核
+
+        Args:
+            fix: 是否自動修復負點數、負持股、超額賣單與無效訂單
+                （成交紀錄、IPO 與欠款不一致只回報，需人工處理）
+            incremental: 只稽核上次檢查點之後有異動的使用者
+
+        Returns:
+            dict: 各項檢查結果、問題數量與修復統計
+        """
+        started_at = datetime.now(timezone.utc)
+        since = await self.get_checkpoint() if incremental else None
+        scope: Optional[List[ObjectId]] = None
+        if incremental and since is not None:
+            scope = await self.touched_users(since)
+
+        report: Dict[str, Any] = {
+            "success": True,
+            "mode": "incremental" if scope is not None else "full",
+            "fix_mode": fix,
+            "since": since.isoformat() if since else None,
+            "scope_size": len(scope) if scope is not None else None,
+            "check_time": started_at.isoformat()
+        }
+
+        if scope is not None and not scope:
+            report.update(violations=0, message="檢查點之後沒有異動的使用者")
+            await self.save_checkpoint(started_at)
+            return report
+
+        balances = await self.audit_balances(scope)
+        holdings = await self.audit_holdings(scope)
+        fills = await self.audit_fills(scope)
+        reservations = await self.audit_reservations(scope)
+        invalid_orders = await self.find_invalid_orders(scope)
+        # IPO 為全域不變量，只在完整稽核時檢查
+        ipo = None
+        if scope is None:
+            ipo = await self.audit_ipo(holdings["total_shares"])
+
+        report["balances"] = {
+            "total_users": balances["total_users"],
+            "total_points": balances["total_points"],
+            "total_owed": balances["total_owed"],
+            "negative_count": len(balances["negative"]),
+            "negative_users": [self.format_negative_user(u) for u in balances["negative"][:MAX_REPORTED_ITEMS]],
+            "negative_debt_count": len(balances["negative_debt"]),
+            "negative_debt": [{
+                "user_id": str(u["_id"]),
+                "username": u.get("name", "未知"),
+                "points": u.get("points", 0),
+                "owed_points": u.get("owed_points", 0)
+            } for u in balances["negative_debt"][:MAX_REPORTED_ITEMS]],
+            # 資訊用途，不計入問題數
+            "unsettled_debt_count": balances["unsettled_debt_count"]
+        }
+        report["holdings"] = {
+            "holding_records": holdings["holding_records"],
+            "total_shares": holdings["total_shares"],
+            "negative_count": len(holdings["negative"]),
+            "negative_holdings": [{
+                "user_id": str(h["user_id"]),
+                "username": h["username"],
+                "stock_amount": h["stock_amount"]
+            } for h in holdings["negative"][:MAX_REPORTED_ITEMS]]
+        }
+        report["fills"] = {
+            "checked": fills["checked"],
+            "skipped": fills["skipped"],
+            "mismatch_count": len(fills["mismatches"]),
+            "mismatches": fills["mismatches"][:MAX_REPORTED_ITEMS]
+        }
+        report["reservations"] = {
+            "over_reserved_count": len(reservations),
+            "over_reserved": [{
+                "user_id": str(r["user_id"]),
+                "username": r["username"],
+                "reserved": r["reserved"],
+                "stock_amount": r["stock_amount"],
+                "orders": r["orders"]
+            } for r in reservations[:MAX_REPORTED_ITEMS]]
+        }
+        report["invalid_orders"] = {
+            "count": len(invalid_orders),
+            "orders": [{
+                "order_id": str(o["_id"]),
+                "user_id": str(o.get("user_id")),
+                "username": o["username"],
+                "quantity": o.get("quantity", 0),
+                "side": o.get("side", "unknown"),
+                "status": o.get("status", "unknown")
+            } for o in invalid_orders[:MAX_REPORTED_ITEMS]]
+        }
+        report["ipo"] = ipo
+
+        report["violations"] = (
+            len(balances["negative"]) + len(balances["negative_debt"]) +
+            len(holdings["negative"]) + len(fills["mismatches"]) +
+            len(reservations) + len(invalid_orders) +
+            (0 if ipo is None else int(not ipo["issued_matches_fills"]) + int(ipo["total_matches"] is False))
+        )
+
+        if fix:
+            fixes = {"negative_balances": 0, "negative_holdings": 0, "cancelled_sell_orders": 0, "invalid_orders": 0}
+            if balances["negative"]:
+                fixes["negative_balances"] = await self.fix_negative_balances(balances["negative"])
+            if holdings["negative"]:
+                holding_fix = await self.fix_negative_holdings(holdings["negative"])
+                fixes["negative_holdings"] = holding_fix["fixed_count"]
+                fixes["cancelled_sell_orders"] += holding_fix["cancelled_orders"]
+            if reservations:
+                fixes["cancelled_sell_orders"] += await self.cancel_open_sell_orders(
+                    [r["user_id"] for r in reservations], "系統修復：賣單數量超過持股"
+                )
+            if invalid_orders:
+                fixes["invalid_orders"] = await self.cancel_invalid_orders([o["_id"] for o in invalid_orders])
+            report["fixes"] = fixes
+
+        report["message"] = f"完整性稽核完成，發現 {report['violations']} 個問題"
+        await self.save_checkpoint(started_at)
+        logger.info(f"Integrity audit ({report['mode']}) finished with {report['violations']} violations")
+        return report
+
+
+class IntegrityAuditScheduler:
+    """定期執行增量完整性稽核（只回報，不自動修復）"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._last_report: Optional[Dict[str, Any]] = None
+        self._interval_seconds = 0
+
+    async def start(self, interval_seconds: int = None) -> None:
+        """啟動背景排程；間隔為 0 時不啟動"""
+        interval_seconds = config.trading.integrity_audit_interval if interval_seconds is None else interval_seconds
+        if interval_seconds <= 0 or (self._task and not self._task.done()):
+            return
+        self._interval_seconds = interval_seconds
+        self._task = asyncio.create_task(self._loop(interval_seconds))
+        logger.info(f"Integrity audit scheduler started with {interval_seconds}s interval")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("Integrity audit scheduler stopped")
+
+    async def _loop(self, interval_seconds: int) -> None:
+        while True:
+            try:
+                await asyncio.sleep(interval_seconds)
+                report = await IntegrityAuditService().run_audit(incremental=True)
+                self._last_report = report
+                if report.get("violations"):
+                    logger.error(f"INTEGRITY AUDIT: {report['violations']} violations found: {report}")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in integrity audit scheduler: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self._interval_seconds,
+            "last_report": self._last_report
+        }
+
+
+# 全域排程實例
+_integrity_audit_scheduler = IntegrityAuditScheduler()
+
+
+def get_integrity_audit_scheduler() -> IntegrityAuditScheduler:
+    """獲取完整性稽核排程實例"""
+    return _integrity_audit_scheduler
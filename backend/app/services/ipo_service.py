@@ -1,6 +1,7 @@
 from __future__ import annotations
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import get_database, Collections
+from app.services.market_config_snapshot import get_market_config_snapshot
 from datetime import datetime, timezone
 from typing import Optional
 import logging
@@ -25,12 +26,18 @@ class IPOService:
         """
         從資料庫獲取 IPO 設定，如果不存在則從環境變數初始化。
         環境變數: CAMP_IPO_INITIAL_SHARES, CAMP_IPO_INITIAL_PRICE
+
+        傳入 session 時讀寫都在該交易內，呼叫者需在交易提交後呼叫
+        get_market_config_snapshot().invalidate("ipo_status")
         """
-        # 首先嘗試直接獲取
-        ipo_config = await self.db[Collections.MARKET_CONFIG].find_one(
-            {"type": "ipo_status"}, 
-            session=session
-        )
+        # 交易內直接以 session 讀取；其他情況從市場設定快照取得
+        # （剩餘股數由條件式更新把關，快照略舊不影響正確性）
+        if session is not None:
+            ipo_config = await self.db[Collections.MARKET_CONFIG].find_one(
+                {"type": "ipo_status"}, session=session
+            )
+        else:
+            ipo_config = await get_market_config_snapshot().get("ipo_status", self.db)
         if ipo_config:
             return ipo_config
             
@@ -64,6 +71,9 @@ class IPOService:
             {"type": "ipo_status"}, 
             session=session
         )
+        if session is None:
+            # 交易內的寫入在提交前對快照不可見，由呼叫者提交後再標記
+            get_market_config_snapshot().invalidate("ipo_status")
         
         logger.info(f"從環境變數初始化 IPO 狀態: {initial_shares} 股，每股 {initial_price} 點。")
         return ipo_config
@@ -92,7 +102,7 @@ class IPOService:
         
         Args:
             shares_to_deduct: 要扣除的股數
-            session: 資料庫 session（用於交易）
+            session: 資料庫 session（用於交易，提交後由呼叫者標記快照失效）
             
         Returns:
             dict: 更新結果
@@ -123,6 +133,10 @@ class IPOService:
                     "shares_remaining": remaining_shares
                 }
             
+            if session is None:
+                # 交易內的更新由呼叫者在提交後標記，避免提交前就被重新讀取成舊值
+                get_market_config_snapshot().invalidate("ipo_status")
+            
             # 更新成功，獲取更新後的狀態
             updated_ipo = await self.db[Collections.MARKET_CONFIG].find_one(
                 {"type": "ipo_status"}, session=session
@@ -207,6 +221,7 @@ class IPOService:
             )
             
             if result.modified_count > 0 or result.upserted_id:
+                await get_market_config_snapshot().refresh("ipo_status", self.db)
                 logger.info(f"IPO reset: shares={new_shares}, price={new_price}")
                 return {
                     "success": True,
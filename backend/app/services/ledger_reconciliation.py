@@ -0,0 +1,373 @@
+"""
+帳本重播對帳服務 - 依時間順序重播 point_logs 與 trades
+
+以游標依 (時間, _id) 順序串流點數日誌與成交紀錄，逐位使用者重播餘額與
+持股（每位使用者只保留固定大小的狀態），回報每個帳戶第一次與日誌
+balance_after 不一致的位置，最後再與目前的點數、持股比對。
+重播狀態與串流位置會存成檢查點，之後的執行只重播新的紀錄。
+
+重播規則：
+- 同一時間、同一 balance_after 的日誌視為同一筆入帳（例如償還欠款 + 剩餘點數）
+- debt_repayment 日誌不計入金額（入帳時已從入帳點數扣除）；
+  只有償還紀錄的入帳無法驗證，直接以 balance_after 對齊
+- 沒有 balance_after 的舊日誌只套用金額（repay_amount 視為扣除）
+- 每位使用者第一筆可驗證的日誌作為起始餘額
+- 持股以初始持股加上買進、減去賣出成交重播，最終結算後歸零
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from app.services.roster_import import INITIAL_STOCK_AMOUNT
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from bson import ObjectId
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 串流位置檢查點（存放於 market_config）
+RECONCILIATION_CHECKPOINT_TYPE = "ledger_reconciliation_checkpoint"
+
+# 報告中最多列出的帳戶數
+MAX_REPORTED_ACCOUNTS = 200
+
+# 每批 bulk_write / $in 查詢的筆數
+RECONCILIATION_BATCH_SIZE = 1000
+
+
+def get_ledger_reconciliation_service() -> LedgerReconciliationService:
+    """LedgerReconciliationService 的依賴注入函數"""
+    return LedgerReconciliationService()
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class AccountReplayState:
+    """單一帳戶的重播狀態（固定大小）"""
+
+    __slots__ = (
+        "balance", "holdings", "entries", "divergence_count", "first_divergence",
+        "pending_at", "pending_balance_after", "pending_sum", "pending_repay_only", "pending_entry"
+    )
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data or {}
+        self.balance: Optional[int] = data.get("balance")
+        self.holdings: Optional[int] = data.get("holdings")
+        self.entries: int = data.get("entries", 0)
+        self.divergence_count: int = data.get("divergence_count", 0)
+        self.first_divergence: Optional[dict] = data.get("first_divergence")
+        self.pending_at = None
+        self.pending_balance_after: Optional[int] = None
+        self.pending_sum = 0
+        self.pending_repay_only = False
+        self.pending_entry: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "balance": self.balance,
+            "holdings": self.holdings,
+            "entries": self.entries,
+            "divergence_count": self.divergence_count,
+            "first_divergence": self.first_divergence
+        }
+
+    # ========== 點數 ==========
+
+    def apply_log(self, log: dict) -> None:
+        self.entries += 1
+        at = log.get("_at")
+        is_repayment = log.get("type") == "debt_repayment"
+        amount = log.get("amount") if isinstance(log.get("amount"), (int, float)) else 0
+
+        if log.get("type") == "final_settlement":
+            # 最終結算把持股換成點數並清空持股
+            self.holdings = 0
+
+        balance_after = log.get("balance_after")
+        if not isinstance(balance_after, (int, float)):
+            self.close_posting()
+            if self.balance is not None:
+                if isinstance(log.get("repay_amount"), (int, float)):
+                    self.balance -= log["repay_amount"]
+                else:
+                    self.balance += amount
+            return
+
+        if self.pending_entry is not None and (
+            self.pending_at != at or self.pending_balance_after != balance_after
+        ):
+            self.close_posting()
+
+        if self.pending_entry is None:
+            self.pending_at = at
+            self.pending_balance_after = balance_after
+            self.pending_sum = 0
+            self.pending_repay_only = True
+            self.pending_entry = {"log_id": str(log["_id"]), "type": log.get("type"), "at": _iso(at)}
+
+        if not is_repayment:
+            self.pending_sum += amount
+            self.pending_repay_only = False
+
+    def close_posting(self) -> None:
+        """結束目前的入帳群組並與 balance_after 比對"""
+        if self.pending_entry is None:
+            return
+        recorded = self.pending_balance_after
+        if self.balance is not None and not self.pending_repay_only:
+            expected = self.balance + self.pending_sum
+            if expected != recorded:
+                self.divergence_count += 1
+                if self.first_divergence is None:
+                    self.first_divergence = {
+                        **self.pending_entry,
+                        "source": "point_logs",
+                        "expected_balance": expected,
+                        "recorded_balance": recorded,
+                        "difference": recorded - expected
+                    }
+        # 以日誌記錄的餘額對齊，之後的日誌各自驗證
+        self.balance = recorded
+        self.pending_entry = None
+
+    # ========== 持股 ==========
+
+    def apply_trade(self, quantity: int) -> None:
+        self.entries += 1
+        if self.holdings is None:
+            self.holdings = INITIAL_STOCK_AMOUNT
+        self.holdings += quantity
+
+
+class LedgerReconciliationService:
+    def __init__(self, db: AsyncIOMotorDatabase = None, batch_size: int = RECONCILIATION_BATCH_SIZE):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.batch_size = batch_size
+
+    # ========== 串流 ==========
+
+    @staticmethod
+    def _after_position(position: Optional[dict]) -> List[dict]:
+        """串流位置之後的條件（時間相同時以 _id 排序）"""
+        if not position:
+            return []
+        return [{"$match": {"$or": [
+            {"_at": {"$gt": position["at"]}},
+            {"_at": position["at"], "_id": {"$gt": position["id"]}}
+        ]}}]
+
+    def _stream_point_logs(self, position: Optional[dict], until: datetime) -> AsyncIterator[dict]:
+        pipeline: List[dict] = []
+        if position:
+            # 先以索引欄位縮小範圍（舊的償還 / 欠款日誌只有 timestamp）
+            pipeline.append({"$match": {"$or": [
+                {"created_at": {"$gte": position["at"]}},
+                {"timestamp": {"$gte": position["at"]}}
+            ]}})
+        pipeline.append({"$addFields": {"_at": {"$ifNull": ["$created_at", "$timestamp"]}}})
+        pipeline.extend(self._after_position(position))
+        pipeline.extend([
+            {"$match": {"_at": {"$lte": until}}},
+            {"$sort": {"_at": 1, "_id": 1}},
+            {"$project": {
+                "user_id": 1, "type": 1, "amount": 1,
+                "balance_after": 1, "repay_amount": 1, "_at": 1
+            }}
+        ])
+        return self.db[Collections.POINT_LOGS].aggregate(pipeline, allowDiskUse=True)
+
+    def _stream_trades(self, position: Optional[dict], until: datetime) -> AsyncIterator[dict]:
+        query: Dict[str, Any] = {"created_at": {"$lte": until}}
+        if position:
+            query["$or"] = [
+                {"created_at": {"$gt": position["at"]}},
+                {"created_at": position["at"], "_id": {"$gt": position["id"]}}
+            ]
+        return self.db[Collections.TRADES].find(
+            query,
+            {"buy_user_id": 1, "sell_user_id": 1, "quantity": 1, "created_at": 1}
+        ).sort([("created_at", 1), ("_id", 1)])
+
+    @staticmethod
+    async def _merge(point_logs: AsyncIterator[dict],
+                     trades: AsyncIterator[dict]) -> AsyncIterator[Tuple[str, dict]]:
+        """依時間合併兩個已排序的游標（同一時間先處理成交）"""
+        async def advance(cursor):
+            try:
+                return await cursor.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        log = await advance(point_logs)
+        trade = await advance(trades)
+        while log is not None or trade is not None:
+            if trade is not None and (log is None or trade["created_at"] <= log["_at"]):
+                yield "trades", trade
+                trade = await advance(trades)
+            else:
+                yield "point_logs", log
+                log = await advance(point_logs)
+
+    # ========== 檢查點 ==========
+
+    async def _load_checkpoint(self) -> Tuple[Optional[dict], Dict[Any, AccountReplayState]]:
+        checkpoint = await self.db[Collections.MARKET_CONFIG].find_one({"type": RECONCILIATION_CHECKPOINT_TYPE})
+        if not checkpoint:
+            return None, {}
+        states = {
+            doc["user_id"]: AccountReplayState(doc)
+            async for doc in self.db[Collections.LEDGER_CHECKPOINTS].find({})
+        }
+        return checkpoint, states
+
+    async def _save_checkpoint(self, states: Dict[Any, AccountReplayState], touched: set,
+                               positions: Dict[str, Optional[dict]], until: datetime,
+                               full: bool) -> None:
+        now = datetime.now(timezone.utc)
+        if full:
+            await self.db[Collections.LEDGER_CHECKPOINTS].delete_many({})
+        operations = [
+            UpdateOne({"user_id": user_id}, {"$set": {**states[user_id].to_dict(), "updated_at": now}}, upsert=True)
+            for user_id in touched
+        ]
+        for start in range(0, len(operations), self.batch_size):
+            await self.db[Collections.LEDGER_CHECKPOINTS].bulk_write(
+                operations[start:start + self.batch_size], ordered=False
+            )
+        await self.db[Collections.MARKET_CONFIG].update_one(
+            {"type": RECONCILIATION_CHECKPOINT_TYPE},
+            {"$set": {
+                "point_logs_position": positions["point_logs"],
+                "trades_position": positions["trades"],
+                "replayed_until": until,
+                "updated_at": now
+            }},
+            upsert=True
+        )
+
+    # ========== 對帳 ==========
+
+    async def _current_mismatches(self, states: Dict[Any, AccountReplayState],
+                                  user_ids: List[Any]) -> Tuple[List[dict], List[dict]]:
+        """將重播結果與目前的點數、持股比對"""
+        balance_mismatches: List[dict] = []
+        holding_mismatches: List[dict] = []
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            users = {
+                u["_id"]: u
+                async for u in self.db[Collections.USERS].find({"_id": {"$in": batch}}, {"points": 1, "name": 1})
+            }
+            holdings = {
+                h["user_id"]: h.get("stock_amount", 0)
+                async for h in self.db[Collections.STOCKS].find({"user_id": {"$in": batch}}, {"user_id": 1, "stock_amount": 1})
+            }
+            for user_id in batch:
+                state = states[user_id]
+                user = users.get(user_id)
+                if user is None:
+                    continue
+                if state.balance is not None and user.get("points", 0) != state.balance:
+                    balance_mismatches.append({
+                        "user_id": str(user_id),
+                        "username": user.get("name", "Unknown"),
+                        "replayed_balance": state.balance,
+                        "current_balance": user.get("points", 0),
+                        "difference": user.get("points", 0) - state.balance
+                    })
+                if state.holdings is not None and holdings.get(user_id, 0) != state.holdings:
+                    holding_mismatches.append({
+                        "user_id": str(user_id),
+                        "username": user.get("name", "Unknown"),
+                        "replayed_holdings": state.holdings,
+                        "current_holdings": holdings.get(user_id, 0),
+                        "difference": holdings.get(user_id, 0) - state.holdings
+                    })
+        return balance_mismatches, holding_mismatches
+
+    async def reconcile(self, full: bool = False) -> Dict[str, Any]:
+        """
+        重播點數日誌與成交紀錄並對帳
+
+        Args:
+            full: 忽略檢查點，從頭重播所有紀錄
+
+        Returns:
+            dict: 重播筆數、每個帳戶第一次不一致的位置、與目前資料的差異
+        """
+        until = datetime.now(timezone.utc)
+        checkpoint, states = (None, {}) if full else await self._load_checkpoint()
+        positions: Dict[str, Optional[dict]] = {
+            "point_logs": checkpoint.get("point_logs_position") if checkpoint else None,
+            "trades": checkpoint.get("trades_position") if checkpoint else None
+        }
+
+        touched: set = set()
+        counts = {"point_logs": 0, "trades": 0}
+
+        def state_for(user_id) -> AccountReplayState:
+            state = states.get(user_id)
+            if state is None:
+                state = states[user_id] = AccountReplayState()
+            touched.add(user_id)
+            return state
+
+        stream = self._merge(
+            self._stream_point_logs(positions["point_logs"], until),
+            self._stream_trades(positions["trades"], until)
+        )
+        async for source, entry in stream:
+            counts[source] += 1
+            if source == "point_logs":
+                positions["point_logs"] = {"at": entry["_at"], "id": entry["_id"]}
+                if entry.get("user_id") is not None:
+                    state_for(entry["user_id"]).apply_log(entry)
+            else:
+                positions["trades"] = {"at": entry["created_at"], "id": entry["_id"]}
+                quantity = entry.get("quantity", 0)
+                if isinstance(entry.get("buy_user_id"), ObjectId):
+                    state_for(entry["buy_user_id"]).apply_trade(quantity)
+                if isinstance(entry.get("sell_user_id"), ObjectId):
+                    state_for(entry["sell_user_id"]).apply_trade(-quantity)
+
+        for user_id in touched:
+            states[user_id].close_posting()
+
+        balance_mismatches, holding_mismatches = await self._current_mismatches(states, list(touched))
+        await self._save_checkpoint(states, touched, positions, until, full or checkpoint is None)
+
+        divergent = [
+            {"user_id": str(user_id), "divergence_count": state.divergence_count, **state.first_divergence}
+            for user_id, state in states.items() if state.first_divergence
+        ]
+        divergent.sort(key=lambda d: str(d.get("at")))
+
+        logger.info(
+            f"Ledger reconciliation replayed {counts['point_logs']} point logs and {counts['trades']} trades, "
+            f"{len(divergent)} divergent accounts"
+        )
+
+        return {
+            "success": True,
+            "mode": "incremental" if checkpoint is not None else "full",
+            "since": _iso(checkpoint.get("replayed_until")) if checkpoint else None,
+            "until": until.isoformat(),
+            "replayed_point_logs": counts["point_logs"],
+            "replayed_trades": counts["trades"],
+            "accounts_replayed": len(touched),
+            "accounts_tracked": len(states),
+            "divergent_count": len(divergent),
+            "divergences": divergent[:MAX_REPORTED_ACCOUNTS],
+            "balance_mismatch_count": len(balance_mismatches),
+            "balance_mismatches": balance_mismatches[:MAX_REPORTED_ACCOUNTS],
+            "holding_mismatch_count": len(holding_mismatches),
+            "holding_mismatches": holding_mismatches[:MAX_REPORTED_ACCOUNTS],
+            "message": f"對帳完成，{len(divergent)} 個帳戶與日誌不一致"
+        }
@@ -0,0 +1,256 @@
+# 市場交易時間行事曆
+# 將 market_hours 設定編譯成記憶體中的排序區間，避免每筆訂單都查詢並解析設定
+
+import asyncio
+import bisect
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.database import get_database, Collections
+
+logger = logging.getLogger(__name__)
+
+# 開放時間以台北時間 (UTC+8) 的每日時段計算
+TAIPEI_TZ = timezone(timedelta(hours=8))
+SECONDS_PER_DAY = 86400
+
+# 事件監聽器：callback(event, at)，event 為 "open" 或 "close"
+MarketEventListener = Callable[[str, datetime], Awaitable[None]]
+
+
+class MarketCalendar:
+    """
+    市場交易時間行事曆
+
+    將 openTime 時段轉成台北時間的每日秒數區間（閉區間），跨日時段拆成兩段，
+    合併重疊後排序；查詢時以二分搜尋判斷是否開放、下次開盤與收盤時間。
+    設定只在 load() 或 update_slots() 時重新編譯。
+    """
+
+    def __init__(self):
+        # None 表示沒有設定，視為全天開放（與原本邏輯一致）
+        self._intervals: Optional[List[Tuple[int, int]]] = None
+        self._starts: List[int] = []
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._listeners: List[MarketEventListener] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    # ========== 編譯 ==========
+
+    @staticmethod
+    def compile_slots(open_time: Optional[List[dict]]) -> Optional[List[Tuple[int, int]]]:
+        """將 openTime 時段編譯成排序且不重疊的每日秒數區間"""
+        if open_time is None:
+            return None
+
+        raw: List[Tuple[int, int]] = []
+        for slot in open_time:
+            start_dt = datetime.fromtimestamp(slot["start"], tz=timezone.utc).astimezone(TAIPEI_TZ)
+            end_dt = datetime.fromtimestamp(slot["end"], tz=timezone.utc).astimezone(TAIPEI_TZ)
+            start_seconds = start_dt.hour * 3600 + start_dt.minute * 60 + start_dt.second
+            end_seconds = end_dt.hour * 3600 + end_dt.minute * 60 + end_dt.second
+
+            if start_seconds <= end_seconds:
+                raw.append((start_seconds, end_seconds))
+            else:
+                # 跨日時段（例如 23:00 到 01:00）拆成兩段
+                raw.append((start_seconds, SECONDS_PER_DAY - 1))
+                raw.append((0, end_seconds))
+
+        raw.sort()
+        merged: List[Tuple[int, int]] = []
+        for start, end in raw:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _apply(self, intervals: Optional[List[Tuple[int, int]]]) -> None:
+        self._intervals = intervals
+        self._starts = [start for start, _ in intervals] if intervals else []
+        self._loaded = True
+        # 喚醒事件監看，依新的時段重新計算下一次轉換
+        self._wakeup.set()
+
+    async def load(self, db: AsyncIOMotorDatabase = None) -> None:
+        """從資料庫載入 market_hours 設定並編譯"""
+        if db is None:
+            db = get_database()
+        market_config = await db[Collections.MARKET_CONFIG].find_one({"type": "market_hours"})
+        open_time = market_config.get("openTime") if market_config else None
+        self._apply(self.compile_slots(open_time))
+        logger.info(f"Market calendar loaded: {self._intervals}")
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase = None) -> None:
+        """尚未載入時載入一次"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self.load(db)
+
+    def update_slots(self, open_time: Optional[List[dict]]) -> None:
+        """管理員更新開放時間後直接以新時段重新編譯"""
+        self._apply(self.compile_slots(open_time))
+        logger.info(f"Market calendar updated: {self._intervals}")
+
+    def invalidate(self) -> None:
+        """標記需要重新載入（設定文件被直接改寫時使用）"""
+        self._loaded = False
+        self._wakeup.set()
+
+    # ========== 查詢 ==========
+
+    @staticmethod
+    def _seconds_of_day(now: datetime) -> int:
+        local = now.astimezone(TAIPEI_TZ)
+        return local.hour * 3600 + local.minute * 60 + local.second
+
+    def _interval_at(self, seconds: int) -> Optional[Tuple[int, int]]:
+        index = bisect.bisect_right(self._starts, seconds) - 1
+        if index >= 0 and self._intervals[index][1] >= seconds:
+            return self._intervals[index]
+        return None
+
+    def is_open_at(self, now: Optional[datetime] = None) -> bool:
+        """指定時間是否在開放時段內"""
+        if self._intervals is None:
+            return True
+        now = now or datetime.now(timezone.utc)
+        return self._interval_at(self._seconds_of_day(now)) is not None
+
+    async def is_open(self, db: AsyncIOMotorDatabase = None) -> bool:
+        """目前是否開放交易（必要時先載入設定）"""
+        await self.ensure_loaded(db)
+        return self.is_open_at()
+
+    def next_open(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """下一次開盤時間；目前已開放或沒有任何時段時回傳 None"""
+        if not self._intervals:
+            return None
+        now = now or datetime.now(timezone.utc)
+        seconds = self._seconds_of_day(now)
+        if self._interval_at(seconds) is not None:
+            return None
+
+        index = bisect.bisect_right(self._starts, seconds)
+        day_offset = 0
+        if index >= len(self._starts):
+            index, day_offset = 0, 1
+        return self._to_datetime(now, day_offset, self._starts[index])
+
+    def next_close(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """目前時段的收盤時間；未開放或全天開放時回傳 None"""
+        if not self._intervals:
+            return None
+        now = now or datetime.now(timezone.utc)
+        seconds = self._seconds_of_day(now)
+        interval = self._interval_at(seconds)
+        if interval is None:
+            return None
+
+        end = interval[1]
+        day_offset = 0
+        if end == SECONDS_PER_DAY - 1 and self._starts[0] == 0:
+            # 跨日時段延續到隔天的第一段
+            if self._intervals[0][1] == SECONDS_PER_DAY - 1:
+                return None
+            end, day_offset = self._intervals[0][1], 1
+        # 區間為閉區間，收盤發生在結束秒數的下一秒
+        return self._to_datetime(now, day_offset, end + 1)
+
+    @staticmethod
+    def _to_datetime(now: datetime, day_offset: int, seconds: int) -> datetime:
+        local = now.astimezone(TAIPEI_TZ)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight + timedelta(days=day_offset, seconds=seconds)).astimezone(timezone.utc)
+
+    def get_status(self) -> dict:
+        """取得行事曆狀態"""
+        now = datetime.now(timezone.utc)
+        next_open = self.next_open(now)
+        next_close = self.next_close(now)
+        return {
+            "loaded": self._loaded,
+            "intervals": self._intervals,
+            "is_open": self.is_open_at(now),
+            "next_open": next_open.isoformat() if next_open else None,
+            "next_close": next_close.isoformat() if next_close else None,
+            "listeners": len(self._listeners),
+            "watching": self._watch_task is not None and not self._watch_task.done()
+        }
+
+    # ========== 開收盤事件 ==========
+
+    def subscribe(self, listener: MarketEventListener) -> None:
+        """註冊開盤 / 收盤事件監聽器"""
+        self._listeners.append(listener)
+
+    async def _emit(self, event: str, at: datetime) -> None:
+        logger.info(f"Market {event} event at {at.isoformat()}")
+        for listener in list(self._listeners):
+            try:
+                await listener(event, at)
+            except Exception as e:
+                logger.error(f"Market {event} listener failed: {e}")
+
+    async def start_watching(self, max_sleep_seconds: int = 300) -> None:
+        """啟動背景監看，於開放狀態轉換時發出事件"""
+        if self._watch_task and not self._watch_task.done():
+            return
+        self._watch_task = asyncio.create_task(self._watch_loop(max_sleep_seconds))
+        logger.info("Market calendar watcher started")
+
+    async def stop_watching(self) -> None:
+        """停止背景監看"""
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        logger.info("Market calendar watcher stopped")
+
+    async def _watch_loop(self, max_sleep_seconds: int) -> None:
+        await self.ensure_loaded()
+        was_open = self.is_open_at()
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                transition = self.next_close(now) if was_open else self.next_open(now)
+                timeout = max_sleep_seconds
+                if transition is not None:
+                    timeout = min(timeout, max((transition - now).total_seconds(), 0.5))
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+                await self.ensure_loaded()
+                now = datetime.now(timezone.utc)
+                is_open = self.is_open_at(now)
+                if is_open != was_open:
+                    was_open = is_open
+                    await self._emit("open" if is_open else "close", now)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in market calendar watcher: {e}")
+                await asyncio.sleep(5)
+
+
+# 全域行事曆實例
+_market_calendar = MarketCalendar()
+
+
+def get_market_calendar() -> MarketCalendar:
+    """獲取市場行事曆實例"""
+    return _market_calendar
@@ -0,0 +1,171 @@
+# 市場設定快照
+# 啟動時載入所有 market_config 文件，轉帳、下單與價格查詢直接讀取記憶體中的設定
+
+import asyncio
+import copy
+import logging
+from typing import Any, Dict, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+from app.core.database import get_database, Collections
+
+logger = logging.getLogger(__name__)
+
+
+class MarketConfigSnapshot:
+    """
+    市場設定快照
+
+    以 type 為鍵保存所有 market_config 文件，每次變動遞增版本號。
+    同一行程內的寫入在寫入後呼叫 refresh() / invalidate()；
+    連線到 replica set 時另以 change stream 接收其他行程的變動。
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, dict] = {}
+        # 文件 _id → type（change stream 的刪除事件只帶 _id）
+        self._types_by_id: Dict[Any, str] = {}
+        # 需要重新讀取的設定類型
+        self._dirty: Set[str] = set()
+        self._version = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._change_stream_active = False
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    # ========== 載入 ==========
+
+    async def load(self, db: AsyncIOMotorDatabase = None) -> None:
+        """從資料庫載入所有 market_config 文件"""
+        if db is None:
+            db = get_database()
+        docs = await db[Collections.MARKET_CONFIG].find({"type": {"$exists": True}}).to_list(length=None)
+        self._docs = {doc["type"]: doc for doc in docs}
+        self._types_by_id = {doc["_id"]: doc["type"] for doc in docs}
+        self._dirty.clear()
+        self._loaded = True
+        self._version += 1
+        logger.info(f"Market config snapshot loaded: {sorted(self._docs)} (version {self._version})")
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase = None) -> None:
+        """尚未載入時載入一次"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self.load(db)
+
+    async def refresh(self, config_type: str, db: AsyncIOMotorDatabase = None) -> Optional[dict]:
+        """重新讀取單一設定（管理員寫入後呼叫）"""
+        if db is None:
+            db = get_database()
+        doc = await db[Collections.MARKET_CONFIG].find_one({"type": config_type})
+        self._set(config_type, doc)
+        self._dirty.discard(config_type)
+        return copy.deepcopy(doc)
+
+    def invalidate(self, config_type: Optional[str] = None) -> None:
+        """標記設定需要重新讀取；未指定類型時全部重新載入"""
+        if config_type is None:
+            self._loaded = False
+        else:
+            self._dirty.add(config_type)
+        self._version += 1
+
+    def _set(self, config_type: str, doc: Optional[dict]) -> None:
+        previous = self._docs.pop(config_type, None)
+        if previous is not None:
+            self._types_by_id.pop(previous.get("_id"), None)
+        if doc is not None:
+            self._docs[config_type] = doc
+            self._types_by_id[doc["_id"]] = config_type
+        self._version += 1
+
+    # ========== 查詢 ==========
+
+    async def get(self, config_type: str, db: AsyncIOMotorDatabase = None) -> Optional[dict]:
+        """取得設定文件（回傳副本，不存在時回傳 None）"""
+        await self.ensure_loaded(db)
+        if config_type in self._dirty:
+            return await self.refresh(config_type, db)
+        doc = self._docs.get(config_type)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def get_status(self) -> dict:
+        """取得快照狀態"""
+        return {
+            "loaded": self._loaded,
+            "version": self._version,
+            "types": sorted(self._docs),
+            "dirty": sorted(self._dirty),
+            "change_stream": self._change_stream_active
+        }
+
+    # ========== Change Stream ==========
+
+    async def start_watching(self, db: AsyncIOMotorDatabase = None) -> None:
+        """啟動 change stream 監看（standalone MongoDB 不支援時自動停止）"""
+        if self._watch_task and not self._watch_task.done():
+            return
+        self._watch_task = asyncio.create_task(self._watch_loop(db or get_database()))
+
+    async def stop_watching(self) -> None:
+        """停止 change stream 監看"""
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        self._change_stream_active = False
+
+    async def _watch_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            try:
+                async with db[Collections.MARKET_CONFIG].watch(full_document="updateLookup") as stream:
+                    self._change_stream_active = True
+                    logger.info("Market config change stream started")
+                    # 監看開始前的變動可能已錯過，重新載入一次
+                    await self.load(db)
+                    async for change in stream:
+                        self._apply_change(change)
+            except asyncio.CancelledError:
+                break
+            except OperationFailure as e:
+                # standalone MongoDB 不支援 change stream，改為只靠寫入後刷新
+                self._change_stream_active = False
+                logger.info(f"Market config change stream unavailable, relying on write-through refresh: {e}")
+                break
+            except Exception as e:
+                self._change_stream_active = False
+                logger.error(f"Market config change stream error: {e}")
+                await asyncio.sleep(5)
+
+    def _apply_change(self, change: dict) -> None:
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc and doc.get("type"):
+                self._set(doc["type"], doc)
+                self._dirty.discard(doc["type"])
+        elif operation == "delete":
+            config_type = self._types_by_id.get(change.get("documentKey", {}).get("_id"))
+            if config_type:
+                self._set(config_type, None)
+        elif operation in ("drop", "invalidate", "dropDatabase"):
+            self.invalidate()
+
+
+# 全域快照實例
+_market_config_snapshot = MarketConfigSnapshot()
+
+
+def get_market_config_snapshot() -> MarketConfigSnapshot:
+    """獲取市場設定快照實例"""
+    return _market_config_snapshot
@@ -89,6 +89,11 @@ class MatchingScheduler:
         finally:
             self._matching_in_progress = False
             
+    async def on_market_event(self, event: str, at: datetime):
+        """市場開盤時立即撮合累積的掛單，不必等下一次定期撮合"""
+        if event == "open":
+            await self.trigger_matching_async("market_open")
+            
     def is_matching_in_progress(self) -> bool:
         """檢查是否正在撮合"""
         return self._matching_in_progress
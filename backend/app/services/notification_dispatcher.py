@@ -0,0 +1,215 @@
+# Telegram 通知批次派送
+# 撮合與交易流程只把通知放進記憶體緩衝區，背景工作定期一次送出整批到 BOT 的 /bot/notification/batch，
+# 取代每筆成交、每一方各自同步呼叫一次 /bot/notification/trade
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import requests
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config_refactored import config
+from app.core.database import get_database, Collections
+
+logger = logging.getLogger(__name__)
+
+# 通知種類與 BOT 批次端點欄位的對應
+NOTIFICATION_KINDS = ("trades", "transfers", "systems", "direct")
+
+
+class NotificationDispatcher:
+    """
+    通知批次派送器
+
+    enqueue_* 只寫入緩衝區，不做任何 I/O，可以安全地在交易 session 內呼叫。
+    背景工作每 flush_interval 秒（或緩衝區達到 batch_size 時）送出一次：
+    以 user_id 排入的通知在送出時用一次 $in 查詢補上 telegram_id。
+    """
+
+    def __init__(self):
+        self._buffer: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_interval = 0.0
+        self._batch_size = 200
+        self._last_flush_at: Optional[datetime] = None
+        self._total_sent = 0
+        self._total_dropped = 0
+        self._total_requests = 0
+
+    async def start(self, flush_interval: float = None, batch_size: int = None) -> None:
+        """啟動背景派送；間隔為 0 時改為每次排入後立即送出"""
+        external = config.external_services
+        self._flush_interval = external.notification_flush_interval if flush_interval is None else flush_interval
+        self._batch_size = external.notification_batch_size if batch_size is None else batch_size
+        if self._flush_interval <= 0 or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Notification dispatcher started (flush every {self._flush_interval}s)")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 送出剩餘的通知
+        await self.flush()
+        logger.info("Notification dispatcher stopped")
+
+    # ========== 排入 ==========
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], user_id: Any = None) -> None:
+        """
+        排入一則通知
+
+        Args:
+            kind: trades / transfers / systems / direct
+            payload: BOT 端對應 schema 的欄位；已知 telegram_id 時放在 payload["user_id"]
+            user_id: 使用者 _id，送出前才查詢 telegram_id
+        """
+        if kind not in NOTIFICATION_KINDS:
+            raise ValueError(f"Unknown notification kind: {kind}")
+        self._buffer.append({"kind": kind, "payload": payload, "user": user_id})
+
+        if self._task is None or self._task.done():
+            # 背景派送未啟動時直接送出
+            asyncio.ensure_future(self.flush())
+        elif len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+
+    def enqueue_trade(self, action: str, quantity: int, price: float, total_amount: float,
+                      order_id: Optional[str] = None, user_id: Any = None, telegram_id: Optional[int] = None) -> None:
+        """排入成交通知（user_id 與 telegram_id 擇一提供）"""
+        payload = {
+            "action": action,
+            "quantity": quantity,
+            "price": price,
+            "total_amount": total_amount,
+            "order_id": order_id
+        }
+        if telegram_id is not None:
+            payload["user_id"] = telegram_id
+        self.enqueue("trades", payload, user_id=None if telegram_id is not None else user_id)
+
+    # ========== 送出 ==========
+
+    async def _resolve_telegram_ids(self, entries: List[Dict[str, Any]], db: AsyncIOMotorDatabase) -> Dict[Any, int]:
+        user_ids = list({entry["user"] for entry in entries if entry["user"] is not None})
+        if not user_ids:
+            return {}
+        users = await db[Collections.USERS].find(
+            {"_id": {"$in": user_ids}, "telegram_id": {"$ne": None}},
+            {"telegram_id": 1}
+        ).to_list(length=None)
+        return {user["_id"]: user["telegram_id"] for user in users}
+
+    async def flush(self, db: AsyncIOMotorDatabase = None) -> int:
+        """送出緩衝區中的所有通知，回傳送出的數量"""
+        if not self._buffer:
+            return 0
+        entries, self._buffer = self._buffer, []
+
+        if not config.external_services.telegram_bot_api_url or not config.security.internal_api_key:
+            logger.warning("Telegram Bot API 設定不完整，跳過通知傳送")
+            self._total_dropped += len(entries)
+            return 0
+
+        if db is None:
+            db = get_database()
+        try:
+            telegram_ids = await self._resolve_telegram_ids(entries, db)
+        except Exception as e:
+            logger.error(f"查詢通知對象 telegram_id 失敗: {e}")
+            self._total_dropped += len(entries)
+            return 0
+
+        batch: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in NOTIFICATION_KINDS}
+        for entry in entries:
+            payload = entry["payload"]
+            if entry["user"] is not None:
+                telegram_id = telegram_ids.get(entry["user"])
+                if telegram_id is None:
+                    logger.warning(f"無法傳送通知：使用者 {entry['user']} 未設定 telegram_id")
+                    self._total_dropped += 1
+                    continue
+                payload = {**payload, "user_id": telegram_id}
+            batch[entry["kind"]].append(payload)
+
+        sent = 0
+        # 依 batch_size 切成多個請求
+        for start in range(0, len(entries), max(self._batch_size, 1)):
+            chunk = {kind: items[start:start + self._batch_size] for kind, items in batch.items()}
+            count = sum(len(items) for items in chunk.values())
+            if count == 0:
+                continue
+            if await self._post_batch(chunk):
+                sent += count
+            else:
+                self._total_dropped += count
+
+        self._total_sent += sent
+        self._last_flush_at = datetime.now(timezone.utc)
+        return sent
+
+    async def _post_batch(self, batch: Dict[str, List[Dict[str, Any]]]) -> bool:
+        notification_url = f"{config.external_services.telegram_bot_api_url.rstrip('/')}/bot/notification/batch"
+        headers = {
+            "Content-Type": "application/json",
+            "token": config.security.internal_api_key
+        }
+        self._total_requests += 1
+        try:
+            # requests 為同步函式庫，在執行緒中送出避免阻塞事件迴圈
+            response = await asyncio.to_thread(
+                requests.post, notification_url, json=batch, headers=headers, timeout=5
+            )
+            if response.status_code == 200:
+                return True
+            logger.warning(f"傳送批次通知失敗: HTTP {response.status_code} - {response.text}")
+        except requests.exceptions.Timeout:
+            logger.warning("傳送批次通知超時")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"傳送批次通知網路錯誤: {e}")
+        except Exception as e:
+            logger.error(f"傳送批次通知發生未預期錯誤: {e}")
+        return False
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in notification dispatcher: {e}")
+                await asyncio.sleep(5)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "flush_interval_seconds": self._flush_interval,
+            "batch_size": self._batch_size,
+            "buffered": len(self._buffer),
+            "last_flush_at": self._last_flush_at.isoformat() if self._last_flush_at else None,
+            "total_sent": self._total_sent,
+            "total_dropped": self._total_dropped,
+            "total_requests": self._total_requests
+        }
+
+
+# 全域派送器實例
+_notification_dispatcher = NotificationDispatcher()
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """獲取通知批次派送器實例"""
+    return _notification_dispatcher
@@ -2,6 +2,7 @@ from __future__ import annotations
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import get_database, Collections
 from app.core.config_refactored import config
+from app.services.notification_dispatcher import get_notification_dispatcher
 from typing import Optional
 import logging
 import requests
@@ -23,86 +24,33 @@ class NotificationService:
     
     async def send_trade_notifications(self, buy_order: dict, sell_order: dict, trade_quantity: int, 
                                      trade_price: float, trade_amount: float, is_system_sale: bool, session=None):
-        """傳送交易通知給買方和賣方"""
+        """排入買方和賣方的交易通知（由通知批次派送器合併送出）"""
         try:
-            # 獲取買方使用者資訊
-            buy_user = await self.db[Collections.USERS].find_one({"_id": buy_order["user_id"]}, session=session)
-            if not buy_user or not buy_user.get("telegram_id"):
-                logger.warning(f"無法傳送買方通知：使用者 {buy_order['user_id']} 未設定 telegram_id")
-            else:
-                await self._send_single_trade_notification(
-                    user_telegram_id=buy_user["telegram_id"],
-                    action="buy",
+            dispatcher = get_notification_dispatcher()
+            dispatcher.enqueue_trade(
+                action="buy",
+                quantity=trade_quantity,
+                price=trade_price,
+                total_amount=trade_amount,
+                order_id=str(buy_order["_id"]),
+                user_id=buy_order["user_id"]
+            )
+            
+            # 系統 IPO 交易沒有賣方使用者
+            if not is_system_sale and sell_order:
+                dispatcher.enqueue_trade(
+                    action="sell",
                     quantity=trade_quantity,
                     price=trade_price,
                     total_amount=trade_amount,
-                    order_id=str(buy_order["_id"])
+                    order_id=str(sell_order["_id"]),
+                    user_id=sell_order["user_id"]
                 )
-            
-            # 獲取賣方使用者資訊（如果不是系統 IPO 交易）
-            if not is_system_sale and sell_order:
-                sell_user = await self.db[Collections.USERS].find_one({"_id": sell_order["user_id"]}, session=session)
-                if not sell_user or not sell_user.get("telegram_id"):
-                    logger.warning(f"無法傳送賣方通知：使用者 {sell_order['user_id']} 未設定 telegram_id")
-                else:
-                    await self._send_single_trade_notification(
-                        user_telegram_id=sell_user["telegram_id"],
-                        action="sell",
-                        quantity=trade_quantity,
-                        price=trade_price,
-                        total_amount=trade_amount,
-                        order_id=str(sell_order["_id"])
-                    )
                     
         except Exception as e:
             # 通知傳送失敗不應該影響交易本身
             logger.error(f"傳送交易通知時發生錯誤: {e}")
 
-    async def _send_single_trade_notification(self, user_telegram_id: int, action: str, quantity: int, 
-                                            price: float, total_amount: float, order_id: str):
-        """傳送單一交易通知"""
-        try:
-            if not config.external_services.telegram_bot_api_url or not config.security.internal_api_key:
-                logger.warning("Telegram Bot API 設定不完整，跳過通知傳送")
-                return
-            
-            # 構建通知請求
-            notification_url = f"{config.external_services.telegram_bot_api_url.rstrip('/')}/bot/notification/trade"
-            
-            payload = {
-                "user_id": user_telegram_id,
-                "action": action,
-                "quantity": quantity,
-                "price": price,
-                "total_amount": total_amount,
-                "order_id": order_id
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "token": config.security.internal_api_key
-            }
-            
-            # 傳送通知（設定短超時避免阻塞交易）
-            response = requests.post(
-                notification_url,
-                json=payload,
-                headers=headers,
-                timeout=5  # 5秒超時
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"成功傳送 {action} 交易通知給使用者 {user_telegram_id}")
-            else:
-                logger.warning(f"傳送交易通知失敗: HTTP {response.status_code} - {response.text}")
-                
-        except requests.exceptions.Timeout:
-            logger.warning(f"傳送交易通知超時，使用者: {user_telegram_id}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"傳送交易通知網路錯誤: {e}")
-        except Exception as e:
-            logger.error(f"傳送交易通知發生未預期錯誤: {e}")
-
     async def send_cancellation_notification(self, user_id: str, order_id: str, 
                                            order_type: str, side: str, quantity: int,
                                            price: float, reason: str):
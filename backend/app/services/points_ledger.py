@@ -0,0 +1,341 @@
+"""
+點數帳本引擎 - 統一處理點數的入帳與扣款
+
+入帳時在同一個 pipeline 更新內完成欠款償還與解除凍結，扣款時以條件式
+find_one_and_update 同時檢查餘額、帳戶狀態與欠款；兩者都直接由回傳的文件
+算出 balance_after，不再為了寫日誌重新查詢使用者。日誌以批次寫入。
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from bson import ObjectId
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 預設的欠款償還 / 償還後剩餘點數日誌備註
+DEFAULT_REPAY_NOTE = "債務償還 {repaid} 點（{note}）"
+DEFAULT_REMAINDER_NOTE = "償還欠款後剩餘點數: {net} 點 - {note}"
+
+# check_spendable 需要的使用者欄位
+SPEND_CHECK_PROJECTION = {"points": 1, "owed_points": 1, "enabled": 1, "frozen": 1}
+
+
+def get_points_ledger() -> PointsLedger:
+    """PointsLedger 的依賴注入函數"""
+    return PointsLedger()
+
+
+class PointsLedger:
+    def __init__(self, db: AsyncIOMotorDatabase = None):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+
+    # ========== 入帳 ==========
+
+    @staticmethod
+    def _credit_pipeline(amount: int, repay_debt: bool, extra_set: Optional[dict]) -> List[dict]:
+        """
+        入帳的 pipeline 更新
+
+        同一個 $set 階段內所有運算式都以更新前的文件計算：
+        償還金額 = min(現有點數 + 入帳點數, 欠款)，全數償還時解除凍結。
+        """
+        stage: Dict[str, Any] = {}
+        if repay_debt:
+            total = {"$add": [{"$ifNull": ["$points", 0]}, amount]}
+            owed = {"$max": [{"$ifNull": ["$owed_points", 0]}, 0]}
+            repay = {"$max": [{"$cond": [{"$gt": [owed, 0]}, {"$min": [total, owed]}, 0]}, 0]}
+            stage["points"] = {"$subtract": [total, repay]}
+            stage["owed_points"] = {"$cond": [
+                {"$gt": [repay, 0]},
+                {"$subtract": [{"$ifNull": ["$owed_points", 0]}, repay]},
+                "$owed_points"
+            ]}
+            stage["frozen"] = {"$cond": [
+                {"$and": [{"$gt": [owed, 0]}, {"$gte": [repay, owed]}]},
+                False,
+                "$frozen"
+            ]}
+        else:
+            stage["points"] = {"$add": [{"$ifNull": ["$points", 0]}, amount]}
+
+        for key, value in (extra_set or {}).items():
+            stage[key] = {"$literal": value}
+        return [{"$set": stage}]
+
+    async def credit(self, user_id: ObjectId, amount: int, change_type: str, note: str,
+                     transaction_id: str = None, repay_debt: bool = True,
+                     repay_note: str = None, remainder_note: str = None,
+                     extra_set: dict = None, extra_log_fields: dict = None,
+                     require_spendable: int = None, action: str = "交易",
+                     log: bool = True, session=None) -> dict:
+        """
+        增加使用者點數，有欠款時優先償還
+
+        Args:
+            user_id: 使用者 _id
+            amount: 入帳點數
+            change_type: 點數日誌類型
+            note: 點數日誌備註
+            transaction_id: 交易ID
+            repay_debt: 是否自動償還欠款
+            repay_note / remainder_note: 償還日誌與剩餘點數日誌的備註樣板，
+                可使用 {amount} {repaid} {net} {points_before} {note}
+            extra_set: 同時寫入使用者文件的欄位
+            extra_log_fields: 附加在入帳日誌上的欄位
+            require_spendable: 指定時只在使用者當下可以消費這個金額
+                （與 debit 相同的狀態與餘額條件）時才入帳
+            action: require_spendable 不符時失敗訊息中的操作名稱
+            log: False 時只建立日誌不寫入（由呼叫者批次寫入）
+            session: 資料庫 session
+
+        Returns:
+            dict: success / message / balance_before / balance_after /
+                  debt_repaid / remaining_debt / final_points / logs
+        """
+        if require_spendable is not None:
+            query = self._spendable_filter(user_id, require_spendable, True)
+        else:
+            query = {"_id": user_id}
+
+        before = await self.db[Collections.USERS].find_one_and_update(
+            query,
+            self._credit_pipeline(amount, repay_debt, extra_set),
+            projection={"points": 1, "owed_points": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if before is None and require_spendable is not None:
+            result = await self._spend_failure(user_id, require_spendable, True, action, session)
+            result.update(debt_repaid=0, remaining_debt=0, logs=[])
+            return result
+        if before is None:
+            return {
+                'success': False,
+                'message': '使用者不存在',
+                'balance_before': 0,
+                'balance_after': 0,
+                'debt_repaid': 0,
+                'remaining_debt': 0,
+                'logs': []
+            }
+
+        # 更新是原子的，依更新前文件以相同公式算出更新後狀態
+        points_before = before.get("points", 0)
+        owed_before = max(before.get("owed_points", 0) or 0, 0) if repay_debt else 0
+        repaid = max(min(points_before + amount, owed_before), 0) if owed_before > 0 else 0
+        balance_after = points_before + amount - repaid
+        net = balance_after - points_before
+
+        now = datetime.now(timezone.utc)
+        logs: List[dict] = []
+        if repaid > 0:
+            values = {"amount": amount, "repaid": repaid, "net": net,
+                      "points_before": points_before, "note": note}
+            logs.append(self._build_log(
+                user_id, "debt_repayment", repaid,
+                (repay_note or DEFAULT_REPAY_NOTE).format(**values),
+                balance_after, transaction_id, now
+            ))
+            if net > 0:
+                logs.append(self._build_log(
+                    user_id, change_type, net,
+                    (remainder_note or DEFAULT_REMAINDER_NOTE).format(**values),
+                    balance_after, transaction_id, now, extra_log_fields
+                ))
+        else:
+            logs.append(self._build_log(
+                user_id, change_type, amount, note,
+                balance_after, transaction_id, now, extra_log_fields
+            ))
+
+        if log:
+            await self.write_logs(logs, session=session)
+
+        if repaid > 0:
+            logger.info(f"Credit with debt repay: user {user_id}, amount {amount}, repaid {repaid}, remaining debt {owed_before - repaid}")
+
+        return {
+            'success': True,
+            'message': f'成功增加 {amount} 點' if repaid == 0 else f'自動償還欠款 {repaid} 點',
+            'balance_before': points_before,
+            'balance_after': balance_after,
+            'debt_repaid': repaid,
+            'remaining_debt': owed_before - repaid,
+            'final_points': balance_after,
+            'logs': logs
+        }
+
+    # ========== 扣款 ==========
+
+    async def debit(self, user_id: ObjectId, amount: int, change_type: str, note: str,
+                    transaction_id: str = None, enforce_status: bool = True,
+                    action: str = "交易", log: bool = True, session=None) -> dict:
+        """
+        安全地扣除使用者點數，防止產生負數餘額
+
+        Args:
+            user_id: 使用者 _id
+            amount: 扣除點數（正數）
+            change_type: 點數日誌類型
+            note: 點數日誌備註
+            transaction_id: 交易ID
+            enforce_status: 是否同時要求帳戶已啟用、未凍結且沒有欠款
+            action: 失敗訊息中的操作名稱（交易、轉帳…）
+            log: False 時只建立日誌不寫入（由呼叫者批次寫入）
+            session: 資料庫 session
+
+        Returns:
+            dict: success / message / balance_before / balance_after / logs
+                  （失敗時另有 error_code，與 UserValidationService 的錯誤碼相同）
+        """
+        after = await self.db[Collections.USERS].find_one_and_update(
+            self._spendable_filter(user_id, amount, enforce_status),
+            {"$inc": {"points": -amount}},
+            projection={"points": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if after is None:
+            return await self._spend_failure(user_id, amount, enforce_status, action, session)
+
+        balance_after = after.get("points", 0)
+        balance_before = balance_after + amount
+        logs = [self._build_log(
+            user_id, change_type, -amount, note,
+            balance_after, transaction_id, datetime.now(timezone.utc)
+        )]
+        if log:
+            await self.write_logs(logs, session=session)
+
+        logger.info(f"Safe point deduction successful: user {user_id}, amount {amount}, balance: {balance_before} -> {balance_after}")
+
+        return {
+            'success': True,
+            'message': f'成功扣除 {amount} 點',
+            'balance_before': balance_before,
+            'balance_after': balance_after,
+            'logs': logs
+        }
+
+    @staticmethod
+    def _spendable_filter(user_id: ObjectId, amount: int, enforce_status: bool) -> Dict[str, Any]:
+        """使用者可以消費指定金額的查詢條件"""
+        query: Dict[str, Any] = {
+            "_id": user_id,
+            "points": {"$gte": amount}  # 確保扣除後不會變負數
+        }
+        if enforce_status:
+            query["enabled"] = {"$ne": False}
+            query["frozen"] = {"$ne": True}
+            query["$or"] = [
+                {"owed_points": {"$exists": False}},
+                {"owed_points": {"$lte": 0}}
+            ]
+        return query
+
+    async def _spend_failure(self, user_id: ObjectId, amount: int, enforce_status: bool,
+                             action: str, session=None) -> dict:
+        """消費條件不符時查詢一次使用者，回傳具體原因"""
+        user = await self.db[Collections.USERS].find_one(
+            {"_id": user_id},
+            SPEND_CHECK_PROJECTION,
+            session=session
+        )
+        return self.check_spendable(user, amount, enforce_status, action) or {
+            # 查詢前條件已恢復（例如剛收到點數），仍以扣款失敗回報
+            'success': False,
+            'message': '扣款失敗，請稍後再試',
+            'error_code': 'CONCURRENT_UPDATE',
+            'balance_before': user.get("points", 0),
+            'balance_after': user.get("points", 0)
+        }
+
+    @staticmethod
+    def check_spendable(user: Optional[dict], amount: int, enforce_status: bool = True,
+                        action: str = "交易") -> Optional[dict]:
+        """
+        以已讀取的使用者文件檢查能否消費，可以時回傳 None，否則回傳與 debit 失敗相同格式的結果
+
+        使用者文件需包含 SPEND_CHECK_PROJECTION 的欄位
+        """
+        if not user:
+            return {
+                'success': False,
+                'message': '使用者不存在',
+                'error_code': 'USER_NOT_FOUND',
+                'balance_before': 0,
+                'balance_after': 0
+            }
+
+        points = user.get("points", 0)
+        owed_points = user.get("owed_points", 0)
+        result = {
+            'success': False,
+            'balance_before': points,
+            'balance_after': points,
+            'user_data': {'points': points, 'owed_points': owed_points}
+        }
+
+        if not enforce_status:
+            if points >= amount:
+                return None
+            result['message'] = f'點數不足，目前餘額：{points}，需要：{amount}'
+            result['error_code'] = 'INSUFFICIENT_BALANCE'
+            return result
+
+        if not user.get("enabled", True):
+            result['message'] = '帳戶未啟用'
+            result['error_code'] = 'ACCOUNT_DISABLED'
+        elif user.get("frozen", False):
+            result['message'] = f'帳戶已凍結，無法進行{action}'
+            result['error_code'] = 'ACCOUNT_FROZEN'
+        elif owed_points > 0:
+            result['message'] = f'帳戶有欠款 {owed_points} 點，請先償還後才能進行{action}'
+            result['error_code'] = 'HAS_DEBT'
+            result['owed_points'] = owed_points
+        elif points < amount:
+            available_balance = points - owed_points
+            result['message'] = f'餘額不足（含欠款檢查）。需要: {amount} 點，可用: {available_balance} 點'
+            result['error_code'] = 'INSUFFICIENT_BALANCE'
+            result['available_balance'] = available_balance
+        else:
+            return None
+        return result
+
+    # ========== 日誌 ==========
+
+    @staticmethod
+    def _build_log(user_id: ObjectId, change_type: str, amount: int, note: str,
+                   balance_after: int, transaction_id: Optional[str], created_at: datetime,
+                   extra_fields: Optional[dict] = None) -> dict:
+        log_entry = {
+            "user_id": user_id,
+            "type": change_type,
+            "amount": amount,
+            "note": note,
+            "balance_after": balance_after,
+            "created_at": created_at,
+            "transaction_id": transaction_id
+        }
+        if extra_fields:
+            log_entry.update(extra_fields)
+        return log_entry
+
+    async def write_logs(self, logs: List[dict], session=None) -> None:
+        """批次寫入點數日誌（日誌失敗不影響主要業務邏輯）"""
+        if not logs:
+            return
+        try:
+            if len(logs) == 1:
+                await self.db[Collections.POINT_LOGS].insert_one(logs[0], session=session)
+            else:
+                await self.db[Collections.POINT_LOGS].insert_many(logs, ordered=False, session=session)
+        except Exception as e:
+            logger.error(f"Failed to write point logs: {e}")
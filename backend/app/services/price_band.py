@@ -0,0 +1,217 @@
+# 漲跌限制價格帶
+# 每個交易日（或漲跌限制設定變動時）計算一次基準價格與漲跌停價格，下單與撮合直接在記憶體中判斷
+
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.database import get_database, Collections
+from app.services.market_calendar import TAIPEI_TZ
+from app.services.market_config_snapshot import get_market_config_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 無法決定基準價格時的預設價格與預設漲跌限制（%）
+DEFAULT_REFERENCE_PRICE = 20.0
+DEFAULT_LIMIT_PERCENT = 20.0
+
+
+class PriceBand:
+    """
+    漲跌限制價格帶
+
+    基準價格為前一交易日（台北時間）最後一筆成交價；沒有前日成交時依序改用
+    今日第一筆成交價、market_config 的 current_price，最後才是預設價格。
+    基準價格每個交易日只查詢一次，漲跌限制從市場設定快照讀取，快照版本變動時才重新計算。
+    價格帶移動後以一次 update_many 重新啟用落在新價格帶內的 pending_limit 訂單。
+    """
+
+    def __init__(self):
+        self.reference_price: float = DEFAULT_REFERENCE_PRICE
+        self.limit_percent: float = DEFAULT_LIMIT_PERCENT
+        self.min_price: float = 0.0
+        self.max_price: float = 0.0
+        # 基準價格來源：previous_close / today_open / current_price / default
+        self.reference_source: str = "default"
+        self._trading_day: Optional[date] = None
+        self._snapshot_version: Optional[int] = None
+        # 價格帶每移動一次遞增；_reactivated_version 記錄最後一次重新啟用時的版本
+        self._band_version = 0
+        self._reactivated_version = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def provisional(self) -> bool:
+        """基準價格尚未取自實際成交（今日第一筆成交後需重新計算）"""
+        return self.reference_source in ("current_price", "default")
+
+    # ========== 計算 ==========
+
+    @staticmethod
+    def _today() -> date:
+        return datetime.now(timezone.utc).astimezone(TAIPEI_TZ).date()
+
+    async def _load_reference_price(self, db: AsyncIOMotorDatabase, trading_day: date) -> None:
+        """查詢基準價格（每個交易日一次）"""
+        day_start = datetime(trading_day.year, trading_day.month, trading_day.day, tzinfo=TAIPEI_TZ).astimezone(timezone.utc)
+
+        # 前一交易日最後一筆成交作為前日收盤價
+        last_trade = await db[Collections.TRADES].find_one(
+            {"created_at": {"$lt": day_start}, "price": {"$gt": 0}},
+            {"price": 1},
+            sort=[("created_at", -1)]
+        )
+        if last_trade:
+            self.reference_price, self.reference_source = float(last_trade["price"]), "previous_close"
+            return
+
+        # 沒有前日成交時使用今日第一筆成交作為開盤價
+        first_trade = await db[Collections.TRADES].find_one(
+            {"created_at": {"$gte": day_start}, "price": {"$gt": 0}},
+            {"price": 1},
+            sort=[("created_at", 1)]
+        )
+        if first_trade:
+            self.reference_price, self.reference_source = float(first_trade["price"]), "today_open"
+            return
+
+        # 最後回到市場設定或預設價格
+        price_config = await db[Collections.MARKET_CONFIG].find_one({"type": "current_price"})
+        if price_config and price_config.get("price", 0) > 0:
+            self.reference_price, self.reference_source = float(price_config["price"]), "current_price"
+            return
+
+        self.reference_price, self.reference_source = DEFAULT_REFERENCE_PRICE, "default"
+
+    async def _load_limit_percent(self, db: AsyncIOMotorDatabase) -> None:
+        """從市場設定快照讀取漲跌限制（limitPercent 以 basis points 儲存）"""
+        snapshot = get_market_config_snapshot()
+        limit_config = await snapshot.get("trading_limit", db)
+        if limit_config and limit_config.get("limitPercent"):
+            self.limit_percent = float(limit_config["limitPercent"]) / 100.0
+        else:
+            self.limit_percent = DEFAULT_LIMIT_PERCENT
+        self._snapshot_version = snapshot.version
+
+    def _apply_band(self) -> None:
+        min_price = self.reference_price * (1 - self.limit_percent / 100.0)
+        max_price = self.reference_price * (1 + self.limit_percent / 100.0)
+        if (min_price, max_price) != (self.min_price, self.max_price):
+            self.min_price, self.max_price = min_price, max_price
+            self._band_version += 1
+            logger.info(
+                f"Price band updated: reference={self.reference_price} ({self.reference_source}), "
+                f"limit={self.limit_percent}%, range=[{min_price:.2f}, {max_price:.2f}]"
+            )
+
+    async def ensure_current(self, db: AsyncIOMotorDatabase = None) -> "PriceBand":
+        """換日或設定變動時重新計算價格帶，否則不查詢資料庫"""
+        today = self._today()
+        snapshot_version = get_market_config_snapshot().version
+        if self._trading_day == today and self._snapshot_version == snapshot_version:
+            return self
+
+        async with self._lock:
+            if db is None:
+                db = get_database()
+            if self._trading_day != today:
+                await self._load_reference_price(db, today)
+                self._trading_day = today
+            if self._snapshot_version != get_market_config_snapshot().version:
+                await self._load_limit_percent(db)
+            self._apply_band()
+        return self
+
+    async def refresh_reference(self, db: AsyncIOMotorDatabase = None) -> None:
+        """重新查詢基準價格（今日第一筆成交後或成交資料被重置時使用）"""
+        self._trading_day = None
+        await self.ensure_current(db)
+
+    def invalidate(self) -> None:
+        """標記基準價格與漲跌限制需要重新計算"""
+        self._trading_day = None
+        self._snapshot_version = None
+
+    # ========== 查詢 ==========
+
+    def contains(self, price: float) -> bool:
+        """價格是否在漲跌停範圍內（呼叫前需先 ensure_current）"""
+        return self.min_price <= price <= self.max_price
+
+    async def check(self, price: float, db: AsyncIOMotorDatabase = None) -> bool:
+        """檢查價格是否在漲跌限制內"""
+        await self.ensure_current(db)
+        return self.contains(price)
+
+    def get_info(self, price: float) -> dict:
+        """取得價格限制的詳細資訊（呼叫前需先 ensure_current）"""
+        return {
+            "within_limit": self.contains(price),
+            "reference_price": self.reference_price,
+            "reference_source": self.reference_source,
+            "limit_percent": self.limit_percent,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "order_price": price
+        }
+
+    # ========== 重新啟用 ==========
+
+    async def reactivate_in_band(self, db: AsyncIOMotorDatabase = None) -> int:
+        """
+        價格帶移動後，將價格落在新範圍內的 pending_limit 訂單改回 pending
+
+        Returns:
+            int: 重新啟用的訂單數
+        """
+        if db is None:
+            db = get_database()
+        await self.ensure_current(db)
+        if self._reactivated_version == self._band_version:
+            return 0
+
+        band_version = self._band_version
+        result = await db[Collections.STOCK_ORDERS].update_many(
+            {
+                "status": "pending_limit",
+                "order_type": "limit",
+                "price": {"$gte": self.min_price, "$lte": self.max_price}
+            },
+            {
+                "$set": {
+                    "status": "pending",
+                    "reactivated_at": datetime.now(timezone.utc)
+                },
+                "$unset": {"limit_exceeded": "", "limit_note": ""}
+            }
+        )
+        self._reactivated_version = band_version
+        if result.modified_count > 0:
+            logger.info(
+                f"Reactivated {result.modified_count} orders within price band "
+                f"[{self.min_price:.2f}, {self.max_price:.2f}]"
+            )
+        return result.modified_count
+
+    def get_status(self) -> dict:
+        """取得價格帶狀態"""
+        return {
+            "trading_day": self._trading_day.isoformat() if self._trading_day else None,
+            "reference_price": self.reference_price,
+            "reference_source": self.reference_source,
+            "limit_percent": self.limit_percent,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "band_version": self._band_version
+        }
+
+
+# 全域價格帶實例
+_price_band = PriceBand()
+
+
+def get_price_band() -> PriceBand:
+    """獲取漲跌限制價格帶實例"""
+    return _price_band
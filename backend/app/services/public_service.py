@@ -7,6 +7,8 @@ from app.schemas.public import (
     MarketPriceInfo
 )
 from app.services.cache_service import cached, get_cache_service, CacheKeys
+from app.services.market_calendar import get_market_calendar
+from app.services.market_config_snapshot import get_market_config_snapshot
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timezone, timedelta
 from typing import List
@@ -96,9 +98,7 @@ class PublicService:
             change_percent = (change / open_price * 100) if open_price > 0 else 0
             
             # 取得漲跌限制（以 basis points 為單位）
-            limit_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "trading_limit"}
-            )
+            limit_config = await get_market_config_snapshot().get("trading_limit", self.db)
             limit_percent = limit_config.get("limitPercent", 2000) if limit_config else 2000
             
             return PriceSummary(
@@ -610,9 +610,7 @@ class PublicService:
         """
         try:
             # 查詢IPO設定
-            ipo_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "ipo_status"}
-            )
+            ipo_config = await get_market_config_snapshot().get("ipo_status", self.db)
             
             if ipo_config:
                 return {
@@ -650,46 +648,9 @@ class PublicService:
     
     # 檢查市場是否開放（與 user_service 邏輯一致）
     async def _is_market_open(self) -> bool:
-        """檢查市場是否開放交易"""
+        """檢查市場是否開放交易（使用記憶體中的交易時間行事曆）"""
         try:
-            from datetime import datetime, timezone, timedelta
-            
-            # 檢查預定時間
-            market_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "market_hours"}
-            )
-            
-            if not market_config or "openTime" not in market_config:
-                # 如果沒有設定，預設市場開放
-                return True
-            
-            # 取得目前台北時間 (UTC+8)
-            taipei_tz = timezone(timedelta(hours=8))
-            current_time = datetime.now(timezone.utc).astimezone(taipei_tz)
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-            current_seconds_of_day = current_hour * 3600 + current_minute * 60 + current_time.second
-            
-            # 檢查目前是否在任何一個開放時間段內
-            for slot in market_config["openTime"]:
-                # 將儲存的時間戳轉換為當日的秒數
-                start_dt = datetime.fromtimestamp(slot["start"], tz=timezone.utc).astimezone(taipei_tz)
-                end_dt = datetime.fromtimestamp(slot["end"], tz=timezone.utc).astimezone(taipei_tz)
-                
-                start_seconds = start_dt.hour * 3600 + start_dt.minute * 60 + start_dt.second
-                end_seconds = end_dt.hour * 3600 + end_dt.minute * 60 + end_dt.second
-                
-                # 處理跨日情況（例如 23:00 到 01:00）
-                if start_seconds <= end_seconds:
-                    # 同一天內的時間段
-                    if start_seconds <= current_seconds_of_day <= end_seconds:
-                        return True
-                else:
-                    # 跨日時間段
-                    if current_seconds_of_day >= start_seconds or current_seconds_of_day <= end_seconds:
-                        return True
-            
-            return False
+            return await get_market_calendar().is_open(self.db)
             
         except Exception as e:
             logger.error(f"Failed to check market status: {e}")
@@ -0,0 +1,223 @@
+# PvP 挑戰到期處理
+# 由單一背景掃描器依 (status, expires_at) 索引將到期挑戰標記為 expired，
+# 取代各處讀取挑戰後在 Python 中比對 expires_at 的延遲寫入與 BOT 端每個挑戰各自的計時器
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config_refactored import config
+from app.core.database import get_database, Collections
+
+logger = logging.getLogger(__name__)
+
+# 尚未結束的挑戰狀態
+PVP_OPEN_STATUSES = ["pending", "waiting_accepter"]
+
+# 挑戰有效時間
+PVP_CHALLENGE_TTL = timedelta(hours=3)
+
+# BOT 取出過期挑戰後回報結果的期限，逾期未回報的挑戰會再被取出
+EXPIRY_NOTICE_LEASE = timedelta(seconds=60)
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class PvPExpirySweeper:
+    """
+    PvP 挑戰到期掃描器
+
+    每次掃描以一次 update_many 將所有到期的挑戰標記為 expired，
+    接著睡到下一個挑戰的 expires_at（最長 max_interval 秒）；
+    建立新挑戰時以 notify() 喚醒，重新計算下一次到期時間。
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._max_interval = 0
+        self._next_expiry: Optional[datetime] = None
+        self._last_sweep_at: Optional[datetime] = None
+        self._total_expired = 0
+
+    async def start(self, max_interval: int = None) -> None:
+        """啟動背景掃描；間隔為 0 時不啟動"""
+        max_interval = config.trading.pvp_sweep_interval if max_interval is None else max_interval
+        if max_interval <= 0 or (self._task and not self._task.done()):
+            return
+        self._max_interval = max_interval
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"PvP expiry sweeper started (max interval {max_interval}s)")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("PvP expiry sweeper stopped")
+
+    def notify(self, expires_at: datetime) -> None:
+        """新挑戰建立後呼叫；比目前排定的下一次掃描更早到期時喚醒掃描器"""
+        expires_at = _as_utc(expires_at)
+        if self._next_expiry is None or expires_at < self._next_expiry:
+            self._wakeup.set()
+
+    # ========== 掃描 ==========
+
+    async def sweep(self, db: AsyncIOMotorDatabase = None) -> int:
+        """將所有到期的挑戰標記為 expired，回傳本次標記的數量"""
+        if db is None:
+            db = get_database()
+        now = datetime.now(timezone.utc)
+        result = await db[Collections.PVP_CHALLENGES].update_many(
+            {"status": {"$in": PVP_OPEN_STATUSES}, "expires_at": {"$lte": now}},
+            {"$set": {
+                "status": "expired",
+                "expired_at": now,
+                "expiry_notified": False
+            }}
+        )
+        self._last_sweep_at = now
+        self._total_expired += result.modified_count
+        if result.modified_count:
+            logger.info(f"PvP expiry sweep: expired {result.modified_count} challenges")
+        return result.modified_count
+
+    async def _find_next_expiry(self, db: AsyncIOMotorDatabase) -> Optional[datetime]:
+        challenge = await db[Collections.PVP_CHALLENGES].find_one(
+            {"status": {"$in": PVP_OPEN_STATUSES}},
+            {"expires_at": 1},
+            sort=[("expires_at", 1)]
+        )
+        if challenge and challenge.get("expires_at"):
+            return _as_utc(challenge["expires_at"])
+        return None
+
+    async def _loop(self) -> None:
+        db = get_database()
+        while True:
+            try:
+                self._wakeup.clear()
+                await self.sweep(db)
+                self._next_expiry = await self._find_next_expiry(db)
+
+                delay = self._max_interval
+                if self._next_expiry is not None:
+                    until_next = (self._next_expiry - datetime.now(timezone.utc)).total_seconds()
+                    delay = min(delay, max(until_next, 0.5))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in PvP expiry sweeper: {e}")
+                await asyncio.sleep(5)
+
+    # ========== 通知 ==========
+
+    async def claim_expired(self, limit: int = 100, db: AsyncIOMotorDatabase = None) -> List[Dict[str, Any]]:
+        """
+        取出尚未通知的過期挑戰（供 BOT 發送過期訊息）
+
+        取出時只蓋上租約，BOT 送出後以 ack_expired() 回報才標記為已通知；
+        BOT 沒有回報（送出失敗或當機）的挑戰在租約到期後會再被取出
+        """
+        if db is None:
+            db = get_database()
+        now = datetime.now(timezone.utc)
+        claimable = {
+            "status": "expired",
+            "expiry_notified": False,
+            "$or": [
+                {"expiry_claimed_at": None},
+                {"expiry_claimed_at": {"$lte": now - EXPIRY_NOTICE_LEASE}}
+            ]
+        }
+        candidates = await db[Collections.PVP_CHALLENGES].find(claimable, {"_id": 1}).sort(
+            "expired_at", 1
+        ).limit(limit).to_list(length=limit)
+        if not candidates:
+            return []
+
+        # 以本次的 claim token 標記，只回傳確實由這次取出的挑戰
+        claim_token = uuid.uuid4().hex
+        await db[Collections.PVP_CHALLENGES].update_many(
+            {"_id": {"$in": [c["_id"] for c in candidates]}, **claimable},
+            {"$set": {"expiry_claimed_at": now, "expiry_claim_token": claim_token}}
+        )
+        challenges = await db[Collections.PVP_CHALLENGES].find(
+            {"expiry_claim_token": claim_token},
+            {"challenger": 1, "challenger_name": 1, "amount": 1, "chat_id": 1, "message_id": 1, "expired_at": 1}
+        ).sort("expired_at", 1).to_list(length=limit)
+        return [{
+            "challenge_id": str(c["_id"]),
+            "challenger": c.get("challenger"),
+            "challenger_name": c.get("challenger_name"),
+            "amount": c.get("amount", 0),
+            "chat_id": c.get("chat_id"),
+            "message_id": c.get("message_id"),
+            "expired_at": c.get("expired_at")
+        } for c in challenges]
+
+    async def ack_expired(self, delivered: List[str], failed: List[str] = None,
+                          db: AsyncIOMotorDatabase = None) -> Dict[str, int]:
+        """
+        BOT 回報過期通知的結果
+
+        delivered 標記為已通知；failed 釋放租約，下一次 claim_expired() 立即重新取出
+        """
+        if db is None:
+            db = get_database()
+
+        def _object_ids(values):
+            return [ObjectId(value) for value in values or [] if ObjectId.is_valid(value)]
+
+        acknowledged = released = 0
+        delivered_ids = _object_ids(delivered)
+        if delivered_ids:
+            result = await db[Collections.PVP_CHALLENGES].update_many(
+                {"_id": {"$in": delivered_ids}, "status": "expired", "expiry_notified": False},
+                {"$set": {"expiry_notified": True}, "$unset": {"expiry_claimed_at": "", "expiry_claim_token": ""}}
+            )
+            acknowledged = result.modified_count
+
+        failed_ids = _object_ids(failed)
+        if failed_ids:
+            result = await db[Collections.PVP_CHALLENGES].update_many(
+                {"_id": {"$in": failed_ids}, "status": "expired", "expiry_notified": False},
+                {"$unset": {"expiry_claimed_at": "", "expiry_claim_token": ""}}
+            )
+            released = result.modified_count
+
+        if released:
+            logger.warning(f"PvP expiry notices failed for {released} challenges, released for retry")
+        return {"acknowledged": acknowledged, "released": released}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "max_interval_seconds": self._max_interval,
+            "next_expiry": self._next_expiry.isoformat() if self._next_expiry else None,
+            "last_sweep_at": self._last_sweep_at.isoformat() if self._last_sweep_at else None,
+            "total_expired": self._total_expired
+        }
+
+
+# 全域掃描器實例
+_pvp_expiry_sweeper = PvPExpirySweeper()
+
+
+def get_pvp_expiry_sweeper() -> PvPExpirySweeper:
+    """獲取 PvP 到期掃描器實例"""
+    return _pvp_expiry_sweeper
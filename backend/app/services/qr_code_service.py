@@ -0,0 +1,189 @@
+"""
+QR Code 點數兌換服務
+
+兌換以條件式 find_one_and_update（{id, used: false}）原子地佔用 QR Code，
+並與入帳在同一個交易內完成：同一張 QR Code 被多人同時掃描時只有一人
+能佔用成功，入帳失敗時交易回滾，QR Code 仍可再兌換。
+批次產生 QR Code 以 insert_many 一次寫入，qr_codes.id 有唯一索引。
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from app.services.points_ledger import PointsLedger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from datetime import datetime
+from typing import Any, Dict, List
+import asyncio
+import json
+import logging
+import random
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+# 每批 insert_many 的筆數
+QR_BATCH_SIZE = 1000
+
+
+def get_qr_code_service() -> QRCodeService:
+    """QRCodeService 的依賴注入函數"""
+    return QRCodeService()
+
+
+class QRCodeRedeemError(Exception):
+    """兌換失敗（用於回滾交易）"""
+
+
+class QRCodeService:
+    def __init__(self, db: AsyncIOMotorDatabase = None):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.ledger = PointsLedger(self.db)
+
+    # ========== 兌換 ==========
+
+    async def redeem(self, qr_id: str, user_identifier: str) -> Dict[str, Any]:
+        """
+        兌換 QR Code，帶寫入衝突重試機制
+
+        Returns:
+            dict: ok / message / points
+        """
+        max_retries = 5
+        retry_delay = 0.003
+
+        for attempt in range(max_retries):
+            try:
+                return await self._redeem_with_transaction(qr_id, user_identifier)
+
+            except QRCodeRedeemError as e:
+                return {"ok": False, "message": str(e)}
+
+            except Exception as e:
+                error_str = str(e)
+
+                # 檢查是否為事務不支援的錯誤
+                if "Transaction numbers are only allowed on a replica set member or mongos" in error_str:
+                    logger.warning("MongoDB transactions not supported, falling back to non-transactional mode")
+                    return await self._redeem_without_transaction(qr_id, user_identifier)
+
+                # 檢查是否為寫入衝突錯誤（可重試）
+                if ("WriteConflict" in error_str or "TransientTransactionError" in error_str) and attempt < max_retries - 1:
+                    logger.info(f"QR redeem WriteConflict on attempt {attempt + 1}/{max_retries}, retrying...")
+                    await asyncio.sleep(retry_delay * random.uniform(0.8, 1.2))
+                    retry_delay *= 1.6
+                    continue
+
+                raise
+
+    async def _redeem_with_transaction(self, qr_id: str, user_identifier: str) -> Dict[str, Any]:
+        """使用事務兌換（佔用與入帳一起提交或回滾）"""
+        async with await self.db.client.start_session() as session:
+            async with session.start_transaction():
+                return await self._execute_redeem(qr_id, user_identifier, session)
+
+    async def _redeem_without_transaction(self, qr_id: str, user_identifier: str) -> Dict[str, Any]:
+        """不使用事務兌換；入帳失敗時釋放佔用"""
+        try:
+            return await self._execute_redeem(qr_id, user_identifier, None)
+        except QRCodeRedeemError as e:
+            return {"ok": False, "message": str(e)}
+
+    async def _execute_redeem(self, qr_id: str, user_identifier: str, session=None) -> Dict[str, Any]:
+        user = await self.db[Collections.USERS].find_one(
+            {"$or": [{"name": user_identifier}, {"id": user_identifier}]},
+            {"_id": 1},
+            session=session
+        )
+        if not user:
+            raise QRCodeRedeemError("使用者不存在")
+
+        # 原子地佔用 QR Code：只有 used 為 false 的文件會被更新
+        claimed = await self.db[Collections.QR_CODES].find_one_and_update(
+            {"id": qr_id, "used": False},
+            {"$set": {"used": True, "used_by": user_identifier, "used_at": datetime.now()}},
+            projection={"points": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if claimed is None:
+            existing = await self.db[Collections.QR_CODES].find_one(
+                {"id": qr_id}, {"used_by": 1}, session=session
+            )
+            if not existing:
+                raise QRCodeRedeemError("無效的 QR Code")
+            raise QRCodeRedeemError(f"此 QR Code 已經被 {existing.get('used_by') or '其他人'} 兌換過了")
+
+        # 點數以資料庫記錄為準，不信任 QR Code 內容
+        points = claimed.get("points", 0)
+        result = await self.ledger.credit(
+            user_id=user["_id"],
+            amount=points,
+            change_type="qr_redeem",
+            note=f"QR Code 兌換: {points} 點",
+            transaction_id=qr_id,
+            repay_note="QR Code 兌換 {amount} 點 + 現有 {points_before} 點，共償還欠款: {repaid} 點",
+            session=session
+        )
+        if not result["success"]:
+            if session is None:
+                await self._release(qr_id, user_identifier)
+            raise QRCodeRedeemError(result["message"])
+
+        logger.info(f"QR code {qr_id} redeemed by {user_identifier}: {points} points")
+        return {"ok": True, "message": f"成功兌換 {points} 點數！", "points": points}
+
+    async def _release(self, qr_id: str, user_identifier: str) -> None:
+        """非事務模式下入帳失敗，釋放自己佔用的 QR Code"""
+        await self.db[Collections.QR_CODES].update_one(
+            {"id": qr_id, "used": True, "used_by": user_identifier},
+            {"$set": {"used": False, "used_by": None, "used_at": None}}
+        )
+
+    # ========== 批次產生 ==========
+
+    @staticmethod
+    def build_record(qr_id: str, points: int, created_by: str, created_at: datetime) -> dict:
+        """建立 QR Code 記錄（qr_data 與前端產生的格式相同）"""
+        qr_data = json.dumps({
+            "type": "points_redeem",
+            "id": qr_id,
+            "points": points,
+            "created_at": created_at.isoformat(),
+            "used": False
+        })
+        return {
+            "id": qr_id,
+            "qr_data": qr_data,
+            "points": points,
+            "created_at": created_at,
+            "used": False,
+            "used_by": None,
+            "used_at": None,
+            "created_by": created_by
+        }
+
+    async def create_bulk(self, count: int, points: int, created_by: str) -> List[dict]:
+        """
+        批次產生 QR Code 並以 insert_many 寫入
+
+        Returns:
+            list: 建立的 QR Code 記錄（不含 _id）
+        """
+        now = datetime.now()
+        prefix = f"qr_{int(time.time() * 1000)}"
+        records = [
+            self.build_record(f"{prefix}_{i}_{secrets.token_hex(5)}", points, created_by, now)
+            for i in range(count)
+        ]
+        for start in range(0, len(records), QR_BATCH_SIZE):
+            # insert_many 會在傳入的 dict 上加入 _id，寫入副本以便直接回傳
+            await self.db[Collections.QR_CODES].insert_many(
+                [dict(record) for record in records[start:start + QR_BATCH_SIZE]],
+                ordered=False
+            )
+        logger.info(f"Created {count} QR codes ({points} points each) by {created_by}")
+        return records
@@ -5,7 +5,8 @@ from typing import List, Dict, Optional
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import get_database, Collections
-from app.core.rbac import Role, Permission, RBACService, ROLE_PERMISSIONS
+from app.core.rbac import Role, Permission, RBACService, ROLE_PERMISSIONS, get_role_claim_registry
+from app.services.user_identity_service import get_user_identity_resolver
 from app.schemas.rbac import (
     UserRoleInfo, RoleUpdateRequest, RoleUpdateResponse,
     PermissionCheckRequest, PermissionCheckResponse, 
@@ -159,6 +160,10 @@ class RBACManagementService:
                     detail="角色更新失敗"
                 )
             
+            # 角色已變更，清除該使用者的身分與角色快取，並撤銷已簽發的角色聲明
+            get_user_identity_resolver().invalidate_user(user["_id"])
+            get_role_claim_registry().bump(user.get("id"), user.get("name"), str(user["_id"]))
+            
             # 記錄角色變更
             await self._log_role_change(
                 user_id=user["_id"],
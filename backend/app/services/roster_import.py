@@ -0,0 +1,268 @@
+"""
+學員名單匯入服務 - 批次新增 / 更新學員資料
+
+整份名單先以一次 $in 查詢與現有使用者比對，只對新增或有變動的列送出
+unordered bulk_write；新學員的初始持股在第二批 insert_many 建立。
+每一列都回傳處理結果（created / updated / unchanged / error）。
+"""
+from __future__ import annotations
+from app.core.database import get_database, Collections
+from app.services.user_identity_service import get_user_identity_resolver
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import codecs
+import csv
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每批 bulk_write 的筆數
+ROSTER_BATCH_SIZE = 1000
+
+# 新學員的初始點數與持股
+INITIAL_POINTS = 100
+INITIAL_STOCK_AMOUNT = 10
+
+# CSV 必要欄位
+ROSTER_FIELDS = ("id", "name", "team")
+
+
+def get_roster_import_service() -> RosterImportService:
+    """RosterImportService 的依賴注入函數"""
+    return RosterImportService()
+
+
+async def read_roster_csv(upload, chunk_size: int = 65536) -> List[dict]:
+    """
+    逐塊讀取上傳的 CSV 名單（需有 id,name,team 標頭）
+
+    先逐塊解碼到文字緩衝區再交給 csv.reader，引號內的換行與 \r\n 換行才會正確處理。
+
+    Args:
+        upload: FastAPI UploadFile
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = io.StringIO(newline="")
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        buffer.write(decoder.decode(chunk))
+    buffer.write(decoder.decode(b"", final=True))
+    buffer.seek(0)
+
+    rows: List[dict] = []
+    header: Optional[List[str]] = None
+    for values in csv.reader(buffer):
+        if not any(value.strip() for value in values):
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            missing = [f for f in ROSTER_FIELDS if f not in header]
+            if missing:
+                raise ValueError(f"CSV 缺少欄位: {', '.join(missing)}")
+            continue
+        rows.append({key: value.strip() for key, value in zip(header, values)})
+    return rows
+
+
+class RosterImportService:
+    def __init__(self, db: AsyncIOMotorDatabase = None, batch_size: int = ROSTER_BATCH_SIZE):
+        if db is None:
+            self.db = get_database()
+        else:
+            self.db = db
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _validate(row: Any) -> Optional[str]:
+        """檢查單列資料，回傳錯誤訊息（沒有錯誤回傳 None）"""
+        if not isinstance(row, dict):
+            return "資料格式錯誤"
+        for field in ROSTER_FIELDS:
+            value = row.get(field)
+            if not isinstance(value, str) or not value.strip():
+                return f"缺少欄位 {field}"
+        return None
+
+    async def import_rows(self, rows: List[dict]) -> Dict[str, Any]:
+        """
+        匯入學員名單
+
+        Returns:
+            dict: created_count / updated_count / unchanged_count / errors / results
+        """
+        results: List[Dict[str, Any]] = [
+            {"row": index, "id": (row.get("id") if isinstance(row, dict) else None), "status": "pending"}
+            for index, row in enumerate(rows)
+        ]
+
+        # 驗證並以 id 去重（同一個 id 以最後一列為準）
+        latest: Dict[str, int] = {}
+        for index, row in enumerate(rows):
+            error = self._validate(row)
+            if error:
+                results[index].update(status="error", error=error)
+                continue
+            student_id = row["id"].strip()
+            if student_id in latest:
+                results[latest[student_id]].update(status="skipped", error="同一個 id 在名單中重複，以後面的列為準")
+            latest[student_id] = index
+
+        # 一次查詢所有既有使用者
+        existing: Dict[str, dict] = {}
+        if latest:
+            cursor = self.db[Collections.USERS].find(
+                {"id": {"$in": list(latest.keys())}},
+                {"_id": 1, "id": 1, "name": 1, "team": 1}
+            )
+            async for user in cursor:
+                existing[user["id"]] = user
+
+        now = datetime.now(timezone.utc)
+        operations: List[UpdateOne] = []
+        op_rows: List[int] = []
+        for student_id, index in latest.items():
+            row = rows[index]
+            name, team = row["name"].strip(), row["team"].strip()
+            current = existing.get(student_id)
+
+            if current is not None:
+                if current.get("name") == name and current.get("team") == team:
+                    results[index]["status"] = "unchanged"
+                    continue
+                results[index]["status"] = "updated"
+            else:
+                results[index]["status"] = "created"
+
+            operations.append(UpdateOne(
+                {"id": student_id},
+                {
+                    "$set": {
+                        "name": name,
+                        "team": team,
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {
+                        "enabled": False,  # 新學員預設未啟用
+                        "points": INITIAL_POINTS,
+                        "stock_amount": INITIAL_STOCK_AMOUNT,
+                        "created_at": now
+                    }
+                },
+                upsert=True
+            ))
+            op_rows.append(index)
+
+        # 第一批：新增與更新使用者
+        created_user_ids = []
+        for start in range(0, len(operations), self.batch_size):
+            batch = operations[start:start + self.batch_size]
+            batch_rows = op_rows[start:start + self.batch_size]
+            try:
+                bulk_result = await self.db[Collections.USERS].bulk_write(batch, ordered=False)
+                upserted = bulk_result.upserted_ids
+            except BulkWriteError as e:
+                details = e.details or {}
+                upserted = {item["index"]: item["_id"] for item in details.get("upserted", [])}
+                for write_error in details.get("writeErrors", []):
+                    row_index = batch_rows[write_error["index"]]
+                    results[row_index].update(status="error", error=write_error.get("errmsg", "寫入失敗"))
+
+            for op_index, row_index in enumerate(batch_rows):
+                if op_index in upserted:
+                    results[row_index]["status"] = "created"
+                    created_user_ids.append(upserted[op_index])
+                elif results[row_index]["status"] == "created":
+                    # 比對後才被其他請求建立，實際上是更新
+                    results[row_index]["status"] = "updated"
+
+        # 第二批：為新學員初始化持股
+        if created_user_ids:
+            holdings = [{
+                "user_id": user_oid,
+                "stock_amount": INITIAL_STOCK_AMOUNT,
+                "initial_amount": INITIAL_STOCK_AMOUNT,  # 開盤持股，供完整性稽核比對成交紀錄
+                "updated_at": now
+            } for user_oid in created_user_ids]
+            for start in range(0, len(holdings), self.batch_size):
+                await self.db[Collections.STOCKS].insert_many(
+                    holdings[start:start + self.batch_size], ordered=False
+                )
+
+        counts = {"created": 0, "updated": 0, "unchanged": 0}
+        errors: List[str] = []
+        for result in results:
+            if result["status"] in counts:
+                counts[result["status"]] += 1
+            elif result["status"] == "error":
+                errors.append(f"Error updating student {result.get('id')}: {result.get('error')}")
+
+        # 姓名、隊伍可能變動，清除身分索引
+        if counts["created"] or counts["updated"]:
+            get_user_identity_resolver().clear()
+
+        logger.info(
+            f"Roster import: {counts['created']} created, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged, {len(errors)} errors"
+        )
+
+        return {
+            "created_count": counts["created"],
+            "updated_count": counts["updated"],
+            "unchanged_count": counts["unchanged"],
+            "errors": errors,
+            "results": results
+        }
+
+    async def list_students(self) -> List[dict]:
+        """取得學生列表（只包含有 id 欄位的學員）"""
+        students_cursor = self.db[Collections.USERS].find(
+            {"id": {"$exists": True}},
+            {"_id": 0, "id": 1, "name": 1, "team": 1, "enabled": 1}
+        )
+        return [{
+            "id": student.get("id", ""),
+            "name": student.get("name", ""),
+            "team": student.get("team", ""),
+            "enabled": student.get("enabled", False)
+        } async for student in students_cursor]
+
+    async def update_students(self, student_data: List[dict]) -> dict:
+        """匯入名單並回傳 update_students 既有的回應格式"""
+        try:
+            summary = await self.import_rows(student_data)
+            students = await self.list_students()
+
+            # 準備回應訊息
+            message = f"成功更新 {summary['updated_count']} 位學員"
+            if summary["created_count"] > 0:
+                message += f"，新增 {summary['created_count']} 位學員"
+            if summary["unchanged_count"] > 0:
+                message += f"，{summary['unchanged_count']} 位學員資料未變動"
+            if summary["errors"]:
+                message += f"，{len(summary['errors'])} 個錯誤"
+
+            return {
+                "success": True,
+                "message": message,
+                "students": students,
+                "updated_count": summary["updated_count"],
+                "created_count": summary["created_count"],
+                "errors": summary["errors"],
+                "results": summary["results"]
+            }
+
+        except Exception as e:
+            logger.error(f"Error in batch update students: {e}")
+            return {
+                "success": False,
+                "message": f"批量更新使用者狀態失敗: {str(e)}",
+                "students": [],
+                "updated_count": 0,
+                "errors": [str(e)]
+            }
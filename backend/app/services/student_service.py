@@ -2,6 +2,8 @@ from __future__ import annotations
 from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import get_database, Collections
+from app.services.user_identity_service import get_user_identity_resolver
+from app.services.roster_import import RosterImportService
 from datetime import datetime, timezone
 from typing import List
 import logging
@@ -71,98 +73,10 @@ class StudentService:
             student_data: 學員資料列表，包含 id, name, team
             
         Returns:
-            dict: 更新結果和學生列表
+            dict: 更新結果、學生列表與每一列的處理結果
         """
-        try:
-            updated_count = 0
-            created_count = 0
-            errors = []
-            
-            # 批量更新學員資料
-            for student in student_data:
-                try:
-                    result = await self.db[Collections.USERS].update_one(
-                        {"id": student["id"]},
-                        {
-                            "$set": {
-                                "name": student["name"],
-                                "team": student["team"],
-                                "updated_at": datetime.now(timezone.utc)
-                            },
-                            "$setOnInsert": {
-                                "enabled": False,  # 新學員預設未啟用
-                                "points": 100,     # 初始點數
-                                "stock_amount": 10,  # 10 股
-                                "created_at": datetime.now(timezone.utc)
-                            }
-                        },
-                        upsert=True  # 允許建立新記錄
-                    )
-                    
-                    if result.matched_count > 0:
-                        updated_count += 1
-                        logger.info(f"Updated student: {student['id']} - {student['name']} - {student['team']}")
-                    elif result.upserted_id:
-                        created_count += 1
-                        logger.info(f"Created student: {student['id']} - {student['name']} - {student['team']}")
-                        
-                        # 為新學員初始化股票持有記錄，給予5股初始股票
-                        await self.db[Collections.STOCKS].insert_one({
-                            "user_id": result.upserted_id,
-                            "stock_amount": 10, # 10 股
-                            "updated_at": datetime.now(timezone.utc)
-                        })
-                        
-                except Exception as e:
-                    error_msg = f"Error updating student {student['id']}: {e}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-            
-            # 獲取更新後的學生列表（只包含有 id 欄位的學員）
-            students_cursor = self.db[Collections.USERS].find(
-                {"id": {"$exists": True}},  # 只查詢有 id 欄位的文件
-                {
-                    "_id": 0,
-                    "id": 1,
-                    "name": 1,
-                    "team": 1,
-                    "enabled": 1
-                }
-            )
-            
-            students = []
-            async for student in students_cursor:
-                students.append({
-                    "id": student.get("id", ""),
-                    "name": student.get("name", ""),
-                    "team": student.get("team", ""),
-                    "enabled": student.get("enabled", False)
-                })
-            
-            # 準備回應訊息
-            message = f"成功更新 {updated_count} 位學員"
-            if created_count > 0:
-                message += f"，新增 {created_count} 位學員"
-            if errors:
-                message += f"，{len(errors)} 個錯誤"
-            
-            return {
-                "success": True,
-                "message": message,
-                "students": students,
-                "updated_count": updated_count,
-                "errors": errors
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in batch update students: {e}")
-            return {
-                "success": False,
-                "message": f"批量更新使用者狀態失敗: {str(e)}",
-                "students": [],
-                "updated_count": 0,
-                "errors": [str(e)]
-            }
+        # 一次比對既有學員後以 bulk_write 批次寫入
+        return await RosterImportService(self.db).update_students(student_data)
     
     async def activate_student(self, student_id: str, telegram_id: str, telegram_nickname: str) -> dict:
         """
@@ -209,6 +123,7 @@ class StudentService:
             )
             
             if result.modified_count > 0:
+                get_user_identity_resolver().invalidate_user(student["_id"])
                 logger.info(f"Student activated: {student_id} - {student.get('name', 'Unknown')}")
                 return {
                     "ok": True,
@@ -0,0 +1,196 @@
+# 各隊點數總和投影
+# 啟動時掃描一次使用者，之後依 users 的 change stream 逐筆套用點數與隊伍變動，
+# BOT /point 查詢單一隊伍只需讀取記憶體，不再每次對整個 users 集合做 $group
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+from app.core.config_refactored import config
+from app.core.database import get_database, Collections
+
+logger = logging.getLogger(__name__)
+
+# 只監看會影響隊伍總和的變動
+_WATCH_PIPELINE = [
+    {"$match": {"$or": [
+        {"operationType": {"$in": ["insert", "replace", "delete", "drop", "invalidate", "dropDatabase"]}},
+        {"updateDescription.updatedFields.points": {"$exists": True}},
+        {"updateDescription.updatedFields.team": {"$exists": True}},
+        # $unset team / points：視為離開隊伍或點數歸零
+        {"updateDescription.removedFields": {"$in": ["team", "points"]}}
+    ]}}
+]
+
+
+class TeamTotalsProjection:
+    """
+    隊伍點數總和投影
+
+    以使用者 _id 記住每位使用者目前的 (隊伍, 點數)，變動時只對新舊隊伍加減差額。
+    連線到 replica set 時以 change stream 即時更新；standalone MongoDB 不支援
+    change stream，改為查詢時距離上次載入超過 team_totals_refresh_interval 秒就重新掃描。
+    """
+
+    def __init__(self):
+        # 使用者 _id → (隊伍, 點數)
+        self._users: Dict[Any, Tuple[Optional[str], int]] = {}
+        # 隊伍 → {"member_count", "total_points"}
+        self._teams: Dict[str, Dict[str, int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._change_stream_active = False
+        self._changes_applied = 0
+
+    # ========== 載入 ==========
+
+    async def load(self, db: AsyncIOMotorDatabase = None) -> None:
+        """掃描所有使用者重建投影"""
+        if db is None:
+            db = get_database()
+        users = await db[Collections.USERS].find(
+            {"team": {"$ne": None, "$exists": True}}, {"team": 1, "points": 1}
+        ).to_list(length=None)
+
+        self._users = {}
+        self._teams = {}
+        for user in users:
+            self._set_user(user["_id"], user.get("team"), user.get("points"))
+        self._loaded_at = time.monotonic()
+        logger.info(f"Team totals loaded: {len(self._teams)} teams, {len(self._users)} users")
+
+    async def _ensure_fresh(self, db: AsyncIOMotorDatabase = None) -> None:
+        if self._loaded_at is not None and (
+            self._change_stream_active
+            or time.monotonic() - self._loaded_at < config.trading.team_totals_refresh_interval
+        ):
+            return
+        async with self._load_lock:
+            # 等待鎖期間可能已由其他請求重新載入
+            if self._loaded_at is None or (
+                not self._change_stream_active
+                and time.monotonic() - self._loaded_at >= config.trading.team_totals_refresh_interval
+            ):
+                await self.load(db)
+
+    # ========== 增量更新 ==========
+
+    def _set_user(self, user_id: Any, team: Optional[str], points: Optional[int]) -> None:
+        """以使用者目前的隊伍與點數取代舊值，對新舊隊伍加減差額"""
+        previous = self._users.pop(user_id, None)
+        if previous is not None:
+            old_team, old_points = previous
+            stats = self._teams[old_team]
+            stats["member_count"] -= 1
+            stats["total_points"] -= old_points
+            if stats["member_count"] <= 0:
+                del self._teams[old_team]
+
+        if team is None:
+            return
+        points = points or 0
+        self._users[user_id] = (team, points)
+        stats = self._teams.setdefault(team, {"member_count": 0, "total_points": 0})
+        stats["member_count"] += 1
+        stats["total_points"] += points
+
+    def _apply_change(self, change: dict) -> None:
+        operation = change.get("operationType")
+        user_id = change.get("documentKey", {}).get("_id")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                # updateLookup 時文件已被刪除
+                self._set_user(user_id, None, None)
+            else:
+                self._set_user(user_id, doc.get("team"), doc.get("points"))
+        elif operation == "delete":
+            self._set_user(user_id, None, None)
+        elif operation in ("drop", "invalidate", "dropDatabase"):
+            # 下次查詢時重新載入
+            self._loaded_at = None
+        self._changes_applied += 1
+
+    # ========== 查詢 ==========
+
+    async def get_team(self, name: str, db: AsyncIOMotorDatabase = None) -> Optional[Dict[str, Any]]:
+        """取得單一隊伍的成員數量與點數總和，隊伍不存在時回傳 None"""
+        await self._ensure_fresh(db)
+        stats = self._teams.get(name)
+        if stats is None:
+            return None
+        return {"name": name, **stats}
+
+    async def list_teams(self, db: AsyncIOMotorDatabase = None) -> List[Dict[str, Any]]:
+        """取得所有隊伍，依成員數量降序排列（與 AdminService.list_all_teams 相同格式）"""
+        await self._ensure_fresh(db)
+        return sorted(
+            ({"name": name, **stats} for name, stats in self._teams.items()),
+            key=lambda team: team["member_count"],
+            reverse=True
+        )
+
+    def get_status(self) -> dict:
+        """取得投影狀態"""
+        return {
+            "loaded": self._loaded_at is not None,
+            "teams": len(self._teams),
+            "users": len(self._users),
+            "change_stream": self._change_stream_active,
+            "changes_applied": self._changes_applied
+        }
+
+    # ========== Change Stream ==========
+
+    async def start_watching(self, db: AsyncIOMotorDatabase = None) -> None:
+        """啟動 change stream 監看（standalone MongoDB 不支援時自動停止）"""
+        if self._watch_task and not self._watch_task.done():
+            return
+        self._watch_task = asyncio.create_task(self._watch_loop(db or get_database()))
+
+    async def stop_watching(self) -> None:
+        """停止 change stream 監看"""
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        self._change_stream_active = False
+
+    async def _watch_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            try:
+                async with db[Collections.USERS].watch(_WATCH_PIPELINE, full_document="updateLookup") as stream:
+                    # 監看開始前的變動可能已錯過，重新載入一次
+                    await self.load(db)
+                    self._change_stream_active = True
+                    logger.info("Team totals change stream started")
+                    async for change in stream:
+                        self._apply_change(change)
+            except asyncio.CancelledError:
+                break
+            except OperationFailure as e:
+                # standalone MongoDB 不支援 change stream，改為定期重新掃描
+                self._change_stream_active = False
+                logger.info(f"Team totals change stream unavailable, reloading every "
+                            f"{config.trading.team_totals_refresh_interval}s on demand: {e}")
+                break
+            except Exception as e:
+                self._change_stream_active = False
+                logger.error(f"Team totals change stream error: {e}")
+                await asyncio.sleep(5)
+
+
+# 全域投影實例
+_team_totals = TeamTotalsProjection()
+
+
+def get_team_totals() -> TeamTotalsProjection:
+    """獲取隊伍點數總和投影實例"""
+    return _team_totals
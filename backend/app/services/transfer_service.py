@@ -2,6 +2,8 @@ from __future__ import annotations
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.database import get_database, Collections
 from app.schemas.user import TransferRequest, TransferResponse
+from app.services.points_ledger import PointsLedger
+from app.services.market_config_snapshot import get_market_config_snapshot
 from datetime import datetime, timezone
 from bson import ObjectId
 import logging
@@ -21,6 +23,7 @@ class TransferService:
             self.db = get_database()
         else:
             self.db = db
+        self.ledger = PointsLedger(self.db)
     
     async def transfer_points(self, from_user_id: str, request: TransferRequest) -> TransferResponse:
         """轉帳點數，帶增強重試機制"""
@@ -77,9 +80,7 @@ class TransferService:
     async def _get_transfer_fee_config(self):
         """獲取轉點數手續費設定"""
         try:
-            fee_config = await self.db[Collections.MARKET_CONFIG].find_one({
-                "type": "transfer_fee"
-            })
+            fee_config = await get_market_config_snapshot().get("transfer_fee", self.db)
             
             if fee_config:
                 return {
@@ -146,11 +147,14 @@ class TransferService:
         # 執行轉帳
         transaction_id = str(uuid.uuid4())
         
-        # 安全扣除傳送方點數
+        # 安全扣除傳送方點數（日誌稍後與接收方一起批次寫入）
         deduction_result = await self._safe_deduct_points(
             user_id=from_user_oid,
             amount=total_deduct,
-            operation_note=f"轉帳給 {request.to_username}：{request.amount} 點 (含手續費 {fee} 點)",
+            operation_note=f"轉帳給 {to_user.get('name', to_user.get('id', request.to_username))} (含手續費 {fee})",
+            change_type="transfer_out",
+            transaction_id=transaction_id,
+            log=False,
             session=session
         )
         
@@ -172,6 +176,8 @@ class TransferService:
             user_id=to_user["_id"],
             amount=request.amount,
             operation_note=f"收到來自 {from_user.get('name', from_user.get('id', 'unknown'))} 的轉帳",
+            transaction_id=transaction_id,
+            log=False,
             session=session
         )
         
@@ -181,28 +187,12 @@ class TransferService:
                 message=f"轉帳處理失敗：{repay_result['message']}"
             )
         
-        # 記錄轉帳發送方日誌
-        await self._log_point_change(
-            from_user_oid,
-            "transfer_out",
-            -total_deduct,
-            f"轉帳給 {to_user.get('name', to_user.get('id', request.to_username))} (含手續費 {fee})",
-            transaction_id,
+        # 一次寫入發送方與接收方（含債務償還）的點數日誌
+        await self.ledger.write_logs(
+            deduction_result['logs'] + repay_result['logs'],
             session=session
         )
         
-        # 接收方的記錄已在 _add_points_with_debt_repay 中處理
-        # 如果沒有債務，需要補充記錄
-        if repay_result.get('debt_repaid', 0) == 0:
-            await self._log_point_change(
-                to_user["_id"],
-                "transfer_in", 
-                request.amount,
-                f"收到來自 {from_user.get('name', from_user.get('id', 'unknown'))} 的轉帳",
-                transaction_id,
-                session=session
-            )
-        
         # 如果有事務則提交
         if session:
             await session.commit_transaction()
@@ -231,7 +221,9 @@ class TransferService:
         )
     
     async def _safe_deduct_points(self, user_id: ObjectId, amount: int, 
-                                operation_note: str, session=None) -> dict:
+                                operation_note: str, change_type: str = "transfer_out",
+                                transaction_id: str = None, log: bool = True,
+                                session=None) -> dict:
         """
         安全地扣除使用者點數，防止產生負數餘額（含欠款檢查）
         
@@ -239,108 +231,24 @@ class TransferService:
             user_id: 使用者ID
             amount: 要扣除的點數
             operation_note: 操作說明
+            log: False 時只建立日誌（result['logs']），由呼叫者批次寫入
             session: 資料庫session（用於交易）
             
         Returns:
             dict: {'success': bool, 'message': str, 'balance_before': int, 'balance_after': int}
         """
         try:
-            # 首先檢查用戶狀態和欠款情況
-            user = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            if not user:
-                return {
-                    'success': False,
-                    'message': '使用者不存在',
-                    'balance_before': 0,
-                    'balance_after': 0
-                }
-            
-            # 檢查帳戶狀態
-            if not user.get("enabled", True):
-                return {
-                    'success': False,
-                    'message': '帳戶未啟用',
-                    'balance_before': user.get("points", 0),
-                    'balance_after': user.get("points", 0)
-                }
-            
-            if user.get("frozen", False):
-                return {
-                    'success': False,
-                    'message': '帳戶已凍結，無法進行轉帳',
-                    'balance_before': user.get("points", 0),
-                    'balance_after': user.get("points", 0)
-                }
-            
-            # 檢查欠款情況
-            points = user.get("points", 0)
-            owed_points = user.get("owed_points", 0)
-            
-            if owed_points > 0:
-                return {
-                    'success': False,
-                    'message': f'帳戶有欠款 {owed_points} 點，請先償還後才能進行轉帳',
-                    'balance_before': points,
-                    'balance_after': points,
-                    'owed_points': owed_points
-                }
-            
-            # 計算實際可用餘額
-            available_balance = points - owed_points
-            
-            if available_balance < amount:
-                return {
-                    'success': False,
-                    'message': f'餘額不足（含欠款檢查）。需要: {amount} 點，可用: {available_balance} 點',
-                    'balance_before': points,
-                    'balance_after': points,
-                    'available_balance': available_balance
-                }
-            
-            # 使用 MongoDB 的條件更新確保原子性（包含凍結和欠款檢查）
-            update_result = await self.db[Collections.USERS].update_one(
-                {
-                    "_id": user_id,
-                    "points": {"$gte": amount},  # 確保扣除後不會變負數
-                    "frozen": {"$ne": True},     # 確保不是凍結狀態
-                    "$or": [
-                        {"owed_points": {"$exists": False}},  # 沒有欠款字段
-                        {"owed_points": {"$lte": 0}}          # 或者欠款為0
-                    ]
-                },
-                {"$inc": {"points": -amount}},
+            return await self.ledger.debit(
+                user_id=user_id,
+                amount=amount,
+                change_type=change_type,
+                note=operation_note,
+                transaction_id=transaction_id,
+                action="轉帳",
+                log=log,
                 session=session
             )
             
-            if update_result.modified_count == 0:
-                # 扣除失敗，重新檢查原因
-                user_recheck = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-                current_balance = user_recheck.get("points", 0) if user_recheck else 0
-                current_owed = user_recheck.get("owed_points", 0) if user_recheck else 0
-                
-                return {
-                    'success': False,
-                    'message': f'轉帳失敗。可能原因：餘額不足、帳戶凍結或有欠款。目前餘額: {current_balance} 點，欠款: {current_owed} 點',
-                    'balance_before': current_balance,
-                    'balance_after': current_balance
-                }
-            
-            # 扣除成功，取得更新後的餘額
-            user_after = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            balance_after = user_after.get("points", 0) if user_after else 0
-            balance_before = balance_after + amount
-            
-            # 點數扣除記錄由外部調用者處理，避免重複記錄
-            
-            logger.info(f"Safe point deduction successful: user {user_id}, amount {amount}, balance: {balance_before} -> {balance_after}")
-            
-            return {
-                'success': True,
-                'message': f'成功扣除 {amount} 點',
-                'balance_before': balance_before,
-                'balance_after': balance_after
-            }
-            
         except Exception as e:
             logger.error(f"Failed to safely deduct points: user {user_id}, amount {amount}, error: {e}")
             return {
@@ -402,7 +310,8 @@ class TransferService:
             logger.error(f"Failed to validate transaction integrity: {e}")
     
     async def _add_points_with_debt_repay(self, user_id: ObjectId, amount: int, 
-                                         operation_note: str, session=None) -> dict:
+                                         operation_note: str, transaction_id: str = None,
+                                         log: bool = True, session=None) -> dict:
         """
         增加用戶點數，如果有欠款則優先償還
         
@@ -410,99 +319,31 @@ class TransferService:
             user_id: 用戶ID
             amount: 要增加的點數
             operation_note: 操作說明
+            log: False 時只建立日誌（result['logs']），由呼叫者批次寫入
             session: 資料庫session（用於交易）
             
         Returns:
             dict: 操作結果
         """
         try:
-            # 獲取用戶目前狀態
-            user = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            if not user:
-                return {
-                    'success': False,
-                    'message': '用戶不存在'
-                }
-            
-            current_points = user.get("points", 0)
-            current_owed = user.get("owed_points", 0)
-            
-            if current_owed > 0:
-                # 有欠款，優先償還
-                # 總可用於償還的金額 = 現有點數 + 新轉入的點數
-                total_available = current_points + amount
-                
-                # 計算實際償還金額（不能超過欠款總額）
-                actual_repay = min(total_available, current_owed)
-                
-                # 計算償還後剩餘的點數
-                remaining_points = total_available - actual_repay
-                
-                # 更新用戶資料：設定新的點數，減少欠款
-                update_doc = {
-                    "$set": {"points": remaining_points},
-                    "$inc": {"owed_points": -actual_repay}
-                }
-                
-                # 如果完全償還，解除凍結
-                if actual_repay == current_owed:
-                    update_doc["$set"]["frozen"] = False
-                
-                await self.db[Collections.USERS].update_one(
-                    {"_id": user_id},
-                    update_doc,
-                    session=session
-                )
-                
-                # 記錄債務償還日誌（使用標準格式）
-                if actual_repay > 0:
-                    await self._log_point_change(
-                        user_id=user_id,
-                        change_type="debt_repayment",
-                        amount=actual_repay,
-                        note=f"債務償還 {actual_repay} 點（轉帳自動償還）",
-                        transaction_id=None,
-                        session=session
-                    )
-                
-                # 如果有剩餘點數，記錄為轉帳收入
-                if remaining_points > current_points:
-                    net_increase = remaining_points - current_points
-                    await self._log_point_change(
-                        user_id=user_id,
-                        change_type="transfer_in",
-                        amount=net_increase,
-                        note=f"轉帳收入 {net_increase} 點（償還債務後剩餘）",
-                        transaction_id=None,
-                        session=session
-                    )
-                
-                logger.info(f"Transfer with debt repay: user {user_id}, transfer {amount}, repaid {actual_repay}, remaining debt {current_owed - actual_repay}")
-                
-                return {
-                    'success': True,
-                    'message': f'轉帳成功，自動償還欠款 {actual_repay} 點',
-                    'debt_repaid': actual_repay,
-                    'remaining_debt': current_owed - actual_repay,
-                    'final_points': remaining_points
-                }
+            result = await self.ledger.credit(
+                user_id=user_id,
+                amount=amount,
+                change_type="transfer_in",
+                note=operation_note,
+                transaction_id=transaction_id,
+                repay_note="債務償還 {repaid} 點（轉帳自動償還）",
+                remainder_note="轉帳收入 {net} 點（償還債務後剩餘）",
+                log=log,
+                session=session
+            )
+            if not result['success']:
+                result['message'] = '用戶不存在'
+            elif result['debt_repaid'] > 0:
+                result['message'] = f"轉帳成功，自動償還欠款 {result['debt_repaid']} 點"
             else:
-                # 沒有欠款，直接增加點數
-                await self.db[Collections.USERS].update_one(
-                    {"_id": user_id},
-                    {"$inc": {"points": amount}},
-                    session=session
-                )
-                
-                # 點數增加記錄由外部調用者處理，避免重複記錄
-                
-                return {
-                    'success': True,
-                    'message': '轉帳成功',
-                    'debt_repaid': 0,
-                    'remaining_debt': 0,
-                    'final_points': current_points + amount
-                }
+                result['message'] = '轉帳成功'
+            return result
                 
         except Exception as e:
             logger.error(f"Error adding points with debt repay for user {user_id}: {e}")
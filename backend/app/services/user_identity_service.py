@@ -0,0 +1,312 @@
+"""
+使用者身分解析服務 - 減少 BOT 與權限檢查時的使用者查詢次數
+
+維護「查詢識別字（id / telegram_id / 姓名）→ 使用者 _id」與「使用者 → 角色」
+的記憶體索引（帶 TTL）。命中時只需以 _id 取回文件（或完全不查詢），
+使用者資料、啟用狀態或角色變更時必須呼叫 invalidate_* 清除。
+"""
+from __future__ import annotations
+from app.core.database import Collections
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 預設索引存活時間（秒）；識別字對應關係很少變動，變動時會主動失效
+DEFAULT_IDENTITY_TTL = 300
+# 角色快取較短，避免其他行程修改角色後長時間不一致
+DEFAULT_ROLE_TTL = 60
+# 索引條目上限，超過時清除最舊的一半
+DEFAULT_MAX_ENTRIES = 20000
+
+# 新學員的預設點數，用於重複使用者時的挑選規則
+DEFAULT_STUDENT_POINTS = 100
+
+
+class UserIdentityResolver:
+    """使用者身分解析器（行程內記憶體索引）"""
+
+    def __init__(self, ttl: int = DEFAULT_IDENTITY_TTL, role_ttl: int = DEFAULT_ROLE_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._ttl = ttl
+        self._role_ttl = role_ttl
+        self._max_entries = max_entries
+        # 識別字 → (_id, 過期時間)
+        self._index: Dict[str, Tuple[ObjectId, float]] = {}
+        # 識別字 → (角色值, 使用者 _id, 過期時間)
+        self._roles: Dict[str, Tuple[str, Optional[ObjectId], float]] = {}
+        # 使用者 _id → 指向它的識別字（用於失效）
+        self._reverse: Dict[ObjectId, Set[str]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    # ========== 索引操作 ==========
+
+    def lookup(self, identifier: str) -> Optional[ObjectId]:
+        """查詢識別字對應的使用者 _id（未命中或過期回傳 None）"""
+        entry = self._index.get(identifier)
+        if entry is None:
+            self._misses += 1
+            return None
+        user_oid, expires_at = entry
+        if expires_at < time.monotonic():
+            self._index.pop(identifier, None)
+            self._unlink(identifier, user_oid)
+            self._misses += 1
+            return None
+        self._hits += 1
+        return user_oid
+
+    def remember(self, identifier: str, user: dict) -> None:
+        """記錄識別字與使用者的對應"""
+        user_oid = user.get("_id")
+        if user_oid is None:
+            return
+        if len(self._index) >= self._max_entries:
+            self._evict()
+        previous = self._index.get(identifier)
+        self._index[identifier] = (user_oid, time.monotonic() + self._ttl)
+        if previous is not None and previous[0] != user_oid:
+            self._unlink(identifier, previous[0])
+        self._reverse.setdefault(user_oid, set()).add(identifier)
+
+    def get_role(self, identifier: str) -> Optional[str]:
+        """查詢快取的角色值"""
+        entry = self._roles.get(identifier)
+        if entry is None:
+            return None
+        role, user_oid, expires_at = entry
+        if expires_at < time.monotonic():
+            self._roles.pop(identifier, None)
+            self._unlink(identifier, user_oid)
+            return None
+        return role
+
+    def remember_role(self, identifier: str, role: str, user_oid: Optional[ObjectId] = None) -> None:
+        """記錄識別字對應的角色值"""
+        if len(self._roles) >= self._max_entries:
+            roles = self._roles
+            self._roles = {}
+            for cached_identifier, (_, cached_oid, _) in roles.items():
+                self._unlink(cached_identifier, cached_oid)
+        previous = self._roles.get(identifier)
+        self._roles[identifier] = (role, user_oid, time.monotonic() + self._role_ttl)
+        if previous is not None and previous[1] != user_oid:
+            self._unlink(identifier, previous[1])
+        if user_oid is not None:
+            self._reverse.setdefault(user_oid, set()).add(identifier)
+
+    def invalidate_user(self, user_oid: Any) -> None:
+        """清除指向某位使用者的所有索引與角色快取"""
+        if isinstance(user_oid, str):
+            try:
+                user_oid = ObjectId(user_oid)
+            except Exception:
+                self.invalidate_identifier(user_oid)
+                return
+        for identifier in self._reverse.pop(user_oid, set()):
+            self._index.pop(identifier, None)
+            self._roles.pop(identifier, None)
+        logger.debug(f"Identity cache invalidated for user {user_oid}")
+
+    def invalidate_identifier(self, identifier: str) -> None:
+        """清除單一識別字的索引與角色快取"""
+        entry = self._index.pop(identifier, None)
+        if entry is not None:
+            self._unlink(identifier, entry[0])
+        role_entry = self._roles.pop(identifier, None)
+        if role_entry is not None:
+            self._unlink(identifier, role_entry[1])
+
+    def clear(self) -> None:
+        """清空所有索引（批次匯入、重置等大量異動後使用）"""
+        self._index.clear()
+        self._roles.clear()
+        self._reverse.clear()
+        logger.info("Identity cache cleared")
+
+    def _evict(self) -> None:
+        """清除最舊的一半索引條目"""
+        ordered = sorted(self._index.items(), key=lambda item: item[1][1])
+        for identifier, (user_oid, _) in ordered[: len(ordered) // 2]:
+            self._index.pop(identifier, None)
+            self._unlink(identifier, user_oid)
+
+    def _unlink(self, identifier: str, user_oid: Optional[ObjectId]) -> None:
+        """識別字不再有索引或角色指向該使用者時，從反向索引移除（集合空了就刪除整個鍵）"""
+        if user_oid is None:
+            return
+        entry = self._index.get(identifier)
+        if entry is not None and entry[0] == user_oid:
+            return
+        role_entry = self._roles.get(identifier)
+        if role_entry is not None and role_entry[1] == user_oid:
+            return
+        keys = self._reverse.get(user_oid)
+        if keys is None:
+            return
+        keys.discard(identifier)
+        if not keys:
+            del self._reverse[user_oid]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得索引統計"""
+        total = self._hits + self._misses
+        return {
+            "index_entries": len(self._index),
+            "role_entries": len(self._roles),
+            "reverse_entries": len(self._reverse),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / total, 4) if total else 0.0
+        }
+
+    # ========== 解析 ==========
+
+    async def resolve(self, db: AsyncIOMotorDatabase, identifier: str, session=None) -> Optional[dict]:
+        """解析單一識別字，回傳使用者文件（最多一次查詢，重複使用者時額外一次）"""
+        result = await self.resolve_many(db, [identifier], session=session)
+        return result.get(identifier)
+
+    async def resolve_many(self, db: AsyncIOMotorDatabase, identifiers: Iterable[str],
+                           session=None) -> Dict[str, dict]:
+        """
+        批次解析識別字
+
+        已索引的識別字以 _id 取回，未索引的識別字以 id / telegram_id /
+        姓名 / 暱稱比對；兩者合併成同一個 $or 查詢。
+
+        Returns:
+            dict: 識別字 → 使用者文件（找不到的識別字不會出現在結果中）
+        """
+        identifiers = [str(i) for i in dict.fromkeys(identifiers) if i is not None and str(i) != ""]
+        if not identifiers:
+            return {}
+
+        cached: Dict[str, ObjectId] = {}
+        misses: List[str] = []
+        for identifier in identifiers:
+            user_oid = self.lookup(identifier)
+            if user_oid is not None:
+                cached[identifier] = user_oid
+            else:
+                misses.append(identifier)
+
+        conditions: List[dict] = []
+        if cached:
+            conditions.append({"_id": {"$in": list(set(cached.values()))}})
+        if misses:
+            numeric = [int(i) for i in misses if i.isdigit()]
+            conditions.extend([
+                {"id": {"$in": misses}},
+                {"name": {"$in": misses}},
+                {"telegram_id": {"$in": misses + numeric}},
+                {"telegram_nickname": {"$in": misses}},
+            ])
+
+        users = await db[Collections.USERS].find({"$or": conditions}, session=session).to_list(length=None)
+        by_oid = {user["_id"]: user for user in users}
+
+        resolved: Dict[str, dict] = {}
+        stale: List[str] = []
+        for identifier, user_oid in cached.items():
+            user = by_oid.get(user_oid)
+            if user is not None:
+                resolved[identifier] = user
+            else:
+                # 使用者已被刪除，索引過期
+                self.invalidate_identifier(identifier)
+                stale.append(identifier)
+
+        if stale:
+            # 極少見：以完整比對重新解析
+            resolved.update(await self.resolve_many(db, stale, session=session))
+
+        pending = [i for i in misses if i not in resolved]
+        if pending:
+            holdings = await self._load_duplicate_holdings(db, users, pending, session)
+            for identifier in pending:
+                user = self._pick_user(identifier, users, holdings)
+                if user is not None:
+                    resolved[identifier] = user
+                    self.remember(identifier, user)
+
+        return resolved
+
+    async def _load_duplicate_holdings(self, db: AsyncIOMotorDatabase, users: List[dict],
+                                       identifiers: List[str], session=None) -> Dict[ObjectId, int]:
+        """僅在有重複候選人時，一次查詢所有候選人的持股"""
+        duplicate_oids: Set[ObjectId] = set()
+        for identifier in identifiers:
+            candidates = self._name_candidates(identifier, users)
+            if len(candidates) > 1:
+                duplicate_oids.update(u["_id"] for u in candidates if u.get("enabled", False))
+
+        if not duplicate_oids:
+            return {}
+
+        holdings = await db[Collections.STOCKS].find(
+            {"user_id": {"$in": list(duplicate_oids)}},
+            {"user_id": 1, "stock_amount": 1},
+            session=session
+        ).to_list(length=None)
+        return {h["user_id"]: h.get("stock_amount", 0) for h in holdings}
+
+    @staticmethod
+    def _name_candidates(identifier: str, users: List[dict]) -> List[dict]:
+        """以 $or 條件比對的候選人（保留查詢回傳順序）"""
+        return [
+            u for u in users
+            if u.get("name") == identifier
+            or u.get("id") == identifier
+            or u.get("telegram_id") == identifier
+            or u.get("telegram_nickname") == identifier
+        ]
+
+    def _pick_user(self, identifier: str, users: List[dict],
+                   holdings: Dict[ObjectId, int]) -> Optional[dict]:
+        """
+        依原本 _get_user_ 的優先順序挑選使用者：
+        數字識別字先比對 id、再比對 telegram_id；其餘比對多個欄位，
+        重複時優先選擇已啟用且有持股、其次點數非預設值的使用者。
+        """
+        if identifier.isdigit():
+            for user in users:
+                if user.get("id") == identifier:
+                    return user
+            telegram_id = int(identifier)
+            for user in users:
+                if user.get("telegram_id") == telegram_id:
+                    return user
+
+        candidates = self._name_candidates(identifier, users)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+
+        logger.warning(f"Multiple users found for lookup '{identifier}': {[u.get('id') for u in candidates]}")
+        enabled_users = [u for u in candidates if u.get("enabled", False)]
+        if not enabled_users:
+            return candidates[0]
+
+        for user in enabled_users:
+            if holdings.get(user["_id"], 0) > 0:
+                return user
+
+        non_default_users = [u for u in enabled_users if u.get("points", 0) != DEFAULT_STUDENT_POINTS]
+        if non_default_users:
+            return non_default_users[0]
+        return enabled_users[0]
+
+
+# 全域解析器實例
+_user_identity_resolver = UserIdentityResolver()
+
+
+def get_user_identity_resolver() -> UserIdentityResolver:
+    """獲取使用者身分解析器實例"""
+    return _user_identity_resolver
@@ -8,16 +8,26 @@ from app.schemas.user import (
     TransferRequest, TransferResponse,
     PVPChallengeRequest, PVPChallengeResponse,
     PVPAcceptRequest, PVPResult,
-    UserPointLog, UserStockOrder
+    UserPointLog, UserStockOrder, UserStockOrderSummary, UserStockOrdersPage
 )
 from app.services.cache_service import cached, get_cache_service, CacheKeys
 from app.services.cache_invalidation import get_cache_invalidator
+from app.services.user_identity_service import get_user_identity_resolver
+from app.services.roster_import import RosterImportService
+from app.services.market_calendar import get_market_calendar
+from app.services.market_config_snapshot import get_market_config_snapshot
+from app.services.price_band import get_price_band
+from app.services.notification_dispatcher import get_notification_dispatcher
+from app.services.points_ledger import PointsLedger
+from app.services.integrity_audit import IntegrityAuditService, OPEN_ORDER_STATUSES
 from app.core.security import create_access_token
 from app.core.config_refactored import config
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 from bson import ObjectId
+import base64
+import json
 import logging
 import random
 import uuid
@@ -43,6 +53,8 @@ class UserService:
             self.db = db
         self.cache_service = get_cache_service()
         self.cache_invalidator = get_cache_invalidator()
+        self.identity_resolver = get_user_identity_resolver()
+        self.ledger = PointsLedger(self.db)
         
         # 寫入衝突統計
         self.write_conflict_stats = defaultdict(int)
@@ -67,12 +79,18 @@ class UserService:
         """
         從資料庫獲取 IPO 設定，如果不存在則從環境變數初始化。
         環境變數: CAMP_IPO_INITIAL_SHARES, CAMP_IPO_INITIAL_PRICE
+
+        傳入 session 時讀寫都在該交易內，呼叫者需在交易提交後呼叫
+        get_market_config_snapshot().invalidate("ipo_status")
         """
-        # 首先嘗試直接獲取
-        ipo_config = await self.db[Collections.MARKET_CONFIG].find_one(
-            {"type": "ipo_status"}, 
-            session=session
-        )
+        # 交易內直接以 session 讀取；其他情況從市場設定快照取得
+        # （剩餘股數由條件式更新把關，快照略舊不影響正確性）
+        if session is not None:
+            ipo_config = await self.db[Collections.MARKET_CONFIG].find_one(
+                {"type": "ipo_status"}, session=session
+            )
+        else:
+            ipo_config = await get_market_config_snapshot().get("ipo_status", self.db)
         if ipo_config:
             return ipo_config
             
@@ -106,6 +124,9 @@ class UserService:
             {"type": "ipo_status"}, 
             session=session
         )
+        if session is None:
+            # 交易內的寫入在提交前對快照不可見，由呼叫者提交後再標記
+            get_market_config_snapshot().invalidate("ipo_status")
         
         logger.info(f"從環境變數初始化 IPO 狀態: {initial_shares} 股，每股 {initial_price} 點。")
         return ipo_config
@@ -211,32 +232,9 @@ class UserService:
     
     # 檢查價格是否在漲跌限制內
     async def _check_price_limit(self, order_price: float) -> bool:
-        """檢查訂單價格是否在漲跌限制內（基於前日收盤價）"""
+        """檢查訂單價格是否在漲跌限制內（基於前日收盤價，由價格帶在記憶體中判斷）"""
         try:
-            # 🚨 砸盤測試模式：暫時允許所有價格
-            logger.info(f"🧪 TESTING MODE: Price limit check bypassed for price {order_price}")
-            return True
-            
-            # === 原始限制邏輯（已註解） ===
-            # # 取得前日收盤價作為基準價格（更符合現實股市）
-            # reference_price = await self._get_reference_price_for_limit()
-            # 
-            # if reference_price is None:
-            #     logger.warning("Unable to determine reference price for price limit check")
-            #     return True  # 無法確定基準價格時允許交易
-            # 
-            # # 取得固定漲跌限制
-            # limit_percent = await self._get_fixed_price_limit()
-            # 
-            # # 計算漲跌停價格
-            # max_price = reference_price * (1 + limit_percent / 100.0)
-            # min_price = reference_price * (1 - limit_percent / 100.0)
-            # 
-            # logger.info(f"Price limit check: order_price={order_price}, reference_price={reference_price}, limit={limit_percent}%, range=[{min_price:.2f}, {max_price:.2f}]")
-            # 
-            # # 檢查訂單價格是否在限制範圍內
-            # return min_price <= order_price <= max_price
-            
+            return await get_price_band().check(order_price, self.db)
         except Exception as e:
             logger.error(f"Failed to check price limit: {e}")
             # 發生錯誤時，預設允許交易
@@ -245,49 +243,8 @@ class UserService:
     async def _get_price_limit_info(self, order_price: float) -> dict:
         """取得價格限制的詳細資訊"""
         try:
-            # 🚨 砸盤測試模式：所有價格都在限制範圍內
-            logger.info(f"🧪 TESTING MODE: Price limit info bypassed for price {order_price}")
-            return {
-                "within_limit": True,  # 強制返回 True
-                "reference_price": 20.0,
-                "limit_percent": 0.0,
-                "min_price": 0.0,
-                "max_price": 999999.0,  # 使用大數值代替 infinity
-                "order_price": order_price,
-                "note": "Testing mode: all prices allowed"
-            }
-            
-            # === 原始限制邏輯（已註解） ===
-            # # 取得前一日收盤價作為基準價格
-            # reference_price = await self._get_reference_price_for_limit()
-            # 
-            # # 如果無法取得前一日收盤價，使用預設值
-            # if reference_price is None or reference_price <= 0:
-            #     logger.warning("Cannot determine reference price, using default price 20.0")
-            #     reference_price = 20.0
-            # 
-            # # 取得固定漲跌限制
-            # limit_percent = await self._get_fixed_price_limit()
-            # 
-            # # 計算漲跌停價格
-            # max_price = reference_price * (1 + limit_percent / 100.0)
-            # min_price = reference_price * (1 - limit_percent / 100.0)
-            # 
-            # # 檢查是否在限制範圍內
-            # within_limit = min_price <= order_price <= max_price
-            # 
-            # logger.info(f"Price limit check: reference={reference_price}, limit={limit_percent}%, " +
-            #            f"range={min_price:.2f}~{max_price:.2f}, order={order_price}, within={within_limit}")
-            # 
-            # return {
-            #     "within_limit": within_limit,
-            #     "reference_price": reference_price,
-            #     "limit_percent": limit_percent,
-            #     "min_price": min_price,
-            #     "max_price": max_price,
-            #     "order_price": order_price
-            # }
-            
+            band = await get_price_band().ensure_current(self.db)
+            return band.get_info(order_price)
         except Exception as e:
             logger.error(f"Failed to get price limit info: {e}")
             return {
@@ -303,47 +260,8 @@ class UserService:
     async def _get_reference_price_for_limit(self) -> float:
         """取得漲跌限制的基準價格（前日收盤價）"""
         try:
-            # 取得今日開始時間 (使用 Asia/Taipei 時區)
-            from app.config import settings
-            today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-            yesterday_end = today_start - timedelta(seconds=1)
-            
-            # 查找昨日最後一筆成交記錄作為前日收盤價
-            yesterday_last_trade = await self.db[Collections.STOCK_ORDERS].find_one({
-                "status": "filled",
-                "created_at": {"$lt": today_start}
-            }, sort=[("created_at", -1)])
-            
-            if yesterday_last_trade:
-                price = yesterday_last_trade.get("price") or yesterday_last_trade.get("filled_price")
-                if price and price > 0:
-                    logger.info(f"Using yesterday's closing price as reference: {price}")
-                    return float(price)
-            
-            # 如果沒有昨日交易記錄，查找今日第一筆交易作為開盤價
-            today_first_trade = await self.db[Collections.STOCK_ORDERS].find_one({
-                "status": "filled",
-                "created_at": {"$gte": today_start}
-            }, sort=[("created_at", 1)])
-            
-            if today_first_trade:
-                price = today_first_trade.get("price") or today_first_trade.get("filled_price")
-                if price and price > 0:
-                    logger.info(f"Using today's opening price as reference: {price}")
-                    return float(price)
-            
-            # 最後回到市場設定或預設價格
-            price_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "current_price"}
-            )
-            
-            if price_config and price_config.get("price", 0) > 0:
-                logger.info(f"Using market config price as reference: {price_config['price']}")
-                return float(price_config["price"])
-            
-            logger.info("Using default reference price: 20")
-            return 20.0
-            
+            band = await get_price_band().ensure_current(self.db)
+            return band.reference_price
         except Exception as e:
             logger.error(f"Failed to get reference price: {e}")
             return 20.0
@@ -351,21 +269,8 @@ class UserService:
     async def _get_fixed_price_limit(self) -> float:
         """取得固定漲跌限制百分比"""
         try:
-            # 檢查是否有管理員設定的固定限制
-            limit_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "trading_limit"}
-            )
-            
-            if limit_config and limit_config.get("limitPercent"):
-                # 如果管理員有設定固定限制，使用該設定
-                fixed_limit = float(limit_config.get("limitPercent", 2000)) / 100.0
-                logger.debug(f"Using admin configured limit: {fixed_limit}%")
-                return fixed_limit
-            
-            # 預設固定限制 20%
-            logger.debug("Using default fixed limit: 20.0%")
-            return 20.0
-            
+            band = await get_price_band().ensure_current(self.db)
+            return band.limit_percent
         except Exception as e:
             logger.error(f"Failed to get fixed price limit: {e}")
             return 20.0  # 預設 20%
@@ -600,9 +505,7 @@ class UserService:
     async def _get_transfer_fee_config(self):
         """獲取轉點數手續費設定"""
         try:
-            fee_config = await self.db[Collections.MARKET_CONFIG].find_one({
-                "type": "transfer_fee"
-            })
+            fee_config = await get_market_config_snapshot().get("transfer_fee", self.db)
             
             if fee_config:
                 return {
@@ -685,20 +588,15 @@ class UserService:
                 message=deduction_result['message']
             )
         
-        # 增加接收方點數
-        await self.db[Collections.USERS].update_one(
-            {"_id": to_user["_id"]},
-            {"$inc": {"points": request.amount}},
-            session=session
-        )
-        
-        # 只記錄接收方的點數變化日誌（發送方的記錄已經在 _safe_deduct_points 中處理）
-        await self._log_point_change(
-            to_user["_id"],
-            "transfer_in",
-            request.amount,
-            f"收到來自 {from_user.get('name', from_user.get('id', 'unknown'))} 的轉帳",
-            transaction_id,
+        # 增加接收方點數並記錄點數變化日誌；轉帳全額入帳，不自動償還接收方欠款
+        # 發送方的記錄已經在 _safe_deduct_points 中處理
+        await self.ledger.credit(
+            user_id=to_user["_id"],
+            amount=request.amount,
+            change_type="transfer_in",
+            note=f"收到來自 {from_user.get('name', from_user.get('id', 'unknown'))} 的轉帳",
+            transaction_id=transaction_id,
+            repay_debt=False,
             session=session
         )
         
@@ -998,72 +896,20 @@ class UserService:
     # ========== BOT 專用方法 - 基於使用者名查詢 ==========
     
     async def _get_user_(self, username: str):
-        """根據使用者名或ID查詢使用者"""
-        # Special handling for numeric lookups
-        if username.isdigit():
-            # For numeric values, try both id field and telegram_id field
-            # First try id field (internal user ID)
-            user_by_id = await self.db[Collections.USERS].find_one({"id": username})
-            if user_by_id:
-                logger.info(f"Found user by id '{username}': id={user_by_id.get('id')}, name={user_by_id.get('name')}, points={user_by_id.get('points')}, enabled={user_by_id.get('enabled')}")
-                return user_by_id
-                
-            # Then try telegram_id field
-            user_by_telegram = await self.db[Collections.USERS].find_one({"telegram_id": int(username)})
-            if user_by_telegram:
-                logger.info(f"Found user by telegram_id '{username}': id={user_by_telegram.get('id')}, name={user_by_telegram.get('name')}, points={user_by_telegram.get('points')}, enabled={user_by_telegram.get('enabled')}")
-                return user_by_telegram
-        
-        # Check for multiple potential matches to debug duplicates
-        all_matches_cursor = self.db[Collections.USERS].find({
-            "$or": [
-                {"name": username},
-                {"id": username},
-                {"telegram_id": username},
-                {"telegram_nickname": username}
-            ]
-        })
-        all_matches = await all_matches_cursor.to_list(length=None)
-        
-        if not all_matches:
+        """根據使用者名或ID查詢使用者（透過身分解析器，命中時只需一次 _id 查詢）"""
+        user = await self.identity_resolver.resolve(self.db, username)
+        if not user:
             logger.error(f"User lookup failed: no matches found for username '{username}'")
             raise HTTPException(status_code=404, detail=f"使用者不存在：找不到使用者名 '{username}'")
         
-        # Log all matches for debugging
-        if len(all_matches) > 1:
-            logger.warning(f"Multiple users found for lookup '{username}':")
-            for i, match in enumerate(all_matches):
-                logger.warning(f"  Match {i+1}: id={match.get('id')}, name={match.get('name')}, telegram_id={match.get('telegram_id')}, points={match.get('points')}, enabled={match.get('enabled')}")
-            
-            # Prioritize enabled users with stock activity (non-zero stocks or non-100 points)
-            enabled_users = [u for u in all_matches if u.get('enabled', False)]
-            if enabled_users:
-                # Check each enabled user for stock activity
-                for user_candidate in enabled_users:
-                    # Check if this user has stock holdings
-                    stock_holding = await self.db[Collections.STOCKS].find_one({"user_id": user_candidate["_id"]})
-                    if stock_holding and stock_holding.get("stock_amount", 0) > 0:
-                        logger.info(f"Selected enabled user with stock holdings: {user_candidate.get('id')}")
-                        return user_candidate
-                
-                # If no user has stocks, prefer one with non-default points
-                non_default_users = [u for u in enabled_users if u.get('points', 0) != 100]
-                if non_default_users:
-                    user = non_default_users[0]
-                    logger.info(f"Selected enabled user with non-default points: {user.get('id')}")
-                else:
-                    user = enabled_users[0]
-                    logger.info(f"Selected first enabled user: {user.get('id')}")
-            else:
-                user = all_matches[0]
-                logger.info(f"No enabled users found, using first match: {user.get('id')}")
-        else:
-            user = all_matches[0]
-        
         logger.info(f"Found user for lookup '{username}': id={user.get('id')}, name={user.get('name')}, telegram_id={user.get('telegram_id')}, points={user.get('points')}, enabled={user.get('enabled')}")
         
         return user
     
+    async def _get_users_(self, usernames: List[str]) -> dict:
+        """批次解析多個使用者名或ID，回傳 {識別字: 使用者文件}"""
+        return await self.identity_resolver.resolve_many(self.db, usernames)
+    
     async def debug_user_data(self, username: str) -> dict:
         """Debug method to inspect all user data and stocks"""
         try:
@@ -1153,12 +999,15 @@ class UserService:
         """根據使用者名轉帳點數"""
         try:
             # 額外檢查：防止用不同的使用者名稱格式指向同一人的自我轉帳
-            from_user = await self._get_user_(from_username)
-            
-            # 嘗試解析目標使用者以進行自我轉帳檢查
-            try:
-                to_user = await self._get_user_(request.to_username)
-                
+            # 傳送方與接收方一次解析
+            resolved = await self._get_users_([from_username, request.to_username])
+            from_user = resolved.get(from_username)
+            if not from_user:
+                raise HTTPException(status_code=404, detail=f"使用者不存在：找不到使用者名 '{from_username}'")
+            
+            # 如果目標使用者不存在，讓後續邏輯處理
+            to_user = resolved.get(request.to_username)
+            if to_user:
                 # 檢查是否為同一人（多種標識符檢查）
                 if (str(from_user["_id"]) == str(to_user["_id"]) or 
                     from_user.get("telegram_id") == to_user.get("telegram_id") or
@@ -1168,9 +1017,6 @@ class UserService:
                         success=False,
                         message="無法轉帳給自己"
                     )
-            except HTTPException:
-                # 如果目標使用者不存在，讓後續邏輯處理
-                pass
             
             return await self.transfer_points(str(from_user["_id"]), request)
         except Exception as e:
@@ -1195,6 +1041,103 @@ class UserService:
             logger.error(f"Failed to get user stock orders by username: {e}")
             raise
     
+    @staticmethod
+    def _encode_orders_cursor(phase: str, order: Optional[dict] = None) -> str:
+        # order 為 None 表示從該段落的開頭開始
+        payload = {"p": phase}
+        if order is not None:
+            payload.update(t=order["created_at"].isoformat(), id=str(order["_id"]))
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    @staticmethod
+    def _decode_orders_cursor(cursor: str) -> tuple:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if payload["p"] not in ("open", "closed"):
+                raise ValueError(payload["p"])
+            if "t" not in payload:
+                return payload["p"], None
+            return payload["p"], (datetime.fromisoformat(payload["t"]), ObjectId(payload["id"]))
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的分頁游標")
+
+    async def get_user_stock_orders_page(self, username: str, limit: int = 8,
+                                         cursor: Optional[str] = None) -> UserStockOrdersPage:
+        """
+        以游標分頁查詢使用者股票訂單
+
+        先列進行中的訂單，再列已結束的訂單，兩段各自依 (created_at, _id) 新到舊排序；
+        游標記錄所在段落與上一頁最後一筆的排序鍵，每頁只查詢本頁的筆數與顯示用欄位
+        """
+        user = await self._get_user_(username)
+        user_oid = user["_id"]
+
+        phase, after = ("open", None) if not cursor else self._decode_orders_cursor(cursor)
+        phases = ["open", "closed"] if phase == "open" else ["closed"]
+        projection = {
+            "order_type": 1, "side": 1, "quantity": 1, "price": 1, "status": 1,
+            "filled_quantity": 1, "filled_price": 1, "original_quantity": 1,
+            "stock_amount": 1, "created_at": 1
+        }
+
+        orders, next_cursor = [], None
+        for current_phase in phases:
+            query = {
+                "user_id": user_oid,
+                "status": {"$in" if current_phase == "open" else "$nin": OPEN_ORDER_STATUSES}
+            }
+            remaining = limit - len(orders)
+            if remaining <= 0:
+                # 本頁已滿，下一段落還有訂單時從它的開頭接續
+                if await self.db[Collections.STOCK_ORDERS].find_one(query, {"_id": 1}):
+                    next_cursor = self._encode_orders_cursor(current_phase)
+                break
+
+            if after and current_phase == phase:
+                created_at, last_id = after
+                query["$or"] = [
+                    {"created_at": {"$lt": created_at}},
+                    {"created_at": created_at, "_id": {"$lt": last_id}}
+                ]
+
+            # 多取一筆判斷這個段落是否還有下一頁
+            docs = await self.db[Collections.STOCK_ORDERS].find(query, projection).sort(
+                [("created_at", -1), ("_id", -1)]
+            ).limit(remaining + 1).to_list(length=remaining + 1)
+
+            if len(docs) > remaining:
+                orders.extend(docs[:remaining])
+                next_cursor = self._encode_orders_cursor(current_phase, orders[-1])
+                break
+            orders.extend(docs)
+
+        # 總數只在第一頁計算
+        total_count = open_count = None
+        if not cursor:
+            total_count = await self.db[Collections.STOCK_ORDERS].count_documents({"user_id": user_oid})
+            open_count = await self.db[Collections.STOCK_ORDERS].count_documents(
+                {"user_id": user_oid, "status": {"$in": OPEN_ORDER_STATUSES}}
+            )
+
+        return UserStockOrdersPage(
+            orders=[
+                UserStockOrderSummary(
+                    order_type=order.get("order_type", "unknown"),
+                    side=order.get("side", "unknown"),
+                    quantity=self._get_display_quantity(order),
+                    price=order.get("price"),
+                    status=order.get("status", "unknown"),
+                    filled_quantity=order.get("filled_quantity", 0),
+                    filled_price=order.get("filled_price"),
+                    created_at=order["created_at"].isoformat() if order.get("created_at") else ""
+                )
+                for order in orders
+            ],
+            next_cursor=next_cursor,
+            total_count=total_count,
+            open_count=open_count
+        )
+
     async def get_user_profile_by_id(self, username: str) -> dict:
         """根據使用者名查詢使用者基本資料"""
         try:
@@ -1262,110 +1205,17 @@ class UserService:
             dict: {'success': bool, 'message': str, 'balance_before': int, 'balance_after': int}
         """
         try:
-            # 首先檢查用戶狀態和欠款情況
-            user = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            if not user:
-                return {
-                    'success': False,
-                    'message': '使用者不存在',
-                    'balance_before': 0,
-                    'balance_after': 0
-                }
-            
-            # 檢查帳戶狀態
-            if not user.get("enabled", True):
-                return {
-                    'success': False,
-                    'message': '帳戶未啟用',
-                    'balance_before': user.get("points", 0),
-                    'balance_after': user.get("points", 0)
-                }
-            
-            if user.get("frozen", False):
-                return {
-                    'success': False,
-                    'message': '帳戶已凍結，無法進行交易',
-                    'balance_before': user.get("points", 0),
-                    'balance_after': user.get("points", 0)
-                }
-            
-            # 檢查欠款情況
-            points = user.get("points", 0)
-            owed_points = user.get("owed_points", 0)
-            
-            if owed_points > 0:
-                return {
-                    'success': False,
-                    'message': f'帳戶有欠款 {owed_points} 點，請先償還後才能進行交易',
-                    'balance_before': points,
-                    'balance_after': points,
-                    'owed_points': owed_points
-                }
-            
-            # 計算實際可用餘額
-            available_balance = points - owed_points
-            
-            if available_balance < amount:
-                return {
-                    'success': False,
-                    'message': f'餘額不足（含欠款檢查）。需要: {amount} 點，可用: {available_balance} 點',
-                    'balance_before': points,
-                    'balance_after': points,
-                    'available_balance': available_balance
-                }
-            
-            # 使用 MongoDB 的條件更新確保原子性（包含凍結和欠款檢查）
-            update_result = await self.db[Collections.USERS].update_one(
-                {
-                    "_id": user_id,
-                    "points": {"$gte": amount},  # 確保扣除後不會變負數
-                    "frozen": {"$ne": True},     # 確保不是凍結狀態
-                    "$or": [
-                        {"owed_points": {"$exists": False}},  # 沒有欠款字段
-                        {"owed_points": {"$lte": 0}}          # 或者欠款為0
-                    ]
-                },
-                {"$inc": {"points": -amount}},
-                session=session
-            )
-            
-            if update_result.modified_count == 0:
-                # 扣除失敗，重新檢查原因
-                user_recheck = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-                current_balance = user_recheck.get("points", 0) if user_recheck else 0
-                current_owed = user_recheck.get("owed_points", 0) if user_recheck else 0
-                
-                return {
-                    'success': False,
-                    'message': f'扣除失敗。可能原因：餘額不足、帳戶凍結或有欠款。目前餘額: {current_balance} 點，欠款: {current_owed} 點',
-                    'balance_before': current_balance,
-                    'balance_after': current_balance
-                }
-            
-            # 扣除成功，取得更新後的餘額
-            user_after = await self.db[Collections.USERS].find_one({"_id": user_id}, session=session)
-            balance_after = user_after.get("points", 0) if user_after else 0
-            balance_before = balance_after + amount
-            
-            # 記錄點數變化
-            await self._log_point_change(
+            # 條件扣除與點數記錄由帳本引擎一次完成
+            return await self.ledger.debit(
                 user_id=user_id,
+                amount=amount,
                 change_type=change_type,
-                amount=-amount,
                 note=operation_note,
                 transaction_id=transaction_id,
+                action="交易",
                 session=session
             )
             
-            logger.info(f"Safe point deduction successful: user {user_id}, amount {amount}, balance: {balance_before} -> {balance_after}")
-            
-            return {
-                'success': True,
-                'message': f'成功扣除 {amount} 點',
-                'balance_before': balance_before,
-                'balance_after': balance_after
-            }
-            
         except Exception as e:
             logger.error(f"Failed to safely deduct points: user {user_id}, amount {amount}, error: {e}")
             return {
@@ -1529,46 +1379,9 @@ class UserService:
     
     # 檢查市場是否開放
     async def _is_market_open(self) -> bool:
-        """檢查市場是否開放交易"""
+        """檢查市場是否開放交易（使用記憶體中的交易時間行事曆）"""
         try:
-            from datetime import datetime, timezone, timedelta
-            
-            # 檢查預定時間
-            market_config = await self.db[Collections.MARKET_CONFIG].find_one(
-                {"type": "market_hours"}
-            )
-            
-            if not market_config or "openTime" not in market_config:
-                # 如果沒有設定，預設市場開放
-                return True
-            
-            # 取得目前台北時間 (UTC+8)
-            taipei_tz = timezone(timedelta(hours=8))
-            current_time = datetime.now(timezone.utc).astimezone(taipei_tz)
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-            current_seconds_of_day = current_hour * 3600 + current_minute * 60 + current_time.second
-            
-            # 檢查目前是否在任何一個開放時間段內
-            for slot in market_config["openTime"]:
-                # 將儲存的時間戳轉換為當日的秒數
-                start_dt = datetime.fromtimestamp(slot["start"], tz=timezone.utc).astimezone(taipei_tz)
-                end_dt = datetime.fromtimestamp(slot["end"], tz=timezone.utc).astimezone(taipei_tz)
-                
-                start_seconds = start_dt.hour * 3600 + start_dt.minute * 60 + start_dt.second
-                end_seconds = end_dt.hour * 3600 + end_dt.minute * 60 + end_dt.second
-                
-                # 處理跨日情況（例如 23:00 到 01:00）
-                if start_seconds <= end_seconds:
-                    # 同一天內的時間段
-                    if start_seconds <= current_seconds_of_day <= end_seconds:
-                        return True
-                else:
-                    # 跨日時間段
-                    if current_seconds_of_day >= start_seconds or current_seconds_of_day <= end_seconds:
-                        return True
-            
-            return False
+            return await get_market_calendar().is_open(self.db)
             
         except Exception as e:
             logger.error(f"Failed to check market status: {e}")
@@ -1654,15 +1467,22 @@ class UserService:
     async def _execute_market_order_with_transaction(self, user_oid: ObjectId, order_doc: dict) -> StockOrderResponse:
         """使用事務執行市價單交易（適用於 replica set 或 sharded cluster）"""
         async with await self.db.client.start_session() as session:
+            notifications: List[dict] = []
             async with session.start_transaction():
-                return await self._execute_market_order_logic(user_oid, order_doc, session)
+                result = await self._execute_market_order_logic(user_oid, order_doc, session, notifications)
+        if order_doc.get("side") == "buy":
+            # 買單可能向 IPO 申購或初始化 IPO 設定；交易提交後才讓快照重新讀取
+            get_market_config_snapshot().invalidate("ipo_status")
+        await self._send_pending_notifications(notifications)
+        return result
 
     async def _execute_market_order_without_transaction(self, user_oid: ObjectId, order_doc: dict) -> StockOrderResponse:
         """不使用事務執行市價單交易（適用於 standalone MongoDB）"""
         return await self._execute_market_order_logic(user_oid, order_doc, None)
 
-    async def _execute_market_order_logic(self, user_oid: ObjectId, order_doc: dict, session=None) -> StockOrderResponse:
-        """市價單交易邏輯"""
+    async def _execute_market_order_logic(self, user_oid: ObjectId, order_doc: dict, session=None,
+                                          pending_notifications: List[dict] = None) -> StockOrderResponse:
+        """市價單交易邏輯（pending_notifications 見 _match_orders_logic）"""
         try:
             side = order_doc["side"]
             quantity = order_doc["quantity"]
@@ -1701,7 +1521,7 @@ class UserService:
                     temp_buy_order["_id"] = temp_result.inserted_id
                     
                     # 執行撮合 - 撮合邏輯會處理所有資產轉移，包括扣點數
-                    await self._match_orders_logic(temp_buy_order, best_sell_order, session=session)
+                    await self._match_orders_logic(temp_buy_order, best_sell_order, session, pending_notifications)
                     
                     message = f"市價買單已與限價賣單撮合成交，價格: {price} 元/股"
                     
@@ -1755,7 +1575,7 @@ class UserService:
                     temp_sell_order["_id"] = temp_result.inserted_id
                     
                     # 執行撮合 - 撮合邏輯會處理所有資產轉移，包括股票扣除和點數增加
-                    await self._match_orders_logic(best_buy_order, temp_sell_order, session=session)
+                    await self._match_orders_logic(best_buy_order, temp_sell_order, session, pending_notifications)
                     
                     message = f"市價賣單已與限價買單撮合成交，價格: {price} 元/股"
                     
@@ -1870,7 +1690,7 @@ class UserService:
                 # 增加股票持有
                 await self.db[Collections.STOCKS].update_one(
                     {"user_id": user_oid},
-                    {"$inc": {"stock_amount": quantity}},
+                    {"$inc": {"stock_amount": quantity}, "$setOnInsert": {"initial_amount": 0}},
                     upsert=True,
                     session=session
                 )
@@ -1901,6 +1721,9 @@ class UserService:
                             detail=f"IPO 股數不足，無法完成交易。需要 {quantity} 股，剩餘 {remaining_shares} 股"
                         )
                     
+                    if session is None:
+                        # 交易模式由 _execute_market_order_with_transaction 在提交後標記
+                        get_market_config_snapshot().invalidate("ipo_status")
                     logger.info(f"✅ Market order IPO stock updated: reduced by {quantity} shares")
                 
             elif side == "sell":
@@ -2007,14 +1830,17 @@ class UserService:
     async def _try_match_orders(self):
         """嘗試撮合買賣訂單"""
         try:
-            # 查找待成交的買賣單，包含等待限價的訂單
-            # 修復：也包含 "pending_limit" 狀態，在撮合時動態檢查價格限制
+            # 價格帶移動後，先以一次 update_many 重新啟用落在新範圍內的 pending_limit 訂單
+            price_band = await get_price_band().ensure_current(self.db)
+            await price_band.reactivate_in_band(self.db)
+
+            # 查找待成交的買賣單；仍在價格帶外的 pending_limit 訂單不進入撮合
             buy_orders_cursor = self.db[Collections.STOCK_ORDERS].find(
-                {"side": "buy", "status": {"$in": ["pending", "partial", "pending_limit"]}, "order_type": {"$in": ["limit", "market_converted"]}}
+                {"side": "buy", "status": {"$in": ["pending", "partial"]}, "order_type": {"$in": ["limit", "market_converted"]}}
             ).sort([("price", -1), ("created_at", 1)])
             
             sell_orders_cursor = self.db[Collections.STOCK_ORDERS].find(
-                {"side": "sell", "status": {"$in": ["pending", "partial", "pending_limit"]}, "order_type": {"$in": ["limit", "market_converted"]}}
+                {"side": "sell", "status": {"$in": ["pending", "partial"]}, "order_type": {"$in": ["limit", "market_converted"]}}
             ).sort([("price", 1), ("created_at", 1)])
 
             buy_book = await buy_orders_cursor.to_list(None)
@@ -2092,39 +1918,6 @@ class UserService:
                 buy_price = buy_order.get("price", 0)
                 sell_price = sell_order.get("price", float('inf'))
                 
-                # 檢查訂單是否受價格限制影響
-                buy_status = buy_order.get("status")
-                sell_status = sell_order.get("status")
-                
-                # 如果訂單狀態為 "pending_limit"，需要重新檢查價格限制
-                if buy_status == "pending_limit":
-                    if await self._check_price_limit(buy_price):
-                        # 價格現在允許了，更新狀態為 pending
-                        await self.db[Collections.STOCK_ORDERS].update_one(
-                            {"_id": buy_order["_id"]},
-                            {"$set": {"status": "pending"}}
-                        )
-                        buy_order["status"] = "pending"  # 更新本地副本
-                        logger.info(f"Buy order {buy_order['_id']} price limit lifted, status changed from pending_limit to pending")
-                    else:
-                        # 價格仍然受限，跳過這個買單
-                        buy_idx += 1
-                        continue
-                
-                if sell_status == "pending_limit":
-                    if await self._check_price_limit(sell_price):
-                        # 價格現在允許了，更新狀態為 pending
-                        await self.db[Collections.STOCK_ORDERS].update_one(
-                            {"_id": sell_order["_id"]},
-                            {"$set": {"status": "pending"}}
-                        )
-                        sell_order["status"] = "pending"  # 更新本地副本
-                        logger.info(f"Sell order {sell_order['_id']} price limit lifted, status changed from pending_limit to pending")
-                    else:
-                        # 價格仍然受限，跳過這個賣單
-                        sell_idx += 1
-                        continue
-                
                 if buy_price >= sell_price:
                     # 檢查是否為自我交易
                     if buy_order.get("user_id") == sell_order.get("user_id"):
@@ -2153,47 +1946,21 @@ class UserService:
             if matches_found > 0:
                 logger.info(f"Order matching completed: {matches_found} matches executed")
             
-            # 撮合完成後，檢查是否有超出限制的訂單可以重新啟用
-            await self._reactivate_limit_orders()
+            # 基準價格尚未取自實際成交時，今日第一筆成交後重新計算價格帶
+            if matches_found > 0 and price_band.provisional:
+                await price_band.refresh_reference(self.db)
+                await price_band.reactivate_in_band(self.db)
                     
         except Exception as e:
             logger.error(f"Failed to match orders: {e}")
 
-    async def _reactivate_limit_orders(self):
-        """檢查並重新啟用超出漲跌限制但現在可以交易的訂單"""
+    async def _reactivate_limit_orders(self) -> int:
+        """重新啟用價格落在目前價格帶內的 pending_limit 訂單（只在價格帶移動後寫入）"""
         try:
-            # 查找所有因價格限制而等待的訂單
-            pending_limit_orders = await self.db[Collections.STOCK_ORDERS].find(
-                {"status": "pending_limit", "order_type": "limit"}
-            ).to_list(None)
-            
-            reactivated_count = 0
-            for order in pending_limit_orders:
-                order_price = order.get("price", 0)
-                
-                # 檢查該訂單的價格現在是否在允許範圍內
-                if await self._check_price_limit(order_price):
-                    # 價格現在在範圍內，重新啟用訂單
-                    await self.db[Collections.STOCK_ORDERS].update_one(
-                        {"_id": order["_id"]},
-                        {
-                            "$set": {
-                                "status": "pending",
-                                "reactivated_at": datetime.now(timezone.utc)
-                            },
-                            "$unset": {"limit_exceeded": "", "limit_note": ""}
-                        }
-                    )
-                    reactivated_count += 1
-                    logger.info(f"Reactivated order {order['_id']} at price {order_price}")
-            
-            if reactivated_count > 0:
-                logger.info(f"Reactivated {reactivated_count} orders due to price limit changes")
-                # 重新啟用訂單後，再次嘗試撮合
-                await self._try_match_orders()
-                    
+            return await get_price_band().reactivate_in_band(self.db)
         except Exception as e:
             logger.error(f"Failed to reactivate limit orders: {e}")
+            return 0
     
     async def _trigger_async_matching(self, reason: str = "manual_trigger"):
         """觸發異步撮合（不阻塞目前請求）"""
@@ -2335,15 +2102,27 @@ class UserService:
     async def _match_orders_with_transaction(self, buy_order: dict, sell_order: dict):
         """使用事務執行訂單撮合（適用於 replica set 或 sharded cluster）"""
         async with await self.db.client.start_session() as session:
+            notifications: List[dict] = []
             async with session.start_transaction():
-                await self._match_orders_logic(buy_order, sell_order, session)
+                await self._match_orders_logic(buy_order, sell_order, session, notifications)
+        if sell_order.get("is_system_order", False):
+            # IPO 剩餘股數在交易提交後才讓快照重新讀取
+            get_market_config_snapshot().invalidate("ipo_status")
+        # 成交通知在交易提交後才排入，交易中止或重試時不會送出
+        await self._send_pending_notifications(notifications)
 
     async def _match_orders_without_transaction(self, buy_order: dict, sell_order: dict):
         """不使用事務執行訂單撮合（適用於 standalone MongoDB）"""
         await self._match_orders_logic(buy_order, sell_order, None)
 
-    async def _match_orders_logic(self, buy_order: dict, sell_order: dict, session=None):
-        """訂單撮合邏輯"""
+    async def _match_orders_logic(self, buy_order: dict, sell_order: dict, session=None,
+                                  pending_notifications: List[dict] = None):
+        """
+        訂單撮合邏輯
+
+        Args:
+            pending_notifications: 指定時成交通知只加入這個清單，由呼叫者在交易提交後送出
+        """
         try:
             # 注意：自我交易檢查已在主循環中處理
             
@@ -2429,6 +2208,9 @@ class UserService:
                         detail=f"IPO 股數不足，無法完成交易。需要 {trade_quantity} 股，剩餘 {remaining_shares} 股"
                     )
                 
+                if session is None:
+                    # 交易模式由 _match_orders_with_transaction 在提交後標記
+                    get_market_config_snapshot().invalidate("ipo_status")
                 logger.info(f"✅ IPO stock updated: reduced by {trade_quantity} shares")
             
             # 更新使用者資產
@@ -2447,7 +2229,7 @@ class UserService:
                 raise Exception(f"訂單撮合失敗 - 買方點數不足：需要 {trade_amount} 點，{deduction_result['message']}")
             await self.db[Collections.STOCKS].update_one(
                 {"user_id": buy_order["user_id"]},
-                {"$inc": {"stock_amount": trade_quantity}},
+                {"$inc": {"stock_amount": trade_quantity}, "$setOnInsert": {"initial_amount": 0}},
                 upsert=True,
                 session=session
             )
@@ -2524,15 +2306,18 @@ class UserService:
             logger.info(f"Orders matched: {trade_quantity} shares at {trade_price}")
             
             # 傳送交易通知給相關使用者
-            await self._send_trade_notifications(
-                buy_order=buy_order,
-                sell_order=sell_order if not is_system_sale else None,
-                trade_quantity=trade_quantity,
-                trade_price=trade_price,
-                trade_amount=trade_amount,
-                is_system_sale=is_system_sale,
-                session=session
-            )
+            notification = {
+                "buy_order": buy_order,
+                "sell_order": sell_order if not is_system_sale else None,
+                "trade_quantity": trade_quantity,
+                "trade_price": trade_price,
+                "trade_amount": trade_amount,
+                "is_system_sale": is_system_sale
+            }
+            if pending_notifications is None:
+                await self._send_trade_notifications(**notification)
+            else:
+                pending_notifications.append(notification)
             
             # 交易完成後檢查涉及使用者的點數完整性
             user_ids_to_check = [buy_order["user_id"]]
@@ -2621,7 +2406,7 @@ class UserService:
                         raise Exception(f"買方點數不足: {deduction_result['message']}")
                     await self.db[Collections.STOCKS].update_one(
                         {"user_id": buy_order["user_id"]},
-                        {"$inc": {"stock_amount": trade_quantity}},
+                        {"$inc": {"stock_amount": trade_quantity}, "$setOnInsert": {"initial_amount": 0}},
                         upsert=True,
                         session=session
                     )
@@ -2723,98 +2508,10 @@ class UserService:
             student_data: 學員資料列表，包含 id, name, team
             
         Returns:
-            dict: 更新結果和學生列表
+            dict: 更新結果、學生列表與每一列的處理結果
         """
-        try:
-            updated_count = 0
-            created_count = 0
-            errors = []
-            
-            # 批量更新學員資料
-            for student in student_data:
-                try:
-                    result = await self.db[Collections.USERS].update_one(
-                        {"id": student["id"]},
-                        {
-                            "$set": {
-                                "name": student["name"],
-                                "team": student["team"],
-                                "updated_at": datetime.now(timezone.utc)
-                            },
-                            "$setOnInsert": {
-                                "enabled": False,  # 新學員預設未啟用
-                                "points": 100,     # 初始點數
-                                "stock_amount": 10,  # 10 股
-                                "created_at": datetime.now(timezone.utc)
-                            }
-                        },
-                        upsert=True  # 允許建立新記錄
-                    )
-                    
-                    if result.matched_count > 0:
-                        updated_count += 1
-                        logger.info(f"Updated student: {student['id']} - {student['name']} - {student['team']}")
-                    elif result.upserted_id:
-                        created_count += 1
-                        logger.info(f"Created student: {student['id']} - {student['name']} - {student['team']}")
-                        
-                        # 為新學員初始化股票持有記錄，給予5股初始股票
-                        await self.db[Collections.STOCKS].insert_one({
-                            "user_id": result.upserted_id,
-                            "stock_amount": 10, # 10 股
-                            "updated_at": datetime.now(timezone.utc)
-                        })
-                        
-                except Exception as e:
-                    error_msg = f"Error updating student {student['id']}: {e}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-            
-            # 獲取更新後的學生列表（只包含有 id 欄位的學員）
-            students_cursor = self.db[Collections.USERS].find(
-                {"id": {"$exists": True}},  # 只查詢有 id 欄位的文件
-                {
-                    "_id": 0,
-                    "id": 1,
-                    "name": 1,
-                    "team": 1,
-                    "enabled": 1
-                }
-            )
-            
-            students = []
-            async for student in students_cursor:
-                students.append({
-                    "id": student.get("id", ""),
-                    "name": student.get("name", ""),
-                    "team": student.get("team", ""),
-                    "enabled": student.get("enabled", False)
-                })
-            
-            # 準備回應訊息
-            message = f"成功更新 {updated_count} 位學員"
-            if created_count > 0:
-                message += f"，新增 {created_count} 位學員"
-            if errors:
-                message += f"，{len(errors)} 個錯誤"
-            
-            return {
-                "success": True,
-                "message": message,
-                "students": students,
-                "updated_count": updated_count,
-                "errors": errors
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in batch update students: {e}")
-            return {
-                "success": False,
-                "message": f"批量更新使用者狀態失敗: {str(e)}",
-                "students": [],
-                "updated_count": 0,
-                "errors": [str(e)]
-            }
+        # 一次比對既有學員後以 bulk_write 批次寫入
+        return await RosterImportService(self.db).update_students(student_data)
     
     async def activate_student(self, student_id: str, telegram_id: str, telegram_nickname: str) -> dict:
         """
@@ -2859,6 +2556,7 @@ class UserService:
             )
             
             if result.modified_count > 0:
+                get_user_identity_resolver().invalidate_user(student["_id"])
                 logger.info(f"Student activated: {student_id} - {student.get('name', 'Unknown')}")
                 return {
                     "ok": True,
@@ -2990,6 +2688,20 @@ class UserService:
         game_service = GameService(self.db)
         return await game_service.simple_accept_pvp_challenge(from_user, challenge_id)
     
+    async def set_pvp_challenge_message(self, challenge_id: str, message_id: int):
+        """記錄 PVP 挑戰訊息 ID - 委託給 GameService"""
+        from app.services.game_service import GameService
+        
+        game_service = GameService(self.db)
+        return await game_service.set_challenge_message(challenge_id, message_id)
+    
+    async def get_open_pvp_challenges(self):
+        """列出尚未到期的 PVP 挑戰 - 委託給 GameService"""
+        from app.services.game_service import GameService
+        
+        game_service = GameService(self.db)
+        return await game_service.get_open_challenges()
+    
     async def fix_negative_stocks(self, cancel_pending_orders: bool = True) -> dict:
         """
         修復負股票持有量
@@ -3001,9 +2713,9 @@ class UserService:
             dict: 修復結果
         """
         try:
-            # 查找所有負股票持有量的記錄
-            negative_stocks_cursor = self.db[Collections.STOCKS].find({"stock_amount": {"$lt": 0}})
-            negative_stocks = await negative_stocks_cursor.to_list(length=None)
+            # 以聚合一次找出負股票持有量的記錄（附使用者名稱）
+            audit = IntegrityAuditService(self.db)
+            negative_stocks = (await audit.audit_holdings())["negative"]
             
             if not negative_stocks:
                 logger.info("沒有發現負股票持有量，無需修復")
@@ -3019,50 +2731,18 @@ class UserService:
             # 記錄負股票使用者詳情
             negative_users = []
             for stock in negative_stocks:
-                user_id = stock.get("user_id")
-                amount = stock.get("stock_amount", 0)
-                
-                # 獲取使用者訊息
-                user = await self.db[Collections.USERS].find_one({"_id": user_id})
-                username = user.get("name", "Unknown") if user else "Unknown"
-                
                 negative_users.append({
-                    "user_id": str(user_id),
-                    "username": username,
-                    "negative_amount": amount
+                    "user_id": str(stock.get("user_id")),
+                    "username": stock["username"],
+                    "negative_amount": stock.get("stock_amount", 0)
                 })
-                logger.warning(f"用戶 ID: {user_id} 持有 {amount} 股")
+                logger.warning(f"用戶 ID: {stock.get('user_id')} 持有 {stock.get('stock_amount', 0)} 股")
             
-            cancelled_orders_count = 0
-            
-            if cancel_pending_orders:
-                # 取消相關使用者的待成交賣單
-                negative_user_ids = [stock["user_id"] for stock in negative_stocks]
-                
-                cancel_result = await self.db[Collections.STOCK_ORDERS].update_many(
-                    {
-                        "user_id": {"$in": negative_user_ids},
-                        "side": "sell",
-                        "status": {"$in": ["pending", "pending_limit", "partial"]}
-                    },
-                    {
-                        "$set": {
-                            "status": "cancelled",
-                            "cancelled_at": datetime.now(timezone.utc),
-                            "cancel_reason": "系統修復：負股票持有量"
-                        }
-                    }
-                )
-                cancelled_orders_count = cancel_result.modified_count
-                logger.info(f"已取消 {cancelled_orders_count} 個待成交賣單")
-            
-            # 將負股票設為 0
-            fix_result = await self.db[Collections.STOCKS].update_many(
-                {"stock_amount": {"$lt": 0}},
-                {"$set": {"stock_amount": 0}}
-            )
-            fixed_count = fix_result.modified_count
-            logger.info(f"已修復 {fixed_count} 個負股票記錄，全部設為 0 股")
+            # 批次將負股票設為 0，並視需要取消相關使用者的待成交賣單
+            fix_result = await audit.fix_negative_holdings(negative_stocks, cancel_pending_orders)
+            fixed_count = fix_result["fixed_count"]
+            cancelled_orders_count = fix_result["cancelled_orders"]
+            logger.info(f"已修復 {fixed_count} 個負股票記錄，全部設為 0 股，已取消 {cancelled_orders_count} 個待成交賣單")
             
             # 驗證修復結果
             remaining_negative = await self.db[Collections.STOCKS].count_documents({"stock_amount": {"$lt": 0}})
@@ -3104,14 +2784,9 @@ class UserService:
             dict: 修復結果
         """
         try:
-            # 查找無效的訂單（quantity <= 0 但狀態不是 filled）
-            invalid_orders_cursor = self.db[Collections.STOCK_ORDERS].find({
-                "$and": [
-                    {"quantity": {"$lte": 0}},
-                    {"status": {"$nin": ["filled", "cancelled"]}}
-                ]
-            })
-            invalid_orders = await invalid_orders_cursor.to_list(length=None)
+            # 以聚合一次找出無效的訂單（quantity <= 0 但狀態不是 filled），附使用者名稱
+            audit = IntegrityAuditService(self.db)
+            invalid_orders = await audit.find_invalid_orders()
             
             if not invalid_orders:
                 logger.info("沒有發現無效訂單，無需修復")
@@ -3128,13 +2803,10 @@ class UserService:
             invalid_order_details = []
             for order in invalid_orders:
                 user_id = order.get("user_id")
-                user = await self.db[Collections.USERS].find_one({"_id": user_id})
-                username = user.get("name", "Unknown") if user else "Unknown"
-                
                 invalid_order_details.append({
                     "order_id": str(order["_id"]),
                     "user_id": str(user_id),
-                    "username": username,
+                    "username": order["username"],
                     "quantity": order.get("quantity", 0),
                     "side": order.get("side", "unknown"),
                     "status": order.get("status", "unknown"),
@@ -3145,23 +2817,7 @@ class UserService:
                 logger.warning(f"無效訂單: User ID: {user_id} - Order {order['_id']}: quantity={order.get('quantity', 0)}, status={order.get('status', 'unknown')}")
             
             # 修復策略：將這些訂單標記為已取消
-            fix_result = await self.db[Collections.STOCK_ORDERS].update_many(
-                {
-                    "$and": [
-                        {"quantity": {"$lte": 0}},
-                        {"status": {"$nin": ["filled", "cancelled"]}}
-                    ]
-                },
-                {
-                    "$set": {
-                        "status": "cancelled",
-                        "cancelled_at": datetime.now(timezone.utc),
-                        "cancel_reason": "系統修復：無效數量訂單（quantity <= 0）"
-                    }
-                }
-            )
-            
-            fixed_count = fix_result.modified_count
+            fixed_count = await audit.cancel_invalid_orders([order["_id"] for order in invalid_orders])
             logger.info(f"已修復 {fixed_count} 個無效訂單，標記為已取消")
             
             return {
@@ -3180,88 +2836,40 @@ class UserService:
                 "invalid_orders": []
             }
 
+    async def _send_pending_notifications(self, notifications: List[dict]) -> None:
+        """交易提交後排入撮合期間累積的成交通知"""
+        for notification in notifications:
+            await self._send_trade_notifications(**notification)
+
     async def _send_trade_notifications(self, buy_order: dict, sell_order: dict, trade_quantity: int, 
                                       trade_price: float, trade_amount: float, is_system_sale: bool, session=None):
-        """傳送交易通知給買方和賣方"""
+        """排入買方和賣方的交易通知（由通知批次派送器合併送出，不在交易中做任何 I/O）"""
         try:
-            # 獲取買方使用者資訊
-            buy_user = await self.db[Collections.USERS].find_one({"_id": buy_order["user_id"]}, session=session)
-            if not buy_user or not buy_user.get("telegram_id"):
-                logger.warning(f"無法傳送買方通知：使用者 {buy_order['user_id']} 未設定 telegram_id")
-            else:
-                await self._send_single_trade_notification(
-                    user_telegram_id=buy_user["telegram_id"],
-                    action="buy",
+            dispatcher = get_notification_dispatcher()
+            dispatcher.enqueue_trade(
+                action="buy",
+                quantity=trade_quantity,
+                price=trade_price,
+                total_amount=trade_amount,
+                order_id=str(buy_order["_id"]),
+                user_id=buy_order["user_id"]
+            )
+            
+            # 系統 IPO 交易沒有賣方使用者
+            if not is_system_sale and sell_order:
+                dispatcher.enqueue_trade(
+                    action="sell",
                     quantity=trade_quantity,
                     price=trade_price,
                     total_amount=trade_amount,
-                    order_id=str(buy_order["_id"])
+                    order_id=str(sell_order["_id"]),
+                    user_id=sell_order["user_id"]
                 )
-            
-            # 獲取賣方使用者資訊（如果不是系統 IPO 交易）
-            if not is_system_sale and sell_order:
-                sell_user = await self.db[Collections.USERS].find_one({"_id": sell_order["user_id"]}, session=session)
-                if not sell_user or not sell_user.get("telegram_id"):
-                    logger.warning(f"無法傳送賣方通知：使用者 {sell_order['user_id']} 未設定 telegram_id")
-                else:
-                    await self._send_single_trade_notification(
-                        user_telegram_id=sell_user["telegram_id"],
-                        action="sell",
-                        quantity=trade_quantity,
-                        price=trade_price,
-                        total_amount=trade_amount,
-                        order_id=str(sell_order["_id"])
-                    )
                     
         except Exception as e:
             # 通知傳送失敗不應該影響交易本身
             logger.error(f"傳送交易通知時發生錯誤: {e}")
 
-    async def _send_single_trade_notification(self, user_telegram_id: int, action: str, quantity: int, 
-                                            price: float, total_amount: float, order_id: str):
-        """傳送單一交易通知"""
-        try:
-            if not config.external_services.telegram_bot_api_url or not config.security.internal_api_key:
-                logger.warning("Telegram Bot API 設定不完整，跳過通知傳送")
-                return
-            
-            # 構建通知請求
-            notification_url = f"{config.external_services.telegram_bot_api_url.rstrip('/')}/bot/notification/trade"
-            
-            payload = {
-                "user_id": user_telegram_id,
-                "action": action,
-                "quantity": quantity,
-                "price": price,
-                "total_amount": total_amount,
-                "order_id": order_id
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "token": config.security.internal_api_key
-            }
-            
-            # 傳送通知（設定短超時避免阻塞交易）
-            response = requests.post(
-                notification_url,
-                json=payload,
-                headers=headers,
-                timeout=5  # 5秒超時
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"成功傳送 {action} 交易通知給使用者 {user_telegram_id}")
-            else:
-                logger.warning(f"傳送交易通知失敗: HTTP {response.status_code} - {response.text}")
-                
-        except requests.exceptions.Timeout:
-            logger.warning(f"傳送交易通知超時，使用者: {user_telegram_id}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"傳送交易通知網路錯誤: {e}")
-        except Exception as e:
-            logger.error(f"傳送交易通知發生未預期錯誤: {e}")
-
     async def cancel_stock_order(self, user_id: str, order_id: str, reason: str = "user_cancelled") -> dict:
         """
         取消股票訂單 (舊架構方法)
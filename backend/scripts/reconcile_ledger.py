@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+帳本重播對帳腳本
+
+依時間順序重播 point_logs 與 trades，列出每個帳戶第一次與日誌不一致的位置。
+預設只重播上次檢查點之後的新紀錄，加上 --full 從頭重播。
+
+用法:
+    python scripts/reconcile_ledger.py [--full] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# 新增 backend 目錄到 Python 路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ledger_reconciliation import LedgerReconciliationService
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 從環境變數或使用預設值
+MONGO_URI = os.getenv("CAMP_MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = os.getenv("CAMP_DATABASE_NAME", "sitcon_camp_2025")
+
+
+async def reconcile_ledger(full: bool, as_json: bool):
+    """執行對帳並輸出結果"""
+    client = AsyncIOMotorClient(MONGO_URI)
+    db = client[DATABASE_NAME]
+
+    try:
+        result = await LedgerReconciliationService(db).reconcile(full=full)
+
+        if as_json:
+            print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+            return
+
+        logger.info(f"模式: {result['mode']}（{result['since'] or '最早'} → {result['until']}）")
+        logger.info(f"重播點數日誌: {result['replayed_point_logs']} 筆，成交紀錄: {result['replayed_trades']} 筆")
+        logger.info(f"重播帳戶: {result['accounts_replayed']} / 追蹤帳戶: {result['accounts_tracked']}")
+
+        logger.info(f"與日誌不一致的帳戶: {result['divergent_count']}")
+        for item in result["divergences"]:
+            logger.info(
+                f"  使用者 {item['user_id']}：{item['at']} 的 {item['type']} 日誌 ({item['log_id']}) "
+                f"預期餘額 {item['expected_balance']}，日誌記錄 {item['recorded_balance']}，"
+                f"共 {item['divergence_count']} 次不一致"
+            )
+
+        logger.info(f"重播餘額與目前點數不同: {result['balance_mismatch_count']}")
+        for item in result["balance_mismatches"]:
+            logger.info(f"  {item['username']} ({item['user_id']})：重播 {item['replayed_balance']}，目前 {item['current_balance']}")
+
+        logger.info(f"重播持股與目前持股不同: {result['holding_mismatch_count']}")
+        for item in result["holding_mismatches"]:
+            logger.info(f"  {item['username']} ({item['user_id']})：重播 {item['replayed_holdings']}，目前 {item['current_holdings']}")
+
+    except Exception as e:
+        logger.error(f"對帳過程中發生錯誤: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重播 point_logs 與 trades 對帳")
+    parser.add_argument("--full", action="store_true", help="忽略檢查點，從頭重播所有紀錄")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出完整結果")
+    args = parser.parse_args()
+    asyncio.run(reconcile_ledger(args.full, args.json))
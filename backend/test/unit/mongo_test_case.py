@@ -0,0 +1,30 @@
+"""
+需要 MongoDB 的單元測試基底類別
+
+每個測試建立一個獨立的暫時資料庫，結束後刪除；連不上 MongoDB 時略過測試。
+連線位置沿用 CAMP_MONGO_URI（預設 mongodb://localhost:27017）。
+"""
+
+import os
+import unittest
+import uuid
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+MONGO_URI = os.getenv("CAMP_MONGO_URI", "mongodb://localhost:27017")
+
+
+class MongoTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+        try:
+            await self.client.admin.command("ping")
+        except PyMongoError as e:
+            self.client.close()
+            self.skipTest(f"MongoDB not available at {MONGO_URI}: {e}")
+        self.db = self.client[f"test_{uuid.uuid4().hex[:12]}"]
+
+    async def asyncTearDown(self):
+        await self.client.drop_database(self.db.name)
+        self.client.close()
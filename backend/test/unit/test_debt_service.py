@@ -0,0 +1,87 @@
+"""
+DebtService 消費檢查測試
+
+spend 以條件式扣款一次完成檢查與扣除；check_spend / check_spendable 以已讀取的
+使用者文件預檢，條件與錯誤碼需與扣款的查詢條件一致。
+
+執行：cd backend && python -m unittest discover -s test/unit -p "test_debt_service.py"
+（DebtServiceSpendTest 需要 MongoDB）
+"""
+
+import unittest
+
+from bson import ObjectId
+
+from app.core.database import Collections
+from app.services.debt_service import DebtService
+from app.services.points_ledger import PointsLedger
+from mongo_test_case import MongoTestCase
+
+
+class DebtServiceSpendTest(MongoTestCase):
+    async def _create_user(self, **fields) -> ObjectId:
+        user = {"_id": ObjectId(), "name": "測試使用者", "points": 100, "enabled": True, **fields}
+        await self.db[Collections.USERS].insert_one(user)
+        return user["_id"]
+
+    async def _points(self, user_id: ObjectId) -> int:
+        user = await self.db[Collections.USERS].find_one({"_id": user_id})
+        return user["points"]
+
+    async def test_spend_reports_can_spend(self):
+        user_id = await self._create_user()
+        debt_service = DebtService(self.db)
+
+        succeeded = await debt_service.spend(user_id, 40, "pvp_lose", "測試消費")
+        failed = await debt_service.spend(user_id, 100, "pvp_lose", "測試消費")
+        invalid = await debt_service.spend(user_id, 0, "pvp_lose", "測試消費")
+
+        self.assertTrue(succeeded["can_spend"])
+        self.assertFalse(failed["can_spend"])
+        self.assertEqual(failed["error_code"], "INSUFFICIENT_BALANCE")
+        self.assertEqual(invalid["error_code"], "INVALID_AMOUNT")
+        self.assertEqual(await self._points(user_id), 60)
+
+    async def test_check_spend_does_not_move_points(self):
+        user_id = await self._create_user()
+        user = await self.db[Collections.USERS].find_one({"_id": user_id})
+        debt_service = DebtService(self.db)
+
+        self.assertTrue(debt_service.check_spend(user, 100)["can_spend"])
+        self.assertEqual(debt_service.check_spend(user, 101)["error_code"], "INSUFFICIENT_BALANCE")
+        self.assertEqual(debt_service.check_spend(user, 0)["error_code"], "INVALID_AMOUNT")
+        self.assertEqual(await self._points(user_id), 100)
+
+
+class CheckSpendableTest(unittest.TestCase):
+    """check_spendable 以已讀取的文件檢查，條件需與 debit 的查詢條件一致"""
+
+    def test_spendable_user_returns_none(self):
+        user = {"points": 100, "owed_points": 0, "enabled": True, "frozen": False}
+        self.assertIsNone(PointsLedger.check_spendable(user, 100))
+
+    def test_failure_codes(self):
+        cases = [
+            (None, "USER_NOT_FOUND"),
+            ({"points": 100, "enabled": False}, "ACCOUNT_DISABLED"),
+            ({"points": 100, "frozen": True}, "ACCOUNT_FROZEN"),
+            ({"points": 100, "owed_points": 1}, "HAS_DEBT"),
+            ({"points": 99}, "INSUFFICIENT_BALANCE"),
+        ]
+        for user, error_code in cases:
+            with self.subTest(error_code=error_code):
+                result = PointsLedger.check_spendable(user, 100)
+                self.assertFalse(result["success"])
+                self.assertEqual(result["error_code"], error_code)
+
+    def test_without_status_check_only_balance_matters(self):
+        debtor = {"points": 100, "owed_points": 50, "frozen": True}
+        self.assertIsNone(PointsLedger.check_spendable(debtor, 100, enforce_status=False))
+        self.assertEqual(
+            PointsLedger.check_spendable(debtor, 101, enforce_status=False)["error_code"],
+            "INSUFFICIENT_BALANCE"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+點數帳本條件式扣款測試
+
+扣款的餘額、帳戶狀態與欠款檢查都在同一個 find_one_and_update 內，
+這裡確認條件不符時點數不會變動，且併發扣款不會扣成負數；
+另確認不償還欠款的入帳（轉帳）會全額入帳。
+
+執行（需要 MongoDB）：cd backend && python -m unittest discover -s test/unit -p "test_points_ledger.py"
+"""
+
+import asyncio
+import unittest
+
+from bson import ObjectId
+
+from app.core.database import Collections
+from app.services.points_ledger import PointsLedger
+from mongo_test_case import MongoTestCase
+
+
+class PointsLedgerDebitTest(MongoTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.ledger = PointsLedger(self.db)
+
+    async def _create_user(self, **fields) -> ObjectId:
+        user = {"_id": ObjectId(), "name": "測試使用者", "points": 100, "enabled": True, **fields}
+        await self.db[Collections.USERS].insert_one(user)
+        return user["_id"]
+
+    async def _points(self, user_id: ObjectId) -> int:
+        user = await self.db[Collections.USERS].find_one({"_id": user_id})
+        return user["points"]
+
+    async def test_debit_deducts_and_logs_balance_after(self):
+        user_id = await self._create_user()
+
+        result = await self.ledger.debit(user_id, 30, "transfer_out", "測試扣款")
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["balance_before"], 100)
+        self.assertEqual(result["balance_after"], 70)
+        self.assertEqual(await self._points(user_id), 70)
+        logs = await self.db[Collections.POINT_LOGS].find({"user_id": user_id}).to_list(length=None)
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0]["amount"], -30)
+        self.assertEqual(logs[0]["balance_after"], 70)
+
+    async def test_debit_never_overdrafts(self):
+        user_id = await self._create_user(points=50)
+
+        result = await self.ledger.debit(user_id, 51, "transfer_out", "測試扣款")
+
+        self.assertFalse(result["success"])
+        self.assertEqual(result["error_code"], "INSUFFICIENT_BALANCE")
+        self.assertEqual(await self._points(user_id), 50)
+        self.assertEqual(await self.db[Collections.POINT_LOGS].count_documents({"user_id": user_id}), 0)
+
+    async def test_debit_rejects_blocked_accounts(self):
+        cases = [
+            ({"enabled": False}, "ACCOUNT_DISABLED"),
+            ({"frozen": True}, "ACCOUNT_FROZEN"),
+            ({"owed_points": 10}, "HAS_DEBT"),
+        ]
+        for fields, error_code in cases:
+            with self.subTest(error_code=error_code):
+                user_id = await self._create_user(**fields)
+
+                result = await self.ledger.debit(user_id, 10, "transfer_out", "測試扣款")
+
+                self.assertFalse(result["success"])
+                self.assertEqual(result["error_code"], error_code)
+                self.assertEqual(await self._points(user_id), 100)
+
+    async def test_debit_without_status_check_allows_debtor(self):
+        user_id = await self._create_user(owed_points=10)
+
+        result = await self.ledger.debit(user_id, 10, "admin_deduction", "測試扣款", enforce_status=False)
+
+        self.assertTrue(result["success"])
+        self.assertEqual(await self._points(user_id), 90)
+
+    async def test_concurrent_debits_do_not_overdraft(self):
+        user_id = await self._create_user()
+
+        results = await asyncio.gather(*(
+            self.ledger.debit(user_id, 30, "transfer_out", f"併發扣款 {i}") for i in range(10)
+        ))
+
+        self.assertEqual(sum(1 for result in results if result["success"]), 3)
+        self.assertEqual(await self._points(user_id), 10)
+        self.assertEqual(await self.db[Collections.POINT_LOGS].count_documents({"user_id": user_id}), 3)
+
+    async def test_credit_without_repay_keeps_debt(self):
+        user_id = await self._create_user(owed_points=30)
+
+        result = await self.ledger.credit(user_id, 50, "transfer_in", "測試轉入", repay_debt=False)
+
+        self.assertEqual(result["balance_after"], 150)
+        self.assertEqual(result["debt_repaid"], 0)
+        self.assertEqual(await self._points(user_id), 150)
+        user = await self.db[Collections.USERS].find_one({"_id": user_id})
+        self.assertEqual(user["owed_points"], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+PvP 挑戰到期與結算的冪等性測試
+
+到期掃描、過期通知的租約 / 回報，以及接受挑戰時的條件式佔用，
+重複執行或併發執行時都只能生效一次。
+
+執行（需要 MongoDB）：cd backend && python -m unittest discover -s test/unit -p "test_pvp_expiry.py"
+"""
+
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from app.core.database import Collections
+from app.services.game_service import GameService
+from app.services.pvp_expiry import EXPIRY_NOTICE_LEASE, PvPExpirySweeper
+from mongo_test_case import MongoTestCase
+
+CHALLENGER = "1001"
+ACCEPTER = "1002"
+
+
+class PvPTestCase(MongoTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await self.db[Collections.USERS].insert_many([
+            {"_id": ObjectId(), "telegram_id": CHALLENGER, "name": "發起者", "points": 100, "enabled": True},
+            {"_id": ObjectId(), "telegram_id": ACCEPTER, "name": "接受者", "points": 100, "enabled": True},
+            {"_id": ObjectId(), "telegram_id": "1003", "name": "第三人", "points": 100, "enabled": True},
+        ])
+
+    async def _create_challenge(self, expires_in: timedelta = timedelta(hours=3), **fields) -> ObjectId:
+        now = datetime.now(timezone.utc)
+        challenge = {
+            "_id": ObjectId(),
+            "challenger": CHALLENGER,
+            "challenger_name": "發起者",
+            "amount": 10,
+            "chat_id": "-100",
+            "status": "waiting_accepter",
+            "created_at": now,
+            "expires_at": now + expires_in,
+            **fields
+        }
+        await self.db[Collections.PVP_CHALLENGES].insert_one(challenge)
+        return challenge["_id"]
+
+    async def _challenge(self, challenge_id: ObjectId) -> dict:
+        return await self.db[Collections.PVP_CHALLENGES].find_one({"_id": challenge_id})
+
+    async def _points(self, telegram_id: str) -> int:
+        user = await self.db[Collections.USERS].find_one({"telegram_id": telegram_id})
+        return user["points"]
+
+
+class PvPExpiryTest(PvPTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.sweeper = PvPExpirySweeper()
+
+    async def test_sweep_expires_each_challenge_once(self):
+        expired_id = await self._create_challenge(expires_in=timedelta(seconds=-1))
+        open_id = await self._create_challenge(expires_in=timedelta(hours=1))
+
+        self.assertEqual(await self.sweeper.sweep(self.db), 1)
+        self.assertEqual(await self.sweeper.sweep(self.db), 0)
+
+        self.assertEqual((await self._challenge(expired_id))["status"], "expired")
+        self.assertEqual((await self._challenge(open_id))["status"], "waiting_accepter")
+
+    async def test_claim_holds_lease_until_ack(self):
+        challenge_id = await self._create_challenge(expires_in=timedelta(seconds=-1))
+        await self.sweeper.sweep(self.db)
+
+        claimed = await self.sweeper.claim_expired(db=self.db)
+        self.assertEqual([c["challenge_id"] for c in claimed], [str(challenge_id)])
+        # 租約期間不會再被取出
+        self.assertEqual(await self.sweeper.claim_expired(db=self.db), [])
+
+        result = await self.sweeper.ack_expired([str(challenge_id)], db=self.db)
+        self.assertEqual(result, {"acknowledged": 1, "released": 0})
+        self.assertTrue((await self._challenge(challenge_id))["expiry_notified"])
+
+        # 重複回報與之後的取出都不再有效果
+        self.assertEqual(await self.sweeper.ack_expired([str(challenge_id)], db=self.db),
+                         {"acknowledged": 0, "released": 0})
+        self.assertEqual(await self.sweeper.claim_expired(db=self.db), [])
+
+    async def test_failed_notice_is_released_for_retry(self):
+        challenge_id = await self._create_challenge(expires_in=timedelta(seconds=-1))
+        await self.sweeper.sweep(self.db)
+        await self.sweeper.claim_expired(db=self.db)
+
+        result = await self.sweeper.ack_expired([], failed=[str(challenge_id)], db=self.db)
+
+        self.assertEqual(result, {"acknowledged": 0, "released": 1})
+        claimed = await self.sweeper.claim_expired(db=self.db)
+        self.assertEqual([c["challenge_id"] for c in claimed], [str(challenge_id)])
+
+    async def test_unacknowledged_claim_is_reclaimed_after_lease(self):
+        challenge_id = await self._create_challenge(expires_in=timedelta(seconds=-1))
+        await self.sweeper.sweep(self.db)
+        await self.sweeper.claim_expired(db=self.db)
+
+        # 模擬 BOT 取出後當機，租約到期
+        await self.db[Collections.PVP_CHALLENGES].update_one(
+            {"_id": challenge_id},
+            {"$set": {"expiry_claimed_at": datetime.now(timezone.utc) - EXPIRY_NOTICE_LEASE - timedelta(seconds=1)}}
+        )
+
+        claimed = await self.sweeper.claim_expired(db=self.db)
+        self.assertEqual([c["challenge_id"] for c in claimed], [str(challenge_id)])
+
+    async def test_concurrent_claims_do_not_share_challenges(self):
+        for _ in range(5):
+            await self._create_challenge(expires_in=timedelta(seconds=-1))
+        await self.sweeper.sweep(self.db)
+
+        batches = await asyncio.gather(*(self.sweeper.claim_expired(db=self.db) for _ in range(3)))
+
+        claimed = [c["challenge_id"] for batch in batches for c in batch]
+        self.assertEqual(len(claimed), 5)
+        self.assertEqual(len(set(claimed)), 5)
+
+
+class PvPSettlementTest(PvPTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.game_service = GameService(self.db)
+
+    async def test_challenge_settles_once(self):
+        challenge_id = await self._create_challenge(challenger_choice="rock")
+
+        first = await self.game_service.accept_pvp_challenge(ACCEPTER, str(challenge_id), "scissors")
+        second = await self.game_service.accept_pvp_challenge("1003", str(challenge_id), "scissors")
+
+        self.assertTrue(first.success)
+        self.assertEqual(first.winner, CHALLENGER)
+        self.assertFalse(second.success)
+        self.assertEqual(await self._points(CHALLENGER), 110)
+        self.assertEqual(await self._points(ACCEPTER), 90)
+        self.assertEqual(await self._points("1003"), 100)
+
+    async def test_concurrent_accepts_settle_once(self):
+        challenge_id = await self._create_challenge(challenger_choice="rock")
+
+        results = await asyncio.gather(
+            self.game_service.accept_pvp_challenge(ACCEPTER, str(challenge_id), "scissors"),
+            self.game_service.accept_pvp_challenge("1003", str(challenge_id), "scissors"),
+        )
+
+        self.assertEqual(sum(1 for result in results if result.success), 1)
+        self.assertEqual(await self._points(CHALLENGER), 110)
+        self.assertEqual(await self._points(ACCEPTER) + await self._points("1003"), 190)
+
+    async def test_expired_challenge_cannot_be_accepted(self):
+        challenge_id = await self._create_challenge(expires_in=timedelta(seconds=-1), challenger_choice="rock")
+
+        result = await self.game_service.accept_pvp_challenge(ACCEPTER, str(challenge_id), "scissors")
+
+        self.assertFalse(result.success)
+        self.assertEqual(await self._points(CHALLENGER), 100)
+        self.assertEqual(await self._points(ACCEPTER), 100)
+
+    async def test_loser_without_funds_releases_challenge(self):
+        await self.db[Collections.USERS].update_one({"telegram_id": ACCEPTER}, {"$set": {"points": 5}})
+        challenge_id = await self._create_challenge(challenger_choice="rock")
+
+        result = await self.game_service.accept_pvp_challenge(ACCEPTER, str(challenge_id), "scissors")
+
+        self.assertFalse(result.success)
+        self.assertEqual(await self._points(CHALLENGER), 100)
+        self.assertEqual(await self._points(ACCEPTER), 5)
+        # 結算失敗後挑戰恢復為可接受
+        self.assertEqual((await self._challenge(challenge_id))["status"], "waiting_accepter")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+JWT 角色聲明測試
+
+聲明與 token 同時到期；聲明過期或行程重啟（epoch 改變）後不能讓管理員與
+QR / 點數管理員退回學員權限，被撤銷的聲明則不能再被採用。
+
+執行：cd backend && python -m unittest discover -s test/unit -p "test_rbac_claims.py"
+"""
+
+import time
+import unittest
+
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app.core.config_refactored import config
+from app.core.rbac import Permission, RBACService, RESOLVED_ROLE_KEY, Role, get_role_claim_registry
+from app.core.security import create_user_token, get_current_user
+from app.services.user_identity_service import get_user_identity_resolver
+
+USER_ID = "rbac-test-user"
+
+
+def _decode(token: str) -> dict:
+    return jwt.decode(token, config.jwt.secret_key, algorithms=[config.jwt.algorithm])
+
+
+class RoleClaimTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        get_user_identity_resolver().clear()
+
+    def tearDown(self):
+        get_user_identity_resolver().clear()
+
+    def test_role_claim_expires_with_token(self):
+        payload = _decode(create_user_token(USER_ID, 1, Role.ADMIN))
+
+        self.assertAlmostEqual(payload["role_exp"], payload["exp"], delta=1)
+        self.assertEqual(RBACService.get_user_role(payload), Role.ADMIN)
+
+    def test_expired_claim_keeps_token_role(self):
+        payload = _decode(create_user_token(USER_ID, 1, Role.QRCODE_MANAGER))
+        payload["role_exp"] = int(time.time()) - 1
+
+        self.assertEqual(RBACService.get_user_role(payload), Role.QRCODE_MANAGER)
+        self.assertTrue(RBACService.has_permission(payload, Permission.GENERATE_QRCODE))
+
+    def test_epoch_change_keeps_token_role(self):
+        payload = _decode(create_user_token(USER_ID, 1, Role.ADMIN))
+
+        # 模擬行程重啟：epoch 改變
+        get_role_claim_registry().revoke_all()
+
+        self.assertIsNone(get_role_claim_registry().role_from_claims(payload))
+        self.assertEqual(RBACService.get_user_role(payload), Role.ADMIN)
+
+    def test_stale_claim_prefers_cached_role(self):
+        payload = _decode(create_user_token(USER_ID, 1, Role.ADMIN))
+        get_role_claim_registry().revoke_all()
+        get_user_identity_resolver().remember_role(USER_ID, Role.POINT_MANAGER.value)
+
+        self.assertEqual(RBACService.get_user_role(payload), Role.POINT_MANAGER)
+
+    def test_revoked_claim_is_not_trusted(self):
+        payload = _decode(create_user_token(USER_ID, 1, Role.ADMIN))
+
+        get_role_claim_registry().bump(USER_ID)
+
+        self.assertEqual(RBACService.get_user_role(payload), Role.STUDENT)
+
+    async def test_get_current_user_resolves_role_after_epoch_change(self):
+        token = create_user_token(USER_ID, 1, Role.QR_POINT_MANAGER)
+        get_role_claim_registry().revoke_all()
+        # 資料庫中的角色（已由角色快取載入）
+        get_user_identity_resolver().remember_role(USER_ID, Role.QRCODE_MANAGER.value)
+
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+        self.assertEqual(user[RESOLVED_ROLE_KEY], Role.QRCODE_MANAGER.value)
+        self.assertEqual(RBACService.get_user_role(user), Role.QRCODE_MANAGER)
+        self.assertTrue(RBACService.has_permission(user, Permission.GENERATE_QRCODE))
+        self.assertFalse(RBACService.has_permission(user, Permission.GIVE_POINTS))
+
+    async def test_get_current_user_uses_valid_claim(self):
+        token = create_user_token(USER_ID, 1, Role.ANNOUNCER)
+
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+        self.assertEqual(user[RESOLVED_ROLE_KEY], Role.ANNOUNCER.value)
+        self.assertTrue(RBACService.has_permission(user, Permission.CREATE_ANNOUNCEMENT))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+隊伍點數總和投影的增量更新測試
+
+投影只依 change stream 事件對新舊隊伍加減差額，這裡以事件直接驗證
+點數變動、換隊與刪除使用者後的總和都與重新掃描的結果一致。
+
+執行：cd backend && python -m unittest discover -s test/unit -p "test_team_totals.py"
+"""
+
+import unittest
+
+from app.services.team_totals import TeamTotalsProjection, _WATCH_PIPELINE
+
+
+def _change(operation: str, user_id: int, team=None, points=None, deleted: bool = False) -> dict:
+    change = {"operationType": operation, "documentKey": {"_id": user_id}}
+    if operation in ("insert", "update", "replace"):
+        change["fullDocument"] = None if deleted else {"_id": user_id, "team": team, "points": points}
+    return change
+
+
+class TeamTotalsProjectionTest(unittest.TestCase):
+    def setUp(self):
+        self.projection = TeamTotalsProjection()
+        for user_id, team, points in [(1, "紅隊", 100), (2, "紅隊", 50), (3, "藍隊", 80)]:
+            self.projection._set_user(user_id, team, points)
+
+    def _team(self, name: str):
+        return self.projection._teams.get(name)
+
+    def test_points_change_applies_delta(self):
+        self.projection._apply_change(_change("update", 1, "紅隊", 130))
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 2, "total_points": 180})
+        self.assertEqual(self._team("藍隊"), {"member_count": 1, "total_points": 80})
+
+    def test_team_change_moves_member_and_points(self):
+        self.projection._apply_change(_change("update", 2, "藍隊", 50))
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 1, "total_points": 100})
+        self.assertEqual(self._team("藍隊"), {"member_count": 2, "total_points": 130})
+
+    def test_team_and_points_change_together(self):
+        self.projection._apply_change(_change("update", 1, "藍隊", 40))
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 1, "total_points": 50})
+        self.assertEqual(self._team("藍隊"), {"member_count": 2, "total_points": 120})
+
+    def test_moving_last_member_removes_team(self):
+        self.projection._apply_change(_change("update", 3, "綠隊", 80))
+
+        self.assertIsNone(self._team("藍隊"))
+        self.assertEqual(self._team("綠隊"), {"member_count": 1, "total_points": 80})
+
+    def test_leaving_team_removes_member(self):
+        self.projection._apply_change(_change("update", 1, None, 100))
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 1, "total_points": 50})
+        self.assertNotIn(1, self.projection._users)
+
+    def test_unset_team_leaves_team(self):
+        # $unset team：updateLookup 的文件沒有 team 欄位
+        self.projection._apply_change({
+            "operationType": "update",
+            "documentKey": {"_id": 2},
+            "updateDescription": {"updatedFields": {}, "removedFields": ["team"]},
+            "fullDocument": {"_id": 2, "points": 50}
+        })
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 1, "total_points": 100})
+        self.assertNotIn(2, self.projection._users)
+
+    def test_watch_pipeline_includes_removed_team(self):
+        conditions = _WATCH_PIPELINE[0]["$match"]["$or"]
+
+        self.assertIn({"updateDescription.removedFields": {"$in": ["team", "points"]}}, conditions)
+
+    def test_insert_and_delete(self):
+        self.projection._apply_change(_change("insert", 4, "藍隊", 20))
+        self.assertEqual(self._team("藍隊"), {"member_count": 2, "total_points": 100})
+
+        self.projection._apply_change(_change("delete", 4))
+        self.assertEqual(self._team("藍隊"), {"member_count": 1, "total_points": 80})
+
+        # updateLookup 時文件已被刪除
+        self.projection._apply_change(_change("update", 3, deleted=True))
+        self.assertIsNone(self._team("藍隊"))
+
+    def test_repeated_event_is_idempotent(self):
+        change = _change("update", 2, "藍隊", 70)
+        self.projection._apply_change(change)
+        self.projection._apply_change(change)
+
+        self.assertEqual(self._team("紅隊"), {"member_count": 1, "total_points": 100})
+        self.assertEqual(self._team("藍隊"), {"member_count": 2, "total_points": 150})
+
+    def test_deltas_match_full_rebuild(self):
+        changes = [
+            _change("update", 1, "藍隊", 90),
+            _change("insert", 4, "綠隊", 10),
+            _change("update", 2, "綠隊", 55),
+            _change("update", 4, "紅隊", 15),
+            _change("delete", 3),
+        ]
+        for change in changes:
+            self.projection._apply_change(change)
+
+        rebuilt = TeamTotalsProjection()
+        for user_id, (team, points) in {1: ("藍隊", 90), 2: ("綠隊", 55), 4: ("紅隊", 15)}.items():
+            rebuilt._set_user(user_id, team, points)
+        self.assertEqual(self.projection._teams, rebuilt._teams)
+
+    def test_drop_forces_reload(self):
+        self.projection._loaded_at = 0.0
+
+        self.projection._apply_change({"operationType": "drop"})
+
+        self.assertIsNone(self.projection._loaded_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,7 @@ from os import environ
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
-from api.routes import webhook, broadcast, health, notifications
+from api.routes import webhook, broadcast, health, notifications, jobs
 from bot.setup import initialize
 from utils.logger import setup_logger
 
@@ -20,6 +20,14 @@ async def lifespan(app: FastAPI):
     if not WEBHOOK_SECRET:
         logger.warning("WEBHOOK_SECRET was not set!")
     yield
+    from bot.update_dispatcher import get_update_dispatcher
+    await get_update_dispatcher().stop()
+    from bot.pvp_manager import get_pvp_manager
+    await get_pvp_manager().stop_expiry_watch()
+    from bot.send_scheduler import get_send_scheduler
+    await get_send_scheduler().stop()
+    from utils import api_helper
+    await api_helper.close()
     logger.info("Server stopped.")
 
 server = FastAPI(lifespan=lifespan)
@@ -29,3 +37,4 @@ server.include_router(webhook.router)
 server.include_router(broadcast.router)
 server.include_router(health.router)
 server.include_router(notifications.router)
+server.include_router(jobs.router)
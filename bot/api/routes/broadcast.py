@@ -6,7 +6,7 @@ from telegram.constants import ParseMode
 
 from api.depends.auth import verify_backend_token
 from api.schemas.broadcast import Broadcast
-from bot.instance import bot
+from bot.send_scheduler import get_send_scheduler, JOB_WAIT_TIMEOUT
 from utils.logger import setup_logger
 from bot.helper.chat_ids import STUDENT_GROUPS, MAIN_GROUP
 
@@ -26,41 +26,13 @@ async def broadcast(request: Broadcast, token: str = Depends(verify_backend_toke
     groups.append(MAIN_GROUP)
     logger.info(f"Broadcasting to {len(groups)} groups: {groups}")
 
-    successful_sends = 0
-    failed_sends = 0
+    # 使用純文字發送，避免 Markdown 解析問題；實際發送交給排程器依速率限制進行
+    message_text = f"📢 {request.title}\n\n{request.message}"
+    job = get_send_scheduler().submit("broadcast", [(channel, message_text, None) for channel in groups])
 
-    for channel in groups:
-        try:
-            # 先嘗試發送簡單的文本消息，避免 Markdown 解析問題
-            message_text = f"📢 {request.title}\n\n{request.message}"
-            logger.info(f"Sending message to channel {channel}: {message_text[:50]}...")
-            
-            # 檢查 bot 實例是否可用
-            if not bot.bot:
-                logger.error("Bot instance is not available")
-                failed_sends += 1
-                continue
-                
-            await bot.bot.send_message(
-                channel,  # 直接使用 channel ID，不要添加 '-'
-                message_text
-            )
-            logger.info(f"Message successfully sent to channel {channel}")
-            successful_sends += 1
-        except Exception as e:
-            logger.error(f"Error broadcasting message to channel {channel}: {e}")
-            logger.error(f"Exception type: {type(e)}")
-            failed_sends += 1
-            # 嘗試發送不帶格式的消息
-            try:
-                simple_message = f"📢 {request.title}\n\n{request.message}"
-                await bot.bot.send_message(channel, simple_message)
-                logger.info(f"Fallback message sent to channel {channel}")
-                successful_sends += 1
-                failed_sends -= 1  # 修正計數
-            except Exception as fallback_e:
-                logger.error(f"Fallback message also failed for channel {channel}: {fallback_e}")
-                logger.error(f"Fallback exception type: {type(fallback_e)}")
-    
-    logger.info(f"Broadcast completed: {successful_sends} successful, {failed_sends} failed")
-    return {"ok": True, "successful_sends": successful_sends, "failed_sends": failed_sends}
+    if request.wait:
+        await job.wait(JOB_WAIT_TIMEOUT)
+        logger.info(f"Broadcast completed: {len(job.succeeded)} successful, {len(job.failed)} failed")
+        return {"ok": True, "successful_sends": len(job.succeeded), "failed_sends": len(job.failed), **job.to_dict()}
+
+    return {"ok": True, **job.to_dict()}
@@ -2,6 +2,9 @@ from fastapi import APIRouter, status
 from fastapi.responses import JSONResponse
 
 from bot.instance import bot
+from bot.send_scheduler import get_send_scheduler
+from bot.update_dispatcher import get_update_dispatcher
+from utils import metrics
 from utils.logger import setup_logger
 
 router = APIRouter()
@@ -16,3 +19,23 @@ async def healthz():
     except Exception as e:
         logger.error(f"Error checking healthz: {e}")
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"ok": False})
+
+
+@router.get("/health")
+async def health():
+    """
+    回傳 webhook 處理與訊息發送的佇列深度、延遲等指標（不呼叫 Telegram API）
+    """
+    return {
+        "ok": True,
+        "webhook": get_update_dispatcher().get_metrics(),
+        "sender": get_send_scheduler().get_status()
+    }
+
+
+@router.get("/metrics")
+async def handler_metrics():
+    """
+    回傳各指令的處理延遲分布、後端呼叫與 Telegram API 呼叫的次數與耗時
+    """
+    return metrics.get_metrics()
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Depends
+
+from api.depends.auth import verify_backend_token
+from bot.notification_coalescer import get_trade_coalescer
+from bot.send_scheduler import get_send_scheduler
+
+router = APIRouter()
+
+
+@router.get("/bot/jobs/{job_id}")
+async def get_job_status(job_id: str, token: str = Depends(verify_backend_token)):
+    """
+    查詢廣播 / 批量私訊工作的發送進度
+    """
+    job = get_send_scheduler().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"ok": True, **job.to_dict()}
+
+
+@router.get("/bot/jobs")
+async def get_scheduler_status(token: str = Depends(verify_backend_token)):
+    """
+    查詢發送排程器狀態與最近的工作
+    """
+    scheduler = get_send_scheduler()
+    return {
+        "ok": True,
+        "scheduler": scheduler.get_status(),
+        "trade_coalescer": get_trade_coalescer().get_status(),
+        "jobs": [
+            {key: value for key, value in job.to_dict().items() if key not in ("success_users", "failed_users", "errors")}
+            for job in reversed(scheduler.jobs.values())
+        ]
+    }
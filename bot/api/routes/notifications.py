@@ -6,8 +6,12 @@ from telegram.error import TelegramError
 
 from api.depends.auth import verify_backend_token
 from api.schemas.notifications import DMRequest, BulkDMRequest, NotificationRequest, TradeNotificationRequest, \
-    TransferNotificationRequest, SystemNotificationRequest
+    TransferNotificationRequest, SystemNotificationRequest, BatchNotificationRequest
+from bot.helper.notification_messages import render_trade_message, render_transfer_message, render_system_message
 from bot.instance import bot
+from bot.notification_coalescer import get_trade_coalescer
+from bot.send_scheduler import get_send_scheduler, JOB_WAIT_TIMEOUT
+from utils import order_pages, portfolio_cache
 
 logger = logging.getLogger(__name__)
 
@@ -32,31 +36,22 @@ async def send_dm(request: DMRequest, token: str = Depends(verify_backend_token)
 async def send_bulk_dm(request: BulkDMRequest, token: str = Depends(verify_backend_token)):
     """
     批量傳送私人訊息給多個使用者
+
+    訊息交給發送排程器依 Telegram 速率限制併發發送，預設立即回傳 job_id，
+    可用 /bot/jobs/{job_id} 查詢進度；wait 為 True 時等待發送完成後回傳結果
     """
-    sent_users = []
-    failed_users = []
-
-    # TODO: delay_seconds is discarded right now cuz library should have a feature to work around this
-    for user_id in request.user_ids:
-        try:
-            await bot.bot.send_message(chat_id=user_id, text=request.message, parse_mode=request.parse_mode)
-        except TelegramError as e:
-            logger.error(f"Telegram error when sending bulk direct to {user_id}: {e}")
-            failed_users.append(user_id)
-            continue
-        except Exception as e:
-            logger.error(f"Unexpected error when sending bulk direct to {user_id}: {e}")
-            failed_users.append(user_id)
-            continue
-        sent_users.append(user_id)
+    job = get_send_scheduler().submit(
+        "bulk_dm",
+        [(user_id, request.message, request.parse_mode) for user_id in request.user_ids]
+    )
+
+    if request.wait:
+        await job.wait(JOB_WAIT_TIMEOUT)
 
     return {
         "ok": True,
         "total_users": len(request.user_ids),
-        "success_count": len(sent_users),
-        "failed_count": len(failed_users),
-        "success_users": sent_users,
-        "failed_users": failed_users
+        **job.to_dict()
     }
 
 
@@ -100,17 +95,10 @@ async def send_trade_notification(request: TradeNotificationRequest, token: str
     """
     傳送交易通知
     """
-    message_parts = [
-        f"🔔 *您的 SITC {"買入" if request.action == "buy" else "賣出"}交易已完成！*",
-        f"",
-        *([f"• 訂單號碼：`{request.order_id}`"] if request.order_id else []),
-        f"• 數量：{request.quantity}",
-        f"• 價格：{request.price:.2f}",
-        f"• 總金額：{request.total_amount:.2f}"
-    ]
-
+    portfolio_cache.invalidate(request.user_id)
+    order_pages.invalidate(request.user_id)
     try:
-        await bot.bot.send_message(chat_id=request.user_id, text="\n".join(message_parts), parse_mode=ParseMode.MARKDOWN_V2)
+        await bot.bot.send_message(chat_id=request.user_id, text=render_trade_message(request), parse_mode=ParseMode.MARKDOWN_V2)
     except TelegramError as e:
         logger.error(f"Telegram error when sending trade notification: {e}")
         raise HTTPException(status_code=500, detail="Telegram server error")
@@ -124,15 +112,9 @@ async def send_transfer_notification(request: TransferNotificationRequest, token
     """
     傳送轉帳通知
     """
-    message_parts = [
-        f"🔔 *成功{f"轉帳至 {request.other_user}" if request.transfer_type == "sent" else f"接受來自 {request.other_user} 的轉帳"}！*",
-        f"",
-        *([f"• 交易號碼：`{request.transfer_id}`"] if request.transfer_id else []),
-        f"• 轉帳總金額：{request.total_amount:.2f}"
-    ]
-
+    portfolio_cache.invalidate(request.user_id)
     try:
-        await bot.bot.send_message(chat_id=request.user_id, text="\n".join(message_parts), parse_mode=ParseMode.MARKDOWN_V2)
+        await bot.bot.send_message(chat_id=request.user_id, text=render_transfer_message(request), parse_mode=ParseMode.MARKDOWN_V2)
     except TelegramError as e:
         logger.error(f"Telegram error when sending transfer notification: {e}")
         raise HTTPException(status_code=500, detail="Telegram server error")
@@ -146,25 +128,43 @@ async def send_system_notification(request: SystemNotificationRequest, token: st
     """
     傳送系統通知
     """
-    priority_emojis = {
-        "low": "ℹ️",
-        "normal": "📢",
-        "high": "⚠️",
-        "urgent": "🚨"
-    }
-    emoji = priority_emojis.get(request.priority, "ℹ️")
-
-    message_parts = [
-        f"{emoji} *{request.title}*",
-        f"",
-        request.content
-    ]
-
     try:
-        await bot.bot.send_message(chat_id=request.user_id, text="\n".join(message_parts), parse_mode=ParseMode.MARKDOWN_V2)
+        await bot.bot.send_message(chat_id=request.user_id, text=render_system_message(request), parse_mode=ParseMode.MARKDOWN_V2)
     except TelegramError as e:
         logger.error(f"Telegram error when sending transfer notification: {e}")
         raise HTTPException(status_code=500, detail="Telegram server error")
     except Exception as e:
         logger.error(f"Unexpected error when sending transfer notification: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/bot/notification/batch")
+async def send_batch_notifications(request: BatchNotificationRequest, token: str = Depends(verify_backend_token)):
+    """
+    批量傳送通知
+
+    成交通知依使用者在短時間視窗內合併成一則摘要，其餘通知直接排入發送排程器；
+    所有訊息都經由排程器依 Telegram 速率限制發送，端點本身立即回應
+    """
+    scheduler = get_send_scheduler()
+    coalescer = get_trade_coalescer()
+
+    for trade in request.trades:
+        portfolio_cache.invalidate(trade.user_id)
+        order_pages.invalidate(trade.user_id)
+        coalescer.add(trade)
+    for transfer in request.transfers:
+        portfolio_cache.invalidate(transfer.user_id)
+        scheduler.enqueue(transfer.user_id, render_transfer_message(transfer), ParseMode.MARKDOWN_V2)
+    for system in request.systems:
+        scheduler.enqueue(system.user_id, render_system_message(system), ParseMode.MARKDOWN_V2)
+    for direct in request.direct:
+        scheduler.enqueue(direct.user_id, direct.message, direct.parse_mode)
+
+    return {
+        "ok": True,
+        "trades": len(request.trades),
+        "transfers": len(request.transfers),
+        "systems": len(request.systems),
+        "direct": len(request.direct)
+    }
@@ -5,6 +5,7 @@ from fastapi.responses import JSONResponse
 from telegram import Update
 
 from bot.instance import bot
+from bot.update_dispatcher import get_update_dispatcher
 from utils.logger import setup_logger
 
 router = APIRouter()
@@ -28,12 +29,19 @@ async def webhook_post(request: Request):
     try:
         update_data = await request.json()
         update = Update.de_json(update_data, bot.bot)
-        await bot.process_update(update)
-        logger.info("Received and processed Telegram update.")
-        return {"ok": True, "message": "success"}
     except Exception as e:
-        logger.error(f"Error processing update: {e}")
+        logger.error(f"Error parsing update: {e}")
         return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"ok": False, "message": "Error processing update."}
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"ok": False, "message": "Invalid update."}
+        )
+
+    # 排入 worker pool 後立即回應，避免慢的 handler 讓 Telegram 逾時重送
+    if get_update_dispatcher().submit(update):
+        return {"ok": True, "message": "accepted"}
+    else:
+        # 佇列已滿，回覆錯誤讓 Telegram 稍後重送
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"ok": False, "message": "Update queue is full."}
         )
@@ -1,6 +1,10 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class Broadcast(BaseModel):
     title: str
     message: str
+    # 為 True 時等待全部發送完成後才回應（預設立即回傳 job_id）
+    wait: Optional[bool] = False
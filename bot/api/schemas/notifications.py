@@ -13,7 +13,10 @@ class BulkDMRequest(BaseModel):
     user_ids: List[int]
     message: str
     parse_mode: Optional[str] = "MarkdownV2"
+    # 已由發送排程器的全域 / 每聊天室速率限制取代，保留欄位以相容舊的呼叫端
     delay_seconds: Optional[float] = 0.1
+    # 為 True 時等待全部發送完成後才回應（預設立即回傳 job_id）
+    wait: Optional[bool] = False
 
 
 class NotificationRequest(BaseModel):
@@ -45,4 +48,11 @@ class SystemNotificationRequest(BaseModel):
     user_id: int
     title: str
     content: str
-    priority: Optional[str] = "normal"
\ No newline at end of file
+    priority: Optional[str] = "normal"
+
+
+class BatchNotificationRequest(BaseModel):
+    trades: List[TradeNotificationRequest] = []
+    transfers: List[TransferNotificationRequest] = []
+    systems: List[SystemNotificationRequest] = []
+    direct: List[DMRequest] = []
@@ -6,7 +6,7 @@ from telegram.helpers import escape_markdown
 from telegram.error import BadRequest
 from datetime import datetime, timedelta
 
-from utils import api_helper
+from utils import api_helper, order_pages, portfolio_cache
 from utils.logger import setup_logger
 from bot.helper.existing_user import verify_existing_user
 
@@ -51,7 +51,7 @@ async def handle_pvp_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 檢查市場狀態
     try:
-        market_status = api_helper.get("/api/status")
+        market_status = await api_helper.get("/api/status")
         if not market_status or not market_status.get("isOpen", False):
             await query.answer("🚫 目前交易已經關閉，無法進行 PVP 挑戰！", show_alert=True)
             return
@@ -105,12 +105,18 @@ async def handle_pvp_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 調用新的簡單 PVP API
         try:
             logger.info(f"Calling API: /api/bot/pvp/simple-accept with user {update.effective_user.id}")
-            response = api_helper.post("/api/bot/pvp/simple-accept", protected_route=True, json={
+            response = await api_helper.post("/api/bot/pvp/simple-accept", protected_route=True, json={
                 "from_user": str(update.effective_user.id),
                 "challenge_id": challenge_id
             })
             
             logger.info(f"API response: {response}")
+
+            # 雙方點數可能已變動
+            portfolio_cache.invalidate(update.effective_user.id)
+            challenge_info = pvp_manager.get_challenge_info(challenge_id)
+            if challenge_info:
+                portfolio_cache.invalidate(challenge_info["user_id"])
             
             if response and response.get("success"):
                 # 遊戲成功完成
@@ -172,7 +178,8 @@ async def handle_orders_pagination(update: Update, context: ContextTypes.DEFAULT
         user_id = str(query.from_user.id)
         
         if callback_data == "orders_refresh":
-            # 重新整理目前頁面 - 預設第1頁
+            # 重新整理目前頁面 - 預設第1頁，捨棄已查過的頁面
+            order_pages.invalidate(user_id)
             await show_orders_page(query, user_id, 1, edit_message=True)
         elif callback_data.startswith("orders_page_"):
             # 切換到指定頁面
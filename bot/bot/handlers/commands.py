@@ -1,5 +1,6 @@
 from datetime import datetime
 from os import environ
+from urllib.parse import quote
 from zoneinfo import ZoneInfo
 from uuid import uuid4
 
@@ -11,7 +12,7 @@ from telegram.helpers import escape_markdown
 
 from bot.helper.chat_ids import MAIN_GROUP, STUDENT_GROUPS
 from bot.helper.existing_user import verify_existing_user
-from utils import api_helper
+from utils import api_helper, order_pages, portfolio_cache
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -28,9 +29,7 @@ if DEBUG:
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"🚀 使用者 {update.effective_user.full_name} ({update.effective_user.id}) 啟動 BOT")
 
-    response = api_helper.post("/api/bot/portfolio", protected_route=True, json={
-        "from_user": str(update.effective_user.id)
-    })
+    response = await portfolio_cache.get_portfolio(update.effective_user.id)
 
     # 除錯：記錄 API 回應內容
     logger.info(f"📊 Portfolio API 回應內容: {response}")
@@ -61,9 +60,7 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("🚫 請在小隊群裡面註冊！")
         return
     
-    portfolio_response = api_helper.post("/api/bot/portfolio", protected_route=True, json={
-        "from_user": str(update.effective_user.id)
-    })
+    portfolio_response = await portfolio_cache.get_portfolio(update.effective_user.id)
 
     # Check if user doesn't exist (either old format or new format)
     detail = portfolio_response.get("detail", "")
@@ -102,11 +99,12 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     key = context.args[0]
     logger.info(f"📝 使用者 {update.effective_user.full_name} 開始註冊流程，註冊碼: {key}")
 
-    response = api_helper.post("/api/system/users/activate", protected_route=True, json={
+    response = await api_helper.post("/api/system/users/activate", protected_route=True, json={
         "id": key,
         "telegram_id": str(update.effective_user.id),
         "telegram_nickname": update.effective_user.full_name
     })
+    portfolio_cache.invalidate(update.effective_user.id)
 
     if response.get("ok"):
         name = response.get("message").split(":")[1]
@@ -139,19 +137,21 @@ async def point(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("🚫 只能在小隊群組裡面查詢該小隊的點數")
         return
 
-    response = api_helper.get("/api/bot/teams", protected_route=True)
-
     team_name = list(STUDENT_GROUPS.keys())[list(STUDENT_GROUPS.values()).index(update.message.chat_id)]
-    result = next((item for item in response if item["name"] == team_name), None)
+    result = await api_helper.get(f"/api/bot/teams/{quote(team_name, safe='')}", protected_route=True)
+
+    if not isinstance(result, dict) or "total_points" not in result:
+        await update.message.reply_text(f"🙀 目前查不到 {team_name} 的點數")
+        return
 
     await update.message.reply_text(
-        f"👥{team_name} 目前的點數共：*{result.get("total_points")}* 點", parse_mode=ParseMode.MARKDOWN_V2)
+        f"👥{team_name} 目前的點數共：*{escape_markdown(str(result.get("total_points")), 2)}* 點", parse_mode=ParseMode.MARKDOWN_V2)
 
 
 async def log(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"/start triggered by {update.effective_user.id}")
 
-    response = api_helper.post("/api/bot/points/history", protected_route=True, json={
+    response = await api_helper.post("/api/bot/points/history", protected_route=True, json={
         "from_user": str(update.effective_user.id),
         "limit": 10
     })
@@ -192,7 +192,7 @@ async def pvp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     # 檢查是否在交易時間內
     try:
-        market_response = api_helper.get("/api/status")
+        market_response = await api_helper.get("/api/status")
         
         # 檢查 API 是否正常回應
         if not market_response or market_response.get("detail") == "error":
@@ -307,7 +307,7 @@ async def pvp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
     
     # 儲存訊息 ID 供後續編輯
-    pvp_manager.store_challenge_message(challenge_id, message.message_id)
+    await pvp_manager.store_challenge_message(challenge_id, message.message_id)
 
 
 async def orders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -324,13 +324,8 @@ async def orders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def show_orders_page(update_or_query, user_id: str, page: int = 1, edit_message: bool = False):
     """顯示指定頁面的訂單清單"""
-    ORDERS_PER_PAGE = 8  # 每頁顯示的訂單數量
-
-    # 調用後端 API 獲取使用者的所有股票訂單
-    response = api_helper.post("/api/bot/stock/orders", protected_route=True, json={
-        "from_user": user_id,
-        "limit": 100  # 獲取更多訂單用於分頁
-    })
+    # 後端以游標分頁，只查詢這一頁需要的訂單
+    response = await order_pages.get_page(user_id, page)
 
     if hasattr(update_or_query, 'data'):
         # 來自 callback query（CallbackQuery 對象）
@@ -353,7 +348,7 @@ async def show_orders_page(update_or_query, user_id: str, page: int = 1, edit_me
         if await verify_existing_user(response, update):
             return
 
-    if not response:
+    if not isinstance(response, dict) or not response.get("orders"):
         message_text = "📋 你目前沒有任何股票訂單記錄"
 
         if edit_message and hasattr(update_or_query, 'edit_message_text'):
@@ -374,11 +369,12 @@ async def show_orders_page(update_or_query, user_id: str, page: int = 1, edit_me
                 )
         return
 
-    # 分別處理進行中和已完成的訂單
-    pending_orders = []
-    completed_orders = []
+    page = response["page"]
+    total_pages = response["total_pages"]
+    total_orders = response["total_count"]
 
-    for order in response:
+    current_page_orders = []
+    for order in response["orders"]:
         status = order.get('status', 'unknown')
         side_emoji = "🟢" if order.get('side') == 'buy' else "🔴"
         side_text = "買入" if order.get('side') == 'buy' else "賣出"
@@ -407,65 +403,35 @@ async def show_orders_page(update_or_query, user_id: str, page: int = 1, edit_me
                 pass
 
         if status in ['pending', 'partial', 'pending_limit']:
-            # 進行中的訂單
+            # 進行中的訂單；後端回傳的 quantity 為剩餘數量
             filled_qty = order.get('filled_quantity', 0)
 
-            if status == 'partial':
-                if filled_qty > 0:
-                    filled_price = order.get('filled_price', price)
-                    remaining_qty = quantity - filled_qty
-                    status_text = f"部分成交 ({filled_qty}/{quantity} 股已成交@{filled_price}元，剩餘{remaining_qty}股等待)"
-                else:
-                    status_text = '等待成交'
-            elif status == 'pending':
-                if filled_qty > 0:
-                    filled_price = order.get('filled_price', price)
-                    remaining_qty = quantity - filled_qty
-                    status_text = f"部分成交 ({filled_qty}/{quantity} 股已成交@{filled_price}元，剩餘{remaining_qty}股等待)"
-                else:
-                    status_text = '等待成交'
+            if status in ['partial', 'pending'] and filled_qty > 0:
+                filled_price = order.get('filled_price') or price
+                total_qty = quantity + filled_qty
+                status_text = f"部分成交 ({filled_qty}/{total_qty} 股已成交@{filled_price}元，剩餘{quantity}股等待)"
             elif status == 'pending_limit':
                 status_text = '等待中(限制)'
             else:
-                status_text = status
+                status_text = '等待成交'
 
-            pending_orders.append({
-                'text': f"• {escape_markdown(order_info, 2)}{escape_markdown(time_str, 2)}\n  *{escape_markdown(status_text, 2)}*",
-                'created_at': order.get('created_at', '')
-            })
+            current_page_orders.append(
+                ('pending', f"• {escape_markdown(order_info, 2)}{escape_markdown(time_str, 2)}\n  *{escape_markdown(status_text, 2)}*")
+            )
 
-        elif status in ['filled', 'cancelled']:
-            # 已完成的訂單
-            status_text = "✅ 已成交" if status == 'filled' else "❌ 已取消"
+        else:
+            # 已結束的訂單
+            status_text = {
+                'filled': "✅ 已成交",
+                'cancelled': "❌ 已取消"
+            }.get(status, f"⏹ {status}")
             filled_price = order.get('filled_price')
             if filled_price and status == 'filled':
                 order_info += f" → {filled_price}元"
 
-            completed_orders.append({
-                'text': f"• {escape_markdown(order_info, 2)}{escape_markdown(time_str, 2)}\n  {escape_markdown(status_text, 2)}",
-                'created_at': order.get('created_at', '')
-            })
-
-    # 合併所有訂單並按時間排序（最新的在前）
-    all_orders = []
-
-    # 進行中的訂單優先顯示
-    for order in sorted(pending_orders, key=lambda x: x['created_at'], reverse=True):
-        all_orders.append(('pending', order['text']))
-
-    # 然後是已完成的訂單
-    for order in sorted(completed_orders, key=lambda x: x['created_at'], reverse=True):
-        all_orders.append(('completed', order['text']))
-
-    # 計算分頁資訊
-    total_orders = len(all_orders)
-    total_pages = max(1, (total_orders + ORDERS_PER_PAGE - 1) // ORDERS_PER_PAGE)
-    page = max(1, min(page, total_pages))
-
-    # 獲取目前頁的訂單
-    start_idx = (page - 1) * ORDERS_PER_PAGE
-    end_idx = start_idx + ORDERS_PER_PAGE
-    current_page_orders = all_orders[start_idx:end_idx]
+            current_page_orders.append(
+                ('completed', f"• {escape_markdown(order_info, 2)}{escape_markdown(time_str, 2)}\n  {escape_markdown(status_text, 2)}")
+            )
 
     # 構建訊息內容
     if not current_page_orders:
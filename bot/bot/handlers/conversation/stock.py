@@ -12,7 +12,7 @@ from dotenv import load_dotenv
 
 from bot.helper.chat_ids import MAIN_GROUP
 from bot.helper.existing_user import verify_existing_user, verify_user_can_trade
-from utils import api_helper
+from utils import api_helper, order_pages, portfolio_cache
 
 load_dotenv()
 # 讀取 DEBUG 環境變數
@@ -33,9 +33,7 @@ async def start_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🚫 不能在大群交易股票！")
         return ConversationHandler.END
 
-    response = api_helper.post("/api/bot/portfolio", protected_route=True, json={
-        "from_user": str(update.effective_user.id)
-    })
+    response = await portfolio_cache.get_portfolio(update.effective_user.id)
 
     if await verify_existing_user(response, update):
         return ConversationHandler.END
@@ -204,7 +202,9 @@ async def final_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     print(request_body)
 
-    response = api_helper.post("/api/bot/stock/order", protected_route=True, json=request_body)
+    response = await api_helper.post("/api/bot/stock/order", protected_route=True, json=request_body)
+    portfolio_cache.invalidate(update.effective_user.id)
+    order_pages.invalidate(update.effective_user.id)
 
     if response.get("success"):
         await query.edit_message_text(
@@ -5,15 +5,13 @@ from telegram.ext import (CommandHandler, CallbackQueryHandler, ConversationHand
 from telegram.helpers import escape_markdown
 
 from bot.helper.existing_user import verify_existing_user, verify_user_can_trade
-from utils import api_helper
+from utils import api_helper, portfolio_cache
 
 INPUT_AMOUNT, CHOOSE_TEAM, CHOOSE_PERSON, CONFIRM_TRANSFER = range(4)
 
 
 async def start_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    response = api_helper.post("/api/bot/portfolio", protected_route=True, json={
-        "from_user": str(update.effective_user.id),
-    })
+    response = await portfolio_cache.get_portfolio(update.effective_user.id)
 
     if await verify_existing_user(response, update):
         return ConversationHandler.END
@@ -66,9 +64,7 @@ async def input_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["fee"] = transfer_fee
     context.user_data["total"] = total_fee
 
-    response = api_helper.post("/api/bot/portfolio", protected_route=True, json={
-        "from_user": str(update.effective_user.id),
-    })
+    response = await portfolio_cache.get_portfolio(update.effective_user.id)
 
     if amount > response.get("points"):
         await update.message.reply_text(
@@ -94,7 +90,7 @@ async def choose_team(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team = query.data.split(":")[2]
     context.user_data["team"] = team
 
-    student_list = api_helper.get("/api/bot/students", protected_route=True)
+    student_list = await api_helper.get("/api/bot/students", protected_route=True)
     filtered_list = [p for p in student_list if p["team"] == team]
 
     buttons = []
@@ -146,7 +142,7 @@ async def choose_person(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data["to_user"] = telegram_id
 
-    target_user = api_helper.post("/api/bot/profile", protected_route=True, json={"from_user": telegram_id})
+    target_user = await api_helper.post("/api/bot/profile", protected_route=True, json={"from_user": telegram_id})
     nickname = escape_markdown(target_user.get("telegram_nickname"), 2)
     amount = context.user_data["amount"]
 
@@ -173,11 +169,12 @@ async def confirm_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["in_transfer_convo"] = False
         return ConversationHandler.END
 
-    result = api_helper.post("/api/bot/transfer", protected_route=True, json={
+    result = await api_helper.post("/api/bot/transfer", protected_route=True, json={
         "from_user": str(update.effective_user.id),
         "to_username": context.user_data["to_user"],
         "amount": context.user_data["amount"]
     })
+    portfolio_cache.invalidate(update.effective_user.id)
 
     if result.get("success"):
         await query.edit_message_text(
@@ -0,0 +1,82 @@
+from typing import List
+
+from telegram.helpers import escape_markdown
+
+from api.schemas.notifications import TradeNotificationRequest, TransferNotificationRequest, SystemNotificationRequest
+
+PRIORITY_EMOJIS = {
+    "low": "ℹ️",
+    "normal": "📢",
+    "high": "⚠️",
+    "urgent": "🚨"
+}
+
+
+def _md(value) -> str:
+    return escape_markdown(str(value), 2)
+
+
+def _action_text(action: str) -> str:
+    return "買入" if action == "buy" else "賣出"
+
+
+def render_trade_message(request: TradeNotificationRequest) -> str:
+    message_parts = [
+        f"🔔 *您的 SITC {_action_text(request.action)}交易已完成！*",
+        f"",
+        *([f"• 訂單號碼：`{request.order_id}`"] if request.order_id else []),
+        f"• 數量：{request.quantity}",
+        f"• 價格：{_md(f'{request.price:.2f}')}",
+        f"• 總金額：{_md(f'{request.total_amount:.2f}')}"
+    ]
+    return "\n".join(message_parts)
+
+
+def render_trade_summary(trades: List[TradeNotificationRequest]) -> str:
+    """將同一使用者短時間內的多筆成交合併成一則摘要訊息"""
+    if len(trades) == 1:
+        return render_trade_message(trades[0])
+
+    message_parts = [f"🔔 *您的 SITC 訂單共成交 {len(trades)} 筆！*"]
+
+    for action in ("buy", "sell"):
+        fills = [trade for trade in trades if trade.action == action]
+        if not fills:
+            continue
+
+        quantity = sum(trade.quantity for trade in fills)
+        total_amount = sum(trade.total_amount for trade in fills)
+        average_price = total_amount / quantity if quantity else 0
+        order_ids = list(dict.fromkeys(trade.order_id for trade in fills if trade.order_id))
+
+        message_parts += [
+            f"",
+            f"*{_action_text(action)}* {len(fills)} 筆",
+            *([f"• 訂單號碼：{'、'.join(f'`{order_id}`' for order_id in order_ids)}"] if order_ids else []),
+            f"• 數量：{quantity}",
+            f"• 平均價格：{_md(f'{average_price:.2f}')}",
+            f"• 總金額：{_md(f'{total_amount:.2f}')}"
+        ]
+
+    return "\n".join(message_parts)
+
+
+def render_transfer_message(request: TransferNotificationRequest) -> str:
+    other_user = _md(request.other_user)
+    message_parts = [
+        f"🔔 *成功{f"轉帳至 {other_user}" if request.transfer_type == "sent" else f"接受來自 {other_user} 的轉帳"}！*",
+        f"",
+        *([f"• 交易號碼：`{request.transfer_id}`"] if request.transfer_id else []),
+        f"• 轉帳總金額：{_md(f'{request.amount:.2f}')}"
+    ]
+    return "\n".join(message_parts)
+
+
+def render_system_message(request: SystemNotificationRequest) -> str:
+    emoji = PRIORITY_EMOJIS.get(request.priority, "ℹ️")
+    message_parts = [
+        f"{emoji} *{request.title}*",
+        f"",
+        request.content
+    ]
+    return "\n".join(message_parts)
@@ -1,9 +1,47 @@
+import time
 from os import getenv
 
 from dotenv import load_dotenv
-from telegram.ext import ApplicationBuilder
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import HTTPXRequest
+
+from utils import metrics
 
 load_dotenv()
 BOT_TOKEN = getenv("TELEGRAM_BOT_TOKEN")
+# 與 ApplicationBuilder 預設的連線池大小相同
+TELEGRAM_CONNECTION_POOL_SIZE = int(getenv("TELEGRAM_CONNECTION_POOL_SIZE", 256))
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """記錄每次 Telegram Bot API 呼叫耗時的 HTTPXRequest"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started_at = time.monotonic()
+        status_code = None
+        try:
+            status_code, payload = await super().do_request(url, method, *args, **kwargs)
+            return status_code, payload
+        finally:
+            metrics.record_telegram_call(
+                url.rsplit("/", 1)[-1],
+                time.monotonic() - started_at,
+                error=status_code is None or status_code >= 400
+            )
+
+
+def build_application(**request_kwargs) -> Application:
+    """
+    建立 Application
+
+    request_kwargs 會傳給 HTTPXRequest，例如本機壓力測試以 httpx_kwargs 換成假的 Telegram transport
+    """
+    return (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(TimedHTTPXRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE, **request_kwargs))
+        .build()
+    )
+
 
-bot = ApplicationBuilder().token(BOT_TOKEN).build()
+bot = build_application()
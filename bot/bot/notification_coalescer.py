@@ -0,0 +1,72 @@
+import asyncio
+from os import environ
+from typing import Dict, List, Optional
+
+from telegram.constants import ParseMode
+
+from api.schemas.notifications import TradeNotificationRequest
+from bot.helper.notification_messages import render_trade_summary
+from bot.send_scheduler import get_send_scheduler
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 同一使用者的成交在這段時間內合併成一則訊息（秒）
+TRADE_COALESCE_WINDOW = float(environ.get("TRADE_NOTIFICATION_WINDOW", 2.0))
+
+
+class TradeNotificationCoalescer:
+    """
+    成交通知合併器
+
+    使用者的第一筆成交開始計時，視窗內的後續成交累積在一起，
+    時間到時合併成一則摘要交給發送排程器
+    """
+
+    def __init__(self, window: float = TRADE_COALESCE_WINDOW):
+        self.window = window
+        self._pending: Dict[int, List[TradeNotificationRequest]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._received = 0
+        self._messages = 0
+
+    def add(self, trade: TradeNotificationRequest):
+        self._received += 1
+        fills = self._pending.setdefault(trade.user_id, [])
+        fills.append(trade)
+
+        if self.window <= 0:
+            self._flush_user(trade.user_id)
+        elif trade.user_id not in self._timers:
+            self._timers[trade.user_id] = asyncio.get_running_loop().call_later(
+                self.window, self._flush_user, trade.user_id
+            )
+
+    def _flush_user(self, user_id: int):
+        self._timers.pop(user_id, None)
+        fills = self._pending.pop(user_id, None)
+        if not fills:
+            return
+
+        self._messages += 1
+        get_send_scheduler().enqueue(user_id, render_trade_summary(fills), ParseMode.MARKDOWN_V2)
+        if len(fills) > 1:
+            logger.info(f"Coalesced {len(fills)} trade notifications for {user_id}")
+
+    def get_status(self) -> Dict:
+        return {
+            "window_seconds": self.window,
+            "pending_users": len(self._pending),
+            "received": self._received,
+            "messages": self._messages
+        }
+
+
+trade_coalescer: Optional[TradeNotificationCoalescer] = None
+
+
+def get_trade_coalescer() -> TradeNotificationCoalescer:
+    global trade_coalescer
+    if trade_coalescer is None:
+        trade_coalescer = TradeNotificationCoalescer()
+    return trade_coalescer
@@ -1,8 +1,11 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Set
+import heapq
+from datetime import datetime, timedelta, timezone
+from os import environ
+from typing import Dict, List, Optional, Tuple
 from telegram import Bot
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
 from telegram.helpers import escape_markdown
 
 from utils.logger import setup_logger
@@ -10,22 +13,86 @@ from utils import api_helper
 
 logger = setup_logger(__name__)
 
+# 向後端取出過期挑戰的最長間隔（秒）；到期由後端的掃描器統一處理
+EXPIRY_POLL_INTERVAL = int(environ.get("PVP_EXPIRY_POLL_INTERVAL", 60))
+# 過期通知送出失敗時，隔多久重新向後端取出（秒）
+EXPIRY_RETRY_DELAY = float(environ.get("PVP_EXPIRY_RETRY_DELAY", 10))
+# 挑戰到期後等待後端掃描器標記的緩衝時間（秒）
+EXPIRY_GRACE_SECONDS = 2
+
+# 挑戰有效時間（與後端一致）
+CHALLENGE_TTL = timedelta(hours=3)
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
 
 class PVPManager:
+    """
+    PVP 挑戰管理
+
+    挑戰狀態（包含挑戰訊息的 message_id）保存在後端的 pvp_challenges，本地字典只是索引，
+    啟動時以 rehydrate() 從後端重建，BOT 重啟或重新部署後挑戰仍可繼續進行。
+    到期時間放在單一的 heap 中，由一個背景工作睡到最近的到期時間再向後端取出過期挑戰。
+    """
+
     def __init__(self, bot: Bot):
         self.bot = bot
         self.active_challenges: Dict[str, Dict] = {}  # challenge_id -> challenge_info
         self.user_challenges: Dict[str, str] = {}  # user_id -> challenge_id
-        self.timeout_tasks: Dict[str, asyncio.Task] = {}  # challenge_id -> timeout_task
         self.challenge_messages: Dict[str, Dict] = {}  # challenge_id -> {"chat_id": ..., "message_id": ...}
+        self.expiry_task: Optional[asyncio.Task] = None
+        self._expiry_heap: List[Tuple[datetime, str]] = []  # (expires_at, challenge_id)
+        self._expiry_wakeup = asyncio.Event()
+        # 上一次有過期通知送出失敗，下一輪提早重試
+        self._expiry_retry = False
+
+    def _track_challenge(self, challenge_info: Dict, message_id: Optional[int] = None):
+        challenge_id = challenge_info["challenge_id"]
+        self.active_challenges[challenge_id] = challenge_info
+        self.user_challenges[challenge_info["user_id"]] = challenge_id
+        if message_id is not None:
+            self.challenge_messages[challenge_id] = {
+                "chat_id": challenge_info["chat_id"],
+                "message_id": message_id
+            }
+
+        # 比目前最近的到期時間更早時喚醒計時器
+        if not self._expiry_heap or challenge_info["expires_at"] < self._expiry_heap[0][0]:
+            self._expiry_wakeup.set()
+        heapq.heappush(self._expiry_heap, (challenge_info["expires_at"], challenge_id))
+
+    async def rehydrate(self):
+        """從後端重建尚未到期的挑戰（啟動時呼叫）"""
+        response = await api_helper.get("/api/bot/pvp/open", protected_route=True)
+        if not response or not response.get("success"):
+            logger.warning(f"Failed to rehydrate PVP challenges: {response}")
+            return
+
+        for challenge in response.get("challenges", []):
+            self._track_challenge({
+                "challenge_id": challenge["challenge_id"],
+                "user_id": challenge.get("challenger"),
+                "username": challenge.get("challenger_name") or "未知使用者",
+                "amount": challenge.get("amount", 0),
+                "chat_id": challenge.get("chat_id"),
+                "created_at": _parse_datetime(challenge.get("created_at")),
+                "expires_at": _parse_datetime(challenge.get("expires_at")),
+                "status": challenge.get("status")
+            }, challenge.get("message_id"))
+
+        logger.info(f"Rehydrated {len(self.active_challenges)} PVP challenges")
 
     async def create_challenge(self, user_id: str, username: str, amount: int, chat_id: str) -> Dict:
         existing_challenge_id = self.user_challenges.get(user_id)
         if existing_challenge_id and existing_challenge_id in self.active_challenges:
             existing_challenge = self.active_challenges[existing_challenge_id]
 
-            elapsed = datetime.now() - existing_challenge['created_at']
-            remaining = timedelta(hours=3) - elapsed
+            remaining = existing_challenge['expires_at'] - datetime.now(timezone.utc)
 
             if remaining.total_seconds() > 0:
                 return {
@@ -35,7 +102,7 @@ class PVPManager:
                 }
 
         # 調用後端 API 建立挑戰
-        response = api_helper.post("/api/bot/pvp/create", protected_route=True, json={
+        response = await api_helper.post("/api/bot/pvp/create", protected_route=True, json={
             "from_user": user_id,
             "amount": amount,
             "chat_id": chat_id
@@ -45,22 +112,17 @@ class PVPManager:
             challenge_id = response.get("challenge_id")
 
             # 記錄挑戰資訊
-            challenge_info = {
+            now = datetime.now(timezone.utc)
+            self._track_challenge({
                 "challenge_id": challenge_id,
                 "user_id": user_id,
                 "username": username,
                 "amount": amount,
                 "chat_id": chat_id,
-                "created_at": datetime.now(),
+                "created_at": now,
+                "expires_at": now + CHALLENGE_TTL,
                 "status": "waiting_accepter"
-            }
-
-            self.active_challenges[challenge_id] = challenge_info
-            self.user_challenges[user_id] = challenge_id
-
-            # 啟動 3 小時倒數計時
-            timeout_task = asyncio.create_task(self._timeout_challenge(challenge_id))
-            self.timeout_tasks[challenge_id] = timeout_task
+            })
 
             logger.info(f"Created challenge {challenge_id}")
 
@@ -94,7 +156,7 @@ class PVPManager:
         logger.info("No local challenge found, attempting direct API cancellation")
         try:
             # 查詢使用者的活躍挑戰
-            response = api_helper.get(f"/api/bot/pvp/user-challenges/{user_id}", protected_route=True)
+            response = await api_helper.get(f"/api/bot/pvp/user-challenges/{user_id}", protected_route=True)
             if response and response.get("success") and response.get("challenges"):
                 challenges = response.get("challenges", [])
                 logger.info(f"Found {len(challenges)} backend challenges for user {user_id}")
@@ -122,7 +184,7 @@ class PVPManager:
         """直接通過 API 取消挑戰，不經過本地狀態管理"""
         try:
             logger.info(f"Direct API cancel: user {user_id}, challenge {challenge_id}")
-            cancel_response = api_helper.post("/api/bot/pvp/cancel", protected_route=True, json={
+            cancel_response = await api_helper.post("/api/bot/pvp/cancel", protected_route=True, json={
                 "challenge_id": challenge_id,
                 "user_id": user_id
             })
@@ -139,17 +201,119 @@ class PVPManager:
             logger.error(f"Exception in direct API cancel: {e}")
             return False
 
-    async def _timeout_challenge(self, challenge_id: str):
-        try:
-            await asyncio.sleep(10800)  # 3 hours = 10800 seconds
+    def start_expiry_watch(self):
+        """啟動單一的到期計時器（取代每個挑戰各自的倒數計時）"""
+        if self.expiry_task is None or self.expiry_task.done():
+            self.expiry_task = asyncio.create_task(self._expiry_loop())
+
+    async def stop_expiry_watch(self):
+        if self.expiry_task:
+            self.expiry_task.cancel()
+            try:
+                await self.expiry_task
+            except asyncio.CancelledError:
+                pass
+            self.expiry_task = None
+
+    def _next_expiry_delay(self) -> float:
+        # 已結束的挑戰延遲到這裡才從 heap 移除
+        while self._expiry_heap and self._expiry_heap[0][1] not in self.active_challenges:
+            heapq.heappop(self._expiry_heap)
+
+        # 有送出失敗的通知時提早重試
+        poll_interval = EXPIRY_RETRY_DELAY if self._expiry_retry else EXPIRY_POLL_INTERVAL
+        if not self._expiry_heap:
+            return poll_interval
+        until_next = (self._expiry_heap[0][0] - datetime.now(timezone.utc)).total_seconds() + EXPIRY_GRACE_SECONDS
+        return min(poll_interval, max(until_next, 0.5))
+
+    async def _expiry_loop(self):
+        while True:
+            try:
+                self._expiry_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._expiry_wakeup.wait(), timeout=self._next_expiry_delay())
+                    # 新挑戰加入，重新計算下一次到期時間
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+                # 移除已到期的項目；後端尚未標記的挑戰會在下一次輪詢時取出
+                now = datetime.now(timezone.utc)
+                while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                    heapq.heappop(self._expiry_heap)
+
+                response = await api_helper.post("/api/bot/pvp/expired/claim", protected_route=True)
+                await self._deliver_expired(response.get("challenges", []) if response else [])
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error polling expired challenges: {e}")
+
+    async def _deliver_expired(self, challenges: List[Dict]):
+        """逐一送出過期通知，並向後端回報哪些已送出、哪些需要重試"""
+        delivered, failed = [], []
+        for expired in challenges:
+            challenge_id = expired.get("challenge_id")
+            try:
+                await self._notify_expired(expired)
+                delivered.append(challenge_id)
+            except (BadRequest, Forbidden) as e:
+                # 聊天室不存在或 BOT 已被移出，重試也不會成功
+                logger.warning(f"Dropped expiry notice for challenge {challenge_id}: {e}")
+                self._cleanup_challenge(challenge_id)
+                delivered.append(challenge_id)
+            except Exception as e:
+                logger.error(f"Failed to send expiry notice for challenge {challenge_id}: {e}")
+                failed.append(challenge_id)
+
+        self._expiry_retry = bool(failed)
+        if delivered or failed:
+            # 回報失敗時後端租約到期後會再交回這些挑戰
+            await api_helper.post("/api/bot/pvp/expired/ack", protected_route=True, json={
+                "delivered": delivered,
+                "failed": failed
+            })
 
-            if challenge_id in self.active_challenges:
-                # 3小時後直接取消挑戰
-                await self._cancel_challenge(challenge_id, "超時自動取消")
+    async def _notify_expired(self, expired: Dict):
+        """通知挑戰已超時；BOT 重啟後本地沒有記錄時改用後端的挑戰資訊"""
+        challenge_id = expired.get("challenge_id")
+        challenge_info = self.active_challenges.get(challenge_id)
+        username = challenge_info["username"] if challenge_info else expired.get("challenger_name") or "未知使用者"
+        amount = challenge_info["amount"] if challenge_info else expired.get("amount", 0)
+        chat_id = challenge_info["chat_id"] if challenge_info else expired.get("chat_id")
+        reason = "超時自動取消"
 
-        except asyncio.CancelledError:
-            logger.info(f"Challenge {challenge_id} countdown is canceled")
+        if not chat_id:
+            self._cleanup_challenge(challenge_id)
+            return
 
+        # 本地沒有訊息記錄時使用後端保存的 message_id
+        if challenge_id not in self.challenge_messages and expired.get("message_id"):
+            self.challenge_messages[challenge_id] = {"chat_id": chat_id, "message_id": expired["message_id"]}
+
+        await self.bot.send_message(
+            text=f"⏰ **PVP 挑戰已取消**\n\n"
+                 f"**發起者**: {escape_markdown(username, 2)}\n"
+                 f"**金額**: {escape_markdown(str(amount), 2)} 點\n"
+                 f"**原因**: {escape_markdown(reason, 2)}",
+            chat_id=chat_id,
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+
+        logger.info(f"Challenge {challenge_id} is canceled: {reason}")
+
+        await self.edit_challenge_message(
+            challenge_id,
+            f"❌ **PVP 挑戰已取消**\n\n"
+            f"**發起者**: {escape_markdown(username, 2)}\n"
+            f"**金額**: {escape_markdown(str(amount), 2)} 點\n"
+            f"**原因**: {escape_markdown(reason, 2)}\n\n"
+            f"此挑戰已失效，無法再進行操作\\."
+        )
+
+        self._cleanup_challenge(challenge_id)
 
     async def _cancel_challenge(self, challenge_id: str, reason: str):
         if challenge_id not in self.active_challenges:
@@ -163,7 +327,7 @@ class PVPManager:
 
         api_cancel_success = False
 
-        cancel_response = api_helper.post("/api/bot/pvp/cancel", protected_route=True, json={
+        cancel_response = await api_helper.post("/api/bot/pvp/cancel", protected_route=True, json={
             "challenge_id": challenge_id,
             "user_id": user_id
         })
@@ -176,7 +340,7 @@ class PVPManager:
 
         # API will return reason in Chinese? Fr?
         # Probably consider some short word or so, though this won't affect how code works.
-        if api_cancel_success or reason == "超時自動取消":
+        if api_cancel_success:
             await self.bot.send_message(
                 text=f"⏰ **PVP 挑戰已取消**\n\n"
                      f"**發起者**: {escape_markdown(username, 2)}\n"
@@ -212,16 +376,9 @@ class PVPManager:
             if user_id in self.user_challenges:
                 del self.user_challenges[user_id]
 
-            # 清理訊息記錄
-            if challenge_id in self.challenge_messages:
-                del self.challenge_messages[challenge_id]
-
-            # 取消倒數計時任務
-            if challenge_id in self.timeout_tasks:
-                task = self.timeout_tasks[challenge_id]
-                if not task.done():
-                    task.cancel()
-                del self.timeout_tasks[challenge_id]
+        # 清理訊息記錄
+        if challenge_id in self.challenge_messages:
+            del self.challenge_messages[challenge_id]
 
     async def complete_challenge(self, challenge_id: str):
         logger.info(f"Challenge {challenge_id} is completed!")
@@ -238,8 +395,8 @@ class PVPManager:
     def get_user_challenge(self, user_id: str) -> Optional[str]:
         return self.user_challenges.get(user_id)
     
-    def store_challenge_message(self, challenge_id: str, message_id: int):
-        """儲存挑戰訊息的ID，用於後續編輯或刪除"""
+    async def store_challenge_message(self, challenge_id: str, message_id: int):
+        """儲存挑戰訊息的ID，用於後續編輯或刪除（同時寫回後端，重啟後仍可編輯）"""
         if challenge_id in self.active_challenges:
             chat_id = self.active_challenges[challenge_id]["chat_id"]
             self.challenge_messages[challenge_id] = {
@@ -247,6 +404,13 @@ class PVPManager:
                 "message_id": message_id
             }
             logger.info(f"Stored message {message_id} for challenge {challenge_id}")
+
+        response = await api_helper.post("/api/bot/pvp/message", protected_route=True, json={
+            "challenge_id": challenge_id,
+            "message_id": message_id
+        })
+        if not response.get("success"):
+            logger.warning(f"Failed to persist message {message_id} for challenge {challenge_id}")
     
     async def edit_challenge_message(self, challenge_id: str, new_text: str, reply_markup=None):
         """編輯挑戰訊息"""
@@ -282,4 +446,5 @@ def get_pvp_manager() -> PVPManager:
 def init_pvp_manager(bot: Bot):
     global pvp_manager
     pvp_manager = PVPManager(bot)
+    pvp_manager.start_expiry_watch()
     logger.info("Initialized PVP Manager")
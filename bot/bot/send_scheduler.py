@@ -0,0 +1,320 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from os import environ
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Telegram 官方建議：全域每秒約 30 則、同一私訊每秒 1 則、同一群組每分鐘 20 則
+GLOBAL_RATE = float(environ.get("TELEGRAM_GLOBAL_RATE", 25))
+GLOBAL_BURST = int(environ.get("TELEGRAM_GLOBAL_BURST", 25))
+PRIVATE_CHAT_INTERVAL = float(environ.get("TELEGRAM_PRIVATE_CHAT_INTERVAL", 1.0))
+GROUP_CHAT_INTERVAL = float(environ.get("TELEGRAM_GROUP_CHAT_INTERVAL", 3.0))
+SEND_WORKERS = int(environ.get("TELEGRAM_SEND_WORKERS", 8))
+MAX_ATTEMPTS = int(environ.get("TELEGRAM_SEND_MAX_ATTEMPTS", 5))
+RETRY_BACKOFF = float(environ.get("TELEGRAM_SEND_RETRY_BACKOFF", 1.0))
+# 呼叫端要求等待完成時的最長等待秒數
+JOB_WAIT_TIMEOUT = float(environ.get("TELEGRAM_SEND_WAIT_TIMEOUT", 300))
+# 保留在記憶體中供查詢的工作數量
+MAX_TRACKED_JOBS = int(environ.get("TELEGRAM_SEND_MAX_TRACKED_JOBS", 200))
+
+ChatId = Union[int, str]
+
+
+class TokenBucket:
+    """全域令牌桶；收到 RetryAfter 時整個桶暫停到指定時間"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated_at = self.paused_until
+
+
+class SendJob:
+    """一次提交的發送工作（廣播或批量私訊），記錄每個聊天室的結果"""
+
+    def __init__(self, kind: str, chat_ids: List[ChatId]):
+        self.job_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.total = len(chat_ids)
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.succeeded: List[ChatId] = []
+        self.failed: List[ChatId] = []
+        self.errors: Dict[str, str] = {}
+        self.retries = 0
+        self._done = asyncio.Event()
+        if self.total == 0:
+            self._finish()
+
+    @property
+    def pending(self) -> int:
+        return self.total - len(self.succeeded) - len(self.failed)
+
+    @property
+    def status(self) -> str:
+        if self.finished_at:
+            return "completed"
+        if self.succeeded or self.failed:
+            return "running"
+        return "queued"
+
+    def record_success(self, chat_id: ChatId):
+        self.succeeded.append(chat_id)
+        self._check_finished()
+
+    def record_failure(self, chat_id: ChatId, error: str):
+        self.failed.append(chat_id)
+        self.errors[str(chat_id)] = error
+        self._check_finished()
+
+    def _check_finished(self):
+        if self.pending <= 0 and not self.finished_at:
+            self._finish()
+
+    def _finish(self):
+        self.finished_at = datetime.now(timezone.utc)
+        self._done.set()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待工作完成；逾時回傳 False"""
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "success_count": len(self.succeeded),
+            "failed_count": len(self.failed),
+            "pending_count": self.pending,
+            "retries": self.retries,
+            "success_users": self.succeeded,
+            "failed_users": self.failed,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class _SendTask:
+    __slots__ = ("chat_id", "text", "parse_mode", "job", "attempts", "slot_reserved")
+
+    def __init__(self, chat_id: ChatId, text: str, parse_mode: Optional[str], job: Optional[SendJob]):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.job = job
+        self.attempts = 0
+        self.slot_reserved = False
+
+
+class SendScheduler:
+    """
+    Telegram 訊息發送排程器
+
+    所有訊息進入同一個佇列，由多個 worker 併發發送：
+    - 全域令牌桶限制每秒發送數
+    - 每個聊天室依私訊 / 群組各自的最小間隔排程，還沒輪到的訊息延後放回佇列，不佔用 worker
+    - 收到 RetryAfter 時暫停全域令牌桶並在指定時間後重送；網路錯誤以指數退避重試
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.jobs: "OrderedDict[str, SendJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._next_slot: Dict[ChatId, float] = {}
+        self._workers: List[asyncio.Task] = []
+        self._sent = 0
+        self._failed = 0
+        self._rate_limited = 0
+
+    # ========== 生命週期 ==========
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(SEND_WORKERS, 1))]
+        logger.info(f"Send scheduler started with {len(self._workers)} workers "
+                    f"(global {GLOBAL_RATE}/s, private {PRIVATE_CHAT_INTERVAL}s, group {GROUP_CHAT_INTERVAL}s)")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Send scheduler stopped")
+
+    # ========== 提交 ==========
+
+    def submit(self, kind: str, messages: Iterable[Tuple[ChatId, str, Optional[str]]]) -> SendJob:
+        """
+        提交一批訊息並立即回傳工作，發送在背景進行
+
+        messages 為 (chat_id, text, parse_mode) 的序列
+        """
+        messages = list(messages)
+        job = SendJob(kind, [chat_id for chat_id, _, _ in messages])
+        self._track(job)
+        for chat_id, text, parse_mode in messages:
+            self._queue.put_nowait(_SendTask(chat_id, text, parse_mode, job))
+        logger.info(f"Queued {kind} job {job.job_id} with {job.total} messages")
+        return job
+
+    def enqueue(self, chat_id: ChatId, text: str, parse_mode: Optional[str] = None):
+        """排入單則訊息（不建立可查詢的工作）"""
+        self._queue.put_nowait(_SendTask(chat_id, text, parse_mode, None))
+
+    def get_job(self, job_id: str) -> Optional[SendJob]:
+        return self.jobs.get(job_id)
+
+    def _track(self, job: SendJob):
+        self.jobs[job.job_id] = job
+        # 超過上限時先移除最舊的已完成工作
+        while len(self.jobs) > MAX_TRACKED_JOBS:
+            finished = next((job_id for job_id, tracked in self.jobs.items() if tracked.finished_at), None)
+            if finished is None:
+                break
+            del self.jobs[finished]
+
+    # ========== 排程 ==========
+
+    def _reserve_chat_slot(self, chat_id: ChatId) -> float:
+        """預約聊天室的下一個發送時間，回傳需要等待的秒數"""
+        interval = GROUP_CHAT_INTERVAL if str(chat_id).startswith("-") else PRIVATE_CHAT_INTERVAL
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + interval
+
+        if len(self._next_slot) > 10000:
+            self._next_slot = {chat: at for chat, at in self._next_slot.items() if at > now}
+        return slot - now
+
+    def _requeue_later(self, task: _SendTask, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, task)
+
+    async def _worker(self):
+        while True:
+            task = await self._queue.get()
+            try:
+                if not task.slot_reserved:
+                    delay = self._reserve_chat_slot(task.chat_id)
+                    task.slot_reserved = True
+                    if delay > 0:
+                        self._requeue_later(task, delay)
+                        continue
+
+                await self.bucket.acquire()
+                await self._send(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Unexpected error in send worker for {task.chat_id}: {e}")
+                self._fail(task, str(e))
+
+    async def _send(self, task: _SendTask):
+        task.attempts += 1
+        try:
+            await self.bot.send_message(chat_id=task.chat_id, text=task.text, parse_mode=task.parse_mode)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            self._rate_limited += 1
+            logger.warning(f"Flood control hit when sending to {task.chat_id}, pausing {seconds}s")
+            self.bucket.pause(seconds)
+            self._next_slot[task.chat_id] = time.monotonic() + seconds
+            self._retry(task, seconds, str(e))
+        except (BadRequest, Forbidden) as e:
+            # 內容錯誤或使用者封鎖 bot，重試沒有意義
+            logger.error(f"Telegram rejected message to {task.chat_id}: {e}")
+            self._fail(task, str(e))
+        except NetworkError as e:
+            self._retry(task, RETRY_BACKOFF * (2 ** (task.attempts - 1)) * random.uniform(0.8, 1.2), str(e))
+        except TelegramError as e:
+            logger.error(f"Telegram error when sending to {task.chat_id}: {e}")
+            self._fail(task, str(e))
+        else:
+            self._sent += 1
+            if task.job:
+                task.job.record_success(task.chat_id)
+
+    def _retry(self, task: _SendTask, delay: float, error: str):
+        if task.attempts >= MAX_ATTEMPTS:
+            logger.error(f"Giving up sending to {task.chat_id} after {task.attempts} attempts: {error}")
+            self._fail(task, error)
+            return
+        if task.job:
+            task.job.retries += 1
+        # 重送時沿用已預約的時段，不再排到聊天室佇列最後
+        self._requeue_later(task, delay)
+
+    def _fail(self, task: _SendTask, error: str):
+        self._failed += 1
+        if task.job:
+            task.job.record_failure(task.chat_id, error)
+
+    def get_status(self) -> Dict:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "sent": self._sent,
+            "failed": self._failed,
+            "rate_limited": self._rate_limited,
+            "tracked_jobs": len(self.jobs)
+        }
+
+
+send_scheduler: Optional[SendScheduler] = None
+
+
+def get_send_scheduler() -> SendScheduler:
+    global send_scheduler
+    if send_scheduler is None:
+        raise RuntimeError("Send scheduler not initialized")
+    return send_scheduler
+
+
+def init_send_scheduler(bot: Bot):
+    global send_scheduler
+    send_scheduler = SendScheduler(bot)
+    send_scheduler.start()
+    logger.info("Initialized send scheduler")
@@ -10,7 +10,10 @@ from telegram.helpers import escape_markdown
 from bot.handlers import commands, welcome, buttons
 from bot.handlers.conversation import stock, transfer
 from bot.instance import bot
-from bot.pvp_manager import init_pvp_manager
+from bot.pvp_manager import init_pvp_manager, get_pvp_manager
+from bot.send_scheduler import init_send_scheduler
+from bot.update_dispatcher import init_update_dispatcher
+from utils import metrics
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -21,6 +24,7 @@ ERROR_CHANNEL = environ.get("ERROR_CHANNEL")
 
 async def error_handler(update: Optional[object], context: CallbackContext) -> None:
     crashed_message = getattr(update, "message", None)
+    metrics.mark_error()
 
     if context.error:
         trace = format_exception(type(context.error), context.error, context.error.__traceback__)
@@ -72,7 +76,7 @@ async def initialize():
 
     # 測試與後端的連線狀態
     from utils.api_helper import test_backend_connection
-    test_backend_connection()
+    await test_backend_connection()
 
     bot.add_handler(stock.stock_conversation)
     bot.add_handler(transfer.transfer_conversation)
@@ -91,6 +95,9 @@ async def initialize():
     await bot.initialize()
 
     init_pvp_manager(bot.bot)
+    await get_pvp_manager().rehydrate()
+    init_send_scheduler(bot.bot)
+    init_update_dispatcher(bot)
 
     await bot.bot.set_my_commands([
         ("start", "顯示你的個人資訊，喵喵"),
@@ -0,0 +1,196 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from os import environ
+from typing import Deque, List, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from utils import metrics
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+WEBHOOK_WORKERS = int(environ.get("WEBHOOK_WORKERS", 8))
+# 每個 worker 佇列的上限，滿了就回覆 503 讓 Telegram 稍後重送
+WEBHOOK_QUEUE_SIZE = int(environ.get("WEBHOOK_QUEUE_SIZE", 100))
+# 記住最近處理過的 update_id 數量，用來丟棄 Telegram 的重送
+WEBHOOK_DEDUPE_SIZE = int(environ.get("WEBHOOK_DEDUPE_SIZE", 5000))
+# 關閉時等待佇列清空的最長秒數
+WEBHOOK_DRAIN_TIMEOUT = float(environ.get("WEBHOOK_DRAIN_TIMEOUT", 10))
+# 延遲統計保留的樣本數
+LATENCY_SAMPLES = 500
+
+
+def _update_label(update: Update) -> str:
+    """依 update 內容取得統計用的名稱：指令、callback 前綴或 update 種類"""
+    message = update.effective_message
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        # pvp:accept:123 → pvp、orders_page_2 → orders_page
+        return f"callback:{re.sub(r'_?\d+$', '', data.split(':', 1)[0]) or 'unknown'}"
+    if message and message.text and message.text.startswith("/"):
+        return message.text.split()[0].split("@")[0]
+    if update.chat_member or update.my_chat_member:
+        return "chat_member"
+    if message:
+        return "message"
+    return "other"
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent))]
+
+
+class UpdateDispatcher:
+    """
+    Webhook update 分派器
+
+    webhook 收到 update 後只做去重與排入佇列就立即回應 Telegram。
+    每個 worker 有自己的有界佇列，同一個聊天室固定分到同一個 worker，
+    因此同一聊天室的 update 依序處理，不同聊天室之間則併發處理。
+    """
+
+    def __init__(self, application: Application, workers: int = WEBHOOK_WORKERS):
+        self.application = application
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE) for _ in range(max(workers, 1))]
+        self._workers: List[asyncio.Task] = []
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._in_flight = 0
+        self._accepted = 0
+        self._processed = 0
+        self._failed = 0
+        self._duplicates = 0
+        self._rejected = 0
+        self._handler_latency: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._total_latency: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    # ========== 生命週期 ==========
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        logger.info(f"Update dispatcher started with {len(self._workers)} workers")
+
+    async def stop(self):
+        # 先讓已排入的 update 處理完，逾時才取消
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update dispatcher stopped with {self.queue_depth} updates still queued")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Update dispatcher stopped")
+
+    # ========== 排入 ==========
+
+    @staticmethod
+    def _chat_key(update: Update) -> int:
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return update.update_id
+
+    def submit(self, update: Update) -> bool:
+        """
+        排入一個 update
+
+        Returns:
+            bool: False 表示佇列已滿，呼叫端應讓 Telegram 稍後重送；重複的 update 視為已接受
+        """
+        if update.update_id in self._seen:
+            self._duplicates += 1
+            logger.info(f"Dropped duplicate update {update.update_id}")
+            return True
+
+        queue = self._queues[hash(self._chat_key(update)) % len(self._queues)]
+        try:
+            queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            logger.warning(f"Update queue full, rejecting update {update.update_id}")
+            return False
+
+        self._accepted += 1
+        self._seen[update.update_id] = None
+        while len(self._seen) > WEBHOOK_DEDUPE_SIZE:
+            self._seen.popitem(last=False)
+        return True
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update, enqueued_at = await queue.get()
+            started_at = time.monotonic()
+            self._in_flight += 1
+            try:
+                with metrics.track_update(_update_label(update)):
+                    await self.application.process_update(update)
+                self._processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                finished_at = time.monotonic()
+                self._in_flight -= 1
+                self._handler_latency.append(finished_at - started_at)
+                self._total_latency.append(finished_at - enqueued_at)
+                queue.task_done()
+
+    # ========== 指標 ==========
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def get_metrics(self) -> dict:
+        handler = list(self._handler_latency)
+        total = list(self._total_latency)
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": WEBHOOK_QUEUE_SIZE * len(self._queues),
+            "in_flight": self._in_flight,
+            "accepted": self._accepted,
+            "processed": self._processed,
+            "failed": self._failed,
+            "duplicates": self._duplicates,
+            "rejected": self._rejected,
+            "handler_latency_ms": {
+                "avg": round(sum(handler) / len(handler) * 1000, 2) if handler else 0.0,
+                "p50": round(_percentile(handler, 0.5) * 1000, 2),
+                "p95": round(_percentile(handler, 0.95) * 1000, 2),
+                "max": round(max(handler) * 1000, 2) if handler else 0.0
+            },
+            "end_to_end_latency_ms": {
+                "p50": round(_percentile(total, 0.5) * 1000, 2),
+                "p95": round(_percentile(total, 0.95) * 1000, 2)
+            }
+        }
+
+
+update_dispatcher: Optional[UpdateDispatcher] = None
+
+
+def get_update_dispatcher() -> UpdateDispatcher:
+    global update_dispatcher
+    if update_dispatcher is None:
+        raise RuntimeError("Update dispatcher not initialized")
+    return update_dispatcher
+
+
+def init_update_dispatcher(application: Application):
+    global update_dispatcher
+    update_dispatcher = UpdateDispatcher(application)
+    update_dispatcher.start()
+    logger.info("Initialized update dispatcher")
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+BOT 本機壓力測試
+
+不連線 Telegram 與後端：兩者都換成本機的假服務，把合成或錄下來的 Update JSON
+以指定速率排入 webhook 使用的 UpdateDispatcher，最後列出整體與各指令的吞吐量與延遲。
+
+用法:
+    python scripts/load_test.py [--rate 50] [--count 1000] [--scenarios start,point,orders,log,orders_page]
+                                [--updates updates.jsonl] [--users 200]
+                                [--backend-latency-ms 20] [--telegram-latency-ms 50] [--json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs, unquote
+
+import httpx
+
+# 新增 bot 目錄到 Python 路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 匯入 BOT 模組前先補上必要的環境變數
+os.environ.setdefault("BACKEND_URL", "http://backend.load-test")
+os.environ.setdefault("BACKEND_TOKEN", "load-test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:LOAD-TEST")
+# 測試結束時等佇列全部處理完再統計
+os.environ.setdefault("WEBHOOK_DRAIN_TIMEOUT", "600")
+
+from telegram import Update
+
+from bot import instance
+from bot.helper.chat_ids import STUDENT_GROUPS
+from utils import api_helper, metrics
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot"}
+FIRST_USER_ID = 100000000
+ORDERS_PER_USER = 30
+
+
+# ========== 假的 Telegram Bot API ==========
+
+class FakeTelegram:
+    """回應 Bot API 請求的 httpx transport handler"""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self._message_ids = itertools.count(1)
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        api_method = request.url.path.rsplit("/", 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText", "sendPhoto"):
+            chat_id = int(params.get("chat_id", 0))
+            result = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": BOT_USER,
+                "text": params.get("text", "")
+            }
+        else:
+            # answerCallbackQuery、setMyCommands、deleteMessage 等只回傳 True
+            result = True
+
+        return httpx.Response(200, json={"ok": True, "result": result})
+
+
+# ========== 假的後端 ==========
+
+class FakeBackend:
+    """回應 BOT 會呼叫的 /api/bot 端點的 httpx transport handler"""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = request.url.path
+        body = json.loads(request.content) if request.content else {}
+
+        if path == "/api/bot/health":
+            return httpx.Response(200, json={"status": "healthy", "service": "load-test"})
+        if path == "/api/bot/pvp/open":
+            return httpx.Response(200, json={"success": True, "challenges": []})
+        if path == "/api/bot/portfolio":
+            return httpx.Response(200, json={
+                "username": body.get("from_user"), "points": 1000, "stocks": 10,
+                "stockValue": 200, "totalValue": 1200, "avgCost": 20
+            })
+        if path == "/api/bot/teams":
+            return httpx.Response(200, json=[
+                {"name": name, "member_count": 10, "total_points": 10000} for name in STUDENT_GROUPS
+            ])
+        if path.startswith("/api/bot/teams/"):
+            return httpx.Response(200, json={"name": unquote(path.rsplit("/", 1)[-1]), "member_count": 10, "total_points": 10000})
+        if path == "/api/bot/points/history":
+            return httpx.Response(200, json=[
+                {"created_at": "2025-07-01T08:00:00", "note": "轉帳", "amount": -10, "balance_after": 1000 - 10 * index}
+                for index in range(body.get("limit", 10))
+            ])
+        if path == "/api/bot/stock/orders/page":
+            return httpx.Response(200, json=self._orders_page(body))
+
+        return httpx.Response(404, json={"detail": "Not Found"})
+
+    @staticmethod
+    def _orders_page(body: Dict) -> Dict:
+        # 游標就是下一頁的起始位置
+        start = int(body.get("cursor") or 0)
+        end = min(start + body.get("limit", 8), ORDERS_PER_USER)
+        page = {
+            "orders": [
+                {
+                    "order_type": "limit", "side": "buy" if index % 2 else "sell",
+                    "quantity": 10, "price": 20, "status": "pending" if index < 5 else "filled",
+                    "filled_quantity": 0, "filled_price": None if index < 5 else 20.0,
+                    "created_at": "2025-07-01T08:00:00"
+                }
+                for index in range(start, end)
+            ],
+            "next_cursor": str(end) if end < ORDERS_PER_USER else None
+        }
+        if not body.get("cursor"):
+            page.update(total_count=ORDERS_PER_USER, open_count=5)
+        return page
+
+
+# ========== 合成 Update ==========
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def _chat(chat_id: int) -> Dict:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": "Load Test"}
+
+
+def _command(user_id: int, chat_id: int, text: str) -> Dict:
+    return {"message": {
+        "message_id": 1, "date": int(time.time()), "chat": _chat(chat_id), "from": _user(user_id),
+        "text": text, "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    }}
+
+
+def _callback(user_id: int, data: str) -> Dict:
+    return {"callback_query": {
+        "id": str(random.getrandbits(32)), "from": _user(user_id), "chat_instance": "load-test", "data": data,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": _chat(user_id), "from": BOT_USER, "text": "orders"}
+    }}
+
+
+SCENARIOS = {
+    "start": lambda user_id: _command(user_id, user_id, "/start"),
+    "point": lambda user_id: _command(user_id, random.choice(list(STUDENT_GROUPS.values())), "/point"),
+    "orders": lambda user_id: _command(user_id, user_id, "/orders"),
+    "log": lambda user_id: _command(user_id, user_id, "/log"),
+    "orders_page": lambda user_id: _callback(user_id, f"orders_page_{random.randint(2, 4)}")
+}
+
+
+def build_payloads(args) -> List[Dict]:
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as file:
+            text = file.read().strip()
+        recorded = json.loads(text) if text.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+        payloads = [dict(update) for _, update in zip(range(args.count), itertools.cycle(recorded))]
+    else:
+        scenarios = [SCENARIOS[name] for name in args.scenarios.split(",")]
+        payloads = [
+            random.choice(scenarios)(FIRST_USER_ID + random.randrange(args.users))
+            for _ in range(args.count)
+        ]
+
+    # 重新編號，避免被 dispatcher 當成重送而丟棄
+    for update_id, payload in enumerate(payloads, start=1):
+        payload["update_id"] = update_id
+    return payloads
+
+
+# ========== 執行 ==========
+
+async def run(args) -> Dict:
+    # 換成假的 Telegram 與後端，必須在匯入 bot.setup 之前替換 Application
+    instance.bot = instance.build_application(
+        httpx_kwargs={"transport": httpx.MockTransport(FakeTelegram(args.telegram_latency_ms))}
+    )
+    await api_helper.use_transport(httpx.MockTransport(FakeBackend(args.backend_latency_ms)))
+
+    from bot.setup import initialize
+    from bot.pvp_manager import get_pvp_manager
+    from bot.send_scheduler import get_send_scheduler
+    from bot.update_dispatcher import get_update_dispatcher
+
+    if not args.verbose:
+        # handler 每個 update 都會寫 INFO 日誌，只保留警告（含慢 update 的耗時明細）
+        for logger in list(logging.root.manager.loggerDict.values()):
+            if isinstance(logger, logging.Logger):
+                logger.setLevel(logging.WARNING)
+
+    application = instance.bot
+    await initialize()
+    metrics.reset()
+
+    dispatcher = get_update_dispatcher()
+    payloads = build_payloads(args)
+    loop = asyncio.get_running_loop()
+    rejected = 0
+
+    started_at = loop.time()
+    for index, payload in enumerate(payloads):
+        if args.rate > 0:
+            delay = started_at + index / args.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if not dispatcher.submit(Update.de_json(payload, application.bot)):
+            rejected += 1
+    injected_at = loop.time()
+
+    # 等待佇列處理完
+    await dispatcher.stop()
+    finished_at = loop.time()
+    dispatcher_metrics = dispatcher.get_metrics()
+
+    await get_pvp_manager().stop_expiry_watch()
+    await get_send_scheduler().stop()
+    await api_helper.close()
+    await application.shutdown()
+
+    elapsed = finished_at - started_at
+    handler_metrics = metrics.get_metrics()
+    return {
+        "updates": len(payloads),
+        "rejected": rejected,
+        "target_rate": args.rate,
+        "injection_seconds": round(injected_at - started_at, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(dispatcher_metrics["processed"] / elapsed, 2) if elapsed else None,
+        "dispatcher": dispatcher_metrics,
+        "commands": {
+            label: {**stats, "throughput_per_second": round(stats["latency"]["count"] / elapsed, 2) if elapsed else None}
+            for label, stats in handler_metrics["handlers"].items()
+        },
+        "backend_routes": handler_metrics["backend_routes"],
+        "telegram_methods": handler_metrics["telegram_methods"]
+    }
+
+
+def print_report(report: Dict):
+    print(f"Updates: {report['updates']}（拒絕 {report['rejected']}），"
+          f"耗時 {report['elapsed_seconds']}s，吞吐量 {report['throughput_per_second']} updates/s")
+    latency = report["dispatcher"]["end_to_end_latency_ms"]
+    print(f"端到端延遲: p50 {latency['p50']}ms，p95 {latency['p95']}ms")
+    print()
+    print(f"{'指令':<24}{'次數':>8}{'每秒':>10}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'最大ms':>10}"
+          f"{'錯誤':>6}{'後端次數':>10}{'後端ms':>10}{'TG次數':>8}{'TGms':>10}")
+    for label, stats in report["commands"].items():
+        latency = stats["latency"]
+        print(f"{label:<24}{latency['count']:>8}{stats['throughput_per_second']:>10}{latency['avg_ms']:>10}"
+              f"{str(latency['p50_ms']):>10}{str(latency['p95_ms']):>10}{latency['max_ms']:>10}{stats['errors']:>6}"
+              f"{stats['backend']['calls']:>10}{stats['backend']['total_ms']:>10}"
+              f"{stats['telegram']['calls']:>8}{stats['telegram']['total_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BOT 本機壓力測試")
+    parser.add_argument("--rate", type=float, default=50, help="每秒排入的 update 數，0 表示全部一次排入")
+    parser.add_argument("--count", type=int, default=1000, help="排入的 update 總數")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"合成 update 的種類（{', '.join(SCENARIOS)}）")
+    parser.add_argument("--updates", help="錄下來的 Update JSON 檔（JSON 陣列或每行一個），不足 --count 時循環重播")
+    parser.add_argument("--users", type=int, default=200, help="合成 update 使用的不同使用者數")
+    parser.add_argument("--backend-latency-ms", type=float, default=20, help="假後端每個請求的延遲")
+    parser.add_argument("--telegram-latency-ms", type=float, default=50, help="假 Telegram 每個請求的延遲")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出完整報告")
+    parser.add_argument("--verbose", action="store_true", help="保留 handler 的 INFO 日誌")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown and not args.updates:
+        parser.error(f"未知的情境: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
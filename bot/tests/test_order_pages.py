@@ -0,0 +1,92 @@
+"""
+/orders 游標分頁快取測試：以 httpx.MockTransport 取代後端
+
+執行：cd bot && python -m unittest discover -s tests
+"""
+
+import json
+import os
+import unittest
+
+import httpx
+
+os.environ.setdefault("BACKEND_URL", "http://backend.test")
+os.environ.setdefault("BACKEND_TOKEN", "test-token")
+
+from utils import api_helper, order_pages
+
+
+class _FakeBackend:
+    """以位移當作游標分頁回傳訂單"""
+
+    def __init__(self, order_count: int):
+        self.orders = [{"order_id": f"o{i}"} for i in range(order_count)]
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body.get("cursor"))
+        start = int(body.get("cursor") or 0)
+        end = start + body["limit"]
+        return httpx.Response(200, json={
+            "orders": self.orders[start:end],
+            "next_cursor": str(end) if end < len(self.orders) else None,
+            "total_count": len(self.orders),
+            "open_count": 1
+        })
+
+
+class OrderPagesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        order_pages._cache.clear()
+        self.backend = _FakeBackend(order_pages.ORDERS_PER_PAGE * 3 - 1)
+        await api_helper.use_transport(httpx.MockTransport(self.backend.handle))
+
+    async def asyncTearDown(self):
+        await api_helper.use_transport(None)
+        order_pages._cache.clear()
+
+    async def test_first_page(self):
+        page = await order_pages.get_page(1)
+
+        self.assertEqual(page["page"], 1)
+        self.assertEqual(page["total_pages"], 3)
+        self.assertEqual([o["order_id"] for o in page["orders"]][0], "o0")
+        self.assertEqual(self.backend.requests, [None])
+
+    async def test_jump_follows_cursors_and_caches_pages(self):
+        page = await order_pages.get_page(1, 3)
+
+        self.assertEqual(page["page"], 3)
+        self.assertEqual(len(page["orders"]), order_pages.ORDERS_PER_PAGE - 1)
+        self.assertEqual(self.backend.requests, [None, "8", "16"])
+
+        # 已查過的頁面不再打後端
+        await order_pages.get_page(1, 2)
+        await order_pages.get_page(1, 1)
+        self.assertEqual(len(self.backend.requests), 3)
+
+    async def test_page_is_clamped(self):
+        self.assertEqual((await order_pages.get_page(1, 99))["page"], 3)
+        self.assertEqual((await order_pages.get_page(1, 0))["page"], 1)
+
+    async def test_invalidate_refetches(self):
+        await order_pages.get_page(1)
+        order_pages.invalidate(1)
+        await order_pages.get_page(1)
+
+        self.assertEqual(self.backend.requests, [None, None])
+
+    async def test_error_response_is_returned_and_not_cached(self):
+        await api_helper.use_transport(httpx.MockTransport(
+            lambda request: httpx.Response(404, json={"detail": "noexist"})
+        ))
+
+        response = await order_pages.get_page(1)
+
+        self.assertEqual(response.get("detail"), "noexist")
+        self.assertNotIn("1", order_pages._cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+UpdateDispatcher 測試：同一聊天室依序處理、不同聊天室併發、去重與佇列滿時拒絕
+
+執行：cd bot && python -m unittest discover -s tests
+"""
+
+import asyncio
+import random
+import unittest
+
+from telegram import Update
+
+from bot import update_dispatcher as dispatcher_module
+from bot.update_dispatcher import UpdateDispatcher
+
+
+def _update(update_id: int, chat_id: int, text: str = "/start") -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "測試"},
+            "text": text
+        }
+    }, None)
+
+
+class _RecordingApplication:
+    """記錄每個 update 開始與結束處理的順序"""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.started = []
+        self.finished = []
+        self.active_chats = set()
+        self.max_concurrency = 0
+        self.overlapping_same_chat = False
+
+    async def process_update(self, update: Update):
+        chat_id = update.effective_chat.id
+        if chat_id in self.active_chats:
+            self.overlapping_same_chat = True
+        self.active_chats.add(chat_id)
+        self.started.append((chat_id, update.update_id))
+        self.max_concurrency = max(self.max_concurrency, len(self.active_chats))
+        try:
+            await asyncio.sleep(random.uniform(0, self.delay))
+            if update.effective_message.text == "/fail":
+                raise RuntimeError("handler failed")
+        finally:
+            self.active_chats.discard(chat_id)
+            self.finished.append((chat_id, update.update_id))
+
+
+class UpdateDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_same_chat_updates_run_in_order(self):
+        application = _RecordingApplication()
+        dispatcher = UpdateDispatcher(application, workers=4)
+        dispatcher.start()
+
+        update_ids = {chat_id: [] for chat_id in range(1, 6)}
+        update_id = 0
+        for _ in range(10):
+            for chat_id in update_ids:
+                update_id += 1
+                update_ids[chat_id].append(update_id)
+                self.assertTrue(dispatcher.submit(_update(update_id, chat_id)))
+        await dispatcher.stop()
+
+        self.assertFalse(application.overlapping_same_chat)
+        for chat_id, expected in update_ids.items():
+            with self.subTest(chat_id=chat_id):
+                self.assertEqual([u for c, u in application.finished if c == chat_id], expected)
+        self.assertEqual(dispatcher.get_metrics()["processed"], 50)
+
+    async def test_different_chats_run_concurrently(self):
+        application = _RecordingApplication(delay=0.05)
+        dispatcher = UpdateDispatcher(application, workers=8)
+        dispatcher.start()
+
+        # 挑選會分到不同 worker 的聊天室
+        chat_ids, workers_used = [], set()
+        for chat_id in range(1, 1000):
+            worker = hash(chat_id) % 8
+            if worker not in workers_used:
+                workers_used.add(worker)
+                chat_ids.append(chat_id)
+            if len(chat_ids) == 4:
+                break
+        for update_id, chat_id in enumerate(chat_ids, start=1):
+            dispatcher.submit(_update(update_id, chat_id))
+        await dispatcher.stop()
+
+        self.assertGreater(application.max_concurrency, 1)
+
+    async def test_failed_update_does_not_block_chat(self):
+        application = _RecordingApplication(delay=0)
+        dispatcher = UpdateDispatcher(application, workers=1)
+        dispatcher.start()
+
+        dispatcher.submit(_update(1, 7, "/fail"))
+        dispatcher.submit(_update(2, 7))
+        await dispatcher.stop()
+
+        self.assertEqual(application.finished, [(7, 1), (7, 2)])
+        metrics = dispatcher.get_metrics()
+        self.assertEqual((metrics["processed"], metrics["failed"]), (1, 1))
+
+    async def test_duplicate_updates_are_dropped(self):
+        application = _RecordingApplication(delay=0)
+        dispatcher = UpdateDispatcher(application, workers=2)
+        dispatcher.start()
+
+        self.assertTrue(dispatcher.submit(_update(1, 7)))
+        self.assertTrue(dispatcher.submit(_update(1, 7)))
+        await dispatcher.stop()
+
+        self.assertEqual(application.finished, [(7, 1)])
+        self.assertEqual(dispatcher.get_metrics()["duplicates"], 1)
+
+    async def test_full_queue_rejects_without_marking_seen(self):
+        original_size = dispatcher_module.WEBHOOK_QUEUE_SIZE
+        dispatcher_module.WEBHOOK_QUEUE_SIZE = 1
+        try:
+            application = _RecordingApplication(delay=0)
+            # 不啟動 worker，佇列不會被消化
+            dispatcher = UpdateDispatcher(application, workers=1)
+        finally:
+            dispatcher_module.WEBHOOK_QUEUE_SIZE = original_size
+
+        self.assertTrue(dispatcher.submit(_update(1, 7)))
+        self.assertFalse(dispatcher.submit(_update(2, 7)))
+        self.assertEqual(dispatcher.get_metrics()["rejected"], 1)
+
+        # Telegram 重送被拒絕的 update 時仍會被接受處理
+        dispatcher.start()
+        await asyncio.sleep(0)
+        await dispatcher._queues[0].join()
+        self.assertTrue(dispatcher.submit(_update(2, 7)))
+        await dispatcher.stop()
+        self.assertEqual(application.finished, [(7, 1), (7, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
+import asyncio
+import random
+import time
 from os import environ
-from typing import Dict
+from typing import Dict, Optional
 
 import httpx
 from dotenv import load_dotenv
 
+from utils import metrics
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -15,73 +19,125 @@ BACKEND_TOKEN = environ.get("BACKEND_TOKEN") or environ.get("INTERNAL_API_KEY")
 if BACKEND_URL.endswith("/"):
     BACKEND_URL = BACKEND_URL[:-1]
 
+# 連線池與重試設定
+REQUEST_TIMEOUT = float(environ.get("BACKEND_TIMEOUT", 10))
+MAX_CONNECTIONS = int(environ.get("BACKEND_MAX_CONNECTIONS", 50))
+MAX_KEEPALIVE_CONNECTIONS = int(environ.get("BACKEND_MAX_KEEPALIVE_CONNECTIONS", 20))
+MAX_CONCURRENT_REQUESTS = int(environ.get("BACKEND_MAX_CONCURRENT_REQUESTS", 32))
+MAX_RETRIES = int(environ.get("BACKEND_MAX_RETRIES", 2))
+RETRY_BACKOFF = float(environ.get("BACKEND_RETRY_BACKOFF", 0.3))
+
+# 可重試的狀態碼（只對冪等方法重試）
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE"}
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+# 替換後端連線用的 transport（本機壓力測試時指向假的後端）
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """取得共用的 AsyncClient（第一次使用時建立，之後重用連線池）"""
+    global _client, _semaphore
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=BACKEND_URL,
+            timeout=httpx.Timeout(REQUEST_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            ),
+            transport=_transport
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _client
 
-def get(path, protected_route=False, **kwargs) -> Dict:
-    headers = kwargs.get("headers", {}) or {}
 
-    if protected_route:
-        headers = headers.copy()
-        headers["token"] = BACKEND_TOKEN
+async def use_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """改用指定的 transport 連線後端（本機壓力測試用），None 恢復一般連線"""
+    global _transport
 
-    response = httpx.get(f"{BACKEND_URL}{path}", headers=headers, **kwargs)
-    _log_api_error(response, path)
+    await close()
+    _transport = transport
 
-    try:
-        return response.json()
-    except Exception:
-        # Return a standardized error response for non-JSON responses
-        return {"detail": "error", "status_code": response.status_code}
 
+async def close():
+    """關閉共用連線池（伺服器關閉時呼叫）"""
+    global _client
 
-def post(path, protected_route=False, **kwargs) -> Dict:
-    headers = kwargs.get("headers", {}) or {}
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
-    if protected_route:
-        headers = headers.copy()
-        headers["token"] = BACKEND_TOKEN
-
-    response = httpx.post(f"{BACKEND_URL}{path}", headers=headers, **kwargs)
-    _log_api_error(response, path)
 
+async def _send(client: httpx.AsyncClient, method: str, path: str, headers: Dict, **kwargs) -> httpx.Response:
+    """送出單次請求並記錄耗時（含等待並行上限的時間）"""
+    started_at = time.monotonic()
+    response = None
     try:
-        return response.json()
-    except Exception:
-        # Return a standardized error response for non-JSON responses
-        return {"detail": "error", "status_code": response.status_code}
+        async with _semaphore:
+            response = await client.request(method, path, headers=headers, **kwargs)
+        return response
+    finally:
+        metrics.record_backend_call(method, path, time.monotonic() - started_at,
+                                    error=response is None or response.status_code >= 500)
 
 
-def put(path, protected_route=False, **kwargs) -> Dict:
-    headers = kwargs.get("headers", {}) or {}
+async def _request(method: str, path: str, protected_route: bool = False, **kwargs) -> Dict:
+    headers = kwargs.pop("headers", {}) or {}
 
     if protected_route:
         headers = headers.copy()
         headers["token"] = BACKEND_TOKEN
 
-    response = httpx.put(f"{BACKEND_URL}{path}", headers=headers, **kwargs)
-    _log_api_error(response, path)
+    client = _get_client()
+    retries = kwargs.pop("retries", MAX_RETRIES)
+
+    for attempt in range(retries + 1):
+        try:
+            response = await _send(client, method, path, headers, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # 請求尚未送出，任何方法都可以安全重試
+            if attempt >= retries:
+                raise
+            logger.warning(f"Backend connection failed {path} ({type(e).__name__}), retrying...")
+        except httpx.TransportError as e:
+            # 請求可能已送達後端，只重試冪等方法
+            if method not in IDEMPOTENT_METHODS or attempt >= retries:
+                raise
+            logger.warning(f"Backend request failed {path} ({type(e).__name__}), retrying...")
+        else:
+            if response.status_code in RETRYABLE_STATUS_CODES and method in IDEMPOTENT_METHODS and attempt < retries:
+                logger.warning(f"Backend unavailable {path} ({response.status_code}), retrying...")
+            else:
+                _log_api_error(response, path)
 
-    try:
-        return response.json()
-    except Exception:
-        # Return a standardized error response for non-JSON responses
-        return {"detail": "error", "status_code": response.status_code}
+                try:
+                    return response.json()
+                except Exception:
+                    # Return a standardized error response for non-JSON responses
+                    return {"detail": "error", "status_code": response.status_code}
 
+        # 指數退避加上隨機抖動
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.8, 1.2))
 
-def delete(path, protected_route=False, **kwargs) -> Dict:
-    headers = kwargs.get("headers", {}) or {}
 
-    if protected_route:
-        headers = headers.copy()
-        headers["token"] = BACKEND_TOKEN
+async def get(path, protected_route=False, **kwargs) -> Dict:
+    return await _request("GET", path, protected_route, **kwargs)
 
-    response = httpx.delete(f"{BACKEND_URL}{path}", headers=headers, **kwargs)
-    _log_api_error(response, path)
 
-    try:
-        return response.json()
-    except Exception:
-        # Return a standardized error response for non-JSON responses
-        return {"detail": "error", "status_code": response.status_code}
+async def post(path, protected_route=False, **kwargs) -> Dict:
+    return await _request("POST", path, protected_route, **kwargs)
+
+
+async def put(path, protected_route=False, **kwargs) -> Dict:
+    return await _request("PUT", path, protected_route, **kwargs)
+
+
+async def delete(path, protected_route=False, **kwargs) -> Dict:
+    return await _request("DELETE", path, protected_route, **kwargs)
 
 
 def _log_api_error(response: httpx.Response, path):
@@ -103,14 +159,16 @@ def _log_api_error(response: httpx.Response, path):
         logger.error(f"Failed to send request to backend {path} ({status_code})")
 
 
-def test_backend_connection():
+async def test_backend_connection():
     logger.info("Testing connection with backend")
     logger.info(f"Backend URL: {BACKEND_URL}")
     logger.info(f"Authentication token: {'configured' if BACKEND_TOKEN else 'unset'}")
 
+    client = _get_client()
+
     try:
-        response = httpx.get(
-            f"{BACKEND_URL}/api/bot/health",
+        response = await client.get(
+            "/api/bot/health",
             headers={"token": BACKEND_TOKEN},
             timeout=5.0
         )
@@ -131,8 +189,8 @@ def test_backend_connection():
     except Exception as e:
         logger.error(f"An error occurred when connecting to backend: {e}")
 
-    response = httpx.post(
-        f"{BACKEND_URL}/api/bot/portfolio",
+    response = await client.post(
+        "/api/bot/portfolio",
         headers={"token": BACKEND_TOKEN, "Content-Type": "application/json"},
         json={"from_user": "__test_connection__"},
         timeout=5.0
@@ -144,4 +202,3 @@ def test_backend_connection():
         logger.error("Unauthorized, please check backend authentication token")
     else:
         logger.warning(f"An error occurred when requesting test data: {response.status_code}")
-
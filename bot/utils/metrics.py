@@ -0,0 +1,220 @@
+import re
+import time
+from contextvars import ContextVar
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 超過這個毫秒數的 update 記錄各段耗時，0 表示不記錄
+SLOW_UPDATE_THRESHOLD_MS = float(environ.get("SLOW_UPDATE_THRESHOLD_MS", 1000))
+# 統計的 handler 名稱上限，使用者亂打的指令超過上限後併入 other
+MAX_HANDLER_LABELS = 100
+# 延遲分布的桶上界（毫秒），最後一桶為無上限
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, duration_ms: float):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """以桶上界估計百分位數"""
+        if not self.count:
+            return None
+        target = self.count * percent
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.buckets))
+        }
+
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def add(self, duration_ms: float, error: bool = False):
+        self.calls += 1
+        self.total_ms += duration_ms
+        if error:
+            self.errors += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0
+        }
+
+
+class _HandlerStats:
+    def __init__(self):
+        self.latency = _Histogram()
+        self.errors = 0
+        self.backend = _CallStats()
+        self.telegram = _CallStats()
+
+    def to_dict(self) -> Dict:
+        return {
+            "latency": self.latency.to_dict(),
+            "errors": self.errors,
+            "backend": self.backend.to_dict(),
+            "telegram": self.telegram.to_dict()
+        }
+
+
+class _Trace:
+    """單一 update 處理期間的外部呼叫紀錄"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.monotonic()
+        self.error = False
+        # (種類, 名稱, 耗時毫秒, 是否失敗)
+        self.spans: List[Tuple[str, str, float, bool]] = []
+
+
+# 目前 task 正在處理的 update；handler 內的後端與 Telegram 呼叫記到這裡
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("handler_trace", default=None)
+
+_handlers: Dict[str, _HandlerStats] = {}
+_backend_routes: Dict[str, _CallStats] = {}
+_telegram_methods: Dict[str, _CallStats] = {}
+_slow_updates = 0
+
+_DYNAMIC_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{24}|.*%.*)$")
+
+
+def _route_label(method: str, path: str) -> str:
+    # 數字、ObjectId 與編碼過的路徑參數合併成同一個路由
+    segments = ["{id}" if _DYNAMIC_SEGMENT.match(segment) else segment for segment in path.split("?")[0].split("/")]
+    return f"{method} {'/'.join(segments)}"
+
+
+# ========== 記錄 ==========
+
+class track_update:
+    """
+    記錄一個 update 的處理時間
+
+    用法：with track_update(label): await application.process_update(update)
+    """
+
+    def __init__(self, label: str):
+        self._trace = _Trace(label)
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self._trace)
+        return self._trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._token)
+        _finish(self._trace, failed=exc_type is not None)
+        return False
+
+
+def _finish(trace: _Trace, failed: bool = False):
+    global _slow_updates
+
+    duration_ms = (time.monotonic() - trace.started_at) * 1000
+    label = trace.label if trace.label in _handlers or len(_handlers) < MAX_HANDLER_LABELS else "other"
+    stats = _handlers.setdefault(label, _HandlerStats())
+    stats.latency.observe(duration_ms)
+    if failed or trace.error:
+        stats.errors += 1
+    for kind, _, span_ms, error in trace.spans:
+        (stats.backend if kind == "backend" else stats.telegram).add(span_ms, error)
+
+    if SLOW_UPDATE_THRESHOLD_MS > 0 and duration_ms >= SLOW_UPDATE_THRESHOLD_MS:
+        _slow_updates += 1
+        logger.warning(f"Slow update {label} took {duration_ms:.0f}ms: {_breakdown(trace, duration_ms)}")
+
+
+def _breakdown(trace: _Trace, duration_ms: float) -> str:
+    parts = []
+    accounted = 0.0
+    for kind in ("backend", "telegram"):
+        spans = [span for span in trace.spans if span[0] == kind]
+        if not spans:
+            continue
+        total = sum(span[2] for span in spans)
+        accounted += total
+        detail = ", ".join(f"{name} {span_ms:.0f}ms{' (failed)' if error else ''}" for _, name, span_ms, error in spans)
+        parts.append(f"{kind} {len(spans)} calls {total:.0f}ms [{detail}]")
+    parts.append(f"handler {max(duration_ms - accounted, 0):.0f}ms")
+    return "; ".join(parts)
+
+
+def mark_error():
+    """目前處理中的 update 發生錯誤（由 error handler 呼叫）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.error = True
+
+
+def record_backend_call(method: str, path: str, duration: float, error: bool = False):
+    duration_ms = duration * 1000
+    _backend_routes.setdefault(_route_label(method, path), _CallStats()).add(duration_ms, error)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(("backend", f"{method} {path}", duration_ms, error))
+
+
+def record_telegram_call(api_method: str, duration: float, error: bool = False):
+    duration_ms = duration * 1000
+    _telegram_methods.setdefault(api_method, _CallStats()).add(duration_ms, error)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(("telegram", api_method, duration_ms, error))
+
+
+# ========== 查詢 ==========
+
+def get_metrics() -> Dict:
+    return {
+        "slow_update_threshold_ms": SLOW_UPDATE_THRESHOLD_MS,
+        "slow_updates": _slow_updates,
+        "handlers": {label: stats.to_dict() for label, stats in sorted(_handlers.items())},
+        "backend_routes": {route: stats.to_dict() for route, stats in sorted(_backend_routes.items())},
+        "telegram_methods": {method: stats.to_dict() for method, stats in sorted(_telegram_methods.items())}
+    }
+
+
+def reset():
+    global _slow_updates
+    _handlers.clear()
+    _backend_routes.clear()
+    _telegram_methods.clear()
+    _slow_updates = 0
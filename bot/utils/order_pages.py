@@ -0,0 +1,101 @@
+import time
+from os import environ
+from typing import Dict, Optional
+
+from utils import api_helper
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# /orders 每頁顯示的訂單數量
+ORDERS_PER_PAGE = 8
+# 使用者翻頁期間保留已查過的頁面與游標的秒數
+ORDER_PAGE_CACHE_TTL = float(environ.get("ORDER_PAGE_CACHE_TTL", 30))
+
+
+class _UserOrderPages:
+    def __init__(self):
+        self.expires_at = time.monotonic() + ORDER_PAGE_CACHE_TTL
+        # 頁碼 → 查詢該頁用的游標，第一頁不帶游標
+        self.cursors: Dict[int, Optional[str]] = {1: None}
+        # 頁碼 → 該頁的訂單
+        self.pages: Dict[int, list] = {}
+        self.total_count = 0
+        self.open_count = 0
+
+
+# telegram_id → 已查過的頁面
+_cache: Dict[str, _UserOrderPages] = {}
+
+
+async def _fetch(user_id: str, cursor: Optional[str]) -> Dict:
+    return await api_helper.post("/api/bot/stock/orders/page", protected_route=True, json={
+        "from_user": user_id,
+        "limit": ORDERS_PER_PAGE,
+        **({"cursor": cursor} if cursor else {})
+    })
+
+
+def _is_page(response) -> bool:
+    return isinstance(response, dict) and isinstance(response.get("orders"), list)
+
+
+async def get_page(user_id, page: int = 1) -> Dict:
+    """
+    取得使用者訂單的第 page 頁
+
+    後端以游標分頁，這裡記住每一頁的游標；跳到還沒看過的頁面時從最近一個已知游標往後查。
+
+    Returns:
+        dict: 成功時含 orders、page、total_pages、total_count、open_count；
+              失敗時原樣回傳後端回應，交給 verify_existing_user 處理
+    """
+    user_id = str(user_id)
+    now = time.monotonic()
+
+    state = _cache.get(user_id)
+    if state is None or state.expires_at <= now:
+        state = _UserOrderPages()
+        response = await _fetch(user_id, None)
+        if not _is_page(response):
+            return response
+        state.total_count = response.get("total_count") or 0
+        state.open_count = response.get("open_count") or 0
+        state.pages[1] = response["orders"]
+        state.cursors[2] = response.get("next_cursor")
+        _cache[user_id] = state
+
+        if len(_cache) > 1000:
+            for key in [key for key, value in _cache.items() if value.expires_at <= now]:
+                del _cache[key]
+
+    total_pages = max(1, (state.total_count + ORDERS_PER_PAGE - 1) // ORDERS_PER_PAGE)
+    page = max(1, min(page, total_pages))
+
+    # 從最近的已知頁面依游標往後查到目標頁
+    known = max(number for number in state.pages if number <= page)
+    while known < page:
+        cursor = state.cursors.get(known + 1)
+        if not cursor:
+            # 訂單在翻頁期間變少，停在最後一頁
+            page = known
+            break
+        response = await _fetch(user_id, cursor)
+        if not _is_page(response):
+            return response
+        known += 1
+        state.pages[known] = response["orders"]
+        state.cursors[known + 1] = response.get("next_cursor")
+
+    return {
+        "orders": state.pages[page],
+        "page": page,
+        "total_pages": total_pages,
+        "total_count": state.total_count,
+        "open_count": state.open_count
+    }
+
+
+def invalidate(user_id):
+    """使用者的訂單可能已變動（下單、取消、收到成交通知、按下重新整理）時呼叫"""
+    _cache.pop(str(user_id), None)
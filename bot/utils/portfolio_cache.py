@@ -0,0 +1,76 @@
+import asyncio
+import time
+from os import environ
+from typing import Dict, Tuple
+
+from utils import api_helper
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 投資組合回應的快取秒數
+PORTFOLIO_CACHE_TTL = float(environ.get("PORTFOLIO_CACHE_TTL", 3))
+
+# telegram_id → (到期時間, 回應)
+_cache: Dict[str, Tuple[float, Dict]] = {}
+# telegram_id → 進行中的後端請求（同一使用者的併發查詢共用）
+_inflight: Dict[str, asyncio.Task] = {}
+# telegram_id → 失效次數；請求期間被失效時，回應不寫回快取
+_generation: Dict[str, int] = {}
+
+
+def _is_cacheable(response) -> bool:
+    # 只快取成功的回應，使用者不存在或後端錯誤都重新查詢
+    return isinstance(response, dict) and "detail" not in response and response.get("success") is not False
+
+
+def _copy(response):
+    # 快取與共用請求的回應是同一個 dict，回傳淺拷貝，呼叫端修改不會影響其他人
+    return dict(response) if isinstance(response, dict) else response
+
+
+async def _fetch(user_id: str, generation: int) -> Dict:
+    try:
+        response = await api_helper.post("/api/bot/portfolio", protected_route=True, json={
+            "from_user": user_id
+        })
+        if _generation.get(user_id, 0) == generation and _is_cacheable(response):
+            _cache[user_id] = (time.monotonic() + PORTFOLIO_CACHE_TTL, response)
+        return response
+    finally:
+        if _inflight.get(user_id) is asyncio.current_task():
+            del _inflight[user_id]
+
+
+async def get_portfolio(user_id) -> Dict:
+    """
+    取得使用者的投資組合
+
+    幾秒內的重複查詢直接回傳快取，同一使用者同時發出的查詢只打一次後端
+    """
+    user_id = str(user_id)
+    now = time.monotonic()
+
+    cached = _cache.get(user_id)
+    if cached and cached[0] > now:
+        return _copy(cached[1])
+
+    task = _inflight.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_fetch(user_id, _generation.get(user_id, 0)))
+        _inflight[user_id] = task
+
+        if len(_cache) > 1000:
+            for key in [key for key, (expires_at, _) in _cache.items() if expires_at <= now]:
+                del _cache[key]
+
+    # shield：單一呼叫端被取消時不影響其他共用同一請求的呼叫端
+    return _copy(await asyncio.shield(task))
+
+
+def invalidate(user_id):
+    """使用者的點數或持股可能已變動（下單、轉帳、PvP、收到成交通知）時呼叫"""
+    user_id = str(user_id)
+    _cache.pop(user_id, None)
+    _inflight.pop(user_id, None)
+    _generation[user_id] = _generation.get(user_id, 0) + 1